@@ -0,0 +1,314 @@
+'''
+Checkpointed, resumable batch runs over fragment lists.
+
+Every fragment's status and result are recorded in a SQLite journal, so an interrupted run resumes where it stopped, and several worker processes can share one journal: fragments are claimed inside an IMMEDIATE transaction, so no two workers ever claim the same one.
+'''
+from json import dumps, loads
+from os import getpid
+from socket import gethostname
+from sqlite3 import connect
+from sys import stdout
+from time import time
+from traceback import format_exc
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, TextIO, Tuple
+
+from dihedral_fragments.exceptions import ATB_Molecule_Running
+from dihedral_fragments.instrumentation import add_sink, remove_sink, Histogram_Sink, SINKS
+
+PENDING, RUNNING, DONE, FAILED, MOLECULE_RUNNING = 'pending', 'running', 'done', 'failed', 'molecule_running'
+
+STATUSES = (PENDING, RUNNING, DONE, FAILED, MOLECULE_RUNNING)
+
+# Failed fragments are retried `retry_delay` seconds after their first attempt finished, then after twice as long after every further attempt
+Retry_Policy = NamedTuple('Retry_Policy', [('max_attempts', int), ('retry_statuses', Tuple[str, ...]), ('retry_delay', float)])
+
+# Molecules still running in the ATB usually take minutes to complete
+DEFAULT_RETRY_DELAY = 600.0
+
+DEFAULT_RETRY_POLICY = Retry_Policy(max_attempts=3, retry_statuses=(FAILED, MOLECULE_RUNNING), retry_delay=DEFAULT_RETRY_DELAY)
+
+NO_RETRY_POLICY = Retry_Policy(max_attempts=1, retry_statuses=(), retry_delay=0.0)
+
+# Fragments left `running` for longer than this (in seconds) are assumed to belong to a dead worker and can be claimed again
+DEFAULT_STALE_AFTER = 6 * 3600
+
+Progress = NamedTuple(
+    'Progress',
+    [('counts', Dict[str, int]), ('total', int), ('completed', int), ('elapsed', float), ('throughput', float)],
+)
+
+def format_progress(progress: Progress) -> str:
+    return 'Completed {completed}/{total} fragments ({counts}) in {elapsed:.1f}s ({throughput:.3f} fragments/s)'.format(
+        completed=progress.completed,
+        total=progress.total,
+        counts=', '.join('{0}={1}'.format(status, progress.counts[status]) for status in STATUSES if progress.counts[status]),
+        elapsed=progress.elapsed,
+        throughput=progress.throughput,
+    )
+
+def default_worker_name() -> str:
+    return '{0}:{1}'.format(gethostname(), getpid())
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS fragments (
+    fragment TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS fragments_status_position ON fragments (status, position);
+'''
+
+class Journal(object):
+    def __init__(self, path: str, timeout: float = 60.0) -> None:
+        self.path = path
+        self.connection = connect(path, timeout=timeout, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> 'Journal':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def add_fragments(self, fragments: Iterable[str]) -> int:
+        '''Append fragments (in order) to the journal, ignoring those already present. Returns the number of new fragments.'''
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            next_position, = self.connection.execute('SELECT COALESCE(MAX(position) + 1, 0) FROM fragments').fetchone()
+            cursor = self.connection.executemany(
+                'INSERT OR IGNORE INTO fragments (fragment, position, status) VALUES (?, ?, ?)',
+                ((fragment, position, PENDING) for (position, fragment) in enumerate(fragments, start=next_position)),
+            )
+            return cursor.rowcount
+
+    def claim(self, worker: str, retry_policy: Retry_Policy = DEFAULT_RETRY_POLICY, stale_after: float = DEFAULT_STALE_AFTER) -> Optional[str]:
+        '''
+        Atomically mark the next runnable fragment (in input order) as running for `worker` and return it, or None if nothing is left to do.
+        Fragments waiting for their retry delay are not runnable yet.
+        Fragments left running for longer than `stale_after` seconds (e.g. by a worker killed by a segfault or the OOM killer) are reclaimed,
+        unless they have run out of attempts, in which case they are marked as failed.
+        '''
+        now = time()
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.execute(
+                '''
+                UPDATE fragments SET status = ?, finished_at = ?, error = 'Worker stopped responding after ' || attempts || ' attempt(s)'
+                WHERE status = ? AND started_at < ? AND attempts >= ?
+                ''',
+                (FAILED, now, RUNNING, now - stale_after, retry_policy.max_attempts),
+            )
+            row = self.connection.execute(
+                '''
+                SELECT fragment FROM fragments
+                WHERE status = ?
+                OR (status IN ({retry_statuses}) AND attempts < ? AND finished_at + ? * (1 << (attempts - 1)) <= ?)
+                OR (status = ? AND started_at < ? AND attempts < ?)
+                ORDER BY position LIMIT 1
+                '''.format(retry_statuses=','.join('?' for _ in retry_policy.retry_statuses) or 'NULL'),
+                (PENDING,) + tuple(retry_policy.retry_statuses) + (retry_policy.max_attempts, retry_policy.retry_delay, now, RUNNING, now - stale_after, retry_policy.max_attempts),
+            ).fetchone()
+            if row is None:
+                return None
+            fragment, = row
+            self.connection.execute(
+                'UPDATE fragments SET status = ?, worker = ?, attempts = attempts + 1, started_at = ?, finished_at = NULL WHERE fragment = ?',
+                (RUNNING, worker, now, fragment),
+            )
+            return fragment
+
+    def record_success(self, fragment: str, result: Any) -> None:
+        self._record(fragment, DONE, result=dumps(result), error=None)
+
+    def record_failure(self, fragment: str, status: str, error: str) -> None:
+        assert status in (FAILED, MOLECULE_RUNNING), status
+        self._record(fragment, status, result=None, error=error)
+
+    def release(self, fragment: str) -> None:
+        '''Put a claimed fragment back in the queue without counting the attempt (e.g. on KeyboardInterrupt).'''
+        with self.connection:
+            self.connection.execute(
+                'UPDATE fragments SET status = ?, attempts = MAX(attempts - 1, 0), worker = NULL, started_at = NULL WHERE fragment = ?',
+                (PENDING, fragment),
+            )
+
+    def requeue(self, statuses: Tuple[str, ...] = (RUNNING,)) -> int:
+        '''Reset fragments in `statuses` to pending (e.g. `running` fragments left behind by a crashed single-worker run).'''
+        with self.connection:
+            cursor = self.connection.execute(
+                'UPDATE fragments SET status = ?, worker = NULL, started_at = NULL WHERE status IN ({0})'.format(','.join('?' for _ in statuses)),
+                (PENDING,) + tuple(statuses),
+            )
+            return cursor.rowcount
+
+    def _record(self, fragment: str, status: str, result: Optional[str], error: Optional[str]) -> None:
+        with self.connection:
+            self.connection.execute(
+                'UPDATE fragments SET status = ?, result = ?, error = ?, finished_at = ? WHERE fragment = ?',
+                (status, result, error, time(), fragment),
+            )
+
+    def status(self, fragment: str) -> Optional[str]:
+        row = self.connection.execute('SELECT status FROM fragments WHERE fragment = ?', (fragment,)).fetchone()
+        return row[0] if row else None
+
+    def results(self) -> List[Tuple[str, Any]]:
+        '''(fragment, result) for every successful fragment, in input order.'''
+        return [
+            (fragment, loads(result))
+            for (fragment, result) in self.connection.execute('SELECT fragment, result FROM fragments WHERE status = ? ORDER BY position', (DONE,))
+        ]
+
+    def errors(self) -> List[Tuple[str, str, str]]:
+        return list(
+            self.connection.execute(
+                'SELECT fragment, status, error FROM fragments WHERE status IN (?, ?) ORDER BY position',
+                (FAILED, MOLECULE_RUNNING),
+            )
+        )
+
+    def progress(self, since: Optional[float] = None) -> Progress:
+        '''
+        Counts of the fragments of the journal by status, with the time elapsed and the throughput (successes per second) since `since` (the start of a run).
+        By default, since the first claim of the journal, which includes every previous run (and the time between them).
+        '''
+        counts = dict((status, 0) for status in STATUSES)
+        counts.update(self.connection.execute('SELECT status, COUNT(*) FROM fragments GROUP BY status'))
+        if since is None:
+            since, = self.connection.execute('SELECT MIN(started_at) FROM fragments').fetchone()
+        completed = counts[DONE] + counts[FAILED] + counts[MOLECULE_RUNNING]
+        if since is None:
+            elapsed, n_done = 0.0, 0
+        else:
+            elapsed = time() - since
+            n_done, = self.connection.execute('SELECT COUNT(*) FROM fragments WHERE status = ? AND finished_at >= ?', (DONE, since)).fetchone()
+        return Progress(
+            counts=counts,
+            total=sum(counts.values()),
+            completed=completed,
+            elapsed=elapsed,
+            throughput=(n_done / elapsed if elapsed > 0 else 0.0),
+        )
+
+def read_fragment_list(fh: TextIO) -> List[str]:
+    '''One fragment per line; blank lines, `#` comments and anything after the first whitespace (e.g. a count) are ignored.'''
+    return [
+        line.split()[0]
+        for line in fh
+        if line.strip() and not line.lstrip().startswith('#')
+    ]
+
+def run_batch(
+    journal: Journal,
+    function: Callable[[str], Any],
+    worker: Optional[str] = None,
+    retry_policy: Retry_Policy = DEFAULT_RETRY_POLICY,
+    stale_after: float = DEFAULT_STALE_AFTER,
+    progress_every: int = 10,
+    progress_stream: Optional[TextIO] = stdout,
+    on_success: Optional[Callable[[str, Any], None]] = None,
+    run_start: Optional[float] = None,
+) -> Progress:
+    '''
+    Run `function` on every runnable fragment of `journal` until none is left, recording each outcome as it happens.
+    Fragments still waiting for a retry are left to a later run.
+    `on_success(fragment, result)` is called as soon as each successful result is recorded.
+    Progress (elapsed time and throughput) is reported since `run_start` (by default, the start of this call).
+    '''
+    worker = worker or default_worker_name()
+    run_start = run_start if run_start is not None else time()
+    n_processed = 0
+    while True:
+        fragment = journal.claim(worker, retry_policy=retry_policy, stale_after=stale_after)
+        if fragment is None:
+            break
+        try:
+            result = function(fragment)
+        except KeyboardInterrupt:
+            journal.release(fragment)
+            raise
+        except ATB_Molecule_Running:
+            journal.record_failure(fragment, MOLECULE_RUNNING, format_exc())
+        except Exception:
+            journal.record_failure(fragment, FAILED, format_exc())
+        else:
+            journal.record_success(fragment, result)
+            if on_success is not None:
+                on_success(fragment, result)
+
+        n_processed += 1
+        if progress_stream is not None and progress_every and n_processed % progress_every == 0:
+            print('[{0}] {1}'.format(worker, format_progress(journal.progress(since=run_start))), file=progress_stream)
+    return journal.progress(since=run_start)
+
+def _run_batch_worker(journal_path: str, function: Callable[[str], Any], worker: str, retry_policy: Retry_Policy, stale_after: float, progress_every: int, run_start: float, timings: Any) -> None:
+    '''Worker process of run_batch_with_workers(). If `timings` is a queue, the worker's span timings are sent to it as (durations, outcomes) once it is done.'''
+    histogram_sink = add_sink(Histogram_Sink()) if timings is not None else None
+    try:
+        with Journal(journal_path) as journal:
+            run_batch(journal, function, worker=worker, retry_policy=retry_policy, stale_after=stale_after, progress_every=progress_every, run_start=run_start)
+    finally:
+        if histogram_sink is not None:
+            remove_sink(histogram_sink)
+            timings.put((dict(histogram_sink.durations), {stage: dict(outcomes) for (stage, outcomes) in histogram_sink.outcomes.items()}))
+
+def run_batch_with_workers(
+    journal_path: str,
+    function: Callable[[str], Any],
+    workers: int = 1,
+    retry_policy: Retry_Policy = DEFAULT_RETRY_POLICY,
+    stale_after: float = DEFAULT_STALE_AFTER,
+    progress_every: int = 10,
+) -> Progress:
+    '''
+    Run `workers` processes against the same journal (each with its own SQLite connection).
+    The span timings of the workers are merged into the Histogram_Sinks of the calling process.
+    '''
+    if workers == 1:
+        with Journal(journal_path) as journal:
+            return run_batch(journal, function, retry_policy=retry_policy, stale_after=stale_after, progress_every=progress_every)
+
+    from multiprocessing import Process, Queue
+    from queue import Empty
+
+    histogram_sinks = [sink for sink in SINKS if isinstance(sink, Histogram_Sink)]
+    timings = Queue() if histogram_sinks else None
+    run_start = time()
+    processes = [
+        Process(
+            target=_run_batch_worker,
+            args=(journal_path, function, '{0}/{1}'.format(default_worker_name(), n), retry_policy, stale_after, progress_every, run_start, timings),
+        )
+        for n in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    # Timings are read before joining, as a process only exits once its queued data is consumed (and workers which died without sending any are not waited for)
+    n_timings = 0
+    while timings is not None and n_timings < workers:
+        try:
+            durations, outcomes = timings.get(timeout=1.0)
+        except Empty:
+            if not any(process.is_alive() for process in processes) and timings.empty():
+                break
+        else:
+            for histogram_sink in histogram_sinks:
+                histogram_sink.merge(durations, outcomes)
+            n_timings += 1
+
+    for process in processes:
+        process.join()
+
+    with Journal(journal_path) as journal:
+        return journal.progress(since=run_start)
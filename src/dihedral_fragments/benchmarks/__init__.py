@@ -0,0 +1,102 @@
+from random import Random
+from time import perf_counter
+from typing import Any, Callable, List, Sequence, Tuple
+
+from dihedral_fragments.extraction import Molecular_Graph
+
+BENCHMARK_SEED = 1
+
+BENCHMARK_ELEMENTS = ('C', 'C', 'C', 'H', 'H', 'H', 'N', 'O', 'S', 'CL', 'F', 'P')
+
+def best_time(function: Callable[[], Any], repeat: int = 5, number: int = 1) -> float:
+    '''Best (lowest) wall time per call out of `repeat` timings of `number` calls.'''
+    timings = []
+    for _ in range(repeat):
+        start = perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((perf_counter() - start) / number)
+    return min(timings)
+
+BENCHMARK_CENTRAL_ATOMS = (('C', 'N', 'O', 'S', 'P'), ('C', 'N'))
+
+def random_fragments(
+    n: int,
+    seed: int = BENCHMARK_SEED,
+    cycle_probability: float = 0.2,
+    neighbour_atoms: Sequence[str] = BENCHMARK_ELEMENTS,
+    central_atoms: Tuple[Sequence[str], Sequence[str]] = BENCHMARK_CENTRAL_ATOMS,
+) -> List[str]:
+    '''Deterministic sample of (non-canonical) dihedral fragment strings, some of them cyclic.'''
+    random = Random(seed)
+    fragments = []
+    for _ in range(n):
+        neighbours_1, neighbours_4 = [
+            [random.choice(neighbour_atoms) for _ in range(random.randint(1, 3))]
+            for _ in range(2)
+        ]
+        atom_2, atom_3 = random.choice(central_atoms[0]), random.choice(central_atoms[1])
+        groups = [','.join(neighbours_1), atom_2, atom_3, ','.join(neighbours_4)]
+        if random.random() < cycle_probability:
+            groups.append(
+                '{0}{1}{2}'.format(
+                    random.randrange(len(neighbours_1)),
+                    random.randint(0, 4),
+                    random.randrange(len(neighbours_4)),
+                ),
+            )
+        fragments.append('|'.join(groups))
+    return fragments
+
+def polycyclic_atom_lists(n: int, seed: int = BENCHMARK_SEED, max_neighbours: int = 5, max_cycle_length: int = 6) -> List[Tuple[List[str], str, str, List[str], List[List[int]]]]:
+    '''Deterministic sample of fused polycyclic fragments (as `atom_list`s), with up to one cycle per pair of neighbours.'''
+    random = Random(seed)
+    atom_lists = []
+    for _ in range(n):
+        neighbours_1, neighbours_4 = [
+            [random.choice(('C', 'C', 'C', 'N', 'O')) for _ in range(random.randint(2, max_neighbours))]
+            for _ in range(2)
+        ]
+        pairs = [(i, j) for i in range(len(neighbours_1)) for j in range(len(neighbours_4))]
+        cycles = [
+            [i, random.randint(0, max_cycle_length), j]
+            for (i, j) in random.sample(pairs, random.randint(2, len(pairs)))
+        ]
+        atom_lists.append((neighbours_1, 'C', 'C', neighbours_4, cycles))
+    return atom_lists
+
+HEAVY_ATOM_VALENCES = (('C', 4), ('C', 4), ('C', 4), ('N', 3), ('O', 2), ('S', 2))
+
+def random_molecular_graphs(n: int, seed: int = BENCHMARK_SEED, max_heavy_atoms: int = 20, ring_closure_probability: float = 0.1, min_heavy_atoms: int = 2) -> List[Molecular_Graph]:
+    '''Deterministic sample of random (but valence-respecting) molecules, as hydrogenated heavy atom trees with a few ring closures and random coordinates.'''
+    random = Random(seed)
+    graphs = []
+    for _ in range(n):
+        heavy_atoms = [random.choice(HEAVY_ATOM_VALENCES) for _ in range(random.randint(min_heavy_atoms, max_heavy_atoms))]
+        elements, free_valences, bonds = [element for (element, _) in heavy_atoms], [valence for (_, valence) in heavy_atoms], []
+        for atom in range(1, len(heavy_atoms)):
+            candidates = [other for other in range(atom) if free_valences[other] > 0]
+            if candidates and free_valences[atom] > 0:
+                other = random.choice(candidates)
+                bonds.append((other, atom))
+                free_valences[other] -= 1
+                free_valences[atom] -= 1
+        for atom in range(len(heavy_atoms)):
+            if free_valences[atom] > 0 and random.random() < ring_closure_probability:
+                bonded = {other for bond in bonds if atom in bond for other in bond}
+                candidates = [other for other in range(len(heavy_atoms)) if other not in bonded and free_valences[other] > 0]
+                if candidates:
+                    other = random.choice(candidates)
+                    bonds.append((atom, other))
+                    free_valences[other] -= 1
+                    free_valences[atom] -= 1
+        for atom in range(len(heavy_atoms)):
+            for _ in range(free_valences[atom]):
+                elements.append('H')
+                bonds.append((atom, len(elements) - 1))
+        coordinates = [(random.uniform(-5, 5), random.uniform(-5, 5), random.uniform(-5, 5)) for _ in elements]
+        graphs.append(Molecular_Graph(elements, bonds, coordinates))
+    return graphs
+
+def print_result(name: str, seconds: float, n: int = 1) -> None:
+    print('{0}: {1:.3f} ms total, {2:.2f} us/item (n={3})'.format(name, seconds * 1e3, seconds * 1e6 / n, n))
@@ -0,0 +1,81 @@
+'''
+Binary fragment files: writing, opening (memory mapping), bulk decoding and lookups, compared with loading the same (fragment, count) list from a pickle.
+Also times both paths of `molecule_for_fragment.get_protein_fragments()`: loading the pickle and excluding its cyclic fragments, or opening the binary file and decoding its acyclic fragments only.
+
+    python3 -m dihedral_fragments.benchmarks.binary_format [--n-fragments 10000000]
+'''
+from argparse import ArgumentParser
+from os.path import getsize, join
+from pickle import dump, load
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import numpy as np
+
+from dihedral_fragments.benchmarks import best_time, random_fragments, print_result
+from dihedral_fragments.binary_format import encode_fragments, decode_records, write_records, Fragment_File
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment
+
+N_UNIQUE_FRAGMENTS = 10000
+
+N_DECODED_FRAGMENTS = 100000
+
+N_LOOKUPS = 1000
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument('--n-fragments', type=int, default=1000000, help='Size of the corpus (unique canonical fragments, repeated)')
+    return parser.parse_args()
+
+def main() -> None:
+    args = parse_args()
+    unique_fragments = sorted({str(Dihedral_Fragment(fragment)) for fragment in random_fragments(N_UNIQUE_FRAGMENTS)})
+    n_repeats = -(-args.n_fragments // len(unique_fragments))
+    fragments = (unique_fragments * n_repeats)[:args.n_fragments]
+    counts = np.arange(len(fragments), dtype='<u8')
+
+    print_result('encoding', best_time(lambda: encode_fragments(unique_fragments), repeat=3), n=len(unique_fragments))
+    records = np.tile(encode_fragments(unique_fragments), n_repeats)[:args.n_fragments]
+
+    with TemporaryDirectory() as directory:
+        binary_path, pickle_path = join(directory, 'fragments.bin'), join(directory, 'fragments.pickle')
+
+        start = perf_counter()
+        write_records(binary_path, records, counts=counts)
+        print_result('writing binary file (including sorted index)', perf_counter() - start, n=len(fragments))
+
+        with open(pickle_path, 'wb') as fh:
+            # Distinct string objects, as in a real corpus (pickle would otherwise only store each repeated fragment once)
+            dump([(fragment.encode().decode(), count) for (fragment, count) in zip(fragments, counts.tolist())], fh)
+        print('file sizes: binary {0:.1f} MB, pickle {1:.1f} MB'.format(getsize(binary_path) / 1e6, getsize(pickle_path) / 1e6))
+
+        def load_pickle():
+            with open(pickle_path, 'rb') as fh:
+                return load(fh)
+
+        print_result('loading pickle', best_time(load_pickle, repeat=1), n=len(fragments))
+
+        def load_pickled_acyclic_fragments():
+            return [(fragment, count) for (fragment, count) in load_pickle() if fragment.count('|') == 3]
+
+        print_result('loading pickle and excluding its cyclic fragments', best_time(load_pickled_acyclic_fragments, repeat=1), n=len(fragments))
+        print_result('opening binary file (memory mapped)', best_time(lambda: Fragment_File(binary_path)), n=len(fragments))
+
+        fragment_file = Fragment_File(binary_path)
+        n_decoded = min(N_DECODED_FRAGMENTS, len(fragment_file))
+        print_result('bulk decoding', best_time(lambda: decode_records(fragment_file.records[:n_decoded]), repeat=3), n=n_decoded)
+        assert fragment_file.fragments(0, len(unique_fragments)) == unique_fragments
+
+        def load_acyclic_fragments():
+            binary_file = Fragment_File(binary_path)
+            return binary_file.fragments_with_count_at(binary_file.acyclic_positions())
+
+        n_acyclic = len(fragment_file.acyclic_positions())
+        print_result('opening binary file and decoding its {0} acyclic fragments'.format(n_acyclic), best_time(load_acyclic_fragments, repeat=1), n=n_acyclic)
+
+        queries = unique_fragments[:N_LOOKUPS]
+        print_result('lookups (binary search over the index)', best_time(lambda: [fragment_file.position(fragment) for fragment in queries], repeat=3), n=len(queries))
+        del fragment_file
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+'''
+Computing the canonical, valence-free and chirality-flagged keys of fragments with valences: canonicalisation followed by regex post-processing (which does not re-canonicalise the valence-free key) versus `canonical_keys()`, one by one and in bulk.
+
+    python3 -m dihedral_fragments.benchmarks.canonical_keys
+'''
+from random import Random
+
+from dihedral_fragments.benchmarks import best_time, random_fragments, print_result, BENCHMARK_SEED
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment, canonical_keys, canonical_keys_for_fragments, remove_valences_in_fragment_str, split_group_str, split_neighbour_str, join_groups, join_neighbours
+
+N_FRAGMENTS = 20000
+
+N_DISTINCT_FRAGMENTS = 5000
+
+def with_valences(fragment: str, random: Random) -> str:
+    groups = split_group_str(fragment)
+    for group_index in (0, 3):
+        groups[group_index] = join_neighbours([atom + str(random.randint(1, 4)) for atom in split_neighbour_str(groups[group_index])])
+    return join_groups(groups)
+
+def regex_keys(fragment: str):
+    dihedral_fragment = Dihedral_Fragment(fragment)
+    canonical = str(dihedral_fragment)
+    return (canonical, remove_valences_in_fragment_str(canonical), dihedral_fragment.__str__(flag_chiral_sides=True))
+
+def main() -> None:
+    random = Random(BENCHMARK_SEED)
+    fragments = [with_valences(fragment, random) for fragment in random_fragments(N_FRAGMENTS)]
+    n_wrong = sum(1 for fragment in fragments if regex_keys(fragment)[1] != canonical_keys(fragment).valence_free)
+    print('Regex valence-free keys which are not canonical: {0}/{1}'.format(n_wrong, len(fragments)))
+
+    print_result('canonicalisation + regex post-processing', best_time(lambda: [regex_keys(fragment) for fragment in fragments], repeat=3), n=len(fragments))
+    print_result('canonical_keys()', best_time(lambda: [canonical_keys(fragment) for fragment in fragments], repeat=3), n=len(fragments))
+
+    repeated_fragments = [random.choice(fragments[:N_DISTINCT_FRAGMENTS]) for _ in range(N_FRAGMENTS)]
+    print_result(
+        'canonical_keys_for_fragments() ({0} distinct fragments)'.format(N_DISTINCT_FRAGMENTS),
+        best_time(lambda: canonical_keys_for_fragments(repeated_fragments), repeat=3),
+        n=len(repeated_fragments),
+    )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+'''
+Canonicalisation throughput, with tracing disabled and enabled.
+
+The disabled-tracing overhead is measured by timing the guards themselves (the number of `tracer.debug` checks one canonicalisation goes through) against the time of one canonicalisation.
+
+    python3 -m dihedral_fragments.benchmarks.canonicalisation
+'''
+from timeit import timeit
+
+from dihedral_fragments.benchmarks import best_time, random_fragments, print_result
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment
+from dihedral_fragments.tracing import CANONICALISATION_TRACER, set_level, OFF, DEBUG, clear_trace_records
+
+N_FRAGMENTS = 5000
+
+# flip_fragment_if_necessary(): 1, sort_neighbours_renumber_cycles(): 2 sides + 1 cycle renumbering
+TRACING_GUARDS_PER_CANONICALISATION = 4
+
+def canonise_all(fragments):
+    return [str(Dihedral_Fragment(fragment)) for fragment in fragments]
+
+def main() -> None:
+    fragments = random_fragments(N_FRAGMENTS)
+
+    set_level('canonicalisation', OFF)
+    disabled = best_time(lambda: canonise_all(fragments))
+    print_result('canonicalisation (tracing disabled)', disabled, n=len(fragments))
+
+    set_level('canonicalisation', DEBUG)
+    enabled = best_time(lambda: canonise_all(fragments))
+    print_result('canonicalisation (tracing enabled)', enabled, n=len(fragments))
+    set_level('canonicalisation', OFF)
+    clear_trace_records()
+
+    number = 1000000
+    guard = timeit('tracer.debug', globals=dict(tracer=CANONICALISATION_TRACER), number=number) / number
+    overhead = TRACING_GUARDS_PER_CANONICALISATION * guard / (disabled / len(fragments))
+    print('disabled tracing overhead: {0:.3f}% ({1} guards at {2:.1f} ns each)'.format(100 * overhead, TRACING_GUARDS_PER_CANONICALISATION, guard * 1e9))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+'''
+Building the uncapped molecule's atoms and bonds for every fragment shape (number of neighbours on each side) produced by the fragment enumerator, with and without cycles.
+
+The "per-atom trigonometry" timing reproduces the previous implementation's geometry (one `sqrt`, exact-equality `assert` and list lookups per atom) for comparison.
+
+    python3 -m dihedral_fragments.benchmarks.capping_geometry
+'''
+from itertools import product
+from math import cos, sin, pi, sqrt
+from typing import Dict, List, Tuple
+
+from dihedral_fragments.benchmarks import best_time, print_result
+from dihedral_fragments.capping import uncapped_atoms_and_bonds
+from dihedral_fragments.dihedral_fragment import element_valence_for_atom
+from dihedral_fragments.fragment_generator import enumerated_fragments, ATOMS, number_neighbours
+
+FRAGMENTS_PER_SHAPE = 200
+
+CYCLE_LENGTHS = (0, 1, 2, 3)
+
+def fragments_by_shape(fragments_per_shape: int = FRAGMENTS_PER_SHAPE) -> Dict[Tuple[int, int], List[str]]:
+    max_neighbours = max(max(number_neighbours(atom)) for atom in ATOMS)
+    all_shapes = set(product(range(1, max_neighbours + 1), repeat=2))
+    shapes = {} # type: Dict[Tuple[int, int], List[str]]
+    for fragment in enumerated_fragments():
+        groups = fragment.split('|')
+        shape = (len(groups[0].split(',')), len(groups[3].split(',')))
+        if len(shapes.setdefault(shape, [])) < fragments_per_shape:
+            shapes[shape].append(fragment)
+        if set(shapes) == all_shapes and all(len(fragments) == fragments_per_shape for fragments in shapes.values()):
+            break
+    return shapes
+
+def legacy_atoms_and_bonds(dihedral_fragment: str) -> Tuple[List[Tuple], List[Tuple[int, int]]]:
+    neighbours_1, atom_2, atom_3, neighbours_4 = dihedral_fragment.split('|')[:4]
+    neighbours_1, neighbours_4 = neighbours_1.split(','), neighbours_4.split(',')
+    ids = [n for (n, _) in enumerate(neighbours_1 + [atom_2, atom_3] + neighbours_4, start=1)]
+    neighbours_id_1, atom_id_2, atom_id_3, neighbours_id_4 = ids[0:len(neighbours_1)], ids[len(neighbours_1)], ids[len(neighbours_1) + 1], ids[len(neighbours_1) + 2:]
+    elements = dict(zip(ids, [element_valence_for_atom(neighbour)[0] for neighbour in neighbours_1] + [atom_2, atom_3] + [element_valence_for_atom(neighbour)[0] for neighbour in neighbours_4]))
+    valences = dict(zip(ids, [element_valence_for_atom(neighbour)[1] for neighbour in neighbours_1] + [len(neighbours_1) + 1, len(neighbours_4) + 1] + [element_valence_for_atom(neighbour)[1] for neighbour in neighbours_4]))
+    bonds = [(neighbour_id, atom_id_2) for neighbour_id in neighbours_id_1] + [(atom_id_2, atom_id_3)] + [(atom_id_3, neighbour_id) for neighbour_id in neighbours_id_4]
+
+    def coordinates_for_atom_id(atom_id: int, d: float = 1.5) -> Tuple[float, float, float]:
+        if atom_id == atom_id_2:
+            return (-d / 2, 0, 0)
+        elif atom_id == atom_id_3:
+            return (d / 2, 0, 0)
+        else:
+            e = 0.5 * d
+            f = sqrt(d ** 2 - e ** 2)
+            assert e ** 2 + f ** 2 == d ** 2, (e ** 2 + f ** 2, d ** 2)
+            if atom_id in neighbours_id_1:
+                left_theta = 2 * pi / len(neighbours_id_1) * neighbours_id_1.index(atom_id)
+                return (-d /2 - e, -f * cos(left_theta), f * sin(left_theta))
+            else:
+                right_theta = 2 * pi / len(neighbours_id_4) * neighbours_id_4.index(atom_id)
+                return (d / 2 + e, f * cos(right_theta), f * sin(right_theta))
+
+    atoms = [
+        (atom_id, elements[atom_id], valences[atom_id], atom_id not in (neighbours_id_1 + neighbours_id_4), coordinates_for_atom_id(atom_id))
+        for atom_id in ids
+    ]
+    return (atoms, bonds)
+
+def main() -> None:
+    shapes = fragments_by_shape()
+    for (shape, fragments) in sorted(shapes.items()):
+        cyclic_fragments = [fragment + '|0{0}0'.format(n) for fragment in fragments for n in CYCLE_LENGTHS]
+        print_result('{0} legacy per-atom trigonometry'.format(shape), best_time(lambda: [legacy_atoms_and_bonds(fragment) for fragment in fragments]), n=len(fragments))
+        print_result('{0} coordinate template'.format(shape), best_time(lambda: [uncapped_atoms_and_bonds(fragment) for fragment in fragments]), n=len(fragments))
+        print_result('{0} coordinate template (cyclic)'.format(shape), best_time(lambda: [uncapped_atoms_and_bonds(fragment) for fragment in cyclic_fragments]), n=len(cyclic_fragments))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+'''
+Capping throughput on protein-like (acyclic) fragments: a full ILP solve per fragment versus a Capping_Solution_Cache, which reuses the caps of fragments with the same problem or the same halves.
+The stand-in solver caps every neighbour with hydrogens, and pays `STAND_IN_SECONDS_PER_UNCAPPED_ATOM` per neighbour it caps (full solve) or `STAND_IN_CAPPED_SECONDS` to assign bond orders and charges of a molecule whose caps are given.
+
+    python3 -m dihedral_fragments.benchmarks.capping_reuse
+'''
+from collections import Counter
+from time import sleep
+from typing import Dict, List, Tuple
+
+from dihedral_fragments.benchmarks import best_time, print_result, random_fragments
+from dihedral_fragments.capping import Atom_Spec, uncapped_atoms_and_bonds
+from dihedral_fragments.capping_reuse import Capping_Solution_Cache, capped_atoms_and_bonds
+from dihedral_fragments.dihedral_fragment import Fragment
+
+N_FRAGMENTS = 300
+
+STAND_IN_SECONDS_PER_UNCAPPED_ATOM = 0.002
+
+STAND_IN_CAPPED_SECONDS = 0.0005
+
+PROTEIN_NEIGHBOUR_ATOMS = ('C', 'C', 'C', 'H', 'H', 'H', 'N', 'O', 'S')
+
+PROTEIN_CENTRAL_ATOMS = (('C', 'N'), ('C', 'N'))
+
+STANDARD_VALENCES = {'C': 4, 'N': 3, 'O': 2, 'S': 2, 'P': 4}
+
+class Stand_In_Molecule(object):
+    def __init__(self, atoms: List[Atom_Spec], bonds: List[Tuple[int, int]]) -> None:
+        self.atoms = {atom.index: atom for atom in atoms} # type: Dict[int, Atom_Spec]
+        self.bonds = bonds
+
+    def formula(self) -> str:
+        return ''.join('{0}{1}'.format(element, n) for (element, n) in sorted(Counter(atom.element for atom in self.atoms.values()).items()))
+
+    def netcharge(self) -> int:
+        return 0
+
+def stand_in_solve(fragment: Fragment, debug: bool = False) -> Stand_In_Molecule:
+    '''Caps every neighbour with as many hydrogens as its (standard) valence allows.'''
+    atoms, _, _ = uncapped_atoms_and_bonds(fragment)
+    uncapped_atoms = [atom for atom in atoms if not atom.capped]
+    sleep(STAND_IN_SECONDS_PER_UNCAPPED_ATOM * len(uncapped_atoms))
+    return Stand_In_Molecule(
+        *capped_atoms_and_bonds(
+            fragment,
+            {
+                atom.index: (('H', -1),) * ((atom.valence or STANDARD_VALENCES.get(atom.element, 1)) - 1)
+                for atom in uncapped_atoms
+            },
+        )
+    )
+
+def stand_in_solve_capped(fragment: Fragment, atoms: List[Atom_Spec], bonds: List[Tuple[int, int]], debug: bool = False) -> Stand_In_Molecule:
+    sleep(STAND_IN_CAPPED_SECONDS)
+    return Stand_In_Molecule(atoms, bonds)
+
+def main() -> None:
+    fragments = random_fragments(N_FRAGMENTS, cycle_probability=0, neighbour_atoms=PROTEIN_NEIGHBOUR_ATOMS, central_atoms=PROTEIN_CENTRAL_ATOMS)
+    print('{0} fragments, {1} distinct'.format(len(fragments), len(set(fragments))))
+
+    print_result('full solve per fragment', best_time(lambda: [stand_in_solve(fragment) for fragment in fragments], repeat=1), n=N_FRAGMENTS)
+    for verify in (False, True):
+        capping_solution_cache = Capping_Solution_Cache(verify=verify, solve=stand_in_solve, solve_capped=stand_in_solve_capped)
+        print_result('Capping_Solution_Cache(verify={0})'.format(verify), best_time(lambda: [capping_solution_cache.best_capped_molecule(fragment) for fragment in fragments], repeat=1), n=N_FRAGMENTS)
+        print('  {0}'.format(capping_solution_cache.summary()))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+'''
+Parsing and serialisation of cycle strings: compact (three digits) versus extended (dot-separated) encoding, compared with the previous digit-only code.
+
+    python3 -m dihedral_fragments.benchmarks.cycle_encoding
+'''
+from random import Random
+
+from dihedral_fragments.benchmarks import best_time, print_result, BENCHMARK_SEED
+from dihedral_fragments.dihedral_fragment import Cycle, Small_Cycle, cycle_for_str, str_for_cycle
+
+N_CYCLES = 100000
+
+def legacy_cycle_for_str(cycle_str: str) -> Cycle:
+    return Small_Cycle(*list(map(int, cycle_str)))
+
+def legacy_str_for_cycle(cycle: Cycle) -> str:
+    return ''.join(map(str, cycle))
+
+def main() -> None:
+    random = Random(BENCHMARK_SEED)
+    small_cycles = [Cycle(random.randrange(5), random.randint(0, 6), random.randrange(5)) for _ in range(N_CYCLES)]
+    large_cycles = [Cycle(random.randrange(15), random.randint(10, 30), random.randrange(15)) for _ in range(N_CYCLES)]
+
+    small_cycle_strs = [legacy_str_for_cycle(cycle) for cycle in small_cycles]
+    large_cycle_strs = [str_for_cycle(cycle) for cycle in large_cycles]
+
+    print_result('legacy parsing (compact)', best_time(lambda: [legacy_cycle_for_str(cycle_str) for cycle_str in small_cycle_strs]), n=N_CYCLES)
+    print_result('parsing (compact)', best_time(lambda: [cycle_for_str(cycle_str) for cycle_str in small_cycle_strs]), n=N_CYCLES)
+    print_result('parsing (extended)', best_time(lambda: [cycle_for_str(cycle_str) for cycle_str in large_cycle_strs]), n=N_CYCLES)
+
+    print_result('legacy serialisation (compact)', best_time(lambda: [legacy_str_for_cycle(cycle) for cycle in small_cycles]), n=N_CYCLES)
+    print_result('serialisation (compact)', best_time(lambda: [str_for_cycle(cycle) for cycle in small_cycles]), n=N_CYCLES)
+    print_result('serialisation (extended)', best_time(lambda: [str_for_cycle(cycle) for cycle in large_cycles]), n=N_CYCLES)
+
+if __name__ == '__main__':
+    main()
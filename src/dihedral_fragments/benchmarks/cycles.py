@@ -0,0 +1,102 @@
+'''
+Canonicalisation of fused polycyclic fragments (many cycles per fragment), compared with the previous quadratic cycle handling.
+
+    python3 -m dihedral_fragments.benchmarks.cycles
+'''
+from collections import defaultdict
+from functools import reduce
+from typing import Any, Dict, List, Sequence, Tuple
+
+from dihedral_fragments.benchmarks import best_time, polycyclic_atom_lists, print_result
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment, Cycle, DESC
+
+N_FRAGMENTS = 2000
+
+class Legacy_Cycles_Dihedral_Fragment(Dihedral_Fragment):
+    '''Previous implementation of the cycle handling (equivalence partition against every class representative, per-neighbour rescans of all cycles).'''
+    def canonise_cycles(self: Any) -> None:
+        if len(self.cycles) in (0, 1):
+            pass
+        else:
+            def reorder_equivalent_cycles(cycles: Sequence[Cycle]) -> List[Cycle]:
+                Is, Ns, Js = list(zip(*cycles))
+                return [
+                    Cycle(i, n, j)
+                    for (i, n, j) in
+                    zip(
+                        *list(map(
+                            sorted,
+                            (Is, Ns, Js),
+                        ))
+                    )
+                ]
+
+            def are_cycle_equivalent(*cycles: List[Cycle]) -> bool:
+                return (
+                    len({cycle.n for cycle in cycles}) == 1
+                    and
+                    (
+                        len({self.neighbours_1[cycle.i] for cycle in cycles}) == 1
+                        or
+                        len({self.neighbours_4[cycle.j] for cycle in cycles}) == 1
+                    )
+                )
+
+            def equivalence_partition(iterable, relation):
+                classes = defaultdict(set)
+                for element in iterable:
+                    for sample, known in classes.items():
+                        if relation(sample, element):
+                            known.add(element)
+                            break
+                    else:
+                        classes[element].add(element)
+                return list(classes.values())
+
+            equivalent_cycles = sorted(
+                equivalence_partition(self.cycles, are_cycle_equivalent),
+                key=lambda group: list(group)[0].n,
+            )
+
+            self.cycles = reduce(
+                lambda acc, e: acc + list(e),
+                map(reorder_equivalent_cycles, equivalent_cycles),
+                [],
+            )
+
+    def ring_connectivities(self, side: str) -> Dict[int, Tuple[int, int]]:
+        def ring_connectivity(i: int) -> Tuple[int, int]:
+            connectivity = len(
+                tuple(
+                    1
+                    for cycle in self.cycles
+                    if int(i) == int(getattr(cycle, 'i' if side == 'left' else 'j'))
+                )
+            )
+
+            sum_of_lengths = sum(
+                DESC(cycle.n)
+                for cycle in self.cycles
+                if int(i) == int(getattr(cycle, 'i' if side == 'left' else 'j'))
+            )
+
+            return (connectivity, sum_of_lengths)
+
+        return {
+            i: ring_connectivity(i)
+            for i in range(len(self.neighbours_1 if side == 'left' else self.neighbours_4))
+        }
+
+def main() -> None:
+    for max_neighbours in (3, 4, 5):
+        atom_lists = polycyclic_atom_lists(N_FRAGMENTS, max_neighbours=max_neighbours)
+        n_cycles = sum(len(atom_list[4]) for atom_list in atom_lists) / len(atom_lists)
+        for (name, fragment_class) in (('legacy', Legacy_Cycles_Dihedral_Fragment), ('hash-based', Dihedral_Fragment)):
+            print_result(
+                '{0} polycyclic canonicalisation (<= {1} neighbours, {2:.1f} cycles on average)'.format(name, max_neighbours, n_cycles),
+                best_time(lambda: [str(fragment_class(atom_list=atom_list)) for atom_list in atom_lists], repeat=3),
+                n=len(atom_lists),
+            )
+
+if __name__ == '__main__':
+    main()
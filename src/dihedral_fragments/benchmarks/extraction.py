@@ -0,0 +1,42 @@
+'''
+Extracting every canonical dihedral fragment of a set of random molecules from PDB files: parsing, then extraction with and without coordinates, with a Fragment_Extractor shared by every molecule (or one per molecule).
+
+    python3 -m dihedral_fragments.benchmarks.extraction [--n-molecules 10000]
+'''
+from argparse import ArgumentParser
+from os.path import join
+from tempfile import TemporaryDirectory
+
+from dihedral_fragments.benchmarks import best_time, random_molecular_graphs, print_result
+from dihedral_fragments.extraction import Fragment_Extractor, dihedral_fragments_for_graph, molecular_graph_for_pdb_file, pdb_str_for_molecular_graph
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument('--n-molecules', type=int, default=10000)
+    return parser.parse_args()
+
+def main() -> None:
+    args = parse_args()
+    graphs = random_molecular_graphs(args.n_molecules)
+
+    with TemporaryDirectory() as directory:
+        pdb_files = [join(directory, '{0}.pdb'.format(n)) for n in range(len(graphs))]
+        for (pdb_file, graph) in zip(pdb_files, graphs):
+            with open(pdb_file, 'w') as fh:
+                fh.write(pdb_str_for_molecular_graph(graph))
+
+        pdb_graphs = []
+        print_result('PDB parsing', best_time(lambda: pdb_graphs.extend(molecular_graph_for_pdb_file(pdb_file) for pdb_file in pdb_files), repeat=1), n=len(pdb_files))
+
+    n_fragments = sum(len(dihedral_fragments_for_graph(graph)) for graph in pdb_graphs)
+    print('{0:.1f} central bonds per molecule'.format(n_fragments / len(pdb_graphs)))
+    print_result('extraction (with coordinates, one Fragment_Extractor per molecule)', best_time(lambda: [dihedral_fragments_for_graph(graph) for graph in pdb_graphs], repeat=1), n=len(pdb_graphs))
+    print_result('extraction (with coordinates)', best_time(lambda: Fragment_Extractor().dihedral_fragments_for_graphs(pdb_graphs), repeat=1), n=len(pdb_graphs))
+    print_result(
+        'extraction (without coordinates)',
+        best_time(lambda: Fragment_Extractor().dihedral_fragments_for_graphs(graph._replace(coordinates=None) for graph in pdb_graphs), repeat=1),
+        n=len(pdb_graphs),
+    )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+'''
+Dihedral angles of a trajectory (random moves of a large random molecule): one Python call per dihedral and frame versus a single vectorised call, then canonical fragments for every frame (full canonicalisation versus Fragment_Extractor).
+
+    python3 -m dihedral_fragments.benchmarks.geometry [--n-frames 1000]
+'''
+from argparse import ArgumentParser
+from math import atan2, degrees, sqrt
+
+import numpy as np
+
+from dihedral_fragments.benchmarks import best_time, random_molecular_graphs, print_result, BENCHMARK_SEED
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment
+from dihedral_fragments.extraction import Fragment_Extractor, fragment_topologies, topology_quadruples, topology_dihedral_angles
+from dihedral_fragments.geometry import dihedral_angles
+
+N_HEAVY_ATOMS = 300
+
+def python_dihedral_angle(p0, p1, p2, p3) -> float:
+    b0, b1, b2 = [a - b for (a, b) in zip(p0, p1)], [a - b for (a, b) in zip(p2, p1)], [a - b for (a, b) in zip(p3, p2)]
+    norm = sqrt(sum(x * x for x in b1))
+    b1 = [x / norm for x in b1]
+    v = [x - sum(a * b for (a, b) in zip(b0, b1)) * y for (x, y) in zip(b0, b1)]
+    w = [x - sum(a * b for (a, b) in zip(b2, b1)) * y for (x, y) in zip(b2, b1)]
+    b1_cross_v = (b1[1] * v[2] - b1[2] * v[1], b1[2] * v[0] - b1[0] * v[2], b1[0] * v[1] - b1[1] * v[0])
+    return degrees(atan2(sum(x * y for (x, y) in zip(b1_cross_v, w)), sum(x * y for (x, y) in zip(v, w))))
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument('--n-frames', type=int, default=1000)
+    return parser.parse_args()
+
+def main() -> None:
+    args = parse_args()
+    graph, = random_molecular_graphs(1, max_heavy_atoms=N_HEAVY_ATOMS)
+    random = np.random.RandomState(BENCHMARK_SEED)
+    trajectory = np.array(graph.coordinates) + np.cumsum(random.normal(scale=0.05, size=(args.n_frames, len(graph.elements), 3)), axis=0)
+    topologies = fragment_topologies(graph)
+    quadruples = topology_quadruples(topologies)
+    print('{0} atoms, {1} central bonds, {2} dihedrals, {3} frames'.format(len(graph.elements), len(topologies), len(quadruples), args.n_frames))
+
+    frames = trajectory.tolist()
+    python_seconds = best_time(lambda: [[python_dihedral_angle(*[frame[atom] for atom in quadruple]) for quadruple in quadruples] for frame in frames], repeat=1)
+    print_result('dihedral angles (Python loop)', python_seconds, n=args.n_frames * len(quadruples))
+    numpy_seconds = best_time(lambda: dihedral_angles(trajectory, quadruples), repeat=3)
+    print_result('dihedral angles (vectorised)', numpy_seconds, n=args.n_frames * len(quadruples))
+
+    n_canonicalised_frames = min(args.n_frames, 50)
+    frame_angles = dihedral_angles(trajectory[:n_canonicalised_frames], quadruples).tolist()
+    print_result(
+        'fragments per frame (full canonicalisation)',
+        best_time(
+            lambda: [
+                [str(Dihedral_Fragment(atom_list=topology.atom_list, dihedral_angles=angles)) for (topology, angles) in zip(topologies, topology_dihedral_angles(topologies, angles_for_frame))]
+                for angles_for_frame in frame_angles
+            ],
+            repeat=1,
+        ),
+        n=n_canonicalised_frames,
+    )
+    print_result('fragments per frame (Fragment_Extractor)', best_time(lambda: Fragment_Extractor().dihedral_fragments_for_frames(graph, trajectory), repeat=1), n=args.n_frames)
+
+if __name__ == '__main__':
+    main()
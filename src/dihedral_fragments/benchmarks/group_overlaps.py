@@ -0,0 +1,38 @@
+'''
+Overlaps between the CHEMICAL_GROUPS and their coverage of the acyclic fragments of `fragment_generator`: symbolic analysis versus tagging (a sample of) the enumerated fragments by brute force.
+
+    python3 -m dihedral_fragments.benchmarks.group_overlaps
+'''
+from itertools import islice
+
+from dihedral_fragments.benchmarks import best_time, print_result
+from dihedral_fragments.fragment_generator import enumerated_fragments
+from dihedral_fragments.group_overlaps import Overlap_Analyser
+from dihedral_fragments.tag_predictor import chemical_groups_matching_patterns
+
+N_BRUTE_FORCE_FRAGMENTS = 20000
+
+def brute_force_tags(fragments):
+    matchers = chemical_groups_matching_patterns()
+    return [[moiety for (moiety, matcher) in matchers if matcher(fragment)] for fragment in fragments]
+
+def main() -> None:
+    overlap_analyser = Overlap_Analyser()
+    print_result('building the boxes of {0} groups'.format(len(overlap_analyser.side_boxes)), best_time(Overlap_Analyser, repeat=3), n=1)
+    print_result('overlaps()', best_time(overlap_analyser.overlaps, repeat=3), n=1)
+    print_result('coverage()', best_time(overlap_analyser.coverage, repeat=3), n=1)
+    print_result('full analysis', best_time(lambda: (lambda analyser: (analyser.overlaps(), analyser.coverage()))(Overlap_Analyser()), repeat=3), n=1)
+
+    coverage = overlap_analyser.coverage()
+    print('{0} overlapping pairs; {1} fragments, {2} tagged, {3} by several groups'.format(len(overlap_analyser.overlaps()), *coverage[:3]))
+
+    # Enumerating and tagging (with duplicates, as `fragment_generator.main()` used to) a prefix of the space, extrapolated to all of it
+    n_enumerated = sum(1 for _ in enumerated_fragments())
+    print_result('enumerating fragments', best_time(lambda: sum(1 for _ in enumerated_fragments()), repeat=1), n=n_enumerated)
+    fragments = list(islice(enumerated_fragments(), N_BRUTE_FORCE_FRAGMENTS))
+    seconds = best_time(lambda: brute_force_tags(fragments), repeat=1)
+    print_result('brute-force tagging', seconds, n=len(fragments))
+    print('~{0:.0f} s to tag all {1} enumerated fragments'.format(seconds * n_enumerated / len(fragments), n_enumerated))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+'''
+Improper canonicalisation (one by one, in bulk, with improper angles) and pattern matching throughput.
+
+    python3 -m dihedral_fragments.benchmarks.improper
+'''
+from random import Random
+
+from dihedral_fragments.benchmarks import best_time, print_result, BENCHMARK_SEED, BENCHMARK_ELEMENTS
+from dihedral_fragments.improper import Improper, canonical_impropers, improper_pattern_matching_for
+
+N_IMPROPERS = 20000
+
+PATTERNS = ('C|O,%', 'C|O,X,J', 'N|J{3}', 'C|!H,H,H', 'P|O{3}')
+
+def main() -> None:
+    random = Random(BENCHMARK_SEED)
+    impropers = [
+        '{0}|{1}'.format(random.choice(('C', 'N', 'P')), ','.join(random.choice(BENCHMARK_ELEMENTS) for _ in range(3)))
+        for _ in range(N_IMPROPERS)
+    ]
+    improper_angles = [[random.uniform(-180, 180) for _ in range(3)] for _ in impropers]
+
+    print_result('canonicalisation', best_time(lambda: [str(Improper(improper_str=improper)) for improper in impropers], repeat=3), n=len(impropers))
+    print_result('bulk canonicalisation (deduplicated)', best_time(lambda: canonical_impropers(impropers), repeat=3), n=len(impropers))
+    print_result('stereo-aware canonicalisation', best_time(lambda: canonical_impropers(impropers, improper_angles=improper_angles), repeat=3), n=len(impropers))
+
+    canonical_forms = canonical_impropers(impropers)
+    matchers = [improper_pattern_matching_for(pattern) for pattern in PATTERNS]
+    print_result(
+        'pattern matching ({0} patterns)'.format(len(PATTERNS)),
+        best_time(lambda: [[matcher(improper) for matcher in matchers] for improper in canonical_forms], repeat=3),
+        n=len(canonical_forms),
+    )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+'''
+Chemical group queries over a vocabulary of canonical fragments: materialised bitsets versus scanning the vocabulary with pattern matchers, combined queries, ad-hoc patterns (cold and cached) and incremental growth.
+
+    python3 -m dihedral_fragments.benchmarks.materialisation
+'''
+from dihedral_fragments.benchmarks import best_time, random_fragments, print_result, BENCHMARK_SEED
+from dihedral_fragments.chemistry import CHEMICAL_GROUPS
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment
+from dihedral_fragments.materialisation import Group_Materialisation
+from dihedral_fragments.pattern_matching import re_pattern_matching_for
+
+N_DRAWS = 40000
+
+N_ADDED_DRAWS = 4000
+
+COMBINED_QUERIES = (
+    '(alcohol I OR alcohol II) AND NOT "%|C|C|%"',
+    'chloro OR bromo OR monofluoro',
+    'amide AND NOT (ester OR ketone)',
+)
+
+AD_HOC_PATTERNS = ('J|C|C|J', 'N,%|C|C|%', 'O|C|C|C,C,C')
+
+def vocabulary(n: int, seed: int = BENCHMARK_SEED):
+    return list(dict.fromkeys(str(Dihedral_Fragment(fragment)) for fragment in random_fragments(n, seed=seed)))
+
+def scan(fragments, pattern):
+    matcher = re_pattern_matching_for(pattern)
+    return [fragment for fragment in fragments if matcher(fragment)]
+
+def main() -> None:
+    fragments = vocabulary(N_DRAWS)
+    group_materialisation = Group_Materialisation()
+    print_result(
+        'materialising {0} groups'.format(len(group_materialisation.groups)),
+        best_time(lambda: Group_Materialisation(fragments), repeat=1),
+        n=len(fragments),
+    )
+    group_materialisation.add_fragments(fragments)
+
+    moieties = [moiety for (moiety, _) in CHEMICAL_GROUPS]
+    print_result('scanning for every group', best_time(lambda: [scan(fragments, pattern) for (_, pattern) in CHEMICAL_GROUPS], repeat=1), n=len(moieties))
+    print_result('materialised group queries', best_time(lambda: [group_materialisation.fragments_matching('"{0}"'.format(moiety)) for moiety in moieties], repeat=3), n=len(moieties))
+    print_result('materialised group counts', best_time(lambda: [group_materialisation.count('"{0}"'.format(moiety)) for moiety in moieties], repeat=3), n=len(moieties))
+    print_result('combined queries (counts)', best_time(lambda: [group_materialisation.count(query) for query in COMBINED_QUERIES], repeat=3), n=len(COMBINED_QUERIES))
+
+    print_result(
+        'ad-hoc patterns (cold)',
+        best_time(lambda: (group_materialisation.patterns.clear(), [group_materialisation.count(pattern) for pattern in AD_HOC_PATTERNS]), repeat=3),
+        n=len(AD_HOC_PATTERNS),
+    )
+    print_result('ad-hoc patterns (cached)', best_time(lambda: [group_materialisation.count(pattern) for pattern in AD_HOC_PATTERNS], repeat=3), n=len(AD_HOC_PATTERNS))
+
+    added_fragments = [fragment for fragment in vocabulary(N_ADDED_DRAWS, seed=BENCHMARK_SEED + 1) if fragment not in group_materialisation.fragment_ids]
+    print_result(
+        'adding {0} fragments, then the cached patterns'.format(len(added_fragments)),
+        best_time(lambda: (group_materialisation.add_fragments(added_fragments), [group_materialisation.count(pattern) for pattern in AD_HOC_PATTERNS]), repeat=1),
+        n=len(added_fragments),
+    )
+    print('{0} fragments'.format(len(group_materialisation)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+'''
+Energy minimisation latency per fragment: spawning a (stand-in) minimiser process per PDB, as `molecule.energy_minimised_pdb()` did, versus a Minimisation_Stage's long-lived workers (one PDB at a time, batches, and cache hits).
+The stand-in pays a start-up cost (`STAND_IN_START_UP` seconds, e.g. loading force fields) once per process, then `STAND_IN_SECONDS_PER_PDB` per PDB.
+
+    python3 -m dihedral_fragments.benchmarks.minimisation
+'''
+from subprocess import run
+from sys import executable, stdin, stdout
+from tempfile import TemporaryDirectory
+from time import sleep
+
+from dihedral_fragments.benchmarks import best_time, print_result
+from dihedral_fragments.minimisation import Minimisation_Stage
+
+N_PDBS = 40
+
+STAND_IN_START_UP = 0.05
+
+STAND_IN_SECONDS_PER_PDB = 0.002
+
+STARTED_UP = False
+
+def stand_in_minimiser(pdb: str) -> str:
+    global STARTED_UP
+    if not STARTED_UP:
+        sleep(STAND_IN_START_UP)
+        STARTED_UP = True
+    sleep(STAND_IN_SECONDS_PER_PDB)
+    return 'REMARK minimised\n' + pdb
+
+def spawned_stand_in_minimiser(pdb: str) -> str:
+    return run([executable, '-m', 'dihedral_fragments.benchmarks.minimisation', '--stand-in'], input=pdb, capture_output=True, text=True, check=True).stdout
+
+def benchmark_pdbs(n: int, tag: str = 'UNL'):
+    return ['HETATM    1  C   {0}  {1:5d}       0.000   0.000   0.000  1.00  0.00           C\nEND\n'.format(tag, n) for n in range(n)]
+
+def main() -> None:
+    pdbs = benchmark_pdbs(N_PDBS)
+    print_result('spawning a minimiser per PDB', best_time(lambda: [spawned_stand_in_minimiser(pdb) for pdb in pdbs], repeat=1), n=N_PDBS)
+
+    for processes in (1, 4):
+        with TemporaryDirectory() as directory, Minimisation_Stage(stand_in_minimiser, processes=processes, cache_directory=directory) as minimisation_stage:
+            print_result('starting {0} worker(s)'.format(processes), best_time(lambda: minimisation_stage.minimise(benchmark_pdbs(processes, tag='WRM'), chunksize=1), repeat=1), n=1)
+            print_result('stage ({0} worker(s)), one PDB at a time'.format(processes), best_time(lambda: [minimisation_stage.minimise_one(pdb) for pdb in pdbs], repeat=1), n=N_PDBS)
+            new_pdbs = benchmark_pdbs(N_PDBS, tag='NEW')
+            print_result('stage ({0} worker(s)), one batch'.format(processes), best_time(lambda: minimisation_stage.minimise(new_pdbs), repeat=1), n=N_PDBS)
+            print_result('stage ({0} worker(s)), cached'.format(processes), best_time(lambda: minimisation_stage.minimise(pdbs), repeat=3), n=N_PDBS)
+
+if __name__ == '__main__':
+    from sys import argv
+    if '--stand-in' in argv:
+        stdout.write(stand_in_minimiser(stdin.read()))
+    else:
+        main()
@@ -0,0 +1,90 @@
+'''
+Fragment and tag posting lists (roaring bitmaps) over a million molecules: building, serialising and memory-mapping them, and queries such as "molecules containing both `O,C|C|O|H` and a nitro group", versus scanning every molecule's list of fragments.
+
+    python3 -m dihedral_fragments.benchmarks.posting_lists
+'''
+from os.path import join
+from tempfile import TemporaryDirectory
+
+import numpy as np
+
+from dihedral_fragments.benchmarks import best_time, random_fragments, print_result, BENCHMARK_SEED
+from dihedral_fragments.benchmarks.tagging import unambiguous
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment
+from dihedral_fragments.posting_lists import Posting_File, molecules_with_all, molecules_with_any, posting_lists_for_pairs, tag_posting_lists
+from dihedral_fragments.tagging import Tagging_Service
+
+N_MOLECULES = 1000000
+
+N_SCANNED_MOLECULES = 100000
+
+MEAN_FRAGMENTS_PER_MOLECULE = 15
+
+# Fragment popularities follow a Zipf law, the fragments below being given these popularity ranks
+CARBOXYLIC_ACID, NITRO, AMIDE = str(Dihedral_Fragment('O,C|C|O|H')), str(Dihedral_Fragment('H,H,H|C|N|O,O')), str(Dihedral_Fragment('C,H,H|C|N|O,O'))
+
+RANKED_FRAGMENTS = ((CARBOXYLIC_ACID, 40), (NITRO, 300), (AMIDE, 1000))
+
+def molecule_fragment_pairs(n_molecules: int, seed: int = BENCHMARK_SEED):
+    ranked_fragments = dict(RANKED_FRAGMENTS)
+    keys = [
+        fragment
+        for fragment in dict.fromkeys(str(Dihedral_Fragment(fragment)) for fragment in random_fragments(30000, seed=seed))
+        if fragment not in ranked_fragments and unambiguous(fragment)
+    ]
+    for (fragment, rank) in RANKED_FRAGMENTS:
+        keys.insert(rank, fragment)
+
+    random_state = np.random.default_rng(seed)
+    n_fragments = random_state.poisson(MEAN_FRAGMENTS_PER_MOLECULE, size=n_molecules)
+    molecule_ids = np.repeat(np.arange(n_molecules, dtype=np.uint32), n_fragments)
+    key_ids = (random_state.zipf(1.1, size=len(molecule_ids)) - 1) % len(keys)
+    return (molecule_ids, key_ids, keys)
+
+def main() -> None:
+    molecule_ids, key_ids, keys = molecule_fragment_pairs(N_MOLECULES)
+    print('{0} molecules, {1} (molecule, fragment) pairs, {2} fragments'.format(N_MOLECULES, len(molecule_ids), len(keys)))
+
+    posting_lists = posting_lists_for_pairs(molecule_ids, key_ids, keys)
+    print_result('building fragment posting lists', best_time(lambda: posting_lists_for_pairs(molecule_ids, key_ids, keys), repeat=1), n=len(molecule_ids))
+
+    tagging_service = Tagging_Service()
+    tagging_service.tags_for_fragments(posting_lists.keys())
+    tags = tag_posting_lists(posting_lists, tagging_service.fragments_for_tag)
+    print_result('building tag posting lists', best_time(lambda: tag_posting_lists(posting_lists, tagging_service.fragments_for_tag), repeat=1), n=len(tags))
+    print('{0} molecules with {1}, {2} with a nitro group'.format(len(posting_lists.bitmap(CARBOXYLIC_ACID)), CARBOXYLIC_ACID, len(tags.bitmap('nitro'))))
+
+    query = lambda: posting_lists.bitmap(CARBOXYLIC_ACID) & tags.bitmap('nitro')
+    print('{0} molecules with both'.format(len(query())))
+    print_result('"{0}" AND nitro'.format(CARBOXYLIC_ACID), best_time(query, repeat=5, number=20), n=1)
+    print_result('"{0}" AND nitro (count)'.format(CARBOXYLIC_ACID), best_time(lambda: len(query()), repeat=5, number=20), n=1)
+    print_result('"{0}" ANDNOT nitro'.format(CARBOXYLIC_ACID), best_time(lambda: posting_lists.bitmap(CARBOXYLIC_ACID) - tags.bitmap('nitro'), repeat=5, number=20), n=1)
+    print_result('molecules_with_all() (3 fragments)', best_time(lambda: molecules_with_all(posting_lists, [CARBOXYLIC_ACID, NITRO, AMIDE]), repeat=5, number=20), n=1)
+    print_result('molecules_with_any() (3 fragments)', best_time(lambda: molecules_with_any(posting_lists, [CARBOXYLIC_ACID, NITRO, AMIDE]), repeat=5, number=20), n=1)
+
+    nitro_fragments = tagging_service.fragments_for_tag['nitro']
+    scanned_molecules = [[] for _ in range(N_SCANNED_MOLECULES)]
+    n_scanned_pairs = int(np.searchsorted(molecule_ids, N_SCANNED_MOLECULES))
+    for (molecule_id, key_id) in zip(molecule_ids[:n_scanned_pairs].tolist(), key_ids[:n_scanned_pairs].tolist()):
+        scanned_molecules[molecule_id].append(keys[key_id])
+    print_result(
+        'scanning fragment lists ({0} molecules)'.format(N_SCANNED_MOLECULES),
+        best_time(lambda: [molecule_id for (molecule_id, fragments) in enumerate(scanned_molecules) if CARBOXYLIC_ACID in fragments and any(fragment in nitro_fragments for fragment in fragments)], repeat=3),
+        n=1,
+    )
+
+    with TemporaryDirectory() as directory:
+        path = join(directory, 'fragments.postings')
+        print_result('writing the fragment posting file', best_time(lambda: posting_lists.write(path), repeat=1), n=len(posting_lists))
+        print('{0:.1f} MB ({1:.1f} MB as uint32 arrays)'.format(
+            sum(posting_lists.bitmap(key).serialised_size() for key in posting_lists.keys()) / 1e6,
+            4 * sum(len(posting_lists.bitmap(key)) for key in posting_lists.keys()) / 1e6,
+        ))
+        print_result('opening the fragment posting file', best_time(lambda: Posting_File(path), repeat=5), n=1)
+        posting_file = Posting_File(path)
+        mapped_query = lambda: posting_file.bitmap(CARBOXYLIC_ACID) & tags.bitmap('nitro')
+        assert mapped_query() == query()
+        print_result('"{0}" AND nitro (memory-mapped)'.format(CARBOXYLIC_ACID), best_time(mapped_query, repeat=5, number=20), n=1)
+
+if __name__ == '__main__':
+    main()
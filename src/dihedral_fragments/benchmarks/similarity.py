@@ -0,0 +1,72 @@
+'''
+Nearest-fragment queries over a vocabulary of about a million fragments (with valences): Fragment_Similarity_Index versus a linear scan (on a smaller vocabulary), batch queries and incremental growth.
+
+    python3 -m dihedral_fragments.benchmarks.similarity
+'''
+from random import Random
+
+from dihedral_fragments.benchmarks import best_time, random_fragments, print_result, BENCHMARK_SEED
+from dihedral_fragments.similarity import Fragment_Similarity_Index, Similar_Fragment, oriented_distance, oriented_fragments
+
+N_DRAWS = 1200000
+
+N_SCANNED_FRAGMENTS = 50000
+
+N_QUERIES = 200
+
+N_BATCH_QUERIES = 2000
+
+N_ADDED_FRAGMENTS = 10000
+
+VALENCE_ATOMS = ('C4', 'C4', 'C4', 'C3', 'H1', 'H1', 'H1', 'N3', 'N2', 'N4', 'O2', 'O1', 'S2', 'S4', 'P4', 'CL1', 'F1', 'BR1')
+
+CENTRAL_ATOMS = (('C4', 'C3', 'N3', 'N2', 'O2', 'S2', 'S4', 'P4'), ('C4', 'C3', 'N3', 'N2', 'O2', 'S2', 'S4', 'P4'))
+
+def valence_fragments(n: int, seed: int = BENCHMARK_SEED):
+    # Not canonised (which would dominate the set-up): the index only relies on canonical strings to deduplicate them
+    return list(dict.fromkeys(random_fragments(n, seed=seed, neighbour_atoms=VALENCE_ATOMS, central_atoms=CENTRAL_ATOMS)))
+
+def linear_scan(fragments, fragment, k):
+    orientation = oriented_fragments(fragment)[0]
+    return sorted(
+        Similar_Fragment(min(oriented_distance(orientation, other) for other in oriented_fragments(other_fragment)), other_fragment)
+        for other_fragment in fragments
+    )[:k]
+
+def main() -> None:
+    fragments = valence_fragments(N_DRAWS)
+    queries = valence_fragments(N_QUERIES, seed=BENCHMARK_SEED + 1)
+
+    similarity_index = Fragment_Similarity_Index()
+    print_result('building the index', best_time(lambda: (similarity_index.add_fragments(fragments), similarity_index.nearest(queries[0], canonise=False)), repeat=1), n=len(fragments))
+    print('{0} fragments, {1} buckets, {2} distinct sides'.format(len(similarity_index), len(similarity_index.buckets), len(similarity_index.side_ids)))
+
+    print_result('nearest() (k=5)', best_time(lambda: [similarity_index.nearest(query, k=5, canonise=False) for query in queries], repeat=3), n=len(queries))
+    print_result('nearest() (k=50)', best_time(lambda: [similarity_index.nearest(query, k=50, canonise=False) for query in queries], repeat=3), n=len(queries))
+
+    scanned_index = Fragment_Similarity_Index(fragments[:N_SCANNED_FRAGMENTS])
+    assert all(scanned_index.nearest(query, canonise=False) == linear_scan(fragments[:N_SCANNED_FRAGMENTS], query, 5) for query in queries[:5])
+    print_result(
+        'linear scan ({0} fragments)'.format(N_SCANNED_FRAGMENTS),
+        best_time(lambda: [linear_scan(fragments[:N_SCANNED_FRAGMENTS], query, 5) for query in queries[:5]], repeat=1),
+        n=5,
+    )
+    print_result(
+        'nearest() ({0} fragments)'.format(N_SCANNED_FRAGMENTS),
+        best_time(lambda: [scanned_index.nearest(query, canonise=False) for query in queries], repeat=3),
+        n=len(queries),
+    )
+
+    random = Random(BENCHMARK_SEED)
+    batch = [random.choice(queries) for _ in range(N_BATCH_QUERIES)]
+    print_result('nearest_for_fragments() (canonised, {0} distinct queries)'.format(len(set(batch))), best_time(lambda: similarity_index.nearest_for_fragments(batch), repeat=3), n=len(batch))
+
+    added_fragments = [fragment for fragment in valence_fragments(N_ADDED_FRAGMENTS, seed=BENCHMARK_SEED + 2) if fragment not in similarity_index]
+    print_result(
+        'adding {0} fragments, then the first query'.format(len(added_fragments)),
+        best_time(lambda: (similarity_index.add_fragments(added_fragments), similarity_index.nearest(queries[0], canonise=False)), repeat=1),
+        n=len(added_fragments),
+    )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+'''
+Mapping dihedral angles to stereochemically distinct forms: full canonicalisation versus Stereo_Fragment lookups, and enumeration of every form.
+
+    python3 -m dihedral_fragments.benchmarks.stereo
+'''
+from random import Random
+
+from dihedral_fragments.benchmarks import best_time, print_result, BENCHMARK_SEED, BENCHMARK_ELEMENTS
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment
+from dihedral_fragments.stereo import Stereo_Fragment
+
+N_FRAGMENTS = 200
+
+N_ANGLES_PER_FRAGMENT = 100
+
+def main() -> None:
+    random = Random(BENCHMARK_SEED)
+    atom_lists = [
+        ([random.choice(BENCHMARK_ELEMENTS) for _ in range(3)], 'C', 'C', [random.choice(BENCHMARK_ELEMENTS) for _ in range(random.randint(1, 3))])
+        for _ in range(N_FRAGMENTS)
+    ]
+    queries = [
+        (atom_list, ([random.uniform(-180, 180) for _ in atom_list[0]], [random.uniform(-180, 180) for _ in atom_list[3]]))
+        for atom_list in atom_lists
+        for _ in range(N_ANGLES_PER_FRAGMENT)
+    ]
+
+    print_result(
+        'full canonicalisation',
+        best_time(lambda: [str(Dihedral_Fragment(atom_list=atom_list, dihedral_angles=dihedral_angles)) for (atom_list, dihedral_angles) in queries], repeat=3),
+        n=len(queries),
+    )
+
+    def stereo_lookups():
+        stereo_fragments = {}
+        return [
+            stereo_fragments.setdefault(id(atom_list), Stereo_Fragment(atom_list)).form_for_angles(dihedral_angles)
+            for (atom_list, dihedral_angles) in queries
+        ]
+
+    print_result('Stereo_Fragment lookups (including the first canonicalisation of every form)', best_time(stereo_lookups, repeat=3), n=len(queries))
+    print_result('enumerating every stereo form', best_time(lambda: [Stereo_Fragment(atom_list).stereo_forms() for atom_list in atom_lists], repeat=3), n=len(atom_lists))
+
+if __name__ == '__main__':
+    main()
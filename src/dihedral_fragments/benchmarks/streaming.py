@@ -0,0 +1,37 @@
+'''
+Streaming (fragment, molid) matches: time to the first result and total time, building the whole list first versus iter_results() (in input order and as completed), with a stand-in for capping and ATB look-ups (I/O bound, of random durations).
+
+    python3 -m dihedral_fragments.benchmarks.streaming
+'''
+from random import Random
+from time import perf_counter, sleep
+
+from dihedral_fragments.benchmarks import BENCHMARK_SEED
+from dihedral_fragments.streaming import iter_results
+
+N_FRAGMENTS = 200
+
+MEAN_SECONDS_PER_FRAGMENT = 0.01
+
+def stand_in_durations(n: int, seed: int = BENCHMARK_SEED):
+    random = Random(seed)
+    return [random.expovariate(1 / MEAN_SECONDS_PER_FRAGMENT) for _ in range(n)]
+
+def first_and_total_seconds(results) -> str:
+    '''Times of the first and last items of `results()`.'''
+    start = perf_counter()
+    first = None
+    for _ in results():
+        if first is None:
+            first = perf_counter() - start
+    return 'first result after {0:.3f} s, all {1} after {2:.3f} s'.format(first, N_FRAGMENTS, perf_counter() - start)
+
+def main() -> None:
+    durations = stand_in_durations(N_FRAGMENTS)
+    print('list, then print: {0}'.format(first_and_total_seconds(lambda: [sleep(duration) for duration in durations])))
+    for max_workers in (1, 4, 16):
+        for ordered in (True, False):
+            print('iter_results(max_workers={0}, ordered={1}): {2}'.format(max_workers, ordered, first_and_total_seconds(lambda: iter_results(sleep, durations, max_workers=max_workers, ordered=ordered))))
+
+if __name__ == '__main__':
+    main()
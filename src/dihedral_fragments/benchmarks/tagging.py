@@ -0,0 +1,60 @@
+'''
+Tagging a synthetic molecule library (fragments drawn with a long-tailed distribution, as in the ATB), per molecule versus with a Tagging_Service, and re-tagging after adding one chemical group.
+
+    python3 -m dihedral_fragments.benchmarks.tagging
+'''
+from random import Random
+from typing import List, NamedTuple
+
+from dihedral_fragments.benchmarks import best_time, random_fragments, print_result, BENCHMARK_SEED
+from dihedral_fragments.chemistry import CHEMICAL_GROUPS
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment
+from dihedral_fragments.tag_predictor import tags_for_dihedral, tags_for_molecule
+from dihedral_fragments.tagging import Tagging_Service
+
+Molecule = NamedTuple('Molecule', [('molid', int), ('dihedral_fragments', List[str])])
+
+N_MOLECULES = 20000
+
+N_DIHEDRALS_PER_MOLECULE = 25
+
+N_UNTAGGED_MOLECULES = 500
+
+NEW_GROUP = ('silane', 'J{3}|SI|SI|J{3}')
+
+def unambiguous(fragment: str) -> bool:
+    try:
+        tags_for_dihedral(fragment)
+        return True
+    except AssertionError:
+        return False
+
+def main() -> None:
+    random = Random(BENCHMARK_SEED)
+    fragments = sorted({str(Dihedral_Fragment(fragment)) for fragment in random_fragments(5000)})
+    fragments = [fragment for fragment in fragments if unambiguous(fragment)]
+    weights = [1.0 / rank for rank in range(1, len(fragments) + 1)]
+    molecules = [
+        Molecule(molid, random.choices(fragments, weights=weights, k=N_DIHEDRALS_PER_MOLECULE))
+        for molid in range(N_MOLECULES)
+    ]
+
+    print_result(
+        'tags_for_molecule (no memoisation)',
+        best_time(lambda: [tags_for_molecule(molecule) for molecule in molecules[:N_UNTAGGED_MOLECULES]], repeat=1),
+        n=N_UNTAGGED_MOLECULES,
+    )
+
+    tagging_service = Tagging_Service()
+    print_result('Tagging_Service (cold)', best_time(lambda: tagging_service.tags_for_molecules(molecules), repeat=1), n=len(molecules))
+    print_result('Tagging_Service (warm)', best_time(lambda: tagging_service.tags_for_molecules(molecules), repeat=3), n=len(molecules))
+
+    def add_group_and_retag():
+        tagging_service.update_groups(list(CHEMICAL_GROUPS) + [NEW_GROUP])
+        tagging_service.tags_for_molecules(molecules)
+        tagging_service.update_groups(CHEMICAL_GROUPS)
+
+    print_result('adding one group and re-tagging every molecule (and back)', best_time(add_group_and_retag, repeat=3), n=len(molecules))
+
+if __name__ == '__main__':
+    main()
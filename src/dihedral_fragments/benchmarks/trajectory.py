@@ -0,0 +1,57 @@
+'''
+Tracking the fragments of a large random molecule along a synthetic trajectory (random walk of the coordinates, generated chunk by chunk in constant memory): Fragment_Tracker versus recanonicalising every fragment at every frame.
+
+    python3 -m dihedral_fragments.benchmarks.trajectory [--n-frames 20000]
+'''
+from argparse import ArgumentParser
+from io import StringIO
+from typing import Iterator
+
+import numpy as np
+
+from dihedral_fragments.benchmarks import best_time, random_molecular_graphs, print_result, BENCHMARK_SEED
+from dihedral_fragments.extraction import Fragment_Extractor, FRAMES_PER_CHUNK
+from dihedral_fragments.trajectory import Fragment_Tracker, write_change_log
+
+N_HEAVY_ATOMS = 600
+
+STEP = 0.02
+
+def coordinate_chunks(coordinates: np.ndarray, n_frames: int, seed: int = BENCHMARK_SEED) -> Iterator[np.ndarray]:
+    random = np.random.RandomState(seed)
+    for start in range(0, n_frames, FRAMES_PER_CHUNK):
+        chunk = coordinates + np.cumsum(random.normal(scale=STEP, size=(min(FRAMES_PER_CHUNK, n_frames - start),) + coordinates.shape), axis=0)
+        coordinates = chunk[-1]
+        yield chunk
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument('--n-frames', type=int, default=20000)
+    return parser.parse_args()
+
+def main() -> None:
+    args = parse_args()
+    graph, = random_molecular_graphs(1, min_heavy_atoms=N_HEAVY_ATOMS, max_heavy_atoms=N_HEAVY_ATOMS, ring_closure_probability=0.02)
+    coordinates = np.array(graph.coordinates)
+
+    fragment_tracker = Fragment_Tracker(graph)
+    print('{0} atoms, {1} central bonds, {2} frames'.format(len(graph.elements), len(fragment_tracker.topologies), args.n_frames))
+
+    n_baseline_frames = min(args.n_frames, 1000)
+    print_result(
+        'Fragment_Extractor.dihedral_fragments_for_frames (every fragment, every frame)',
+        best_time(lambda: [Fragment_Extractor().dihedral_fragments_for_frames(graph, chunk) for chunk in coordinate_chunks(coordinates, n_baseline_frames)], repeat=1),
+        n=n_baseline_frames,
+    )
+
+    log = StringIO()
+    n_changes = []
+    print_result(
+        'Fragment_Tracker (change log)',
+        best_time(lambda: n_changes.append(write_change_log(fragment_tracker.track(coordinate_chunks(coordinates, args.n_frames)), log)), repeat=1),
+        n=args.n_frames,
+    )
+    print('{0} changes ({1:.2f} per frame), {2:.1f} MB of change log'.format(n_changes[0], n_changes[0] / args.n_frames, len(log.getvalue()) / 1e6))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+'''
+Canonicalising and tagging a large batch of fragments with a Fragment_Worker_Pool, from 1 to 32 processes (compared to serial canonicalisation).
+Speedups are bounded by the number of cores of the machine (`os.cpu_count()`); pool start-up is timed separately.
+
+    python3 -m dihedral_fragments.benchmarks.worker_pool [--n-fragments 200000]
+'''
+from argparse import ArgumentParser
+from os import cpu_count
+
+from dihedral_fragments.benchmarks import best_time, random_fragments, print_result
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment
+from dihedral_fragments.worker_pool import Fragment_Worker_Pool, canonicalise_chunk, tag_chunk
+
+PROCESSES = [1, 2, 4, 8, 16, 32]
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument('--n-fragments', type=int, default=200000)
+    return parser.parse_args()
+
+def main() -> None:
+    args = parse_args()
+    fragments = random_fragments(args.n_fragments)
+    # Tagging asserts that no fragment matches more than one group, so only tag canonical fragments which do not
+    canonical_fragments = sorted(set(canonicalise_chunk(fragments)))
+
+    def unambiguous(fragment: str) -> bool:
+        try:
+            tag_chunk([fragment])
+            return True
+        except AssertionError:
+            return False
+
+    canonical_fragments = [fragment for fragment in canonical_fragments if unambiguous(fragment)]
+
+    print('cpu_count() = {0}'.format(cpu_count()))
+    print_result('serial canonicalisation', best_time(lambda: [str(Dihedral_Fragment(fragment)) for fragment in fragments], repeat=1), n=len(fragments))
+
+    for processes in PROCESSES:
+        worker_pools = []
+        print_result('Fragment_Worker_Pool({0}) start-up'.format(processes), best_time(lambda: worker_pools.append(Fragment_Worker_Pool(processes)), repeat=1), n=1)
+        with worker_pools[0] as worker_pool:
+            print_result('Fragment_Worker_Pool({0}).canonicalise'.format(processes), best_time(lambda: worker_pool.canonicalise(fragments), repeat=1), n=len(fragments))
+            print_result('Fragment_Worker_Pool({0}).tag'.format(processes), best_time(lambda: worker_pool.tag(canonical_fragments), repeat=1), n=len(canonical_fragments))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,344 @@
+'''
+Compact binary encoding of dihedral fragments (and their counts), with bulk encoding/decoding and a memory-mappable file container.
+
+Every fragment is a fixed-width record of unsigned bytes (element codes are atomic numbers, 0 being padding), whose width is set by the file's layout (maximum number of neighbours per side and of cycles):
+
+    n_neighbours (2) | n_cycles | flags (chiral sides) | central_elements (2) | central_valences (2)
+    | left_elements (M) | left_valences (M) | right_elements (M) | right_valences (M) | cycles (C x 3)
+
+Container (little-endian): a 24 bytes header (magic, version, layout, number of records), the records (padded to 8 bytes), the uint64 counts and the uint64 permutation sorting the records bytewise (used to look fragments up in O(log n)).
+Decoding `encode_fragments(fragments)` gives back `fragments` exactly, e.g. `str(Dihedral_Fragment(...))` or the chiral-flagged strings.
+'''
+from argparse import ArgumentParser
+from functools import lru_cache
+from typing import Any, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from dihedral_fragments.atomic_numbers import ATOMIC_NUMBERS
+from dihedral_fragments.dihedral_fragment import split_fragment_str, element_valence_for_atom, CHIRAL_MARKER, EXTENDED_CYCLE_SEPARATOR, GROUP_SEPARATOR, NEIGHBOUR_SEPARATOR, NO_VALENCE, Cycle, Fragment
+from dihedral_fragments.file_helpers import padding
+
+MAGIC = b'DFRAGBIN'
+
+FORMAT_VERSION = 1
+
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('version', '<u2'), ('max_neighbours', 'u1'), ('max_cycles', 'u1'), ('reserved', '<u4'), ('n_records', '<u8')])
+
+NO_ELEMENT, NO_VALENCE_CODE = 0, 255
+
+LEFT_CHIRAL_FLAG, RIGHT_CHIRAL_FLAG = 1, 2
+
+ELEMENT_FOR_CODE = {code: element for (element, code) in ATOMIC_NUMBERS.items()}
+
+Record_Layout = NamedTuple('Record_Layout', [('max_neighbours', int), ('max_cycles', int)])
+
+class Invalid_Fragment_File(Exception):
+    pass
+
+@lru_cache(maxsize=None)
+def record_dtype(layout: Record_Layout) -> np.dtype:
+    M, C = layout
+    return np.dtype(
+        [
+            ('n_neighbours', 'u1', (2,)),
+            ('n_cycles', 'u1'),
+            ('flags', 'u1'),
+            ('central_elements', 'u1', (2,)),
+            ('central_valences', 'u1', (2,)),
+            ('left_elements', 'u1', (M,)),
+            ('left_valences', 'u1', (M,)),
+            ('right_elements', 'u1', (M,)),
+            ('right_valences', 'u1', (M,)),
+            ('cycles', 'u1', (C, 3)),
+        ],
+    )
+
+Encoded_Atom = Tuple[int, int]
+
+def encoded_atom(atom_desc: str) -> Encoded_Atom:
+    element, valence = element_valence_for_atom(atom_desc)
+    try:
+        return (ATOMIC_NUMBERS[element], valence if valence is not NO_VALENCE else NO_VALENCE_CODE)
+    except KeyError:
+        raise Exception('Element "{0}" (in "{1}") can not be encoded'.format(element, atom_desc))
+
+Parsed_Fragment = Tuple[List[Encoded_Atom], List[Encoded_Atom], List[Encoded_Atom], List[Cycle], int]
+
+def parsed_fragment(fragment: Fragment) -> Parsed_Fragment:
+    '''(central atoms, left neighbours, right neighbours, cycles, flags) of a fragment string, as (element code, valence code) pairs.'''
+    neighbours_1, atom_2, atom_3, neighbours_4, cycles = split_fragment_str(fragment)
+    flags = (LEFT_CHIRAL_FLAG if atom_2.endswith(CHIRAL_MARKER) else 0) | (RIGHT_CHIRAL_FLAG if atom_3.endswith(CHIRAL_MARKER) else 0)
+    return (
+        [encoded_atom(atom_2.rstrip(CHIRAL_MARKER)), encoded_atom(atom_3.rstrip(CHIRAL_MARKER))],
+        [encoded_atom(atom) for atom in neighbours_1],
+        [encoded_atom(atom) for atom in neighbours_4],
+        cycles,
+        flags,
+    )
+
+def minimal_layout(parsed_fragments: Sequence[Parsed_Fragment]) -> Record_Layout:
+    return Record_Layout(
+        max_neighbours=max([max(len(left), len(right)) for (_, left, right, _, _) in parsed_fragments] + [1]),
+        max_cycles=max([len(cycles) for (_, _, _, cycles, _) in parsed_fragments] + [0]),
+    )
+
+def _padded(atoms: List[Encoded_Atom], index: int, width: int, padding: int) -> List[int]:
+    return [atom[index] for atom in atoms] + [padding] * (width - len(atoms))
+
+def encode_fragments(fragments: Sequence[Fragment], layout: Optional[Record_Layout] = None) -> np.ndarray:
+    '''Structured array of records (one per fragment). The smallest layout fitting every fragment is used by default.'''
+    parsed_fragments = [parsed_fragment(fragment) for fragment in fragments]
+    if layout is None:
+        layout = minimal_layout(parsed_fragments)
+    M, C = layout
+
+    for (fragment, (_, left, right, cycles, _)) in zip(fragments, parsed_fragments):
+        if max(len(left), len(right)) > M or len(cycles) > C:
+            raise Exception('Fragment "{0}" does not fit in {1}'.format(fragment, layout))
+        if any(value > 255 for cycle in cycles for value in cycle):
+            raise Exception('Fragment "{0}" has cycle values > 255'.format(fragment))
+
+    records = np.zeros(len(parsed_fragments), dtype=record_dtype(layout))
+    if len(parsed_fragments) == 0:
+        return records
+
+    records['n_neighbours'] = [(len(left), len(right)) for (_, left, right, _, _) in parsed_fragments]
+    records['n_cycles'] = [len(cycles) for (_, _, _, cycles, _) in parsed_fragments]
+    records['flags'] = [flags for (_, _, _, _, flags) in parsed_fragments]
+    records['central_elements'] = [_padded(central, 0, 2, NO_ELEMENT) for (central, _, _, _, _) in parsed_fragments]
+    records['central_valences'] = [_padded(central, 1, 2, NO_VALENCE_CODE) for (central, _, _, _, _) in parsed_fragments]
+    records['left_elements'] = [_padded(left, 0, M, NO_ELEMENT) for (_, left, _, _, _) in parsed_fragments]
+    records['left_valences'] = [_padded(left, 1, M, NO_VALENCE_CODE) for (_, left, _, _, _) in parsed_fragments]
+    records['right_elements'] = [_padded(right, 0, M, NO_ELEMENT) for (_, _, right, _, _) in parsed_fragments]
+    records['right_valences'] = [_padded(right, 1, M, NO_VALENCE_CODE) for (_, _, right, _, _) in parsed_fragments]
+    if C > 0:
+        records['cycles'] = [
+            [tuple(cycle) for cycle in cycles] + [(0, 0, 0)] * (C - len(cycles))
+            for (_, _, _, cycles, _) in parsed_fragments
+        ]
+    return records
+
+def atom_str(element_code: int, valence_code: int) -> str:
+    return ELEMENT_FOR_CODE[element_code] + (str(valence_code) if valence_code != NO_VALENCE_CODE else '')
+
+# Widest number (three digits) in a decoded fragment
+NUMBER_WIDTH = 3
+
+# Tables of zero-padded ASCII bytes are stored by column: `table[:, index]` are the bytes of entry `index`
+
+@lru_cache(maxsize=None)
+def _number_table() -> np.ndarray:
+    return np.ascontiguousarray(np.array([str(number).encode() for number in range(256)], dtype='S{0}'.format(NUMBER_WIDTH)).view(np.uint8).reshape(-1, NUMBER_WIDTH).T)
+
+def _field_rows(records: np.ndarray, name: str) -> np.ndarray:
+    '''A field of the records as contiguous rows: one per value of the field, with the value of every record.'''
+    return np.ascontiguousarray(records[name].reshape(len(records), -1).T)
+
+def _atom_codes(elements: np.ndarray, valences: np.ndarray) -> np.ndarray:
+    return (elements.astype(np.uint16) << 8) | valences
+
+def _atom_table(atom_codes: Sequence[np.ndarray]) -> np.ndarray:
+    '''
+    `atom_str()` of the atoms used in `atom_codes` (`(element_code << 8) | valence_code`), which must all be known elements (or NO_ELEMENT); other entries are empty.
+    Entries are only as wide as the widest of those atoms.
+    '''
+    used_codes = np.flatnonzero(sum(np.bincount(codes.ravel(), minlength=256 * 256) for codes in atom_codes)).tolist()
+    unknown_elements = sorted({code >> 8 for code in used_codes} - set(ELEMENT_FOR_CODE) - {NO_ELEMENT})
+    if unknown_elements:
+        raise Invalid_Fragment_File('Unknown element codes: {0}'.format(unknown_elements))
+
+    atoms = {code: atom_str(code >> 8, code & 255).encode() for code in used_codes if code >> 8 != NO_ELEMENT}
+    atom_table = np.zeros((max(map(len, atoms.values()), default=1), 256 * 256), dtype=np.uint8)
+    for (code, atom) in atoms.items():
+        atom_table[:len(atom), code] = np.frombuffer(atom, dtype=np.uint8)
+    return atom_table
+
+class _Byte_Rows(object):
+    '''Rows of zero-padded ASCII bytes, filled column by column (and stored by column, so that every column is written contiguously).'''
+    def __init__(self, n_rows: int, width: int) -> None:
+        self.columns = np.zeros((width, n_rows), dtype=np.uint8)
+        self.column = 0
+
+    def put_character(self, character: str, mask: Optional[np.ndarray] = None) -> None:
+        self.columns[self.column] = ord(character) if mask is None else mask * np.uint8(ord(character))
+        self.column += 1
+
+    def put_table_entries(self, table: np.ndarray, indices: np.ndarray, mask: Optional[np.ndarray] = None) -> None:
+        entries = np.take(table, indices, axis=1)
+        self.columns[self.column:self.column + len(table)] = entries if mask is None else entries * mask
+        self.column += len(table)
+
+    def strings(self) -> List[str]:
+        '''The rows without their padding (a newline must end each row).'''
+        return self.columns[:self.column].T.tobytes().translate(None, b'\x00').decode('ascii').split('\n')[:-1]
+
+def decode_records(records: np.ndarray) -> List[Fragment]:
+    '''
+    Inverse of `encode_fragments()`.
+    Every record is written, with NumPy, into a row of zero-padded ASCII bytes (atoms and numbers are looked up in tables, and neighbours or cycles no record has are skipped); dropping the padding leaves the newline-separated fragments, which are decoded and split at once.
+    '''
+    if len(records) == 0:
+        return []
+
+    n_neighbours, n_cycles, flags = _field_rows(records, 'n_neighbours'), _field_rows(records, 'n_cycles')[0], _field_rows(records, 'flags')[0]
+    max_left, max_right = n_neighbours.max(axis=1).tolist()
+    max_cycles = int(n_cycles.max())
+    left_codes = _atom_codes(_field_rows(records, 'left_elements')[:max_left], _field_rows(records, 'left_valences')[:max_left])
+    right_codes = _atom_codes(_field_rows(records, 'right_elements')[:max_right], _field_rows(records, 'right_valences')[:max_right])
+    central_codes = _atom_codes(_field_rows(records, 'central_elements'), _field_rows(records, 'central_valences'))
+    atom_table = _atom_table([left_codes, central_codes, right_codes])
+
+    # Every atom is preceded by a separator, every central atom followed by a chiral marker, every cycle by a separator and two extended cycle separators, and every fragment by a newline
+    rows = _Byte_Rows(
+        len(records),
+        (max_left + 2 + max_right) * (1 + len(atom_table)) + 2 + max_cycles * (3 + 3 * NUMBER_WIDTH) + 1,
+    )
+    for (k, codes) in enumerate(left_codes):
+        if k > 0:
+            rows.put_character(NEIGHBOUR_SEPARATOR, codes >= 256)
+        rows.put_table_entries(atom_table, codes)
+    for (codes, flag) in zip(central_codes, (LEFT_CHIRAL_FLAG, RIGHT_CHIRAL_FLAG)):
+        rows.put_character(GROUP_SEPARATOR)
+        rows.put_table_entries(atom_table, codes)
+        rows.put_character(CHIRAL_MARKER, flags & flag != 0)
+    for (k, codes) in enumerate(right_codes):
+        rows.put_character(GROUP_SEPARATOR if k == 0 else NEIGHBOUR_SEPARATOR, codes >= 256)
+        rows.put_table_entries(atom_table, codes)
+    if max_cycles > 0:
+        cycles = _field_rows(records, 'cycles')
+        for c in range(max_cycles):
+            present = n_cycles > c
+            extended = present & np.any(cycles[3 * c:3 * c + 3] > 9, axis=0)
+            rows.put_character(GROUP_SEPARATOR if c == 0 else NEIGHBOUR_SEPARATOR, present)
+            for k in range(3):
+                if k > 0:
+                    rows.put_character(EXTENDED_CYCLE_SEPARATOR, extended)
+                rows.put_table_entries(_number_table(), cycles[3 * c + k], mask=present)
+    rows.put_character('\n')
+    return rows.strings()
+
+def write_fragment_file(path: str, fragments: Sequence[Fragment], counts: Optional[Sequence[int]] = None, layout: Optional[Record_Layout] = None) -> Record_Layout:
+    return write_records(path, encode_fragments(fragments, layout=layout), counts=counts)
+
+def write_records(path: str, records: np.ndarray, counts: Optional[Sequence[int]] = None) -> Record_Layout:
+    layout = Record_Layout(records.dtype['left_elements'].shape[0], records.dtype['cycles'].shape[0])
+
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header['magic'], header['version'], header['n_records'] = MAGIC, FORMAT_VERSION, len(records)
+    header['max_neighbours'], header['max_cycles'] = layout
+
+    if counts is None:
+        counts = np.ones(len(records), dtype='<u8')
+    else:
+        assert len(counts) == len(records), (len(counts), len(records))
+        counts = np.asarray(counts, dtype='<u8')
+
+    index = np.argsort(records.view(np.dtype((np.void, records.dtype.itemsize))), kind='stable').astype('<u8')
+
+    with open(path, 'wb') as fh:
+        fh.write(header.tobytes())
+        fh.write(records.tobytes())
+        fh.write(b'\x00' * padding(records.nbytes))
+        fh.write(counts.tobytes())
+        fh.write(index.tobytes())
+    return layout
+
+def _mapped_array(path: str, dtype: Any, offset: int, n: int) -> np.ndarray:
+    if n == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(n,))
+
+class Fragment_File(object):
+    '''Read-only, memory-mapped view of a fragment file: opening it is O(1), records are only decoded when accessed.'''
+    def __init__(self, path: str) -> None:
+        self.path = path
+        header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+        if len(header) != 1 or header['magic'][0] != MAGIC:
+            raise Invalid_Fragment_File('{0} is not a dihedral fragment file'.format(path))
+        if header['version'][0] != FORMAT_VERSION:
+            raise Invalid_Fragment_File('Unsupported fragment file version {0} (expected {1})'.format(header['version'][0], FORMAT_VERSION))
+
+        self.layout = Record_Layout(int(header['max_neighbours'][0]), int(header['max_cycles'][0]))
+        n_records = int(header['n_records'][0])
+        dtype = record_dtype(self.layout)
+
+        records_offset = HEADER_DTYPE.itemsize
+        counts_offset = records_offset + n_records * dtype.itemsize + padding(n_records * dtype.itemsize)
+        index_offset = counts_offset + n_records * 8
+
+        self.records = _mapped_array(path, dtype, records_offset, n_records)
+        self.counts = _mapped_array(path, '<u8', counts_offset, n_records)
+        self.index = _mapped_array(path, '<u8', index_offset, n_records)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def fragment(self, position: int) -> Fragment:
+        return decode_records(self.records[position:position + 1])[0]
+
+    def fragments(self, start: int = 0, stop: Optional[int] = None) -> List[Fragment]:
+        return decode_records(self.records[start:stop])
+
+    def fragments_with_count(self, start: int = 0, stop: Optional[int] = None) -> List[Tuple[Fragment, int]]:
+        return list(zip(self.fragments(start, stop), self.counts[start:stop].tolist()))
+
+    def acyclic_positions(self) -> np.ndarray:
+        '''Positions of the fragments without cycles, selected on the records (without decoding them).'''
+        return np.flatnonzero(self.records['n_cycles'] == 0)
+
+    def fragments_with_count_at(self, positions: np.ndarray) -> List[Tuple[Fragment, int]]:
+        '''(fragment, count) of the records at `positions` (in that order), decoding only those.'''
+        # np.take() gathers from the memory map much faster than fancy indexing
+        return list(zip(decode_records(np.take(self.records, positions)), np.take(self.counts, positions).tolist()))
+
+    def iter_fragments_with_count(self, chunk_size: int = 100000) -> Iterator[Tuple[Fragment, int]]:
+        for start in range(0, len(self), chunk_size):
+            yield from self.fragments_with_count(start, start + chunk_size)
+
+    def position(self, fragment: Fragment) -> Optional[int]:
+        '''Position of (the first occurrence of) `fragment` in the file, found by binary search over the sorted index, or None.'''
+        try:
+            key = encode_fragments([fragment], layout=self.layout).tobytes()
+        except Exception:
+            return None
+
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.records[int(self.index[middle])].tobytes() < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self) and self.records[int(self.index[low])].tobytes() == key:
+            return int(self.index[low])
+        return None
+
+    def count_for(self, fragment: Fragment) -> Optional[int]:
+        position = self.position(fragment)
+        return int(self.counts[position]) if position is not None else None
+
+def read_fragments_with_count(path: str) -> List[Tuple[Fragment, int]]:
+    return Fragment_File(path).fragments_with_count()
+
+def parse_args() -> Any:
+    parser = ArgumentParser(description='Convert a pickled list of (fragment, count) into a binary fragment file.')
+    parser.add_argument('pickle_file', type=str)
+    parser.add_argument('fragment_file', type=str)
+    return parser.parse_args()
+
+def main() -> None:
+    from pickle import load
+
+    args = parse_args()
+    with open(args.pickle_file, 'rb') as fh:
+        fragments_with_count = load(fh)
+    layout = write_fragment_file(
+        args.fragment_file,
+        [fragment for (fragment, _) in fragments_with_count],
+        counts=[count for (_, count) in fragments_with_count],
+    )
+    print('Wrote {0} fragments to {1} ({2})'.format(len(fragments_with_count), args.fragment_file, layout))
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,7 @@ from argparse import ArgumentParser
 from typing import Any, List, Optional
 
 from dihedral_fragments.molecule_for_fragment import molid_after_capping_fragment, Fragment, Too_Many_Permutations, Molecule_Not_In_ATB, PDB_Structure_Not_Found, ATB_Molecule_Running
+from dihedral_fragments.instrumentation import add_sink, print_summary, Histogram_Sink, JSON_Lines_Sink
 
 def parse_args():
     parser = ArgumentParser()
@@ -9,15 +10,25 @@ def parse_args():
     parser.add_argument('--fragment', type=Fragment, help='')
     parser.add_argument('--profile', action='store_true', help='')
     parser.add_argument('--debug', action='store_true', help='Run overly-verbose debugging')
+    parser.add_argument('--timings', action='store_true', help='Print per-stage timings (p50/p95/p99) at the end of the run')
+    parser.add_argument('--timings-file', type=str, default=None, help='Append per-stage timings to this JSON lines file')
 
     return parser.parse_args()
 
 if __name__ == '__main__':
     args = parse_args()
+    if args.timings:
+        add_sink(Histogram_Sink())
+    if args.timings_file:
+        add_sink(JSON_Lines_Sink(args.timings_file))
+
     if not args.profile:
-        print(
-            molid_after_capping_fragment(args.fragment, quick_run=False, debug=args.debug),
-        )
+        try:
+            print(
+                molid_after_capping_fragment(args.fragment, quick_run=False, debug=args.debug),
+            )
+        finally:
+            print_summary()
     else:
         from cProfile import runctx as profile_run
         from pstats import Stats
@@ -1,139 +1,130 @@
-from typing import Any, List, Optional, Tuple
+from typing import Any, List, NamedTuple, Optional, Tuple
 from pprint import pprint
 from sys import stderr
 from math import cos, sin, pi, sqrt
+from functools import lru_cache
 
-from dihedral_fragments.dihedral_fragment import element_valence_for_atom, NO_VALENCE
+from dihedral_fragments.dihedral_fragment import element_valence_for_atom, split_fragment_str, NO_VALENCE, Fragment
+from dihedral_fragments.instrumentation import span
+from dihedral_fragments.optional_dependencies import required_module
 
-try:
-    from fragment_capping.helpers.molecule import Uncapped_Molecule, Molecule
-    from fragment_capping.helpers.types_helpers import Fragment, Atom
-except ImportError:
-    raise RuntimeError("The `fragment_capping` module (https://github.com/bertrand-caron/fragment_capping) could not be found in your PYTHONPATH.")
+def best_capped_molecule_for_dihedral_fragment(fragment_str: Fragment, debug: bool = False) -> 'Molecule':
+    with span('capping.uncapped_molecule', fragment=fragment_str):
+        uncapped_molecule = uncapped_molecule_for_dihedral_fragment(fragment_str)
 
-def best_capped_molecule_for_dihedral_fragment(fragment_str: Fragment, debug: bool = False) -> Molecule:
-    molecule = uncapped_molecule_for_dihedral_fragment(fragment_str).get_best_capped_molecule_with_ILP(
-        debug=stderr if debug else None,
-        enforce_octet_rule=True,
-    )
+    with span('capping.ilp', fragment=fragment_str):
+        molecule = uncapped_molecule.get_best_capped_molecule_with_ILP(
+            debug=stderr if debug else None,
+            enforce_octet_rule=True,
+        )
 
     if debug:
         print(molecule)
 
     return molecule
 
-def uncapped_molecule_for_dihedral_fragment(dihedral_fragment: Fragment, debug: bool = False) -> Uncapped_Molecule:
-    if dihedral_fragment.count('|') == 3:
-        neighbours_1, atom_2, atom_3, neighbours_4 = dihedral_fragment.split('|')
-        cycles = []
-        neighbours_1, neighbours_4 = neighbours_1.split(','), neighbours_4.split(',')
-    elif dihedral_fragment.count('|') == 4:
-        neighbours_1, atom_2, atom_3, neighbours_4, cycles = dihedral_fragment.split('|')
-        neighbours_1, neighbours_4, cycles = neighbours_1.split(','), neighbours_4.split(','), cycles.split(',')
-    else:
-        raise Exception('Invalid dihedral_fragment: "{0}"'.format(dihedral_fragment))
-
-    ids = [n for (n, _) in enumerate(neighbours_1 + [atom_2, atom_3] + neighbours_4, start=1)]
-
-    neighbours_id_1, atom_id_2, atom_id_3, neighbours_id_4 = ids[0:len(neighbours_1)], ids[len(neighbours_1)], ids[len(neighbours_1) + 1], ids[len(neighbours_1) + 2:]
-    CENTRAL_BOND = (atom_id_2, atom_id_3)
-
-    elements = dict(
-        list(zip(
-            ids,
-            [element_valence_for_atom(neighbour)[0] for neighbour in neighbours_1] + [atom_2, atom_3] + [element_valence_for_atom(neighbour)[0] for neighbour in neighbours_4],
-        )),
-    )
+BOND_LENGTH = 1.5
 
-    valences = dict(
-        list(zip(
-            ids,
-            [element_valence_for_atom(neighbour)[1] for neighbour in neighbours_1] + [len(neighbours_1) + 1, len(neighbours_4) + 1] + [element_valence_for_atom(neighbour)[1] for neighbour in neighbours_4],
-        )),
-    )
+Coordinates = Tuple[float, float, float]
 
-    bonds = (
+Atom_Spec = NamedTuple('Atom_Spec', [('index', int), ('element', str), ('valence', Optional[int]), ('capped', bool), ('coordinates', Optional[Coordinates])])
+
+@lru_cache(maxsize=None)
+def coordinate_template(n_left: int, n_right: int, d: float = BOND_LENGTH) -> Tuple[Coordinates, ...]:
+    '''Placeholder coordinates of (left neighbours..., atom_2, atom_3, right neighbours...), which only depend on the number of neighbours on each side.'''
+    e = 0.5 * d
+    f = sqrt(d ** 2 - e ** 2)
+    return tuple(
         [
-            (neighbour_id, atom_id_2)
-            for neighbour_id in neighbours_id_1
+            (-d / 2 - e, -f * cos(2 * pi / n_left * n), f * sin(2 * pi / n_left * n))
+            for n in range(n_left)
         ]
         +
-        [CENTRAL_BOND]
+        [(-d / 2, 0, 0), (d / 2, 0, 0)]
         +
         [
-            (atom_id_3, neighbour_id)
-            for neighbour_id in neighbours_id_4
+            (d / 2 + e, f * cos(2 * pi / n_right * n), f * sin(2 * pi / n_right * n))
+            for n in range(n_right)
         ]
     )
 
-    def coordinates_for_atom_id(atom_id: int, d: float = 1.5) -> Tuple[float, float, float]:
-        if atom_id == atom_id_2:
-            return (-d / 2, 0, 0)
+def uncapped_atoms_and_bonds(dihedral_fragment: Fragment) -> Tuple[List[Atom_Spec], List[Tuple[int, int]], List[Tuple[int, int, int]]]:
+    '''
+    Atoms and bonds of the uncapped molecule for a fragment, built in one pass over a precomputed coordinate template.
+    Also returns the (i_id, n, j_id) carbon chains closing the fragment's cycles of length n > 0 (cycles of length 0 are merged into a single atom).
+    '''
+    neighbours_1, atom_2, atom_3, neighbours_4, cycles = split_fragment_str(dihedral_fragment)
+    n_left, n_right = len(neighbours_1), len(neighbours_4)
+    atom_id_2, atom_id_3 = n_left + 1, n_left + 2
+    template = coordinate_template(n_left, n_right)
+
+    # Cycles of length 0 mean that i and j are actually the same atom
+    merged_ids = {
+        atom_id_3 + 1 + j: 1 + i
+        for (i, n, j) in cycles
+        if n == 0
+    }
+
+    atoms = []
+    bonds = []
+    for (atom_id, (atom_desc, coordinates)) in enumerate(zip(neighbours_1 + [atom_2, atom_3] + neighbours_4, template), start=1):
+        if atom_id in merged_ids:
+            pass
+        elif atom_id == atom_id_2:
+            atoms.append(Atom_Spec(atom_id, atom_desc, n_left + 1, True, coordinates))
         elif atom_id == atom_id_3:
-            return (d / 2, 0, 0)
+            atoms.append(Atom_Spec(atom_id, atom_desc, n_right + 1, True, coordinates))
         else:
-            e = 0.5 * d
-            f = sqrt(d ** 2 - e ** 2)
-            assert e ** 2 + f ** 2 == d ** 2, (e ** 2 + f ** 2, d ** 2)
-            if atom_id in neighbours_id_1:
-                left_theta = 2 * pi / len(neighbours_id_1) * neighbours_id_1.index(atom_id)
-                return (-d /2 - e, -f * cos(left_theta), f * sin(left_theta))
-            elif atom_id in neighbours_id_4:
-                right_theta = 2 * pi / len(neighbours_id_4) * neighbours_id_4.index(atom_id)
-                return (d / 2 + e, f * cos(right_theta), f * sin(right_theta))
-            else:
-                raise Exception('Impossible id: {0}'.format(atom_id))
-
-    molecule = Molecule(
-        dict(
-            list(zip(
-                ids,
-                [
-                    Atom(
-                        index=atom_id,
-                        element=elements[atom_id],
-                        valence=valences[atom_id],
-                        capped=atom_id not in (neighbours_id_1 + neighbours_id_4),
-                        coordinates=coordinates_for_atom_id(atom_id),
-                    )
-                    for atom_id in ids
-                ],
-
-            ))
-        ),
+            element, valence = element_valence_for_atom(atom_desc)
+            atoms.append(Atom_Spec(atom_id, element, valence, False, coordinates))
+
+        if atom_id < atom_id_2:
+            bonds.append((atom_id, atom_id_2))
+        elif atom_id == atom_id_2:
+            bonds.append((atom_id_2, atom_id_3))
+        elif atom_id > atom_id_3:
+            bonds.append((atom_id_3, merged_ids.get(atom_id, atom_id)))
+
+    chains = [
+        (1 + i, n, merged_ids.get(atom_id_3 + 1 + j, atom_id_3 + 1 + j))
+        for (i, n, j) in cycles
+        if n > 0
+    ]
+
+    return (atoms, bonds, chains)
+
+def molecule_for_atoms_and_bonds(atoms: List[Atom_Spec], bonds: List[Tuple[int, int]], name: str) -> 'Molecule':
+    Molecule = required_module('fragment_capping.helpers.molecule').Molecule
+    Atom = required_module('fragment_capping.helpers.types_helpers').Atom
+
+    return Molecule(
+        {atom.index: Atom(**atom._asdict()) for atom in atoms},
         bonds,
-        name=dihedral_fragment.replace('|', '_'),
+        name=name,
     )
 
+def uncapped_molecule_for_dihedral_fragment(dihedral_fragment: Fragment, debug: bool = False) -> 'Uncapped_Molecule':
+    Atom = required_module('fragment_capping.helpers.types_helpers').Atom
+
+    atoms, bonds, chains = uncapped_atoms_and_bonds(dihedral_fragment)
+
+    molecule = molecule_for_atoms_and_bonds(atoms, bonds, dihedral_fragment.replace('|', '_'))
+
     if debug:
         print(molecule)
 
-    for (i, n, j) in map(lambda cycle: map(int, cycle), cycles):
-        i_id, j_id = neighbours_id_1[i], neighbours_id_4[j]
-        if n == 0:
-            # i and j are actually the same atoms
-            del molecule.atoms[j_id]
-            replace_j_by_i = lambda x: i_id if x == j_id else x
-            molecule.bonds = {
-                frozenset(map(replace_j_by_i, bond))
-                for bond in molecule.bonds
-            }
-        else:
-            NEW_ATOM_ID = -1
-            NEW_ATOM = Atom(
-                index=NEW_ATOM_ID, # This will get overwritten by Molecule.add_atom
-                element='C',
-                valence=NO_VALENCE,
-                capped=False,
-                coordinates=None,
-            )
-            atom_chain_id = [i_id] + [molecule.add_atom(NEW_ATOM) for i in range(n - 1)] + [j_id]
-            new_bonds = zip(atom_chain_id[:-1], atom_chain_id[1:])
-            molecule.add_bonds(new_bonds)
+    NEW_ATOM = Atom(
+        index=-1, # This will get overwritten by Molecule.add_atom
+        element='C',
+        valence=NO_VALENCE,
+        capped=False,
+        coordinates=None,
+    )
+    for (i_id, n, j_id) in chains:
+        atom_chain_id = [i_id] + [molecule.add_atom(NEW_ATOM) for _ in range(n - 1)] + [j_id]
+        molecule.add_bonds(zip(atom_chain_id[:-1], atom_chain_id[1:]))
 
     if debug:
         print(molecule)
 
     return molecule
-
-
@@ -0,0 +1,209 @@
+'''
+Reuse of ILP capping solutions across fragments which share their capping problem, or each half of it.
+
+The capping ILP only depends on the atoms and bonds of the uncapped molecule.
+Fragments which only differ by the order of their neighbours (e.g. stereoisomers) or by their orientation pose the same problem.
+Fragments which only differ by one side of the central bond share the other side's half problem: a central atom, the central atom it is bonded to (and its number of neighbours, which bounds the order of the central bond), and its neighbours.
+After every full solve, the caps (atoms added by the ILP to each neighbour) are cached for the whole problem and for each half.
+A fragment whose problem (or both of whose halves) is cached is capped by composing the cached caps onto its uncapped molecule.
+The ILP then only assigns bond orders and charges, which warm-starts it from the cached half solutions.
+Anything else (cyclic fragments, unseen halves, compositions the ILP rejects) falls back to a full solve.
+If `verify` is set, every composed molecule is checked against the full ILP.
+
+Caps are read from `fragment_capping`'s capped Molecule through its `atoms` ({index: Atom}) and `bonds`.
+'''
+from collections import Counter
+from sys import stderr
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from dihedral_fragments.capping import Atom_Spec, best_capped_molecule_for_dihedral_fragment, molecule_for_atoms_and_bonds, uncapped_atoms_and_bonds
+from dihedral_fragments.dihedral_fragment import split_fragment_str, Fragment, NO_VALENCE
+from dihedral_fragments.instrumentation import span
+
+# Atoms added by the ILP to a neighbour, in breadth-first order: (element, position in the cap of the atom it is bonded to, or -1 for the neighbour itself)
+Cap = Tuple[Tuple[str, int], ...]
+
+# (central atom, central atom it is bonded to, number of neighbours of the latter, neighbours in sorted order)
+Half_Key = Tuple[str, str, int, Tuple[str, ...]]
+
+# Caps of the neighbours of a half, in the order of its key
+Half_Caps = Tuple[Cap, ...]
+
+Half = Tuple[Half_Key, List[int]]
+
+EXACT, HALVES, FULL, FALLBACK, MISMATCH = 'exact', 'halves', 'full', 'fallback', 'mismatch'
+
+OUTCOMES = (EXACT, HALVES, FULL, FALLBACK, MISMATCH)
+
+def halves_of(fragment: Fragment) -> Optional[Tuple[Half, Half]]:
+    '''
+    Left and right halves of an acyclic fragment: the key of each half, and the atom IDs of its neighbours (as numbered by `uncapped_atoms_and_bonds()`) in the order of the key.
+    None for cyclic fragments, whose halves are not independent.
+    '''
+    neighbours_1, atom_2, atom_3, neighbours_4, cycles = split_fragment_str(fragment)
+    if cycles:
+        return None
+    n_left, n_right = len(neighbours_1), len(neighbours_4)
+    left_ids = [1 + k for k in sorted(range(n_left), key=neighbours_1.__getitem__)]
+    right_ids = [n_left + 3 + k for k in sorted(range(n_right), key=neighbours_4.__getitem__)]
+    return (
+        ((atom_2, atom_3, n_right, tuple(sorted(neighbours_1))), left_ids),
+        ((atom_3, atom_2, n_left, tuple(sorted(neighbours_4))), right_ids),
+    )
+
+def caps_for_neighbours(atoms: Dict[int, Any], bonds: Iterable[Iterable[int]], n_uncapped_atoms: int, neighbour_ids: Sequence[int]) -> Optional[List[Cap]]:
+    '''
+    Caps of `neighbour_ids` in a capped molecule whose atoms 1 to `n_uncapped_atoms` are those of the uncapped molecule.
+    None if some added atom is not part of exactly one neighbour's cap (e.g. bonded to a central atom or to another neighbour).
+    '''
+    bonded_ids = {} # type: Dict[int, List[int]]
+    for bond in bonds:
+        (i, j) = tuple(bond)
+        bonded_ids.setdefault(i, []).append(j)
+        bonded_ids.setdefault(j, []).append(i)
+
+    added_ids = {atom_id for atom_id in atoms if atom_id > n_uncapped_atoms}
+    capping_ids = set() # type: Set[int]
+    caps = []
+    for neighbour_id in neighbour_ids:
+        cap, positions, queue = [], {neighbour_id: -1}, [neighbour_id]
+        for atom_id in queue:
+            for bonded_id in sorted(bonded_ids.get(atom_id, [])):
+                if atom_id != neighbour_id and bonded_id not in added_ids and bonded_id != neighbour_id:
+                    return None
+                if bonded_id in added_ids and bonded_id not in positions:
+                    if bonded_id in capping_ids:
+                        return None
+                    positions[bonded_id] = len(cap)
+                    cap.append((atoms[bonded_id].element, positions[atom_id]))
+                    queue.append(bonded_id)
+        capping_ids.update(atom_id for atom_id in positions if atom_id != neighbour_id)
+        caps.append(tuple(cap))
+    return caps if capping_ids == added_ids else None
+
+def capped_atoms_and_bonds(fragment: Fragment, caps: Dict[int, Cap]) -> Optional[Tuple[List[Atom_Spec], List[Tuple[int, int]]]]:
+    '''
+    Atoms and bonds of the uncapped molecule for an acyclic fragment, with `caps` (by neighbour ID) added and every atom capped.
+    None if a neighbour's cap contradicts its valence in the fragment.
+    '''
+    atoms, bonds, _ = uncapped_atoms_and_bonds(fragment)
+    bonds = list(bonds)
+    cap_atoms = []
+    next_id = max(atom.index for atom in atoms) + 1
+    for (neighbour_id, cap) in sorted(caps.items()):
+        cap_ids = [] # type: List[int]
+        for (element, position) in cap:
+            bonds.append((neighbour_id if position == -1 else cap_ids[position], next_id))
+            cap_atoms.append(Atom_Spec(next_id, element, NO_VALENCE, True, None))
+            cap_ids.append(next_id)
+            next_id += 1
+
+    n_bonded_atoms = Counter(atom_id for bond in bonds for atom_id in bond)
+    if any(atom.valence is not NO_VALENCE and atom.valence != n_bonded_atoms[atom.index] for atom in atoms):
+        return None
+    # The structure is now complete: only bond orders and charges are left to the ILP
+    return (
+        [atom._replace(valence=n_bonded_atoms[atom.index], capped=True) for atom in atoms + cap_atoms],
+        bonds,
+    )
+
+def bond_orders_and_charges(fragment: Fragment, atoms: List[Atom_Spec], bonds: List[Tuple[int, int]], debug: bool = False) -> 'Molecule':
+    '''Solve the ILP for a molecule whose atoms are all capped, which leaves it with bond orders and charges only.'''
+    return molecule_for_atoms_and_bonds(atoms, bonds, fragment.replace('|', '_')).get_best_capped_molecule_with_ILP(
+        debug=stderr if debug else None,
+        enforce_octet_rule=True,
+    )
+
+def same_solution(molecule_1: 'Molecule', molecule_2: 'Molecule') -> bool:
+    return (molecule_1.formula(), molecule_1.netcharge()) == (molecule_2.formula(), molecule_2.netcharge())
+
+class Capping_Solution_Cache(object):
+    '''
+    Capped molecules for fragments, reusing the caps of previously solved fragments with the same problem (EXACT) or the same halves (HALVES).
+    `counts` records the outcome of every fragment: EXACT, HALVES, FULL (full solve), FALLBACK (full solve after a failed composition) and MISMATCH (a composition which `verify` rejected).
+    Fragments can be capped from several threads at once.
+    '''
+    def __init__(
+        self,
+        verify: bool = False,
+        solve: Callable[[Fragment, bool], Any] = best_capped_molecule_for_dihedral_fragment,
+        solve_capped: Callable[[Fragment, List[Atom_Spec], List[Tuple[int, int]], bool], Any] = bond_orders_and_charges,
+    ) -> None:
+        self.verify = verify
+        self.solve = solve
+        self.solve_capped = solve_capped
+        self.problem_caps = {} # type: Dict[Tuple[Half_Key, Half_Key], Tuple[Half_Caps, Half_Caps]]
+        self.half_caps = {} # type: Dict[Half_Key, Half_Caps]
+        self.counts = Counter({outcome: 0 for outcome in OUTCOMES})
+        self.lock = Lock()
+
+    def count(self, outcome: str) -> None:
+        with self.lock:
+            self.counts[outcome] += 1
+
+    def cached_caps(self, left_key: Half_Key, right_key: Half_Key) -> Optional[Tuple[str, Half_Caps, Half_Caps]]:
+        if (left_key, right_key) in self.problem_caps:
+            return (EXACT,) + self.problem_caps[(left_key, right_key)]
+        if (right_key, left_key) in self.problem_caps:
+            (right_caps, left_caps) = self.problem_caps[(right_key, left_key)]
+            return (EXACT, left_caps, right_caps)
+        if left_key in self.half_caps and right_key in self.half_caps:
+            return (HALVES, self.half_caps[left_key], self.half_caps[right_key])
+        return None
+
+    def best_capped_molecule(self, fragment: Fragment, debug: bool = False) -> 'Molecule':
+        halves = halves_of(fragment)
+        if halves is None:
+            self.count(FULL)
+            return self.solve(fragment, debug)
+
+        ((left_key, left_ids), (right_key, right_ids)) = halves
+        cached = self.cached_caps(left_key, right_key)
+        if cached is not None:
+            (outcome, left_caps, right_caps) = cached
+            molecule = self.composed_molecule(fragment, dict(zip(left_ids + right_ids, left_caps + right_caps)), outcome, debug)
+            if molecule is not None:
+                if not self.verify:
+                    self.count(outcome)
+                    return molecule
+                full_molecule = self.solve(fragment, debug)
+                if same_solution(molecule, full_molecule):
+                    self.count(outcome)
+                    return molecule
+                self.count(MISMATCH)
+                return full_molecule
+            self.count(FALLBACK)
+        else:
+            self.count(FULL)
+
+        molecule = self.solve(fragment, debug)
+        self.store(molecule, halves)
+        return molecule
+
+    def composed_molecule(self, fragment: Fragment, caps: Dict[int, Cap], outcome: str, debug: bool = False) -> Optional['Molecule']:
+        '''The molecule with `caps`, or None if the caps do not fit the fragment or the ILP rejects them.'''
+        atoms_and_bonds = capped_atoms_and_bonds(fragment, caps)
+        if atoms_and_bonds is None:
+            return None
+        try:
+            with span('capping.reuse', fragment=fragment, outcome=outcome):
+                return self.solve_capped(fragment, *atoms_and_bonds, debug)
+        except Exception as e:
+            if debug:
+                print('Reused caps rejected for {0}: {1}'.format(fragment, e), file=stderr)
+            return None
+
+    def store(self, molecule: 'Molecule', halves: Tuple[Half, Half]) -> None:
+        ((left_key, left_ids), (right_key, right_ids)) = halves
+        caps = caps_for_neighbours(molecule.atoms, molecule.bonds, len(left_ids) + len(right_ids) + 2, left_ids + right_ids)
+        if caps is None:
+            return
+        left_caps, right_caps = tuple(caps[:len(left_ids)]), tuple(caps[len(left_ids):])
+        with self.lock:
+            self.problem_caps.setdefault((left_key, right_key), (left_caps, right_caps))
+            self.half_caps.setdefault(left_key, left_caps)
+            self.half_caps.setdefault(right_key, right_caps)
+
+    def summary(self) -> str:
+        return ', '.join('{0}: {1}'.format(outcome, self.counts[outcome]) for outcome in OUTCOMES)
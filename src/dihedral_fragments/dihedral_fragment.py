@@ -1,25 +1,20 @@
 from copy import deepcopy, copy
-from re import search, sub
+from re import sub
+from string import digits
 from typing import Optional, Any, Tuple, Union, Sequence, NamedTuple, List, Callable, Dict
 from sys import stderr
 from itertools import combinations
-from collections import defaultdict
-from functools import reduce
+from functools import lru_cache
 
 from dihedral_fragments.deque import deque, Deque, rotated_deque, reversed_deque
 from dihedral_fragments.atomic_numbers import ATOMIC_NUMBERS
-from dihedral_fragments.regex import CAPTURE, ATOM_CHARACTERS, VALENCE_CHARACTERS, ONE_ATOM, ONE_NUMBER, ONE_OR_MORE_TIMES, GROUP
+from dihedral_fragments.regex import CAPTURE, ONE_ATOM, ONE_NUMBER, ONE_OR_MORE_TIMES, GROUP
+from dihedral_fragments.tracing import CANONICALISATION_TRACER
 
 Dihedral_Fragment_Str = str
 
-DEBUG = False
-
 ENFORCE_CANONICAL_TRICYLIC = False
 
-def print_if_DEBUG(something: Any) -> None:
-    if DEBUG:
-        print(something)
-
 NEIGHBOUR_SEPARATOR = ','
 
 def join_neighbours(neighbours: List[str]) -> str:
@@ -38,18 +33,15 @@ def split_group_str(group_str: str) -> List[str]:
 
 NO_VALENCE = None
 
+@lru_cache(maxsize=None)
 def element_valence_for_atom(atom_desc: str) -> Tuple[str, Optional[int]]:
+    '''Split an atom description into its element and (trailing) valence, e.g. `CL2` -> (`CL`, 2) and `C` -> (`C`, NO_VALENCE).'''
     upper_atom = atom_desc.upper()
-    match = search(
-        CAPTURE('[' + ATOM_CHARACTERS + ']') + CAPTURE('[' + VALENCE_CHARACTERS + ']'),
-        upper_atom,
-    )
-    if match:
-        element, valence_str = match.groups()
-        valence = int(valence_str)
+    element = upper_atom.rstrip(digits)
+    if element and element != upper_atom:
+        return (element, int(upper_atom[len(element):]))
     else:
-        element, valence = upper_atom, NO_VALENCE
-    return (element, valence)
+        return (upper_atom, NO_VALENCE)
 
 def ASC(x: Optional[int]) -> Optional[int]:
     if x is None:
@@ -98,9 +90,27 @@ def on_desc_atomic_number_then_desc_valence(atom_desc: str) -> Tuple[int, int]:
 Cycle = NamedTuple('Cycle', [('i', int), ('n', int), ('j', int)])
 
 def Small_Cycle(*args: Sequence[int]) -> Cycle:
-    assert len(args) == 3, 'Cycles of length > 9 or containing neighbours with more than 9 bonds are not allowed (details: {0})'.format(args)
+    assert len(args) == 3, 'Cycles should be (i, n, j) triplets (details: {0})'.format(args)
     return Cycle(*args)
 
+# Cycles whose indices and length are all < 10 are encoded compactly as three digits (e.g. `030`).
+# Others (macrocycles, neighbour indices >= 10) use the extended encoding, with dot-separated integers (e.g. `0.12.1`).
+EXTENDED_CYCLE_SEPARATOR = '.'
+
+def cycle_for_str(cycle_str: str) -> Cycle:
+    if len(cycle_str) == 3:
+        return Cycle(int(cycle_str[0]), int(cycle_str[1]), int(cycle_str[2]))
+    else:
+        assert EXTENDED_CYCLE_SEPARATOR in cycle_str, 'Invalid cycle "{0}": cycles with values > 9 should use the extended encoding (e.g. "0.12.1")'.format(cycle_str)
+        return Small_Cycle(*list(map(int, cycle_str.split(EXTENDED_CYCLE_SEPARATOR))))
+
+def str_for_cycle(cycle: Cycle) -> str:
+    i, n, j = cycle
+    if i < 10 and n < 10 and j < 10:
+        return '{0}{1}{2}'.format(i, n, j)
+    else:
+        return '{0}.{1}.{2}'.format(i, n, j)
+
 GROUP_INDICES = (0, 1, 2, 3, 4)
 LEFT_GROUP_INDEX, LEFT_ATOM_INDEX, RIGHT_ATOM_INDEX, RIGHT_GROUP_INDEX, CYCLES_INDEX = GROUP_INDICES
 
@@ -109,6 +119,29 @@ CHIRAL_MARKER = '*'
 class Invalid_Dihedral_Angles(Exception):
     pass
 
+Fragment_Components = Tuple[List[str], str, str, List[str], List[Cycle]]
+
+def split_fragment_str(dihedral_string: str) -> Fragment_Components:
+    '''Parse a dihedral fragment string into (neighbours_1, atom_2, atom_3, neighbours_4, cycles), without canonising it.'''
+    splitted_string = split_group_str(dihedral_string)
+    if len(splitted_string) not in (4, 5):
+        raise Exception('Invalid dihedral_fragment: "{0}"'.format(dihedral_string))
+    return (
+        [atom.upper() for atom in split_neighbour_str(splitted_string[LEFT_GROUP_INDEX])],
+        splitted_string[LEFT_ATOM_INDEX].upper(),
+        splitted_string[RIGHT_ATOM_INDEX].upper(),
+        [atom.upper() for atom in split_neighbour_str(splitted_string[RIGHT_GROUP_INDEX])],
+        (
+            [
+                cycle_for_str(cycle_str)
+                for cycle_str in
+                split_neighbour_str(splitted_string[CYCLES_INDEX])
+            ]
+            if len(splitted_string) == 5
+            else []
+        ),
+    )
+
 Fragment = str
 
 class Dihedral_Fragment(object):
@@ -123,20 +156,7 @@ class Dihedral_Fragment(object):
         assert dihedral_string is not None or atom_list is not None, [dihedral_string, atom_list]
 
         if dihedral_string is not None:
-            splitted_string = split_group_str(dihedral_string)
-            neighbours_1 = [atom.upper() for atom in split_neighbour_str(splitted_string[LEFT_GROUP_INDEX])]
-            self.atom_2 = splitted_string[LEFT_ATOM_INDEX].upper()
-            self.atom_3 = splitted_string[RIGHT_ATOM_INDEX].upper()
-            neighbours_4 = [atom.upper() for atom in split_neighbour_str(splitted_string[RIGHT_GROUP_INDEX])]
-            self.cycles = (
-                [
-                    Small_Cycle(*list(map(int, cycle_str)))
-                    for cycle_str in
-                    split_neighbour_str(splitted_string[CYCLES_INDEX])
-                ]
-                if len(splitted_string) == 5
-                else []
-            )
+            neighbours_1, self.atom_2, self.atom_3, neighbours_4, self.cycles = split_fragment_str(dihedral_string)
         else:
             if len(atom_list) == 4:
                 neighbours_1, self.atom_2, self.atom_3, neighbours_4 = atom_list
@@ -179,7 +199,7 @@ class Dihedral_Fragment(object):
                 [
                     ','.join(
                         list(map(
-                            lambda cycle: ''.join(map(str, cycle)),
+                            str_for_cycle,
                             self.cycles,
                         )),
                     ),
@@ -201,55 +221,49 @@ class Dihedral_Fragment(object):
         )
 
     def canonise_cycles(self: Any) -> None:
+        '''
+        Partition the cycles into equivalence classes and sort the i, n and j indices of each class independently.
+        A cycle joins the earliest class whose first member (representative) has the same length and the same neighbour on at least one side, which is looked up in two dictionaries instead of being compared to every representative.
+        '''
         if len(self.cycles) in (0, 1):
-            pass
-        else:
-            def reorder_equivalent_cycles(cycles: Sequence[Cycle]) -> List[Cycle]:
-                Is, Ns, Js = list(zip(*cycles))
-                return [
-                    Cycle(i, n, j)
-                    for (i, n, j) in
-                    zip(
-                        *list(map(
-                            sorted,
-                            (Is, Ns, Js),
-                        ))
-                    )
-                ]
-
-            def are_cycle_equivalent(*cycles: List[Cycle]) -> bool:
-                '''Equivalent cycles have the same length and at least one equivalent side.'''
-                return (
-                    len({cycle.n for cycle in cycles}) == 1
-                    and
-                    (
-                        len({self.neighbours_1[cycle.i] for cycle in cycles}) == 1
-                        or
-                        len({self.neighbours_4[cycle.j] for cycle in cycles}) == 1
-                    )
-                )
-
-            def equivalence_partition(iterable, relation):
-                classes = defaultdict(set)
-                for element in iterable:
-                    for sample, known in classes.items():
-                        if relation(sample, element):
-                            known.add(element)
-                            break
-                    else:
-                        classes[element].add(element)
-                return list(classes.values())
-
-            equivalent_cycles = sorted(
-                equivalence_partition(self.cycles, are_cycle_equivalent),
-                key=lambda group: list(group)[0].n,
+            return
+
+        first_class_on_left, first_class_on_right = {}, {} # type: Dict[Tuple[int, str], int], Dict[Tuple[int, str], int]
+        equivalence_classes = [] # type: List[Dict[Cycle, None]]
+        for cycle in self.cycles:
+            left_key, right_key = (cycle.n, self.neighbours_1[cycle.i]), (cycle.n, self.neighbours_4[cycle.j])
+            class_index = min(
+                first_class_on_left.get(left_key, len(equivalence_classes)),
+                first_class_on_right.get(right_key, len(equivalence_classes)),
             )
-
-            self.cycles = reduce(
-                lambda acc, e: acc + list(e),
-                map(reorder_equivalent_cycles, equivalent_cycles),
-                [],
+            if class_index == len(equivalence_classes):
+                equivalence_classes.append({})
+                first_class_on_left.setdefault(left_key, class_index)
+                first_class_on_right.setdefault(right_key, class_index)
+            # Identical cycles are only counted once
+            equivalence_classes[class_index][cycle] = None
+
+        if CANONICALISATION_TRACER.debug:
+            CANONICALISATION_TRACER.emit('cycle_classes', classes=[list(equivalence_class) for equivalence_class in equivalence_classes])
+
+        canonical_cycles = []
+        for equivalence_class in sorted(equivalence_classes, key=lambda equivalence_class: next(iter(equivalence_class)).n):
+            Is, Ns, Js = zip(*equivalence_class)
+            canonical_cycles.extend(
+                Cycle(i, n, j)
+                for (i, n, j) in zip(sorted(Is), sorted(Ns), sorted(Js))
             )
+        self.cycles = canonical_cycles
+
+    def ring_connectivities(self, side: str) -> Dict[int, Tuple[int, int]]:
+        '''(number of cycles, DESC(sum of cycle lengths)) for every neighbour index of `side` that belongs to at least one cycle.'''
+        assert side in ('left', 'right'), side
+        connectivities = {} # type: Dict[int, Tuple[int, int]]
+        for cycle in self.cycles:
+            neighbour_index = cycle.i if side == 'left' else cycle.j
+            connectivity, sum_of_lengths = connectivities.get(neighbour_index, (0, 0))
+            connectivities[neighbour_index] = (connectivity + 1, sum_of_lengths + DESC(cycle.n))
+        return connectivities
 
     def __canonical_rep__(self, can_reorder_substituents: bool, dihedral_angles: Optional[Tuple[List[float], List[float]]] = None, can_flip_fragment: bool = True) -> Any:
         other = copy(self)
@@ -287,9 +301,30 @@ class Dihedral_Fragment(object):
         else:
             should_reverse = False
 
+        if CANONICALISATION_TRACER.debug:
+            CANONICALISATION_TRACER.emit(
+                'flip',
+                should_reverse=should_reverse,
+                reason=self._flip_reason(),
+                atoms=(self.atom_2, self.atom_3),
+            )
+
         if should_reverse:
             self.reverse_dihedral()
 
+    def _flip_reason(self) -> str:
+        '''Human-readable explanation of flip_fragment_if_necessary()'s decision (only used for tracing).'''
+        central_keys = tuple(map(on_asc_atomic_number_then_asc_valence, (self.atom_2, self.atom_3)))
+        if central_keys[0] != central_keys[1]:
+            return 'central atoms differ ({0} vs {1})'.format(self.atom_2, self.atom_3)
+        elif len(self.neighbours_1) != len(self.neighbours_4):
+            return 'number of neighbours differ ({0} vs {1})'.format(len(self.neighbours_1), len(self.neighbours_4))
+        else:
+            for (n, (neighbour_1, neighbour_4)) in enumerate(zip(self.neighbours_1, self.neighbours_4)):
+                if on_asc_atomic_number_then_asc_valence(neighbour_1) != on_asc_atomic_number_then_asc_valence(neighbour_4):
+                    return 'neighbours {0} differ ({1} vs {2})'.format(n, neighbour_1, neighbour_4)
+            return 'symmetric fragment'
+
     def sort_neighbours_renumber_cycles(self: Any, dihedral_angles: Optional[List[float]]) -> None:
         '''Order each neighbour list by alphabetical order, reordering the (possible) cycles to match those changes.'''
         if dihedral_angles is not None:
@@ -300,44 +335,21 @@ class Dihedral_Fragment(object):
         else:
             left_dihedral_angles, right_dihedral_angles = [0.0 for _ in self.neighbours_1], [0.0 for _ in self.neighbours_4]
 
-        def ring_connectivity(item: Any, side: str) -> int:
-            assert side in ('left', 'right'), side
-
-            (i, (substituent, _)) = item
-
-            connectivity = len(
-                tuple(
-                    1
-                    for cycle in self.cycles
-                    if int(i) == int(getattr(cycle, 'i' if side == 'left' else 'j'))
-                )
-            )
-
-            sum_of_lengths = sum(
-                DESC(cycle.n)
-                for cycle in self.cycles
-                if int(i) == int(getattr(cycle, 'i' if side == 'left' else 'j'))
-            )
-
-            return (connectivity, sum_of_lengths)
+        NO_RING_CONNECTIVITY = (0, 0)
 
         def sorted_neighbours_permutation_dict(neighbours: List[str], angles: List[str], side: str) -> Tuple[Deque[str], Dict[int, int]]:
             assert len(neighbours) > 0
             assert side in ('left', 'right'), side
 
+            ring_connectivities = self.ring_connectivities(side)
+
             get_neighbour = lambda item: item[1][0]
             on_dihedral_angle_then_desc_atomic_number_and_valence_then_desc_ring_connectivity = lambda item: (
                 item[1][1],
                 on_desc_atomic_number_then_desc_valence(get_neighbour(item)),
-                DESC(ring_connectivity(item, side)),
+                DESC(ring_connectivities.get(item[0], NO_RING_CONNECTIVITY)),
             )
 
-            if DEBUG:
-                print(
-                    'list(enumerate(zip(neighbours, angles))):',
-                    list(enumerate(zip(neighbours, angles))),
-                )
-
             sorted_neighbour_items = list(
                 sorted(
                     enumerate(zip(neighbours, angles)),
@@ -348,21 +360,15 @@ class Dihedral_Fragment(object):
 
             neighbour_items_deque = deque(sorted_neighbour_items)
 
-            if DEBUG:
-                print(
-                    "list(zip(neighbours, angles)):",
-                    list(zip(neighbours, angles))
-                )
-
-            best_items = sorted(
+            best_rotation, best_items = sorted(
                 [
-                    rotated_deque(neighbour_items_deque, n)
+                    (n, rotated_deque(neighbour_items_deque, n))
                     for n in range(len(sorted_neighbour_items))
                 ],
-                key=lambda _neighbours: tuple(
+                key=lambda rotation: tuple(
                     [
                         on_asc_atomic_number_then_asc_valence(neighbour)[0]
-                        for (i, (neighbour, angle)) in _neighbours
+                        for (i, (neighbour, angle)) in rotation[1]
                     ],
                 ),
                 reverse=True,
@@ -372,6 +378,16 @@ class Dihedral_Fragment(object):
                 i: j
                 for (j, (i, _)) in enumerate(best_items)
             }
+
+            if CANONICALISATION_TRACER.debug:
+                CANONICALISATION_TRACER.emit(
+                    'rotation',
+                    side=side,
+                    neighbours=list(zip(neighbours, angles)),
+                    sorted_neighbours=[item[1] for item in sorted_neighbour_items],
+                    rotation=best_rotation,
+                    permutation=permutation_dict,
+                )
             return (
                 deque(map(get_neighbour, best_items)),
                 permutation_dict,
@@ -379,11 +395,20 @@ class Dihedral_Fragment(object):
 
         self.neighbours_1, permutation_1 = sorted_neighbours_permutation_dict(self.neighbours_1, left_dihedral_angles, 'left')
         self.neighbours_4, permutation_4 = sorted_neighbours_permutation_dict(self.neighbours_4, right_dihedral_angles, 'right')
-        self.cycles = [
+        renumbered_cycles = [
             Cycle(permutation_1[neighbour_id_1], cycle_length, permutation_4[neighbour_id_4])
             for (neighbour_id_1, cycle_length, neighbour_id_4) in self.cycles
         ]
 
+        if CANONICALISATION_TRACER.debug and self.cycles:
+            CANONICALISATION_TRACER.emit(
+                'cycle_renumbering',
+                cycles=list(self.cycles),
+                renumbered_cycles=renumbered_cycles,
+            )
+
+        self.cycles = renumbered_cycles
+
     def reverse_dihedral(self) -> None:
         self.atom_2, self.atom_3 = self.atom_3, self.atom_2
         self.neighbours_1, self.neighbours_4 = self.neighbours_4, self.neighbours_1
@@ -401,6 +426,62 @@ class Dihedral_Fragment(object):
 def remove_valences_in_fragment_str(fragment_str: str) -> str:
     return sub(CAPTURE('[a-zA-Z]+') + ONE_NUMBER + ONE_OR_MORE_TIMES, GROUP(1), fragment_str)
 
+Fragment_Keys = NamedTuple('Fragment_Keys', [('canonical', Fragment), ('valence_free', Fragment), ('chiral_flagged', Fragment)])
+
+def valence_free_atom(atom_desc: str) -> str:
+    return element_valence_for_atom(atom_desc)[0]
+
+def canonical_keys(
+    dihedral_string: Optional[str] = None,
+    atom_list: Optional[Fragment_Components] = None,
+    dihedral_angles: Optional[Tuple[List[float], List[float]]] = None,
+    valence_free_forms: Optional[Dict[str, Fragment]] = None,
+    **kwargs: Any
+) -> Fragment_Keys:
+    '''
+    The valence-aware canonical string, the valence-free one and the chirality-flagged one of a fragment, from a single parse.
+    Stripping valences can change which form is canonical, so the valence-free key is canonicalised from the valence-free atoms (only when the fragment has valences).
+    Chirality markers (as in `__str__(flag_chiral_sides=True)`) on the central atoms of `dihedral_string` are ignored.
+    `valence_free_forms` optionally caches the valence-free canonical forms across calls (without dihedral angles).
+    '''
+    assert dihedral_string is not None or atom_list is not None, [dihedral_string, atom_list]
+    if dihedral_string is not None:
+        atom_list = split_fragment_str(dihedral_string)
+    neighbours_1, atom_2, atom_3, neighbours_4 = atom_list[:4]
+    cycles = atom_list[4] if len(atom_list) == 5 else []
+    atom_2, atom_3 = atom_2.rstrip(CHIRAL_MARKER), atom_3.rstrip(CHIRAL_MARKER)
+
+    dihedral_fragment = Dihedral_Fragment(atom_list=(neighbours_1, atom_2, atom_3, neighbours_4, cycles), dihedral_angles=dihedral_angles, **kwargs)
+    canonical = str(dihedral_fragment)
+
+    valence_free_atom_list = (
+        [valence_free_atom(atom) for atom in neighbours_1],
+        valence_free_atom(atom_2),
+        valence_free_atom(atom_3),
+        [valence_free_atom(atom) for atom in neighbours_4],
+        cycles,
+    )
+    if valence_free_atom_list[:4] == (list(neighbours_1), atom_2, atom_3, list(neighbours_4)):
+        valence_free = canonical
+    elif valence_free_forms is not None and dihedral_angles is None and not kwargs:
+        cache_key = repr(valence_free_atom_list)
+        if cache_key not in valence_free_forms:
+            valence_free_forms[cache_key] = str(Dihedral_Fragment(atom_list=valence_free_atom_list))
+        valence_free = valence_free_forms[cache_key]
+    else:
+        valence_free = str(Dihedral_Fragment(atom_list=valence_free_atom_list, dihedral_angles=dihedral_angles, **kwargs))
+
+    return Fragment_Keys(canonical, valence_free, dihedral_fragment.__str__(flag_chiral_sides=True))
+
+def canonical_keys_for_fragments(dihedral_strings: Sequence[str]) -> List[Fragment_Keys]:
+    '''Bulk `canonical_keys()`, computed once per distinct fragment string (and valence-free form).'''
+    keys = {} # type: Dict[str, Fragment_Keys]
+    valence_free_forms = {} # type: Dict[str, Fragment]
+    for dihedral_string in dihedral_strings:
+        if dihedral_string not in keys:
+            keys[dihedral_string] = canonical_keys(dihedral_string, valence_free_forms=valence_free_forms)
+    return [keys[dihedral_string] for dihedral_string in dihedral_strings]
+
 def canonical_representation_for(dihedral_fragment_str: str, **kwargs: Dict[str, Any]) -> str:
     return str(Dihedral_Fragment(dihedral_fragment_str, **kwargs))
 
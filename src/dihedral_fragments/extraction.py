@@ -0,0 +1,322 @@
+'''
+Extraction of the canonical dihedral fragments of a molecule from its molecular graph (elements, bonds and optional coordinates, e.g. from a PDB file), without any ATB round-trip.
+
+Every bond whose two atoms have other neighbours is a central bond.
+The cycles of a fragment are found by a breadth-first search (bounded by MAX_RING_SIZE) from each left neighbour, which avoids both central atoms: a cycle (i, n, j) means that right neighbour j is n bonds away from left neighbour i (n = 0 if they are the same atom).
+With coordinates, neighbours are ordered by dihedral angle: left neighbour i by the dihedral (i, atom_2, atom_3, first right neighbour), right neighbour j by the dihedral (first left neighbour, atom_2, atom_3, j), which does not depend on the direction of the central bond.
+Only the cyclic order of each side is meaningful (the reference neighbour depends on the numbering of the atoms).
+For cyclic fragments, the canonical form can depend on the numbering of the atoms, through the direction of the central bond, the rotation of each side (when its atomic numbers are invariant under some rotations, e.g. `C,C,C`) and, without coordinates, the order of identical neighbours.
+The smallest form over every atom list a renumbering can give is used.
+
+A Fragment_Extractor memoises canonical forms across molecules: atom lists are normalised (neighbours sorted by description, with their cycles and angles) and each one is only canonicalised once per ordering of its neighbours (see stereo.py).
+'''
+from collections import deque
+from itertools import permutations
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment, Fragment, Cycle, on_asc_atomic_number_then_asc_valence
+from dihedral_fragments.geometry import Quadruple, central_bond_quadruples, dihedral_angles, split_angles
+from dihedral_fragments.stereo import Stereo_Fragment, Ordering, angle_ordering
+
+Coordinates = Tuple[float, float, float]
+
+Bond = Tuple[int, int]
+
+# Atoms are numbered from 0, in the order of `elements`
+Molecular_Graph = NamedTuple('Molecular_Graph', [('elements', List[str]), ('bonds', List[Bond]), ('coordinates', Optional[List[Coordinates]])])
+
+Central_Bond_Fragment = NamedTuple('Central_Bond_Fragment', [('bond', Bond), ('fragment', Fragment)])
+
+Atom_List = Tuple[Tuple[str, ...], str, str, Tuple[str, ...], Tuple[Cycle, ...]]
+
+Dihedral_Angles = Tuple[List[float], List[float]]
+
+# Largest ring (in number of atoms) which is recorded as a cycle of a fragment
+MAX_RING_SIZE = 9
+
+# Frames of a trajectory processed at once, by Fragment_Extractor and Fragment_Tracker (bounds the memory used by the intermediate arrays)
+FRAMES_PER_CHUNK = 1000
+
+class Invalid_PDB(Exception):
+    pass
+
+def adjacency_lists(n_atoms: int, bonds: Sequence[Bond]) -> List[List[int]]:
+    adjacency = [[] for _ in range(n_atoms)] # type: List[List[int]]
+    for (i, j) in bonds:
+        adjacency[i].append(j)
+        adjacency[j].append(i)
+    return adjacency
+
+def central_bonds(adjacency: Sequence[Sequence[int]]) -> List[Bond]:
+    return [
+        (atom_2, atom_3)
+        for (atom_2, neighbours) in enumerate(adjacency)
+        for atom_3 in neighbours
+        if atom_2 < atom_3 and len(neighbours) > 1 and len(adjacency[atom_3]) > 1
+    ]
+
+def bounded_distances(adjacency: Sequence[Sequence[int]], source: int, excluded: Tuple[int, int], max_distance: int) -> Dict[int, int]:
+    '''Number of bonds from `source` to every atom at most `max_distance` bonds away, on paths avoiding the `excluded` atoms.'''
+    distances = {source: 0}
+    queue = deque([source])
+    while queue:
+        atom = queue.popleft()
+        if distances[atom] == max_distance:
+            continue
+        for neighbour in adjacency[atom]:
+            if neighbour not in distances and neighbour not in excluded:
+                distances[neighbour] = distances[atom] + 1
+                queue.append(neighbour)
+    return distances
+
+def atom_desc(graph: Molecular_Graph, adjacency: Sequence[Sequence[int]], atom: int, use_valences: bool) -> str:
+    return graph.elements[atom].upper() + (str(len(adjacency[atom])) if use_valences else '')
+
+Fragment_Topology = NamedTuple(
+    'Fragment_Topology',
+    [('bond', Bond), ('atom_list', Tuple[List[str], str, str, List[str], List[Cycle]]), ('left_neighbours', List[int]), ('right_neighbours', List[int])],
+)
+
+def fragment_topologies(graph: Molecular_Graph, use_valences: bool = False, max_ring_size: int = MAX_RING_SIZE) -> List[Fragment_Topology]:
+    '''Central bond, atom_list (before canonicalisation) and neighbour atoms of every fragment of a molecule, which only depend on its molecular graph.'''
+    adjacency = adjacency_lists(len(graph.elements), graph.bonds)
+    descs = [atom_desc(graph, adjacency, atom, use_valences) for atom in range(len(graph.elements))]
+    max_cycle_length = max_ring_size - 3
+
+    topologies = []
+    for (atom_2, atom_3) in central_bonds(adjacency):
+        left_neighbours = [atom for atom in adjacency[atom_2] if atom != atom_3]
+        right_neighbours = [atom for atom in adjacency[atom_3] if atom != atom_2]
+
+        cycles = []
+        for (i, left_neighbour) in enumerate(left_neighbours):
+            distances = bounded_distances(adjacency, left_neighbour, (atom_2, atom_3), max_cycle_length)
+            cycles.extend(
+                Cycle(i, distances[right_neighbour], j)
+                for (j, right_neighbour) in enumerate(right_neighbours)
+                if right_neighbour in distances
+            )
+
+        topologies.append(
+            Fragment_Topology(
+                (atom_2, atom_3),
+                ([descs[atom] for atom in left_neighbours], descs[atom_2], descs[atom_3], [descs[atom] for atom in right_neighbours], cycles),
+                left_neighbours,
+                right_neighbours,
+            ),
+        )
+    return topologies
+
+def topology_quadruples(topologies: Sequence[Fragment_Topology]) -> List[Quadruple]:
+    return [
+        quadruple
+        for topology in topologies
+        for quadruple in central_bond_quadruples(topology.bond[0], topology.bond[1], topology.left_neighbours, topology.right_neighbours)
+    ]
+
+def topology_dihedral_angles(topologies: Sequence[Fragment_Topology], angles: Sequence[float]) -> List[Dihedral_Angles]:
+    '''Split the angles of `topology_quadruples(topologies)` (for one frame) by fragment.'''
+    return split_angles(angles, [(len(topology.left_neighbours), len(topology.right_neighbours)) for topology in topologies])
+
+def fragment_atom_lists(
+    graph: Molecular_Graph,
+    use_valences: bool = False,
+    max_ring_size: int = MAX_RING_SIZE,
+) -> Iterator[Tuple[Bond, Tuple[List[str], str, str, List[str], List[Cycle]], Optional[Dihedral_Angles]]]:
+    '''(central bond, atom_list, dihedral_angles) of every central bond of a molecule, before canonicalisation. Every dihedral angle is computed at once.'''
+    topologies = fragment_topologies(graph, use_valences=use_valences, max_ring_size=max_ring_size)
+    if graph.coordinates is not None:
+        angles = topology_dihedral_angles(topologies, dihedral_angles(graph.coordinates, topology_quadruples(topologies)).tolist()) # type: Sequence[Optional[Dihedral_Angles]]
+    else:
+        angles = [None] * len(topologies)
+    for (topology, dihedral_angles_for_topology) in zip(topologies, angles):
+        yield (topology.bond, topology.atom_list, dihedral_angles_for_topology)
+
+def normalised_atom_list(atom_list: Tuple[List[str], str, str, List[str], List[Cycle]], dihedral_angles: Optional[Dihedral_Angles]) -> Tuple[Atom_List, Optional[Dihedral_Angles]]:
+    '''Same fragment (and angles), with the neighbours of each side sorted by description (which does not change its canonical forms).'''
+    neighbours_1, atom_2, atom_3, neighbours_4, cycles = atom_list
+    order_1 = sorted(range(len(neighbours_1)), key=neighbours_1.__getitem__)
+    order_4 = sorted(range(len(neighbours_4)), key=neighbours_4.__getitem__)
+    position_1, position_4 = {old: new for (new, old) in enumerate(order_1)}, {old: new for (new, old) in enumerate(order_4)}
+    return (
+        (
+            tuple(neighbours_1[k] for k in order_1),
+            atom_2,
+            atom_3,
+            tuple(neighbours_4[k] for k in order_4),
+            tuple(sorted(Cycle(position_1[i], n, position_4[j]) for (i, n, j) in cycles)),
+        ),
+        (
+            ([dihedral_angles[0][k] for k in order_1], [dihedral_angles[1][k] for k in order_4])
+            if dihedral_angles is not None
+            else None
+        ),
+    )
+
+def symmetric_rotations(neighbours: Sequence[str], ordering: Ordering) -> List[Ordering]:
+    '''Rotations of `ordering` which leave the atomic numbers of the ordered neighbours unchanged (canonicalisation can not tell them apart).'''
+    atomic_numbers = [on_asc_atomic_number_then_asc_valence(neighbours[k])[0] for k in ordering]
+    return [
+        ordering[n:] + ordering[:n]
+        for n in range(len(ordering))
+        if atomic_numbers[n:] + atomic_numbers[:n] == atomic_numbers
+    ]
+
+def reversed_atom_list(atom_list: Atom_List) -> Atom_List:
+    '''Same fragment, seen from its other central atom.'''
+    neighbours_1, atom_2, atom_3, neighbours_4, cycles = atom_list
+    return (neighbours_4, atom_3, atom_2, neighbours_1, tuple(sorted(Cycle(j, n, i) for (i, n, j) in cycles)))
+
+def identical_neighbour_permutations(neighbours: Sequence[str]) -> List[Ordering]:
+    '''Permutations of the indices of `neighbours` which only exchange identical neighbours.'''
+    return [
+        permutation
+        for permutation in permutations(range(len(neighbours)))
+        if all(neighbours[k] == neighbours[index] for (index, k) in enumerate(permutation))
+    ]
+
+def renumbered_atom_lists(atom_list: Atom_List) -> List[Atom_List]:
+    '''Every (normalised) atom list of a fragment that a renumbering of its molecule can give without coordinates: both directions of the central bond, and any order of identical neighbours.'''
+    atom_lists = set()
+    for (neighbours_1, atom_2, atom_3, neighbours_4, cycles) in (atom_list, reversed_atom_list(atom_list)):
+        for permutation_1 in identical_neighbour_permutations(neighbours_1):
+            for permutation_4 in identical_neighbour_permutations(neighbours_4):
+                atom_lists.add((neighbours_1, atom_2, atom_3, neighbours_4, tuple(sorted(Cycle(permutation_1[i], n, permutation_4[j]) for (i, n, j) in cycles))))
+    return sorted(atom_lists)
+
+class Fragment_Extractor(object):
+    def __init__(self, use_valences: bool = False, max_ring_size: int = MAX_RING_SIZE) -> None:
+        self.use_valences = use_valences
+        self.max_ring_size = max_ring_size
+        self.stereo_fragments = {} # type: Dict[Atom_List, Stereo_Fragment]
+        self.canonical_forms = {} # type: Dict[Atom_List, Fragment]
+
+    def canonical_fragment(self, atom_list: Tuple[List[str], str, str, List[str], List[Cycle]], dihedral_angles: Optional[Dihedral_Angles] = None) -> Fragment:
+        key, dihedral_angles = normalised_atom_list(atom_list, dihedral_angles)
+        if dihedral_angles is None:
+            if key not in self.canonical_forms:
+                self.canonical_forms[key] = min(str(Dihedral_Fragment(atom_list=renumbered_key)) for renumbered_key in (renumbered_atom_lists(key) if key[4] else [key]))
+            return self.canonical_forms[key]
+
+        left_ordering, right_ordering = angle_ordering(dihedral_angles[0]), angle_ordering(dihedral_angles[1])
+        if left_ordering is None or right_ordering is None:
+            if not key[4]:
+                return str(Dihedral_Fragment(atom_list=key, dihedral_angles=dihedral_angles))
+            return min(
+                str(Dihedral_Fragment(atom_list=key, dihedral_angles=dihedral_angles)),
+                str(Dihedral_Fragment(atom_list=reversed_atom_list(key), dihedral_angles=dihedral_angles[::-1])),
+            )
+
+        if not key[4]:
+            return self.stereo_fragment(key).form_for_orderings(left_ordering, right_ordering)
+        else:
+            # The dihedral angles do not depend on the direction of the central bond: seen from atom_3, the orderings of the sides are swapped
+            return min(
+                self.stereo_fragment(oriented_key).form_for_orderings(left_rotation, right_rotation)
+                for (oriented_key, (oriented_left_ordering, oriented_right_ordering)) in ((key, (left_ordering, right_ordering)), (reversed_atom_list(key), (right_ordering, left_ordering)))
+                for left_rotation in symmetric_rotations(oriented_key[0], oriented_left_ordering)
+                for right_rotation in symmetric_rotations(oriented_key[3], oriented_right_ordering)
+            )
+
+    def stereo_fragment(self, key: Atom_List) -> Stereo_Fragment:
+        if key not in self.stereo_fragments:
+            self.stereo_fragments[key] = Stereo_Fragment(key)
+        return self.stereo_fragments[key]
+
+    def central_bond_fragments(self, graph: Molecular_Graph) -> List[Central_Bond_Fragment]:
+        return [
+            Central_Bond_Fragment(bond, self.canonical_fragment(atom_list, dihedral_angles))
+            for (bond, atom_list, dihedral_angles) in fragment_atom_lists(graph, use_valences=self.use_valences, max_ring_size=self.max_ring_size)
+        ]
+
+    def dihedral_fragments(self, graph: Molecular_Graph) -> List[Fragment]:
+        '''Canonical dihedral fragment of every central bond of a molecule (ordered by central bond), in the notation of ATB's `dihedral_fragments` output.'''
+        return [fragment for (_, fragment) in self.central_bond_fragments(graph)]
+
+    def dihedral_fragments_for_frames(self, graph: Molecular_Graph, trajectory: Any, frames_per_chunk: int = FRAMES_PER_CHUNK) -> List[List[Fragment]]:
+        '''
+        Canonical dihedral fragments of every frame of a trajectory (an (F, N, 3) array of coordinates) of a molecule.
+        The topology is only computed once, and the dihedral angles of `frames_per_chunk` frames at a time in a single vectorised call.
+        '''
+        topologies = fragment_topologies(graph, use_valences=self.use_valences, max_ring_size=self.max_ring_size)
+        quadruples = topology_quadruples(topologies)
+        fragments_for_frames = [] # type: List[List[Fragment]]
+        for start in range(0, len(trajectory), frames_per_chunk):
+            if quadruples:
+                chunk_angles = dihedral_angles(trajectory[start:start + frames_per_chunk], quadruples).tolist()
+            else:
+                chunk_angles = [[] for _ in trajectory[start:start + frames_per_chunk]]
+            fragments_for_frames.extend(
+                [
+                    self.canonical_fragment(topology.atom_list, dihedral_angles_for_topology)
+                    for (topology, dihedral_angles_for_topology) in zip(topologies, topology_dihedral_angles(topologies, frame_angles))
+                ]
+                for frame_angles in chunk_angles
+            )
+        return fragments_for_frames
+
+    def dihedral_fragments_for_graphs(self, graphs: Iterable[Molecular_Graph]) -> List[List[Fragment]]:
+        return [self.dihedral_fragments(graph) for graph in graphs]
+
+def dihedral_fragments_for_graph(graph: Molecular_Graph, use_valences: bool = False, max_ring_size: int = MAX_RING_SIZE) -> List[Fragment]:
+    return Fragment_Extractor(use_valences=use_valences, max_ring_size=max_ring_size).dihedral_fragments(graph)
+
+def pdb_element(line: str) -> str:
+    element = line[76:78].strip()
+    if element:
+        return element.upper()
+    # Without an element column, one-letter elements are right-justified in the (4 characters) atom name
+    atom_name = line[12:16]
+    return (atom_name[1] if atom_name[0] in ' 0123456789' else atom_name[0:2]).upper()
+
+def molecular_graph_for_pdb_str(pdb_str: str) -> Molecular_Graph:
+    '''Atoms (ATOM/HETATM records) and bonds (CONECT records) of a PDB file. Bonds are only read from CONECT records.'''
+    elements, coordinates = [], [] # type: List[str], List[Coordinates]
+    index_for_serial = {} # type: Dict[int, int]
+    conect_lines = []
+    for line in pdb_str.splitlines():
+        if line.startswith(('ATOM', 'HETATM')):
+            try:
+                index_for_serial[int(line[6:11])] = len(elements)
+                coordinates.append((float(line[30:38]), float(line[38:46]), float(line[46:54])))
+            except ValueError:
+                raise Invalid_PDB('Invalid atom record: "{0}"'.format(line))
+            elements.append(pdb_element(line))
+        elif line.startswith('CONECT'):
+            conect_lines.append(line)
+
+    bonds = set()
+    for line in conect_lines:
+        try:
+            serial, *bonded_serials = map(int, line[6:].split())
+            bonds.update(
+                tuple(sorted((index_for_serial[serial], index_for_serial[bonded_serial])))
+                for bonded_serial in bonded_serials
+            )
+        except (ValueError, KeyError):
+            raise Invalid_PDB('Invalid CONECT record: "{0}"'.format(line))
+
+    return Molecular_Graph(elements, sorted(bonds), coordinates)
+
+def molecular_graph_for_pdb_file(pdb_file: str) -> Molecular_Graph:
+    with open(pdb_file) as fh:
+        return molecular_graph_for_pdb_str(fh.read())
+
+def pdb_str_for_molecular_graph(graph: Molecular_Graph) -> str:
+    '''Minimal PDB (HETATM and CONECT records) for a molecular graph (atoms without coordinates are placed at the origin).'''
+    coordinates = graph.coordinates if graph.coordinates is not None else [(0.0, 0.0, 0.0)] * len(graph.elements)
+    adjacency = adjacency_lists(len(graph.elements), graph.bonds)
+    return '\n'.join(
+        [
+            'HETATM{0:>5d} {1:<4s} MOL     1    {2:8.3f}{3:8.3f}{4:8.3f}  1.00  0.00          {5:>2s}'.format(index + 1, element, x, y, z, element)
+            for (index, (element, (x, y, z))) in enumerate(zip(graph.elements, coordinates))
+        ]
+        +
+        [
+            'CONECT' + ''.join('{0:>5d}'.format(atom + 1) for atom in [index] + neighbours)
+            for (index, neighbours) in enumerate(adjacency)
+            if neighbours
+        ]
+        +
+        ['END']
+    ) + '\n'
@@ -0,0 +1,19 @@
+'''
+Byte-layout and file helpers shared by the binary containers (fragment files, roaring bitmaps, posting files) and the on-disk caches (thumbnails, minimised PDBs).
+'''
+from os import makedirs, replace
+from os.path import dirname
+from tempfile import NamedTemporaryFile
+
+def padding(n_bytes: int, alignment: int = 8) -> int:
+    '''Number of zero bytes to write after `n_bytes` bytes to reach the next multiple of `alignment`.'''
+    return (-n_bytes) % alignment
+
+def atomic_write(path: str, data: bytes) -> None:
+    '''Write `data` to `path` through a temporary file in the same directory, so that readers never see a partial file.'''
+    directory = dirname(path)
+    if directory:
+        makedirs(directory, exist_ok=True)
+    with NamedTemporaryFile(dir=directory or '.', delete=False) as fh:
+        fh.write(data)
+    replace(fh.name, path)
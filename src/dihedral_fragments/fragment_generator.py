@@ -1,7 +1,7 @@
 from itertools import product, combinations_with_replacement
+from typing import Dict, Iterator, List, Tuple
 
 from dihedral_fragments.dihedral_fragment import Dihedral_Fragment
-from dihedral_fragments.tag_predictor import tags_for_dihedral
 from dihedral_fragments.chemistry import CHEMICAL_GROUPS
 
 MONOVALENT = (1,)
@@ -43,20 +43,33 @@ FORBIDDEN_BONDS = [sorted(bond) for bond in FORBIDDEN_BONDS]
 def is_forbidden_bond(bond):
     return (sorted(bond) in FORBIDDEN_BONDS)
 
-def main():
-    for (atom_2, atom_3) in combinations_with_replacement(CENTRAL_ATOMS, 2):
+def enumerated_fragments(atom_valences: Dict[str, Tuple[int, ...]] = ATOM_VALENCES, forbidden_bonds: List[List[str]] = FORBIDDEN_BONDS) -> Iterator[str]:
+    '''Every acyclic canonical fragment (possibly with duplicates) built from ATOMS (or `atom_valences`' atoms) around non-forbidden central bonds.'''
+    atoms = list(atom_valences)
+    central_atoms = [atom for atom in atoms if atom_valences[atom] != MONOVALENT]
+    for (atom_2, atom_3) in combinations_with_replacement(central_atoms, 2):
 
-        if is_forbidden_bond((atom_2, atom_3)):
+        if sorted((atom_2, atom_3)) in forbidden_bonds:
             continue
 
-        for (len_neighbours_1, len_neighbours_4) in product(number_neighbours(atom_2), number_neighbours(atom_3)):
-            neighbours_1 = combinations_with_replacement(ATOMS, len_neighbours_1)
-            neighbours_4 = combinations_with_replacement(ATOMS, len_neighbours_4)
+        for (len_neighbours_1, len_neighbours_4) in product(*[[valence - 1 for valence in atom_valences[atom]] for atom in (atom_2, atom_3)]):
+            if len_neighbours_1 == 0 or len_neighbours_4 == 0:
+                continue
+            neighbours_1 = combinations_with_replacement(atoms, len_neighbours_1)
+            neighbours_4 = combinations_with_replacement(atoms, len_neighbours_4)
             for a, b in product(neighbours_1, neighbours_4):
-                d = str(Dihedral_Fragment(atom_list=(list(a), atom_2, atom_3, list(b))))
-                tags = tags_for_dihedral(d)
-                if len(tags) > 0:
-                    print(d, tags)
+                yield str(Dihedral_Fragment(atom_list=(list(a), atom_2, atom_3, list(b))))
+
+def main():
+    # Only the tagged fragments are listed (by `Overlap_Analyser`), rather than tagging every fragment
+    from dihedral_fragments.group_overlaps import Overlap_Analyser
+    overlap_analyser = Overlap_Analyser()
+    tags_for_fragment = {} # type: Dict[str, List[str]]
+    for moiety in overlap_analyser.side_boxes:
+        for d in overlap_analyser.matching_fragments(moiety):
+            tags_for_fragment.setdefault(d, []).append(moiety)
+    for (d, tags) in sorted(tags_for_fragment.items()):
+        print(d, tags)
 
 if __name__ == '__main__':
     main()
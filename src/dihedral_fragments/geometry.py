@@ -0,0 +1,48 @@
+'''
+Vectorised dihedral angles, for the `dihedral_angles` argument of Dihedral_Fragment (see README.md).
+
+All the dihedrals of a molecule (or of every frame of a trajectory) are computed in a single NumPy call, from an (N, 3) (or (F, N, 3)) coordinate array and a (Q, 4) array of atom index quadruples.
+'''
+from typing import Any, List, Sequence, Tuple
+
+import numpy as np
+
+Quadruple = Tuple[int, int, int, int]
+
+def dihedral_angles(coordinates: Any, quadruples: Any) -> np.ndarray:
+    '''
+    Dihedral angles (in degrees, in [-180, 180]) between the planes (i, j, k) and (j, k, l) of every (i, j, k, l) quadruple.
+    `coordinates` is an (N, 3) array (angles of shape (Q,)) or an (F, N, 3) array of F frames (angles of shape (F, Q)).
+    '''
+    coordinates = np.asarray(coordinates, dtype=np.float64)
+    quadruples = np.asarray(quadruples, dtype=np.intp).reshape(-1, 4)
+    p0, p1, p2, p3 = (coordinates[..., quadruples[:, n], :] for n in range(4))
+
+    b0, b1, b2 = p0 - p1, p2 - p1, p3 - p2
+    norm = np.linalg.norm(b1, axis=-1, keepdims=True)
+    b1 /= np.where(norm > 0.0, norm, 1.0)
+    # Projections of the outer bonds on the plane orthogonal to the central bond
+    v = b0 - np.sum(b0 * b1, axis=-1, keepdims=True) * b1
+    w = b2 - np.sum(b2 * b1, axis=-1, keepdims=True) * b1
+    return np.degrees(np.arctan2(np.sum(np.cross(b1, v) * w, axis=-1), np.sum(v * w, axis=-1)))
+
+def central_bond_quadruples(atom_2: int, atom_3: int, left_neighbours: Sequence[int], right_neighbours: Sequence[int]) -> List[Quadruple]:
+    '''
+    Quadruples of the `dihedral_angles` of a fragment: d(A_i, B, C, D_0) for every left neighbour, then d(A_0, B, C, D_j) (i.e. d(D_j, C, B, A_0)) for every right neighbour.
+    Any reference neighbour (A_0, D_0) gives the same stereochemistry.
+    '''
+    return (
+        [(atom, atom_2, atom_3, right_neighbours[0]) for atom in left_neighbours]
+        +
+        [(left_neighbours[0], atom_2, atom_3, atom) for atom in right_neighbours]
+    )
+
+def split_angles(angles: Sequence[float], sizes: Sequence[Tuple[int, int]]) -> List[Tuple[List[float], List[float]]]:
+    '''Split the (flat) angles of consecutive `central_bond_quadruples()` into (left angles, right angles) pairs, given the (n_left, n_right) size of every fragment.'''
+    angles = list(angles)
+    split, start = [], 0
+    for (n_left, n_right) in sizes:
+        split.append((angles[start:start + n_left], angles[start + n_left:start + n_left + n_right]))
+        start += n_left + n_right
+    assert start == len(angles), (start, len(angles))
+    return split
@@ -0,0 +1,233 @@
+'''
+Overlaps between chemical groups, and their coverage of the acyclic fragment space of `fragment_generator`, computed without enumerating that space.
+
+Every regular expression of a pattern (see `re_patterns()`) is anchored, and made of four components (left neighbours, central atoms, right neighbours) separated by `[|]`, none of which can match a `|`:
+a fragment matches it if and only if each of its components fully matches the corresponding component of the regular expression.
+The fragments matched by a pattern are hence a union of boxes (sets of left sides x central atoms x central atoms x sets of right sides), found by matching each component against the few hundred distinct sides (and central atoms) only.
+Sides are numbered by increasing number of neighbours, then atomic numbers, so that a fragment with identical central atoms is canonical if and only if its left side's number is larger than (or equal to) its right side's,
+and sets of sides are bitsets (Python ints): two groups overlap if and only if two of their boxes intersect on a canonical fragment.
+
+    python3 -m dihedral_fragments.group_overlaps
+'''
+from argparse import ArgumentParser
+from itertools import combinations, combinations_with_replacement
+from re import compile, escape
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from dihedral_fragments.atomic_numbers import ATOMIC_NUMBERS
+from dihedral_fragments.chemistry import CHEMICAL_GROUPS
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment, Fragment, GROUP_SEPARATOR, join_groups, join_neighbours, on_desc_atomic_number_then_desc_valence, split_group_str
+from dihedral_fragments.fragment_generator import ATOM_VALENCES, FORBIDDEN_BONDS, MONOVALENT
+from dihedral_fragments.materialisation import Bitset, ids_for_bitset, popcount
+from dihedral_fragments.pattern_matching import has_regex_pattern, has_substitution_pattern, re_patterns
+from dihedral_fragments.regex import FORMAT_UNESCAPED, REGEX_END_ANCHOR, REGEX_ESCAPE, REGEX_START_ANCHOR
+
+Chemical_Group = Tuple[str, str]
+
+# Regular expressions of a fragment's left side, central atoms and right side
+Fragment_Box = NamedTuple('Fragment_Box', [('left', str), ('atom_2', str), ('atom_3', str), ('right', str)])
+
+# Canonical central atoms, and the sets of sides (bitsets of side numbers) they can be bonded to
+Fragment_Cell = NamedTuple('Fragment_Cell', [('atom_2', str), ('atom_3', str), ('left', Bitset), ('right', Bitset)])
+
+# Fragments of a cell whose left side is in `left` and right side in `right`
+Side_Box = NamedTuple('Side_Box', [('cell', int), ('left', Bitset), ('right', Bitset)])
+
+Group_Overlap = NamedTuple('Group_Overlap', [('moiety_1', str), ('moiety_2', str), ('n_fragments', int), ('witness', Fragment)])
+
+Coverage = NamedTuple('Coverage', [('n_fragments', int), ('n_tagged', int), ('n_ambiguous', int), ('n_fragments_for_group', Dict[str, int])])
+
+COMPONENT_SEPARATOR = REGEX_ESCAPE(GROUP_SEPARATOR, flavour='re')
+
+class Unsplittable_Pattern(Exception):
+    pass
+
+def fragment_boxes(pattern: str) -> List[Fragment_Box]:
+    '''The boxes of the acyclic fragments matched by `pattern` (as by `re_pattern_matching_for()`).'''
+    if not (has_substitution_pattern(pattern) or has_regex_pattern(pattern)):
+        components = split_group_str(str(Dihedral_Fragment(pattern)))
+        return [Fragment_Box(*map(escape, components))] if len(components) == 4 else []
+
+    boxes = []
+    for regex in re_patterns(pattern, full_regex=True, flavour='re'):
+        regex = FORMAT_UNESCAPED(regex)
+        components = regex[len(REGEX_START_ANCHOR):-len(REGEX_END_ANCHOR)].split(COMPONENT_SEPARATOR)
+        if not (regex.startswith(REGEX_START_ANCHOR) and regex.endswith(REGEX_END_ANCHOR)) or len(components) != 4:
+            raise Unsplittable_Pattern('Could not split "{0}" (for "{1}") into four components'.format(regex, pattern))
+        boxes.append(Fragment_Box(*components))
+    return list(dict.fromkeys(boxes))
+
+def side_key(side: Sequence[str]) -> Tuple[int, Tuple[int, ...]]:
+    '''Sides with larger keys go on the left of fragments with identical central atoms (see `flip_fragment_if_necessary()`).'''
+    return (len(side), tuple(ATOMIC_NUMBERS[atom] for atom in side))
+
+def highest_id(bitset: Bitset) -> int:
+    return bitset.bit_length() - 1
+
+def lowest_id(bitset: Bitset) -> int:
+    return highest_id(bitset & -bitset)
+
+class Fragment_Space(object):
+    '''The canonical acyclic fragments of `enumerated_fragments()`, as cells of central atoms bonded to sets of sides.'''
+    def __init__(self, atom_valences: Dict[str, Tuple[int, ...]] = ATOM_VALENCES, forbidden_bonds: List[List[str]] = FORBIDDEN_BONDS) -> None:
+        atoms = list(atom_valences)
+        central_atoms = [atom for atom in atoms if atom_valences[atom] != MONOVALENT]
+        number_neighbours = {atom: [valence - 1 for valence in atom_valences[atom] if valence > 1] for atom in central_atoms}
+
+        sides = sorted(
+            (
+                sorted(combination, key=on_desc_atomic_number_then_desc_valence)
+                for size in sorted({size for sizes in number_neighbours.values() for size in sizes})
+                for combination in combinations_with_replacement(atoms, size)
+            ),
+            key=side_key,
+        )
+        self.sides = [join_neighbours(side) for side in sides]
+        sides_of_size = {} # type: Dict[int, Bitset]
+        for (side_id, side) in enumerate(sides):
+            sides_of_size[len(side)] = sides_of_size.get(len(side), 0) | (1 << side_id)
+
+        self.cells = [] # type: List[Fragment_Cell]
+        for bond in combinations_with_replacement(central_atoms, 2):
+            if sorted(bond) in forbidden_bonds:
+                continue
+            atom_2, atom_3 = sorted(bond, key=lambda atom: ATOMIC_NUMBERS[atom], reverse=True)
+            self.cells.append(
+                Fragment_Cell(
+                    atom_2,
+                    atom_3,
+                    *[sum(sides_of_size[size] for size in number_neighbours[atom]) for atom in (atom_2, atom_3)]
+                ),
+            )
+
+    def is_symmetric(self, cell: int) -> bool:
+        return self.cells[cell].atom_2 == self.cells[cell].atom_3
+
+    def canonical_right_sides(self, cell: int, left_side: int) -> Bitset:
+        '''Right sides making a canonical fragment of `cell` with `left_side`.'''
+        if self.is_symmetric(cell):
+            return self.cells[cell].right & ((1 << (left_side + 1)) - 1)
+        return self.cells[cell].right
+
+    def fragment(self, cell: int, left_side: int, right_side: int) -> Fragment:
+        return join_groups([self.sides[left_side], self.cells[cell].atom_2, self.cells[cell].atom_3, self.sides[right_side]])
+
+    def n_fragments(self) -> int:
+        return sum(self.n_fragments_in(Side_Box(cell, fragment_cell.left, fragment_cell.right)) for (cell, fragment_cell) in enumerate(self.cells))
+
+    def n_fragments_in(self, side_box: Side_Box) -> int:
+        return sum(popcount(side_box.right & self.canonical_right_sides(side_box.cell, left_side)) for left_side in ids_for_bitset(side_box.left))
+
+    def witness(self, side_box: Side_Box) -> Optional[Fragment]:
+        '''The canonical fragment of `side_box` with the smallest sides (if any).'''
+        if not (side_box.left and side_box.right):
+            return None
+        right_side = lowest_id(side_box.right)
+        if self.is_symmetric(side_box.cell):
+            # Left sides can not be smaller than the right side
+            left_sides = side_box.left & ~((1 << right_side) - 1)
+            return self.fragment(side_box.cell, lowest_id(left_sides), right_side) if left_sides else None
+        return self.fragment(side_box.cell, lowest_id(side_box.left), right_side)
+
+def intersected_box(side_box_1: Side_Box, side_box_2: Side_Box) -> Side_Box:
+    return Side_Box(side_box_1.cell, side_box_1.left & side_box_2.left, side_box_1.right & side_box_2.right)
+
+class Overlap_Analyser(object):
+    '''The boxes of the fragments of a `Fragment_Space` matched by each chemical group.'''
+    def __init__(self, chemical_groups: Sequence[Chemical_Group] = CHEMICAL_GROUPS, fragment_space: Optional[Fragment_Space] = None) -> None:
+        self.fragment_space = fragment_space if fragment_space is not None else Fragment_Space()
+        self.side_sets = {} # type: Dict[str, Bitset]
+        self.side_boxes = {} # type: Dict[str, List[Side_Box]]
+        for (moiety, pattern) in chemical_groups:
+            if pattern:
+                self.side_boxes[moiety] = self.side_boxes.get(moiety, []) + self.side_boxes_for(pattern)
+
+    def side_set(self, regex: str) -> Bitset:
+        '''Sides fully matching `regex`.'''
+        if regex not in self.side_sets:
+            compiled_regex = compile(regex)
+            self.side_sets[regex] = sum(1 << side_id for (side_id, side) in enumerate(self.fragment_space.sides) if compiled_regex.fullmatch(side))
+        return self.side_sets[regex]
+
+    def side_boxes_for(self, pattern: str) -> List[Side_Box]:
+        side_boxes = []
+        for fragment_box in fragment_boxes(pattern):
+            atom_2_regex, atom_3_regex = compile(fragment_box.atom_2), compile(fragment_box.atom_3)
+            for (cell, fragment_cell) in enumerate(self.fragment_space.cells):
+                if atom_2_regex.fullmatch(fragment_cell.atom_2) and atom_3_regex.fullmatch(fragment_cell.atom_3):
+                    side_box = Side_Box(cell, self.side_set(fragment_box.left) & fragment_cell.left, self.side_set(fragment_box.right) & fragment_cell.right)
+                    if self.fragment_space.witness(side_box) is not None:
+                        side_boxes.append(side_box)
+        return side_boxes
+
+    def rows(self, side_boxes: Sequence[Side_Box]) -> Dict[Tuple[int, int], Bitset]:
+        '''(cell, left side) -> canonical right sides of the union of `side_boxes`.'''
+        rows = {} # type: Dict[Tuple[int, int], Bitset]
+        for side_box in side_boxes:
+            for left_side in ids_for_bitset(side_box.left):
+                rows[(side_box.cell, left_side)] = rows.get((side_box.cell, left_side), 0) | (side_box.right & self.fragment_space.canonical_right_sides(side_box.cell, left_side))
+        return rows
+
+    def matching_fragments(self, moiety: str) -> Iterator[Fragment]:
+        for ((cell, left_side), right_sides) in sorted(self.rows(self.side_boxes[moiety]).items()):
+            for right_side in ids_for_bitset(right_sides):
+                yield self.fragment_space.fragment(cell, left_side, right_side)
+
+    def n_fragments(self, moiety: str) -> int:
+        return sum(map(popcount, self.rows(self.side_boxes[moiety]).values()))
+
+    def overlap(self, moiety_1: str, moiety_2: str) -> Optional[Group_Overlap]:
+        intersected_boxes = [
+            intersected_box(side_box_1, side_box_2)
+            for side_box_1 in self.side_boxes[moiety_1]
+            for side_box_2 in self.side_boxes[moiety_2]
+            if side_box_1.cell == side_box_2.cell
+        ]
+        witnesses = [witness for witness in map(self.fragment_space.witness, intersected_boxes) if witness is not None]
+        if not witnesses:
+            return None
+        return Group_Overlap(moiety_1, moiety_2, sum(map(popcount, self.rows(intersected_boxes).values())), min(witnesses, key=len))
+
+    def overlaps(self) -> List[Group_Overlap]:
+        '''Every pair of groups matching a common fragment (and therefore tripping `tags_for_dihedral()`).'''
+        return [
+            group_overlap
+            for group_overlap in (self.overlap(moiety_1, moiety_2) for (moiety_1, moiety_2) in combinations(self.side_boxes, 2))
+            if group_overlap is not None
+        ]
+
+    def coverage(self) -> Coverage:
+        tagged, ambiguous = {}, {} # type: Tuple[Dict[Tuple[int, int], Bitset], Dict[Tuple[int, int], Bitset]]
+        n_fragments_for_group = {}
+        for (moiety, side_boxes) in self.side_boxes.items():
+            rows = self.rows(side_boxes)
+            n_fragments_for_group[moiety] = sum(map(popcount, rows.values()))
+            for (row, right_sides) in rows.items():
+                ambiguous[row] = ambiguous.get(row, 0) | (tagged.get(row, 0) & right_sides)
+                tagged[row] = tagged.get(row, 0) | right_sides
+        return Coverage(
+            self.fragment_space.n_fragments(),
+            sum(map(popcount, tagged.values())),
+            sum(map(popcount, ambiguous.values())),
+            n_fragments_for_group,
+        )
+
+def parse_args() -> Any:
+    parser = ArgumentParser(description='Overlaps between CHEMICAL_GROUPS, and their coverage of the acyclic fragments of `fragment_generator`.')
+    parser.add_argument('--fragments', action='store_true', help='Also print the number of fragments matched by each group.')
+    return parser.parse_args()
+
+def main() -> None:
+    args = parse_args()
+    overlap_analyser = Overlap_Analyser()
+    for group_overlap in overlap_analyser.overlaps():
+        print('"{0}" and "{1}" overlap on {2} fragments, e.g. {3}'.format(*group_overlap))
+
+    coverage = overlap_analyser.coverage()
+    print('{0} fragments: {1} tagged ({2:.1f}%), {3} by several groups'.format(coverage.n_fragments, coverage.n_tagged, 100 * coverage.n_tagged / coverage.n_fragments, coverage.n_ambiguous))
+    if args.fragments:
+        for (moiety, n_fragments) in sorted(coverage.n_fragments_for_group.items(), key=lambda item: -item[1]):
+            print('{0}: {1}'.format(moiety, n_fragments))
+
+if __name__ == '__main__':
+    main()
@@ -1,24 +1,139 @@
-from typing import List, Any, Optional
+from typing import List, Any, Callable, Dict, Optional, Sequence, Tuple
+from itertools import permutations
+from re import compile
 
-from dihedral_fragments.dihedral_fragment import GROUP_SEPARATOR, on_asc_atomic_number_then_asc_valence, NEIGHBOUR_SEPARATOR
+from dihedral_fragments.atomic_numbers import ATOMIC_NUMBERS
+from dihedral_fragments.dihedral_fragment import on_asc_atomic_number_then_asc_valence, on_desc_atomic_number_then_desc_valence, element_valence_for_atom, join_groups, join_neighbours, split_group_str, split_neighbour_str, Invalid_Dihedral_Angles, NO_VALENCE
+from dihedral_fragments.pattern_matching import has_substitution_pattern, has_regex_pattern, sorted_components_list, escaped_special_regex_characters
+from dihedral_fragments.regex import FORMAT_UNESCAPED
+from dihedral_fragments.tracing import PATTERN_MATCHING_TRACER
+
+Improper_Str = str
+
+Compact_Improper = Tuple[int, ...]
+
+def split_improper_str(improper_str: Improper_Str) -> Tuple[str, List[str]]:
+    fields = split_group_str(improper_str)
+    assert len(fields) == 2, fields
+    return (fields[0].upper(), [atom.upper() for atom in split_neighbour_str(fields[1])])
+
+def ordered_neighbours(neighbours: Sequence[str], improper_angles: Optional[Sequence[float]] = None) -> List[str]:
+    '''
+    Without angles, neighbours are sorted by descending atomic number (then valence).
+    With improper angles (one per neighbour), they are sorted by angle (ties broken by descending atomic number, then valence), then rotated so that the heaviest atoms come first, as for the substituents of a Dihedral_Fragment.
+    '''
+    if improper_angles is None:
+        return sorted(
+            neighbours,
+            key=on_asc_atomic_number_then_asc_valence,
+            reverse=True,
+        )
+
+    assert len(improper_angles) == len(neighbours), (neighbours, improper_angles)
+    if not all(-180.0 <= angle <= 180.0 for angle in improper_angles):
+        raise Invalid_Dihedral_Angles([list(improper_angles)])
+
+    sorted_neighbours = [
+        neighbour
+        for (neighbour, _) in sorted(
+            zip(neighbours, improper_angles),
+            key=lambda item: (item[1], on_desc_atomic_number_then_desc_valence(item[0])),
+        )
+    ]
+    return max(
+        [sorted_neighbours[n:] + sorted_neighbours[:n] for n in range(len(sorted_neighbours))],
+        key=lambda rotation: tuple(on_asc_atomic_number_then_asc_valence(neighbour)[0] for neighbour in rotation),
+    )
 
 class Improper(object):
-    def __init__(self, central: Optional[str] = None, neighbours: Optional[List[str]] = None, improper_str: Optional[str] = None) -> None:
+    def __init__(
+        self,
+        central: Optional[str] = None,
+        neighbours: Optional[List[str]] = None,
+        improper_str: Optional[str] = None,
+        improper_angles: Optional[List[float]] = None,
+    ) -> None:
         if improper_str is not None:
-            fields = improper_str.split(GROUP_SEPARATOR)
-            assert len(fields) == 2, fields
-            self.central, self.neighbours = fields[0], fields[1].split(NEIGHBOUR_SEPARATOR)
+            self.central, self.neighbours = split_improper_str(improper_str)
         else:
             self.central, self.neighbours = central, neighbours
 
-        self.neighbours = sorted(
-            self.neighbours,
-            key=on_asc_atomic_number_then_asc_valence,
-            reverse=True,
-        )
+        assert self.central is not None and self.neighbours, (central, neighbours, improper_str)
+
+        self.neighbours = ordered_neighbours(self.neighbours, improper_angles=improper_angles)
 
     def __str__(self) -> str:
+        return join_groups([self.central, join_neighbours(self.neighbours)])
+
+    def __repr__(self) -> str:
         return 'Improper(central={0}, neighbours={1})'.format(self.central, self.neighbours)
 
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, Improper) and (self.central, self.neighbours) == (other.central, other.neighbours)
+
+    def __ne__(self, other: Any) -> bool:
+        return not self == other
+
+    def __hash__(self) -> int:
+        return hash((self.central, tuple(self.neighbours)))
+
+    def compact_key(self) -> Compact_Improper:
+        '''(atomic number, valence) of the central atom then of every (ordered) neighbour, flattened (0 for no valence).'''
+        return tuple(
+            value
+            for atom in [self.central] + self.neighbours
+            for value in compact_atom(atom)
+        )
+
+def compact_atom(atom_desc: str) -> Tuple[int, int]:
+    element, valence = element_valence_for_atom(atom_desc)
+    return (ATOMIC_NUMBERS[element], valence if valence is not NO_VALENCE else 0)
+
+def canonical_improper_str(improper_str: Improper_Str, improper_angles: Optional[List[float]] = None) -> Improper_Str:
+    return str(Improper(improper_str=improper_str, improper_angles=improper_angles))
+
+def canonical_impropers(improper_strs: Sequence[Improper_Str], improper_angles: Optional[Sequence[List[float]]] = None) -> List[Improper_Str]:
+    '''Bulk canonicalisation. Without angles, every distinct input is only canonicalised once.'''
+    if improper_angles is not None:
+        assert len(improper_angles) == len(improper_strs), (len(improper_angles), len(improper_strs))
+        return [canonical_improper_str(improper_str, angles) for (improper_str, angles) in zip(improper_strs, improper_angles)]
+
+    canonical_forms = {} # type: Dict[Improper_Str, Improper_Str]
+    for improper_str in improper_strs:
+        if improper_str not in canonical_forms:
+            canonical_forms[improper_str] = canonical_improper_str(improper_str)
+    return [canonical_forms[improper_str] for improper_str in improper_strs]
+
+Improper_Matching_Pattern = str
+
+def improper_re_patterns(pattern: Improper_Matching_Pattern) -> List[str]:
+    '''Regular expressions for an improper pattern (e.g. `C|O,X,%`), with the same syntax and operators as dihedral fragment patterns.'''
+    central, neighbour_patterns = split_group_str(pattern)
+    neighbour_patterns = split_neighbour_str(neighbour_patterns)
+    n_distinct_patterns = len(set(neighbour_patterns))
+    return escaped_special_regex_characters(
+        [
+            join_groups([central, join_neighbours(sorted_components_list(neighbour_patterns, permutation))])
+            for permutation in permutations(range(n_distinct_patterns))
+        ],
+        flavour='re',
+    )
+
+def improper_pattern_matching_for(pattern: Improper_Matching_Pattern, debug: bool = False, metadata: Any = None) -> Callable[[Improper_Str], bool]:
+    if not (has_substitution_pattern(pattern) or has_regex_pattern(pattern)):
+        canonical_pattern = canonical_improper_str(pattern)
+        return lambda test_string: test_string == canonical_pattern
+    else:
+        patterns = [FORMAT_UNESCAPED(re_pattern) for re_pattern in improper_re_patterns(pattern)]
+        compiled_patterns = [compile(match_pattern) for match_pattern in patterns]
+
+        def match_pattern_to(test_string):
+            matched = any(compiled_pattern.search(test_string) for compiled_pattern in compiled_patterns)
+            if debug or PATTERN_MATCHING_TRACER.debug:
+                PATTERN_MATCHING_TRACER.emit('improper_match', echo=debug, metadata=metadata, pattern=pattern, patterns=patterns, test_string=test_string, matched=matched)
+            return matched
+
+        return match_pattern_to
+
 if __name__ == '__main__':
     print(Improper(improper_str='C|C,C,H'))
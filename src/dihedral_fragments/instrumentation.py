@@ -0,0 +1,118 @@
+from contextlib import contextmanager
+from collections import defaultdict, Counter
+from time import perf_counter, time
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, TextIO, Iterator
+from json import dumps
+from sys import stdout
+
+Span_Record = NamedTuple('Span_Record', [('stage', str), ('duration', float), ('outcome', str), ('metadata', Dict[str, Any])])
+
+SUCCESS = 'ok'
+
+DEFAULT_QUANTILES = (50, 95, 99)
+
+def percentile(sorted_values: Sequence[float], quantile: float) -> float:
+    '''Nearest-rank percentile of an already sorted sequence.'''
+    assert len(sorted_values) > 0
+    rank = max(int(-(-quantile * len(sorted_values) // 100)), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+class Histogram_Sink(object):
+    '''Keeps every span duration in memory, grouped by stage.'''
+    def __init__(self) -> None:
+        self.durations = defaultdict(list) # type: Dict[str, List[float]]
+        self.outcomes = defaultdict(Counter) # type: Dict[str, Counter]
+
+    def record(self, span_record: Span_Record) -> None:
+        self.durations[span_record.stage].append(span_record.duration)
+        self.outcomes[span_record.stage][span_record.outcome] += 1
+
+    def merge(self, durations: Dict[str, List[float]], outcomes: Dict[str, Dict[str, int]]) -> None:
+        '''Add the durations and outcomes recorded by another sink (e.g. in a worker process).'''
+        for (stage, stage_durations) in durations.items():
+            self.durations[stage].extend(stage_durations)
+        for (stage, stage_outcomes) in outcomes.items():
+            self.outcomes[stage].update(stage_outcomes)
+
+    def percentiles(self, stage: str, quantiles: Sequence[float] = DEFAULT_QUANTILES) -> Dict[float, float]:
+        sorted_durations = sorted(self.durations[stage])
+        return {quantile: percentile(sorted_durations, quantile) for quantile in quantiles}
+
+    def summary(self, quantiles: Sequence[float] = DEFAULT_QUANTILES) -> str:
+        header = ['stage', 'count'] + ['p{0}'.format(quantile) for quantile in quantiles] + ['total', 'outcomes']
+        lines = [header]
+        for stage in sorted(self.durations):
+            stage_percentiles = self.percentiles(stage, quantiles=quantiles)
+            lines.append(
+                [stage, str(len(self.durations[stage]))]
+                +
+                ['{0:.3f}s'.format(stage_percentiles[quantile]) for quantile in quantiles]
+                +
+                [
+                    '{0:.3f}s'.format(sum(self.durations[stage])),
+                    ','.join('{0}={1}'.format(outcome, count) for (outcome, count) in sorted(self.outcomes[stage].items())),
+                ]
+            )
+        widths = [max(len(line[n]) for line in lines) for n in range(len(header))]
+        return '\n'.join(
+            '  '.join(field.ljust(width) for (field, width) in zip(line, widths)).rstrip()
+            for line in lines
+        )
+
+class JSON_Lines_Sink(object):
+    '''Appends one JSON object per span to a file, flushed on every record so that partial runs are usable.'''
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.fh = open(path, 'a')
+
+    def record(self, span_record: Span_Record) -> None:
+        self.fh.write(
+            dumps(
+                dict(
+                    stage=span_record.stage,
+                    duration=span_record.duration,
+                    outcome=span_record.outcome,
+                    timestamp=time(),
+                    **{key: (value if isinstance(value, (int, float, str, bool, type(None))) else str(value)) for (key, value) in span_record.metadata.items()}
+                ),
+            ) + '\n',
+        )
+        self.fh.flush()
+
+    def close(self) -> None:
+        self.fh.close()
+
+SINKS = [] # type: List[Any]
+
+def add_sink(sink: Any) -> Any:
+    SINKS.append(sink)
+    return sink
+
+def remove_sink(sink: Any) -> None:
+    SINKS.remove(sink)
+    if hasattr(sink, 'close'):
+        sink.close()
+
+@contextmanager
+def span(stage: str, **metadata: Any) -> Iterator[None]:
+    '''Time the enclosed block and report its duration and outcome (`ok` or the exception class name) to every sink.'''
+    if not SINKS:
+        yield
+        return
+
+    outcome = SUCCESS
+    start = perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        outcome = type(e).__name__
+        raise
+    finally:
+        span_record = Span_Record(stage, perf_counter() - start, outcome, metadata)
+        for sink in SINKS:
+            sink.record(span_record)
+
+def print_summary(file: TextIO = stdout, quantiles: Sequence[float] = DEFAULT_QUANTILES) -> None:
+    for sink in SINKS:
+        if isinstance(sink, Histogram_Sink):
+            print(sink.summary(quantiles=quantiles), file=file)
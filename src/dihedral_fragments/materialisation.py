@@ -0,0 +1,229 @@
+'''
+Materialised pattern matches over a fixed (but growing) vocabulary of canonical fragments.
+
+Every fragment of the vocabulary gets an ID (its position), and every pattern a bitset (a Python int) of the IDs of the fragments it matches.
+The bitsets of the CHEMICAL_GROUPS are computed once (and extended when fragments are added), those of ad-hoc patterns on demand (kept in an LRU cache, and extended on their next use).
+Queries combine group names and (quoted, if they contain spaces or parentheses) patterns with AND, OR, NOT and parentheses, e.g. `ketone AND NOT ester` or `(alcohol I OR alcohol II) AND NOT "%|C|C|%"`, as bitwise operations.
+'''
+from collections import OrderedDict
+from functools import lru_cache
+from re import compile
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from dihedral_fragments.chemistry import CHEMICAL_GROUPS
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment, Fragment
+from dihedral_fragments.pattern_matching import has_regex_pattern, has_substitution_pattern, re_pattern_matching_for
+
+Chemical_Group = Tuple[str, str]
+
+Bitset = int
+
+# Ad-hoc patterns whose bitsets are kept
+PATTERN_CACHE_SIZE = 256
+
+class Invalid_Query(Exception):
+    pass
+
+def bitset_for_ids(ids: Iterable[int]) -> Bitset:
+    ids = list(ids)
+    if not ids:
+        return 0
+    bits = bytearray(max(ids) // 8 + 1)
+    for fragment_id in ids:
+        bits[fragment_id >> 3] |= 1 << (fragment_id & 7)
+    return int.from_bytes(bytes(bits), 'little')
+
+def ids_for_bitset(bitset: Bitset) -> Iterator[int]:
+    '''IDs of a bitset, in increasing order.'''
+    for (byte_index, byte) in enumerate(bitset.to_bytes((bitset.bit_length() + 7) // 8, 'little')):
+        if byte:
+            for bit in range(8):
+                if byte >> bit & 1:
+                    yield 8 * byte_index + bit
+
+def popcount(bitset: Bitset) -> int:
+    return bin(bitset).count('1')
+
+class Materialised_Pattern(object):
+    '''The bitset of a pattern over the first `n_fragments` fragments of a vocabulary.'''
+    def __init__(self, pattern: str) -> None:
+        self.pattern = pattern
+        self.bitset = 0
+        self.n_fragments = 0
+        if has_substitution_pattern(pattern) or has_regex_pattern(pattern):
+            self.exact_fragment = None # type: Optional[Fragment]
+            self.matcher = re_pattern_matching_for(pattern) # type: Optional[Callable[[Fragment], bool]]
+        else:
+            # Matches a single fragment, looked up rather than compared to every fragment
+            self.exact_fragment, self.matcher = str(Dihedral_Fragment(pattern)), None
+
+    def update(self, fragments: Sequence[Fragment], fragment_ids: Dict[Fragment, int]) -> Bitset:
+        '''Extend the bitset to the fragments added since the last update.'''
+        if self.n_fragments < len(fragments):
+            if self.matcher is None:
+                self.bitset = (1 << fragment_ids[self.exact_fragment]) if self.exact_fragment in fragment_ids else 0
+            else:
+                matcher = self.matcher
+                self.bitset |= bitset_for_ids(
+                    fragment_id
+                    for fragment_id in range(self.n_fragments, len(fragments))
+                    if matcher(fragments[fragment_id])
+                )
+            self.n_fragments = len(fragments)
+        return self.bitset
+
+# Query tokens: parentheses, quoted operands, or bare words
+QUERY_TOKEN = compile(r'\s*(?:(\()|(\))|"([^"]*)"|\'([^\']*)\'|([^\s()"\']+))')
+
+KEYWORDS = ('AND', 'OR', 'NOT')
+
+Query_Tree = Tuple[Any, ...]
+
+def query_tokens(query: str) -> List[Tuple[str, str]]:
+    '''(kind, value) tokens, kind being `(`, `)`, a keyword or `operand` (consecutive bare words, without `|`, form a single group name).'''
+    tokens = [] # type: List[Tuple[str, str]]
+    position = 0
+    query = query.rstrip()
+    while position < len(query):
+        match = QUERY_TOKEN.match(query, position)
+        if match is None:
+            raise Invalid_Query('Invalid query "{0}" (at position {1})'.format(query, position))
+        position = match.end()
+        opening, closing, double_quoted, single_quoted, word = match.groups()
+        if opening or closing:
+            tokens.append((opening or closing, opening or closing))
+        elif word in KEYWORDS:
+            tokens.append((word, word))
+        elif word is not None and '|' not in word and tokens and tokens[-1][0] == 'word':
+            tokens[-1] = ('word', tokens[-1][1] + ' ' + word)
+        elif word is not None:
+            tokens.append(('word' if '|' not in word else 'operand', word))
+        else:
+            tokens.append(('operand', double_quoted if double_quoted is not None else single_quoted))
+    return [('operand' if kind == 'word' else kind, value) for (kind, value) in tokens]
+
+@lru_cache(maxsize=1024)
+def parsed_query(query: str) -> Query_Tree:
+    '''
+    Parse a query into nested ('OR', a, b), ('AND', a, b), ('NOT', a) and ('operand', group name or pattern) tuples.
+    NOT binds tighter than AND, which binds tighter than OR.
+    '''
+    tokens = query_tokens(query)
+    position = 0
+
+    def peek() -> Optional[str]:
+        return tokens[position][0] if position < len(tokens) else None
+
+    def expect(kind: str) -> str:
+        nonlocal position
+        if peek() != kind:
+            raise Invalid_Query('Invalid query "{0}": expected {1}, got {2}'.format(query, kind, tokens[position][1] if position < len(tokens) else 'end of query'))
+        position += 1
+        return tokens[position - 1][1]
+
+    def binary(kind: str, operand: Callable[[], Query_Tree]) -> Query_Tree:
+        tree = operand()
+        while peek() == kind:
+            expect(kind)
+            tree = (kind, tree, operand())
+        return tree
+
+    def factor() -> Query_Tree:
+        if peek() == 'NOT':
+            expect('NOT')
+            return ('NOT', factor())
+        if peek() == '(':
+            expect('(')
+            tree = binary('OR', term)
+            expect(')')
+            return tree
+        return ('operand', expect('operand'))
+
+    def term() -> Query_Tree:
+        return binary('AND', factor)
+
+    tree = binary('OR', term)
+    if position != len(tokens):
+        raise Invalid_Query('Invalid query "{0}": unexpected {1}'.format(query, tokens[position][1]))
+    return tree
+
+class Group_Materialisation(object):
+    def __init__(self, fragments: Iterable[Fragment] = (), chemical_groups: Sequence[Chemical_Group] = CHEMICAL_GROUPS, pattern_cache_size: int = PATTERN_CACHE_SIZE) -> None:
+        self.fragments = [] # type: List[Fragment]
+        self.fragment_ids = {} # type: Dict[Fragment, int]
+        self.groups = {} # type: Dict[str, Materialised_Pattern]
+        self.patterns = OrderedDict() # type: OrderedDict[str, Materialised_Pattern]
+        self.pattern_cache_size = pattern_cache_size
+        self.update_groups(chemical_groups)
+        self.add_fragments(fragments)
+
+    def __len__(self) -> int:
+        return len(self.fragments)
+
+    def add_fragments(self, fragments: Iterable[Fragment]) -> None:
+        '''Append (canonical) fragments to the vocabulary, and extend the bitsets of every group.'''
+        for fragment in fragments:
+            if fragment not in self.fragment_ids:
+                self.fragment_ids[fragment] = len(self.fragments)
+                self.fragments.append(fragment)
+        for materialised_group in self.groups.values():
+            materialised_group.update(self.fragments, self.fragment_ids)
+
+    def update_groups(self, chemical_groups: Sequence[Chemical_Group]) -> None:
+        '''Replace the chemical groups, only re-materialising those whose pattern was added or modified.'''
+        self.groups = {
+            moiety: (
+                self.groups[moiety]
+                if moiety in self.groups and self.groups[moiety].pattern == pattern
+                else Materialised_Pattern(pattern)
+            )
+            for (moiety, pattern) in chemical_groups if pattern
+        }
+        for materialised_group in self.groups.values():
+            materialised_group.update(self.fragments, self.fragment_ids)
+
+    def group_bitset(self, moiety: str) -> Bitset:
+        return self.groups[moiety].update(self.fragments, self.fragment_ids)
+
+    def pattern_bitset(self, pattern: str) -> Bitset:
+        '''Bitset of an ad-hoc pattern (least recently used patterns are evicted from the cache).'''
+        if pattern in self.patterns:
+            self.patterns.move_to_end(pattern)
+        else:
+            self.patterns[pattern] = Materialised_Pattern(pattern)
+            if len(self.patterns) > self.pattern_cache_size:
+                self.patterns.popitem(last=False)
+        return self.patterns[pattern].update(self.fragments, self.fragment_ids)
+
+    def operand_bitset(self, operand: str) -> Bitset:
+        if operand in self.groups:
+            return self.group_bitset(operand)
+        elif '|' in operand:
+            return self.pattern_bitset(operand)
+        else:
+            raise Invalid_Query('Unknown chemical group "{0}" (patterns should contain "|")'.format(operand))
+
+    def bitset(self, tree: Query_Tree) -> Bitset:
+        kind = tree[0]
+        if kind == 'operand':
+            return self.operand_bitset(tree[1])
+        elif kind == 'NOT':
+            return ((1 << len(self.fragments)) - 1) & ~self.bitset(tree[1])
+        elif kind == 'AND':
+            return self.bitset(tree[1]) & self.bitset(tree[2])
+        else:
+            return self.bitset(tree[1]) | self.bitset(tree[2])
+
+    def query(self, query: str) -> Bitset:
+        '''Bitset of the fragments matching a query (e.g. `ketone AND NOT ester`).'''
+        return self.bitset(parsed_query(query))
+
+    def fragments_for_bitset(self, bitset: Bitset) -> List[Fragment]:
+        return [self.fragments[fragment_id] for fragment_id in ids_for_bitset(bitset)]
+
+    def fragments_matching(self, query: str) -> List[Fragment]:
+        '''Fragments matching a query, in vocabulary order.'''
+        return self.fragments_for_bitset(self.query(query))
+
+    def count(self, query: str) -> int:
+        return popcount(self.query(query))
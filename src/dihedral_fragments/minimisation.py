@@ -0,0 +1,111 @@
+'''
+Energy minimisation stage: batches of PDBs minimised by a pool of long-lived worker processes, and minimised PDBs cached by the hash of their input.
+
+Workers are started once, so that the minimiser's start-up (importing `fragment_capping` and Open Babel, loading force fields) is paid once per worker rather than once per fragment.
+Identical PDBs are only minimised once per batch, and never again once cached (in memory, and optionally in a content-addressed directory shared between runs).
+'''
+from hashlib import sha256
+from multiprocessing import get_all_start_methods, get_context, cpu_count
+from os.path import exists, join
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from dihedral_fragments.file_helpers import atomic_write
+from dihedral_fragments.optional_dependencies import required_module
+from dihedral_fragments.worker_pool import chunked, tuned_chunksize
+
+PDB = str
+
+# Maps a PDB to its energy minimised PDB; module-level functions only, as minimisers are sent to the workers by reference
+Minimiser = Callable[[PDB], PDB]
+
+def babel_minimiser(pdb: PDB) -> PDB:
+    '''`fragment_capping`'s (Open Babel) minimiser, as used by `Molecule.energy_minimised_pdb()`.'''
+    return required_module('fragment_capping.helpers.babel').energy_minimised_pdb(pdb_str=pdb)
+
+def minimise_chunk(minimiser_and_pdbs: Tuple[Minimiser, Sequence[PDB]]) -> List[PDB]:
+    minimiser, pdbs = minimiser_and_pdbs
+    return [minimiser(pdb) for pdb in pdbs]
+
+def minimiser_name(minimiser: Minimiser) -> str:
+    return '{0}.{1}'.format(minimiser.__module__, minimiser.__qualname__)
+
+class Minimisation_Cache(object):
+    '''Minimised PDBs by key, in memory and (if `directory` is not None) in a content-addressed directory.'''
+    def __init__(self, directory: Optional[str] = None) -> None:
+        self.directory = directory
+        self.minimised_pdbs = {} # type: Dict[str, PDB]
+
+    def path(self, key: str) -> str:
+        return join(self.directory, key[:2], key + '.pdb')
+
+    def get(self, key: str) -> Optional[PDB]:
+        if key not in self.minimised_pdbs and self.directory is not None and exists(self.path(key)):
+            with open(self.path(key)) as fh:
+                self.minimised_pdbs[key] = fh.read()
+        return self.minimised_pdbs.get(key)
+
+    def put(self, key: str, minimised_pdb: PDB) -> None:
+        self.minimised_pdbs[key] = minimised_pdb
+        if self.directory is not None:
+            atomic_write(self.path(key), minimised_pdb.encode())
+
+class Minimisation_Stage(object):
+    '''
+    Minimise PDBs with `minimiser` in `processes` long-lived worker processes (or in the calling process, if `processes` is 0).
+    Batches can be submitted from several threads at once.
+    Workers are started with `forkserver` (or `spawn`) by default rather than forked, as stages can be created from threads.
+    '''
+    def __init__(
+        self,
+        minimiser: Minimiser = babel_minimiser,
+        processes: Optional[int] = None,
+        cache_directory: Optional[str] = None,
+        start_method: Optional[str] = None,
+    ) -> None:
+        self.minimiser = minimiser
+        self.processes = processes if processes is not None else cpu_count()
+        self.cache = Minimisation_Cache(cache_directory)
+        self.n_minimised = 0
+
+        if start_method is None:
+            start_method = 'forkserver' if 'forkserver' in get_all_start_methods() else 'spawn'
+        self.pool = get_context(start_method).Pool(self.processes) if self.processes > 0 else None
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+    def __enter__(self) -> 'Minimisation_Stage':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def key(self, pdb: PDB) -> str:
+        return sha256(minimiser_name(self.minimiser).encode() + b'\0' + pdb.encode()).hexdigest()
+
+    def minimise(self, pdbs: Sequence[PDB], chunksize: Optional[int] = None) -> List[PDB]:
+        '''Minimised `pdbs`, in order: cached PDBs are looked up, and distinct others minimised by the workers (split into chunks).'''
+        keys = [self.key(pdb) for pdb in pdbs]
+        minimised_pdbs = {key: self.cache.get(key) for key in keys}
+        missing_pdbs = {key: pdb for (key, pdb) in zip(keys, pdbs) if minimised_pdbs[key] is None}
+        if missing_pdbs:
+            for (key, minimised_pdb) in zip(missing_pdbs, self.map(list(missing_pdbs.values()), chunksize=chunksize)):
+                self.cache.put(key, minimised_pdb)
+                minimised_pdbs[key] = minimised_pdb
+            self.n_minimised += len(missing_pdbs)
+        return [minimised_pdbs[key] for key in keys]
+
+    def minimise_one(self, pdb: PDB) -> PDB:
+        return self.minimise([pdb])[0]
+
+    def map(self, pdbs: List[PDB], chunksize: Optional[int] = None) -> List[PDB]:
+        if self.pool is None:
+            return minimise_chunk((self.minimiser, pdbs))
+        chunks = chunked(pdbs, chunksize or tuned_chunksize(len(pdbs), self.processes))
+        return [
+            minimised_pdb
+            for chunk_results in self.pool.map(minimise_chunk, [(self.minimiser, chunk) for chunk in chunks], chunksize=1)
+            for minimised_pdb in chunk_results
+        ]
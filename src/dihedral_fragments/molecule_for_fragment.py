@@ -3,36 +3,84 @@ from itertools import groupby, product
 from math import sqrt, ceil
 from os.path import join, exists, basename, dirname, abspath
 from io import StringIO
-from functools import reduce
+from functools import reduce, wraps
 from operator import itemgetter
-from typing import Any, List, Optional, Tuple
-from re import sub, search
-from urllib.request import urlopen
+from typing import Any, Iterable, Iterator, List, Optional, Sequence, Tuple
 from os.path import dirname, abspath, join
+from functools import lru_cache
+from atexit import register
+from threading import Lock
 
-from dihedral_fragments.dihedral_fragment import element_valence_for_atom, on_asc_atomic_number_then_asc_valence, NO_VALENCE, Fragment, remove_valences_in_fragment_str
+from dihedral_fragments.dihedral_fragment import element_valence_for_atom, on_asc_atomic_number_then_asc_valence, NO_VALENCE, Fragment, canonical_keys, canonical_keys_for_fragments
 from dihedral_fragments.capping import best_capped_molecule_for_dihedral_fragment
+from dihedral_fragments.capping_reuse import Capping_Solution_Cache
 from dihedral_fragments.exceptions import PDB_Structure_Not_Found, ATB_Molecule_Running
+from dihedral_fragments.instrumentation import span, add_sink, print_summary, Histogram_Sink, JSON_Lines_Sink
+from dihedral_fragments.optional_dependencies import required_module
+from dihedral_fragments.batch_runner import Journal, run_batch
+from dihedral_fragments.streaming import iter_results
+from dihedral_fragments.minimisation import Minimisation_Stage
+from dihedral_fragments.rendering import ATB_SVG_Source, Local_SVG_Source, Thumbnail_Cache, Render_Parameters, render_thumbnail, render_thumbnails, compose_collage, DEFAULT_MAX_WORKERS
+
+ATB_Molid = int
+
+# Heavy dependencies (fragment_capping, atb_api, cairosvg) are only imported on first access, so that importing this module stays cheap.
+LAZY_ATTRIBUTES = {
+    'cached': ('fragment_capping.cache', 'cached'),
+    'Atom': ('fragment_capping.helpers.types_helpers', 'Atom'),
+    'FRAGMENT_CAPPING_DIR': ('fragment_capping.helpers.types_helpers', 'FRAGMENT_CAPPING_DIR'),
+    'Molecule': ('fragment_capping.helpers.molecule', 'Molecule'),
+    'Too_Many_Permutations': ('fragment_capping.helpers.molecule', 'Too_Many_Permutations'),
+    'energy_minimised_pdb': ('fragment_capping.helpers.babel', 'energy_minimised_pdb'),
+    'API': ('atb_api', 'API'),
+    'HTTPError': ('atb_api', 'HTTPError'),
+    'ATB_Mol': ('atb_api', 'ATB_Mol'),
+}
+
+def lazy_attribute(name: str) -> Any:
+    module_name, attribute = LAZY_ATTRIBUTES[name]
+    return getattr(required_module(module_name), attribute)
+
+@lru_cache(maxsize=None)
+def get_api() -> Any:
+    return lazy_attribute('API')(
+        host='http://scmb-atb.biosci.uq.edu.au/atb-uqbcaron', #'https://atb.uq.edu.au',
+        debug=False,
+        api_format='pickle',
+    )
+
+MINIMISED_PDB_DIR = join(dirname(abspath(__file__)), 'minimised_pdbs')
+
+# Fragments are minimised one at a time (even with several capping workers, most of the time goes to the ATB), so a single worker is enough
+MINIMISATION_PROCESSES = 1
+
+MINIMISATION_STAGE = None # type: Optional[Minimisation_Stage]
+
+MINIMISATION_STAGE_LOCK = Lock()
+
+def get_minimisation_stage() -> Minimisation_Stage:
+    '''Long-lived minimisation worker (started once, by the first caller of any thread, and closed at exit), and minimised PDBs cached across runs.'''
+    global MINIMISATION_STAGE
+    with MINIMISATION_STAGE_LOCK:
+        if MINIMISATION_STAGE is None:
+            MINIMISATION_STAGE = Minimisation_Stage(processes=MINIMISATION_PROCESSES, cache_directory=MINIMISED_PDB_DIR)
+            register(MINIMISATION_STAGE.close)
+        return MINIMISATION_STAGE
+
+# Set (by --reuse-capping) to reuse capping solutions across fragments with the same capping problem, or the same halves of it
+CAPPING_SOLUTION_CACHE = None # type: Optional[Capping_Solution_Cache]
 
-try:
-    from fragment_capping.cache import cached
-    from fragment_capping.helpers.types_helpers import ATB_Molid, Atom, FRAGMENT_CAPPING_DIR
-    from fragment_capping.helpers.molecule import Molecule, Too_Many_Permutations
-    from fragment_capping.helpers.babel import energy_minimised_pdb
-except ImportError:
-    raise RuntimeError("The `fragment_capping` module (https://github.com/bertrand-caron/fragment_capping) could not be found in your PYTHONPATH.")
-try:
-    from atb_api import API, HTTPError, ATB_Mol
-except ImportError:
-    raise RuntimeError("The `atb_api_public` module (https://github.com/bertrand-caron/atb_api_public) could not be found in your PYTHONPATH.")
-
-from cairosvg import svg2png # pylint: disable=no-name-in-module
-
-api = API(
-    host='http://scmb-atb.biosci.uq.edu.au/atb-uqbcaron', #'https://atb.uq.edu.au',
-    debug=False,
-    api_format='pickle',
-)
+def best_capped_molecule(fragment: Fragment, debug: bool = False) -> 'Molecule':
+    if CAPPING_SOLUTION_CACHE is not None:
+        return CAPPING_SOLUTION_CACHE.best_capped_molecule(fragment, debug=debug)
+    return best_capped_molecule_for_dihedral_fragment(fragment, debug=debug)
+
+def __getattr__(name: str) -> Any:
+    if name == 'api':
+        return get_api()
+    elif name in LAZY_ATTRIBUTES:
+        return lazy_attribute(name)
+    raise AttributeError('module {0!r} has no attribute {1!r}'.format(__name__, name))
 
 class Molecule_Not_In_ATB(Exception):
     pass
@@ -45,6 +93,18 @@ def molid_after_capping_fragment(
     quick_run: bool = False,
     debug: bool = False,
     soft_fail: bool = True,
+) -> Optional[ATB_Molid]:
+    with span('molid_after_capping_fragment', fragment=fragment, quick_run=quick_run):
+        return _molid_after_capping_fragment(fragment, count=count, i=i, fragments=fragments, quick_run=quick_run, debug=debug, soft_fail=soft_fail)
+
+def _molid_after_capping_fragment(
+    fragment: Fragment,
+    count: Optional[int] = None,
+    i: Optional[int] = None,
+    fragments: Optional[List[Any]] = None,
+    quick_run: bool = False,
+    debug: bool = False,
+    soft_fail: bool = True,
 ) -> Optional[ATB_Molid]:
     if all([x is not None for x in (count, i, fragments)]):
         print('Running fragment {0}/{1} (count={2}): "{3}"'.format(
@@ -54,19 +114,24 @@ def molid_after_capping_fragment(
             fragment,
         ))
 
-    molecule = best_capped_molecule_for_dihedral_fragment(fragment, debug=debug)
+    with span('capping', fragment=fragment):
+        molecule = best_capped_molecule(fragment, debug=debug)
 
     if quick_run:
         best_molid = None
     else:
-        optimised_pdb = molecule.energy_minimised_pdb()
+        api, HTTPError, ATB_Mol = get_api(), lazy_attribute('HTTPError'), lazy_attribute('ATB_Mol')
+
+        with span('energy_minimisation', fragment=fragment):
+            optimised_pdb = get_minimisation_stage().minimise_one(molecule.dummy_pdb())
         try:
-            api_response = api.Molecules.structure_search(
-                netcharge=molecule.netcharge(),
-                structure_format='pdb',
-                structure=optimised_pdb,
-                return_type='molecules',
-            )
+            with span('structure_search', fragment=fragment):
+                api_response = api.Molecules.structure_search(
+                    netcharge=molecule.netcharge(),
+                    structure_format='pdb',
+                    structure=optimised_pdb,
+                    return_type='molecules',
+                )
         except HTTPError:
             print('optmised_pdb', optimised_pdb)
             print('netcharge', molecule.netcharge())
@@ -81,10 +146,12 @@ def molid_after_capping_fragment(
             print('optimised_pdb', optimised_pdb)
             print('netcharge', molecule.netcharge())
 
-        has_full_valences = (remove_valences_in_fragment_str(fragment) != fragment)
+        fragment_keys = canonical_keys(fragment)
+        has_full_valences = (fragment_keys.valence_free != fragment_keys.canonical)
         if has_full_valences:
             for atb_molecule in molecules:
-                atb_molecule.dihedral_fragments = api.Molecules.output_file(molid=atb_molecule.molid, output_name='dihedral_fragments',output_kwargs={'use_valences': True})
+                with span('output_file', fragment=fragment, molid=atb_molecule.molid):
+                    atb_molecule.dihedral_fragments = api.Molecules.output_file(molid=atb_molecule.molid, output_name='dihedral_fragments',output_kwargs={'use_valences': True})
 
         if molecules:
             print('molid_after_capping_fragment(): ATB_matches=', [atb_molecule.molid for atb_molecule in molecules])
@@ -111,10 +178,7 @@ def molid_after_capping_fragment(
             print('Dummy PDB')
             print(molecule.dummy_pdb())
             print('Energy Minimised Dummy PDB')
-            try:
-                print(energy_minimised_pdb(pdb_str=molecule.dummy_pdb()))
-            except Exception as e:
-                print('Could not produce Energy Minimised Dummy PDB (error was: "{0}")'.format(str(e)))
+            print(optimised_pdb)
             molecule.write_graph('BEST', output_size=(600, 600))
             if soft_fail:
                 best_molid = None
@@ -125,27 +189,79 @@ def molid_after_capping_fragment(
 
         safe_fragment_name = fragment.replace('|', '_')
 
-        with open(join(FRAGMENT_CAPPING_DIR, 'pdbs/{fragment}.pdb'.format(fragment=safe_fragment_name)), 'w') as fh:
-            fh.write(molecule.dummy_pdb())
+        with span('pdb_writing', fragment=fragment):
+            with open(join(lazy_attribute('FRAGMENT_CAPPING_DIR'), 'pdbs/{fragment}.pdb'.format(fragment=safe_fragment_name)), 'w') as fh:
+                fh.write(molecule.dummy_pdb())
 
     return best_molid
 
-def get_matches(protein_fragments: List[Tuple[Fragment, int]]) -> List[Tuple[Fragment, ATB_Molid]]:
-    matches = [
-        (fragment, molid_after_capping_fragment(fragment, count=count, i=i, fragments=protein_fragments))
-        for (i, (fragment, count)) in
-        enumerate(protein_fragments)
-    ]
+Match = Tuple[Fragment, Optional[ATB_Molid]]
+
+def iter_matches(protein_fragments: Sequence[Tuple[Fragment, int]], max_workers: int = 1, ordered: bool = True, max_in_flight: Optional[int] = None) -> Iterator[Match]:
+    '''(fragment, molid) pairs, yielded as soon as each fragment is capped and looked up (by `max_workers` threads), in input order if `ordered`.'''
+    def molid_for(numbered_fragment: Tuple[int, Tuple[Fragment, int]]) -> Optional[ATB_Molid]:
+        (i, (fragment, count)) = numbered_fragment
+        return molid_after_capping_fragment(fragment, count=count, i=i, fragments=protein_fragments)
+
+    for (_, (_, (fragment, _)), molid) in iter_results(
+        molid_for,
+        enumerate(protein_fragments),
+        max_workers=max_workers,
+        max_in_flight=max_in_flight,
+        ordered=ordered,
+    ):
+        yield (fragment, molid)
+
+def download_command(fragment: Fragment, molid: ATB_Molid) -> str:
+    return 'python3 test.py --download {molid} --submit --dihedral-fragment "{dihedral_fragment}"'.format(
+        molid=molid,
+        dihedral_fragment=fragment,
+    )
+
+def print_download_command(fragment: Fragment, molid: Optional[ATB_Molid]) -> None:
+    if molid:
+        print(download_command(fragment, molid))
 
+def with_download_commands(matches: Iterable[Match]) -> Iterator[Match]:
+    '''Pass `matches` through, printing the download command of each assigned molid as it comes.'''
     for (fragment, molid) in matches:
-        if molid:
-            print('python3 test.py --download {molid} --submit --dihedral-fragment "{dihedral_fragment}"'.format(
-                molid=molid,
-                dihedral_fragment=fragment,
-            ))
+        print_download_command(fragment, molid)
+        yield (fragment, molid)
+
+def get_matches(protein_fragments: List[Tuple[Fragment, int]], max_workers: int = 1, ordered: bool = True) -> List[Match]:
+    return list(with_download_commands(iter_matches(protein_fragments, max_workers=max_workers, ordered=ordered)))
+
+def cached_matches(protein_fragments: List[Tuple[Fragment, int]], capping_workers: int = 1) -> List[Match]:
+    '''
+    get_matches() through `fragment_capping`'s cache. Download commands are streamed on a cache miss, and printed from the cached matches on a cache hit.
+    Matches are ordered, so the number of workers is not part of the cache key.
+    '''
+    missed = [] # type: List[bool]
+
+    @wraps(get_matches)
+    def matches_on_cache_miss(protein_fragments: List[Tuple[Fragment, int]]) -> List[Match]:
+        missed.append(True)
+        return get_matches(protein_fragments, max_workers=capping_workers)
+
+    matches = lazy_attribute('cached')(matches_on_cache_miss, (protein_fragments,), {}, hashed=True)
+    if not missed:
+        for (fragment, molid) in matches:
+            print_download_command(fragment, molid)
     return matches
 
-def truncated_molecule(molecule: Molecule):
+def get_matches_with_journal(protein_fragments: List[Tuple[Fragment, int]], journal_path: str) -> List[Match]:
+    '''Same as get_matches(), but checkpointed in a SQLite journal: completed fragments are never re-run, and failures do not abort the run.'''
+    with Journal(journal_path) as journal:
+        journal.add_fragments(fragment for (fragment, _) in protein_fragments)
+        # Download commands of previous runs first, then as fragments complete
+        for (fragment, molid) in journal.results():
+            print_download_command(fragment, molid)
+        run_batch(journal, molid_after_capping_fragment, on_success=print_download_command)
+        results = dict(journal.results())
+
+    return [(fragment, results.get(fragment)) for (fragment, _) in protein_fragments]
+
+def truncated_molecule(molecule: 'Molecule'):
     return dict(
         n_atoms=molecule.n_atoms,
         num_dihedral_fragments=len(molecule.dihedral_fragments),
@@ -161,69 +277,38 @@ def parse_args() -> Any:
     parser = ArgumentParser()
     parser.add_argument('--only-id', type=int, help='Rerun a single fragment')
     parser.add_argument('--figsize', nargs=2, type=int, default=FIGSIZE, help='Figure dimensions (in inches)')
+    parser.add_argument('--svg-directory', type=str, default=None, help='Render thumbnails offline from the {molid}_thumb.svg files of this directory')
+    parser.add_argument('--journal', type=str, default=None, help='Checkpoint every fragment in this SQLite journal and resume from it')
+    parser.add_argument('--capping-workers', type=int, default=1, help='Cap and look up this many fragments concurrently (results are still in input order)')
+    parser.add_argument('--reuse-capping', action='store_true', help='Reuse capping solutions of fragments with the same capping problem, or the same halves of it')
+    parser.add_argument('--verify-capping', action='store_true', help='Reuse capping solutions, checking every reused solution against a full solve')
+    parser.add_argument('--timings', action='store_true', help='Print per-stage timings (p50/p95/p99) at the end of the run')
+    parser.add_argument('--timings-file', type=str, default=None, help='Append per-stage timings to this JSON lines file')
 
     return parser.parse_args()
 
-def png_file_for(molid: int, force_regen: bool = False, remove_background: bool = True, pixel_height: int = 600, dpi: int = 400):
-    PNG_DIR = 'pngs'
+PNG_DIR = join(dirname(abspath(__file__)), 'pngs')
 
-    png_file = join(
-        dirname(abspath(__file__)),
-        PNG_DIR,
-        '{molid}.png'.format(molid=molid),
+def png_file_for(molid: int, force_regen: bool = False, remove_background: bool = True, pixel_height: int = 600, dpi: int = 400, svg_source: Any = None) -> str:
+    return render_thumbnail(
+        molid,
+        svg_source or ATB_SVG_Source(),
+        Thumbnail_Cache(PNG_DIR),
+        render_parameters=Render_Parameters(remove_background=remove_background, pixel_height=pixel_height, dpi=dpi),
+        force_regen=force_regen,
     )
 
-    if (not exists(png_file)) or force_regen:
-        try:
-            urlopen('https://atb.uq.edu.au/outputs_babel_img.py?molid={molid}'.format(molid=molid))
-
-            vanilla_svg_bytes = urlopen('https://atb.uq.edu.au/cache/img2D/{molid}_thumb.svg'.format(molid=molid)).read()
-
-            modified_svg_bytes = (
-                sub(
-                    b'<rect.*?/>',
-                    b'',
-                    vanilla_svg_bytes,
-                )
-                if remove_background
-                else vanilla_svg_bytes
-            )
-
-
-            if remove_background:
-                assert b'rect' not in modified_svg_bytes, modified_svg_bytes.decode()
-        except:
-            raise
-
-        if False:
-            match = search(
-                b'<svg.* width="([^"])" height="[^"]")',
-                modified_svg_bytes,
-            )
-
-            svg_width, svg_height = match.group(1), match.group()
-
-        svg2png(
-            bytestring=modified_svg_bytes,
-            write_to=png_file,
-            dpi=dpi,
-            height=pixel_height,
-        )
-    return png_file
+COLLAGE_FILE = 'protein_fragment_molecules.png'
 
-def generate_collage(protein_fragments, figsize=FIGSIZE) -> bool:
-    matches = cached(get_matches, (protein_fragments,), {}, hashed=True)
+def generate_collage(protein_fragments, figsize=FIGSIZE, journal: Optional[str] = None, svg_source: Any = None, max_workers: int = DEFAULT_MAX_WORKERS, capping_workers: int = 1) -> bool:
+    # Download commands are printed by get_matches*() as fragments complete (or from the cached matches), rather than once all of them are
+    with span('get_matches', n_fragments=len(protein_fragments)):
+        if journal is not None:
+            matches = get_matches_with_journal(protein_fragments, journal)
+        else:
+            matches = cached_matches(protein_fragments, capping_workers=capping_workers)
     counts = dict(protein_fragments)
 
-    for (fragment, molid) in matches:
-        if molid:
-            print(
-                'python3 test.py --download {molid} --submit --dihedral-fragment "{dihedral_fragment}"'.format(
-                    molid=molid,
-                    dihedral_fragment=fragment,
-                ),
-            )
-
     print(matches)
     print('INFO: Assigned {0}/{1} molecules (missing_ids = {2})'.format(
         len([__molid for __molid in matches if __molid[1] is not None]),
@@ -231,43 +316,22 @@ def generate_collage(protein_fragments, figsize=FIGSIZE) -> bool:
         [i for (i, (fragment, molid)) in enumerate(matches) if molid is None],
     ))
 
-
-    png_files = dict([(molid, png_file_for(molid)) for (_, molid) in matches if molid is not None])
-
-    def figure_collage(figsize=FIGSIZE):
-        import matplotlib.pyplot as p
-        from PIL import Image
-
-        from fragment_capping.collage import best_grid, COLUMNS, LINES, indices_for_subplot
-
-        subplot_dims = best_grid(
-            len(matches),
-            aspect_ratio=figsize,
+    with span('png_files', n_fragments=len(matches)):
+        png_files = render_thumbnails(
+            (molid for (_, molid) in matches if molid is not None),
+            svg_source or ATB_SVG_Source(),
+            Thumbnail_Cache(PNG_DIR),
+            max_workers=max_workers,
         )
 
-        fig, axarr = p.subplots(*subplot_dims, figsize=figsize)
-
-        for (n, (fragment, molid)) in enumerate(matches):
-            indices = indices_for_subplot(n, subplot_dims)
-            if molid in png_files:
-                image = Image.open(png_files[molid])
-                axarr[indices].imshow(image)
-            axarr[indices].set_title(
-                fragment + ('\n(id={1}, molid={0})'.format(molid, n)),
-                fontsize=11,
-                fontname='Andale Mono',
-            )
-            axarr[indices].set_axis_off()
-
-        for n in range(len(matches), subplot_dims[LINES] * subplot_dims[COLUMNS]):
-            indices = indices_for_subplot(n, subplot_dims)
-            axarr[indices].set_axis_off()
-
-        p.tight_layout()
-        #p.show()
-        fig.savefig('protein_fragment_molecules.png', dpi=400)
-
-    figure_collage(figsize=figsize)
+    with span('figure_collage', n_fragments=len(matches)):
+        compose_collage(
+            [
+                (png_files.get(molid), fragment + '\n(id={1}, molid={0})'.format(molid, n))
+                for (n, (fragment, molid)) in enumerate(matches)
+            ],
+            aspect_ratio=figsize,
+        ).save(COLLAGE_FILE)
 
     return True
 
@@ -277,24 +341,47 @@ EXCLUDE_CYCLIC_FRAGMENTS = True
 
 DUMP_NUMBERED_FRAGMENTS = True
 
+PROTEIN_FRAGMENTS_PICKLE_FILE = 'data/protein_fragments_with_count.pickle'
+
+# Converted with `python3 -m dihedral_fragments.binary_format data/protein_fragments_with_count.pickle data/protein_fragments_with_count.bin`
+PROTEIN_FRAGMENTS_BINARY_FILE = 'data/protein_fragments_with_count.bin'
+
 def get_protein_fragments() -> Any:
-    with open('data/protein_fragments_with_count.pickle', 'rb') as fh:
-        protein_fragments = load(fh)
+    '''
+    (fragment, count) of the protein fragments.
+    From the binary file, cyclic fragments are excluded on the memory-mapped records, so that only the fragments returned are decoded (in bulk).
+    This is faster than loading the pickle and filtering its fragments (see `python3 -m dihedral_fragments.benchmarks.binary_format`).
+    '''
+    if exists(PROTEIN_FRAGMENTS_BINARY_FILE):
+        from dihedral_fragments.binary_format import Fragment_File
+        fragment_file = Fragment_File(PROTEIN_FRAGMENTS_BINARY_FILE)
+        if EXCLUDE_CYCLIC_FRAGMENTS:
+            protein_fragments = fragment_file.fragments_with_count_at(fragment_file.acyclic_positions())
+        else:
+            protein_fragments = fragment_file.fragments_with_count()
+        cyclic_fragments_excluded = EXCLUDE_CYCLIC_FRAGMENTS
+    else:
+        with open(PROTEIN_FRAGMENTS_PICKLE_FILE, 'rb') as fh:
+            protein_fragments = load(fh)
+        cyclic_fragments_excluded = False
 
     if REMOVE_VALENCES:
-        from re import sub
-        protein_fragments = [(sub('[0-9]', '', fragment).replace('*', ''), count) for (fragment, count) in protein_fragments]
+        protein_fragments = [
+            (fragment_keys.valence_free, count)
+            for (fragment_keys, (_, count)) in zip(canonical_keys_for_fragments([fragment for (fragment, _) in protein_fragments]), protein_fragments)
+        ]
 
     if EXCLUDE_CYCLIC_FRAGMENTS:
         print(protein_fragments)
-        protein_fragments = [(fragment, count) for (fragment, count) in protein_fragments if fragment.count('|') == 3]
+        if not cyclic_fragments_excluded:
+            protein_fragments = [(fragment, count) for (fragment, count) in protein_fragments if fragment.count('|') == 3]
 
     if DUMP_NUMBERED_FRAGMENTS:
         print()
         def numbered_fragments():
             return {fragment: n for (n, (fragment, count)) in enumerate(protein_fragments)}
 
-        cached(
+        lazy_attribute('cached')(
             numbered_fragments,
             (),
             {},
@@ -302,8 +389,10 @@ def get_protein_fragments() -> Any:
 
     return protein_fragments
 
-def main(only_id: Optional[int] = None, figsize: Tuple[int, int] = FIGSIZE):
+def main(only_id: Optional[int] = None, figsize: Tuple[int, int] = FIGSIZE, journal: Optional[str] = None, svg_directory: Optional[str] = None, capping_workers: int = 1):
     protein_fragments = get_protein_fragments()
+    # Start the minimisation worker before any capping worker thread
+    get_minimisation_stage()
 
     if only_id:
         print(molid_after_capping_fragment(
@@ -313,11 +402,31 @@ def main(only_id: Optional[int] = None, figsize: Tuple[int, int] = FIGSIZE):
             fragments=(True,),
         ))
     else:
-        generate_collage(protein_fragments, figsize=figsize)
+        generate_collage(
+            protein_fragments,
+            figsize=figsize,
+            journal=journal,
+            svg_source=(Local_SVG_Source(svg_directory) if svg_directory is not None else None),
+            capping_workers=capping_workers,
+        )
 
 if __name__ == '__main__':
     args = parse_args()
-    main(
-        only_id=args.only_id,
-        figsize=tuple(args.figsize),
-    )
+    if args.timings:
+        add_sink(Histogram_Sink())
+    if args.timings_file:
+        add_sink(JSON_Lines_Sink(args.timings_file))
+    if args.reuse_capping or args.verify_capping:
+        CAPPING_SOLUTION_CACHE = Capping_Solution_Cache(verify=args.verify_capping)
+    try:
+        main(
+            only_id=args.only_id,
+            figsize=tuple(args.figsize),
+            journal=args.journal,
+            svg_directory=args.svg_directory,
+            capping_workers=args.capping_workers,
+        )
+    finally:
+        print_summary()
+        if CAPPING_SOLUTION_CACHE is not None:
+            print('Capping solutions: {0}'.format(CAPPING_SOLUTION_CACHE.summary()))
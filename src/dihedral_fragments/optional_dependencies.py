@@ -0,0 +1,18 @@
+from importlib import import_module
+from types import ModuleType
+
+MISSING_MODULE_MESSAGES = {
+    'fragment_capping': 'The `fragment_capping` module (https://github.com/bertrand-caron/fragment_capping) could not be found in your PYTHONPATH.',
+    'atb_api': 'The `atb_api_public` module (https://github.com/bertrand-caron/atb_api_public) could not be found in your PYTHONPATH.',
+}
+
+def required_module(module_name: str) -> ModuleType:
+    '''Import a heavy dependency on first use, raising the same RuntimeError as the former import-time checks if it is missing.'''
+    try:
+        return import_module(module_name)
+    except ImportError:
+        top_level_module = module_name.split('.')[0]
+        if top_level_module in MISSING_MODULE_MESSAGES:
+            raise RuntimeError(MISSING_MODULE_MESSAGES[top_level_module])
+        else:
+            raise
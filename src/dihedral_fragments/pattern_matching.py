@@ -1,10 +1,11 @@
-from re import search, sub, findall
+from re import compile, sub, findall
 from operator import itemgetter
 from typing import List, Tuple, Sequence, Dict, Callable, Any, NamedTuple, Optional
 from itertools import product, permutations, groupby
-from jinja2 import Template
+from functools import lru_cache
 
-from dihedral_fragments.dihedral_fragment import Dihedral_Fragment, split_neighbour_str, split_group_str, LEFT_ATOM_INDEX, RIGHT_ATOM_INDEX, LEFT_GROUP_INDEX, RIGHT_GROUP_INDEX, join_groups, join_neighbours, print_if_DEBUG, DEBUG, Dihedral_Fragment_Str
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment, split_neighbour_str, split_group_str, LEFT_ATOM_INDEX, RIGHT_ATOM_INDEX, LEFT_GROUP_INDEX, RIGHT_GROUP_INDEX, join_groups, join_neighbours, Dihedral_Fragment_Str
+from dihedral_fragments.tracing import PATTERN_MATCHING_TRACER
 from dihedral_fragments.regex import CAPTURE, NOT, ESCAPE, exactly_N_times_operator, N_to_M_times_operator, REGEX_START_ANCHOR, REGEX_END_ANCHOR, REGEX_NOT_SET, REGEX_GROUP, REGEX_SET, ESCAPED_COMMA, UNESCAPE_COMMA, ONE_ATOM, REGEX_AT_LEAST, REGEX_OR, ANY_NUMBER_OF_ATOMS, REGEX_ESCAPE, FORMAT_ESCAPED, FORMAT_UNESCAPED
 
 Operator_Pattern = NamedTuple('Operator_Pattern', [('pattern', str), ('replacement', str), ('substitution_type', str)])
@@ -87,8 +88,8 @@ def substitute_atom_pattern(atom_pattern: str) -> str:
 
     all_atom_patterns = [atom_pattern, cleaned_atom_pattern(atom_pattern)]
 
-    if DEBUG:
-        print('all_atom_patterns', all_atom_patterns)
+    if PATTERN_MATCHING_TRACER.debug:
+        PATTERN_MATCHING_TRACER.emit('atom_patterns', atom_patterns=all_atom_patterns)
 
     for an_atom_pattern in all_atom_patterns:
         if an_atom_pattern in ATOM_CATEGORIES:
@@ -115,13 +116,13 @@ def substitute_atoms_in_pattern(pattern: str, flavour: str = 'sql') -> str:
 
 def split_on_atoms(group: Any) -> Any:
     atom_patterns = split_neighbour_str(group)
-    if DEBUG:
-        print('group', group)
-        print('atom_patterns', atom_patterns)
-        print()
+    if PATTERN_MATCHING_TRACER.debug:
+        PATTERN_MATCHING_TRACER.emit('split_on_atoms', group=group, atom_patterns=atom_patterns)
     return atom_patterns
 
 def apply_regex_filters(string, debug=False, flavour='sql'):
+    echo, debug = debug, debug or PATTERN_MATCHING_TRACER.debug
+
     for (pattern, replacement, substitution_type) in regex_filters(flavour):
         if debug:
             old_string = string
@@ -135,21 +136,17 @@ def apply_regex_filters(string, debug=False, flavour='sql'):
 
             matches = findall(general_pattern, string)
             if matches:
-                if debug:
-                    print(matches)
                 for match in matches:
                     tailored_pattern = pattern(*match)
                     mapped_replacement = replacement(*match)
                     if debug:
-                        print(tailored_pattern, match)
-                        print(mapped_replacement)
+                        PATTERN_MATCHING_TRACER.emit('map_groups', echo=echo, match=match, tailored_pattern=tailored_pattern, replacement=mapped_replacement)
                     string = sub(tailored_pattern, mapped_replacement, string)
         else:
             raise Exception('Wrong substitution_type')
 
         if debug:
-            print([pattern, replacement, old_string], string)
-    print_if_DEBUG(string)
+            PATTERN_MATCHING_TRACER.emit('regex_filter', echo=echo, pattern=pattern, replacement=replacement, old_string=old_string, string=string)
     return UNESCAPE_COMMA(substitute_atoms_in_pattern(string, flavour=flavour))
 
 def escaped_special_regex_characters(patterns, flavour='sql'):
@@ -172,12 +169,14 @@ def re_patterns(pattern: Dihedral_Matching_Pattern, full_regex: bool = False, fl
     assert len(components) == 4
     need_to_reverse_inner_atoms = (components[LEFT_ATOM_INDEX] == components[RIGHT_ATOM_INDEX]) or any([x in list(ATOM_CATEGORIES.keys()) for x in (components[LEFT_ATOM_INDEX], components[RIGHT_ATOM_INDEX])])
 
-    if debug:
-        print()
-        print(metadata)
-        print('need_to_reverse_inner_atoms: {0}'.format(need_to_reverse_inner_atoms))
-        print(components[LEFT_ATOM_INDEX])
-        print(components[RIGHT_ATOM_INDEX])
+    if debug or PATTERN_MATCHING_TRACER.debug:
+        PATTERN_MATCHING_TRACER.emit(
+            're_patterns',
+            echo=debug,
+            metadata=metadata,
+            need_to_reverse_inner_atoms=need_to_reverse_inner_atoms,
+            central_atoms=(components[LEFT_ATOM_INDEX], components[RIGHT_ATOM_INDEX]),
+        )
 
     left_neighbour_groups, right_neighbour_groups = list(
         map(
@@ -223,16 +222,23 @@ def re_pattern_matching_for(pattern: Dihedral_Matching_Pattern, debug: bool = Fa
         return lambda test_string: test_string == str(Dihedral_Fragment(pattern))
     else:
         patterns = [FORMAT_UNESCAPED(re_pattern) for re_pattern in re_patterns(pattern, full_regex=True, flavour='re', debug=debug, metadata=metadata)]
+        # Compiled once, rather than looked up in `re`'s cache on every call
+        compiled_patterns = [compile(match_pattern) for match_pattern in patterns]
 
         def match_pattern_to(test_string):
-            if debug:
-                print(metadata)
-                print(pattern)
-                print(patterns)
-                print(test_string)
-                print(any([search(match_pattern, test_string) for match_pattern in patterns]))
-                print()
-            return any([search(match_pattern, test_string) for match_pattern in patterns])
+            if debug or PATTERN_MATCHING_TRACER.debug:
+                matched = any(compiled_pattern.search(test_string) for compiled_pattern in compiled_patterns)
+                PATTERN_MATCHING_TRACER.emit(
+                    'match',
+                    echo=debug,
+                    metadata=metadata,
+                    pattern=pattern,
+                    patterns=patterns,
+                    test_string=test_string,
+                    matched=matched,
+                )
+                return matched
+            return any(compiled_pattern.search(test_string) for compiled_pattern in compiled_patterns)
 
         return match_pattern_to
 
@@ -305,7 +311,7 @@ def sorted_components_list(component_list: List[str], permutation: Sequence[int]
         key=lambda x: sorting_dict[x],
     )
 
-SYNTAX_HELP = Template('''
+SYNTAX_HELP_TEMPLATE = '''
 <h5>Syntax Help</h5>
 
 <p class='help block'>
@@ -325,9 +331,21 @@ SYNTAX_HELP = Template('''
     <li><code>A{X-Y}</code> From <code>X</code> to <code>Y</code> atoms of type <code>A</code>. Ex: <code>CL{2-3}|C|C|%</code></li>
   </ul>
 </p>
-''').render(
-    ATOM_CATEGORIES=list(ATOM_CATEGORIES.items()),
-    in_code_tag=lambda x: '<code>' + (str(x) if x else '') + '</code>',
-)
+'''
+
+@lru_cache(maxsize=None)
+def syntax_help() -> str:
+    from jinja2 import Template
+
+    return Template(SYNTAX_HELP_TEMPLATE).render(
+        ATOM_CATEGORIES=list(ATOM_CATEGORIES.items()),
+        in_code_tag=lambda x: '<code>' + (str(x) if x else '') + '</code>',
+    )
+
+def __getattr__(name: str) -> Any:
+    '''Render SYNTAX_HELP (and import jinja2) on first access only.'''
+    if name == 'SYNTAX_HELP':
+        return syntax_help()
+    raise AttributeError('module {0!r} has no attribute {1!r}'.format(__name__, name))
 
 
@@ -0,0 +1,166 @@
+'''
+Posting lists: for every fragment (or tag), the roaring bitmap of the IDs of the molecules containing it.
+Questions such as "molecules containing both `O,C|C|O|H` and a nitro group" become an intersection of two bitmaps, rather than scans of every molecule's list of fragments.
+
+Posting files (little-endian, 8 bytes aligned): a 16 bytes header (magic, version, number of keys), the uint64 offsets of the keys (UTF-8, sorted bytewise) and of their serialised roaring bitmaps, the keys and the bitmaps.
+Opening a posting file only maps it: keys are found by binary search, and bitmaps are views of the file.
+'''
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from dihedral_fragments.dihedral_fragment import Fragment
+from dihedral_fragments.file_helpers import padding
+from dihedral_fragments.roaring import Roaring_Bitmap, intersection, roaring_bitmap_for_sorted_ids, roaring_bitmap_from_buffer, union
+
+MAGIC = b'DFPOSTNG'
+
+FORMAT_VERSION = 1
+
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('version', '<u2'), ('reserved', '<u2'), ('n_keys', '<u4')])
+
+Molecule_ID = int
+
+EMPTY_BITMAP = Roaring_Bitmap()
+
+class Invalid_Posting_File(Exception):
+    pass
+
+class Posting_Lists(object):
+    def __init__(self, bitmaps: Optional[Dict[str, Roaring_Bitmap]] = None) -> None:
+        self.bitmaps = bitmaps if bitmaps is not None else {} # type: Dict[str, Roaring_Bitmap]
+
+    def __len__(self) -> int:
+        return len(self.bitmaps)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.bitmaps
+
+    def keys(self) -> List[str]:
+        return list(self.bitmaps)
+
+    def bitmap(self, key: str) -> Roaring_Bitmap:
+        '''Molecules containing `key` (possibly none).'''
+        return self.bitmaps.get(key, EMPTY_BITMAP)
+
+    def write(self, path: str) -> None:
+        write_posting_file(path, self.bitmaps)
+
+def posting_lists_for_pairs(molecule_ids: np.ndarray, key_ids: np.ndarray, keys: Sequence[str]) -> Posting_Lists:
+    '''Posting lists of parallel arrays of molecule IDs and of positions in `keys` (pairs may be repeated).'''
+    molecule_ids, key_ids = np.asarray(molecule_ids, dtype=np.uint32), np.asarray(key_ids, dtype=np.int64)
+    order = np.lexsort((molecule_ids, key_ids))
+    molecule_ids, key_ids = molecule_ids[order], key_ids[order]
+    if len(order):
+        distinct = np.concatenate([[True], (molecule_ids[1:] != molecule_ids[:-1]) | (key_ids[1:] != key_ids[:-1])])
+        molecule_ids, key_ids = molecule_ids[distinct], key_ids[distinct]
+
+    starts = np.concatenate([[0], np.flatnonzero(key_ids[1:] != key_ids[:-1]) + 1, [len(key_ids)]]) if len(key_ids) else np.zeros(1, dtype=np.int64)
+    return Posting_Lists({
+        keys[key_ids[start]]: roaring_bitmap_for_sorted_ids(molecule_ids[start:stop])
+        for (start, stop) in zip(starts[:-1].tolist(), starts[1:].tolist())
+    })
+
+def posting_lists_for_molecules(fragments_for_molecules: Iterable[Tuple[Molecule_ID, Iterable[Fragment]]]) -> Posting_Lists:
+    '''Fragment -> molecules posting lists of (molecule ID, fragments) pairs, e.g. ATB molecules' `dihedral_fragments`.'''
+    key_for_fragment = {} # type: Dict[Fragment, int]
+    molecule_ids, key_ids = [], [] # type: Tuple[List[int], List[int]]
+    for (molecule_id, fragments) in fragments_for_molecules:
+        for fragment in fragments:
+            molecule_ids.append(molecule_id)
+            key_ids.append(key_for_fragment.setdefault(fragment, len(key_for_fragment)))
+    return posting_lists_for_pairs(np.array(molecule_ids, dtype=np.uint32), np.array(key_ids, dtype=np.int64), list(key_for_fragment))
+
+def tag_posting_lists(fragment_posting_lists: Posting_Lists, fragments_for_tag: Dict[str, Iterable[Fragment]]) -> Posting_Lists:
+    '''
+    Tag -> molecules posting lists, as the union of the posting lists of each tag's fragments
+    (e.g. `Tagging_Service.fragments_for_tag`, once the posting lists' fragments were tagged).
+    '''
+    return Posting_Lists({
+        tag: union([fragment_posting_lists.bitmap(fragment) for fragment in fragments])
+        for (tag, fragments) in fragments_for_tag.items()
+    })
+
+def write_posting_file(path: str, bitmaps: Dict[str, Roaring_Bitmap]) -> None:
+    encoded_keys = sorted((key.encode('utf-8'), key) for key in bitmaps)
+    n_keys = len(encoded_keys)
+
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header['magic'], header['version'], header['n_keys'] = MAGIC, FORMAT_VERSION, n_keys
+
+    key_offsets = np.cumsum([0] + [len(encoded_key) for (encoded_key, _) in encoded_keys]).astype('<u8')
+    keys_offset = HEADER_DTYPE.itemsize + 8 * (n_keys + 1) + 8 * n_keys
+    bitmaps_offset = keys_offset + int(key_offsets[-1]) + padding(int(key_offsets[-1]))
+    serialised_bitmaps = [bitmaps[key].to_bytes() for (_, key) in encoded_keys]
+    bitmap_offsets = (bitmaps_offset + np.cumsum([0] + [len(serialised_bitmap) for serialised_bitmap in serialised_bitmaps])[:-1]).astype('<u8')
+
+    with open(path, 'wb') as fh:
+        fh.write(header.tobytes())
+        fh.write(key_offsets.tobytes())
+        fh.write(bitmap_offsets.tobytes())
+        fh.write(b''.join(encoded_key for (encoded_key, _) in encoded_keys))
+        fh.write(b'\x00' * padding(int(key_offsets[-1])))
+        for serialised_bitmap in serialised_bitmaps:
+            fh.write(serialised_bitmap)
+
+class Posting_File(object):
+    '''Read-only, memory-mapped posting lists: opening it is O(1), keys are looked up in O(log n), and bitmaps are not copied.'''
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.buffer = np.memmap(path, dtype=np.uint8, mode='r')
+        if len(self.buffer) < HEADER_DTYPE.itemsize or bytes(self.buffer[:8]) != MAGIC:
+            raise Invalid_Posting_File('{0} is not a posting file'.format(path))
+        header = self.buffer[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)[0]
+        if header['version'] != FORMAT_VERSION:
+            raise Invalid_Posting_File('Unsupported posting file version {0} (expected {1})'.format(header['version'], FORMAT_VERSION))
+
+        self.n_keys = int(header['n_keys'])
+        key_offsets_offset = HEADER_DTYPE.itemsize
+        bitmap_offsets_offset = key_offsets_offset + 8 * (self.n_keys + 1)
+        self.keys_offset = bitmap_offsets_offset + 8 * self.n_keys
+        self.key_offsets = self.buffer[key_offsets_offset:bitmap_offsets_offset].view('<u8')
+        self.bitmap_offsets = self.buffer[bitmap_offsets_offset:self.keys_offset].view('<u8')
+
+    def __len__(self) -> int:
+        return self.n_keys
+
+    def encoded_key(self, position: int) -> bytes:
+        return bytes(self.buffer[self.keys_offset + int(self.key_offsets[position]):self.keys_offset + int(self.key_offsets[position + 1])])
+
+    def keys(self) -> List[str]:
+        return [self.encoded_key(position).decode('utf-8') for position in range(self.n_keys)]
+
+    def position(self, key: str) -> Optional[int]:
+        '''Position of `key` in the file (binary search over the sorted keys), or None.'''
+        encoded_key = key.encode('utf-8')
+        low, high = 0, self.n_keys
+        while low < high:
+            middle = (low + high) // 2
+            if self.encoded_key(middle) < encoded_key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.n_keys and self.encoded_key(low) == encoded_key:
+            return low
+        return None
+
+    def __contains__(self, key: str) -> bool:
+        return self.position(key) is not None
+
+    def bitmap(self, key: str) -> Roaring_Bitmap:
+        position = self.position(key)
+        if position is None:
+            return EMPTY_BITMAP
+        return roaring_bitmap_from_buffer(self.buffer, int(self.bitmap_offsets[position]))
+
+    def posting_lists(self) -> Posting_Lists:
+        return Posting_Lists({key: self.bitmap(key) for key in self.keys()})
+
+Any_Posting_Lists = Union[Posting_Lists, Posting_File]
+
+def molecules_with_all(posting_lists: Any_Posting_Lists, keys: Iterable[str]) -> Roaring_Bitmap:
+    '''Molecules containing every key (intersecting the smallest posting lists first).'''
+    return intersection([posting_lists.bitmap(key) for key in keys])
+
+def molecules_with_any(posting_lists: Any_Posting_Lists, keys: Iterable[str]) -> Roaring_Bitmap:
+    return union([posting_lists.bitmap(key) for key in keys])
@@ -0,0 +1,225 @@
+'''
+Concurrent, cached rendering of molecule thumbnails and collage assembly.
+
+SVGs come from an SVG source (the ATB, or a local directory for offline use), are rasterised in a thread pool and stored in a content-addressed thumbnail cache (keyed on the SVG bytes and rendering parameters). The collage is composed by pasting every thumbnail into a single PIL image.
+'''
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from math import ceil, sqrt
+from os.path import join, exists
+from re import sub
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+from urllib.request import urlopen
+
+from dihedral_fragments.file_helpers import atomic_write
+from dihedral_fragments.instrumentation import span
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+PNG_END = b'IEND\xaeB`\x82'
+
+Render_Parameters = NamedTuple('Render_Parameters', [('remove_background', bool), ('pixel_height', int), ('dpi', int)])
+
+DEFAULT_RENDER_PARAMETERS = Render_Parameters(remove_background=True, pixel_height=600, dpi=400)
+
+DEFAULT_MAX_WORKERS = 16
+
+# Pillow's default spacing between the lines of multiline text
+LABEL_LINE_SPACING = 4
+
+class ATB_SVG_Source(object):
+    def __init__(self, host: str = 'https://atb.uq.edu.au') -> None:
+        self.host = host
+
+    def fetch(self, molid: int) -> bytes:
+        with span('png_download', molid=molid):
+            # Makes sure the ATB has generated the thumbnail
+            urlopen('{host}/outputs_babel_img.py?molid={molid}'.format(host=self.host, molid=molid))
+            return urlopen('{host}/cache/img2D/{molid}_thumb.svg'.format(host=self.host, molid=molid)).read()
+
+class Local_SVG_Source(object):
+    '''Offline SVG source, reading `{molid}_thumb.svg` files (same names as the ATB's) from a directory.'''
+    def __init__(self, directory: str, file_name: str = '{molid}_thumb.svg') -> None:
+        self.directory = directory
+        self.file_name = file_name
+
+    def fetch(self, molid: int) -> bytes:
+        with open(join(self.directory, self.file_name.format(molid=molid)), 'rb') as fh:
+            return fh.read()
+
+def cleaned_svg_bytes(svg_bytes: bytes, remove_background: bool = True) -> bytes:
+    if remove_background:
+        modified_svg_bytes = sub(b'<rect.*?/>', b'', svg_bytes)
+        assert b'rect' not in modified_svg_bytes, modified_svg_bytes.decode()
+        return modified_svg_bytes
+    else:
+        return svg_bytes
+
+def cairosvg_rasteriser(svg_bytes: bytes, render_parameters: Render_Parameters) -> bytes:
+    from cairosvg import svg2png # pylint: disable=no-name-in-module
+
+    return svg2png(
+        bytestring=svg_bytes,
+        dpi=render_parameters.dpi,
+        height=render_parameters.pixel_height,
+    )
+
+def is_valid_png(png_bytes: bytes) -> bool:
+    '''Cheap validation: PNG signature at the start and IEND chunk at the end (catches truncated or foreign files).'''
+    return png_bytes.startswith(PNG_SIGNATURE) and png_bytes.endswith(PNG_END)
+
+class Thumbnail_Cache(object):
+    '''
+    Content-addressed PNG store: a thumbnail's key is the hash of its (cleaned) SVG and rendering parameters.
+    A per-molid index avoids fetching the SVG again when a molecule's thumbnail is already cached.
+    Thumbnails of the previous layout (`{molid}.png`, always rendered with the default parameters) are imported into the index on first use, rather than rendered again.
+    '''
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    def key(self, svg_bytes: bytes, render_parameters: Render_Parameters) -> str:
+        return sha256(repr(tuple(render_parameters)).encode() + b'\0' + svg_bytes).hexdigest()
+
+    def path(self, key: str) -> str:
+        return join(self.directory, key[:2], key + '.png')
+
+    def get(self, key: str) -> Optional[str]:
+        path = self.path(key)
+        if exists(path):
+            with open(path, 'rb') as fh:
+                if is_valid_png(fh.read()):
+                    return path
+        return None
+
+    def put(self, key: str, png_bytes: bytes) -> str:
+        assert is_valid_png(png_bytes), 'Refusing to cache an invalid PNG ({0} bytes)'.format(len(png_bytes))
+        path = self.path(key)
+        atomic_write(path, png_bytes)
+        return path
+
+    def _molid_index_path(self, molid: int, render_parameters: Render_Parameters) -> str:
+        return join(self.directory, 'molids', '{molid}_{parameters}.key'.format(molid=molid, parameters='_'.join(map(str, render_parameters))))
+
+    def get_for_molid(self, molid: int, render_parameters: Render_Parameters) -> Optional[str]:
+        index_path = self._molid_index_path(molid, render_parameters)
+        if exists(index_path):
+            with open(index_path) as fh:
+                return self.get(fh.read().strip())
+        elif render_parameters == DEFAULT_RENDER_PARAMETERS:
+            return self._import_legacy_png(molid)
+        return None
+
+    def _import_legacy_png(self, molid: int) -> Optional[str]:
+        '''Index `{molid}.png` (without its SVG, so keyed on the PNG bytes), if it is a valid thumbnail.'''
+        legacy_path = join(self.directory, '{molid}.png'.format(molid=molid))
+        if not exists(legacy_path):
+            return None
+        with open(legacy_path, 'rb') as fh:
+            png_bytes = fh.read()
+        if not is_valid_png(png_bytes):
+            return None
+        key = sha256(b'legacy\0' + png_bytes).hexdigest()
+        path = self.put(key, png_bytes)
+        self.put_for_molid(molid, DEFAULT_RENDER_PARAMETERS, key)
+        return path
+
+    def put_for_molid(self, molid: int, render_parameters: Render_Parameters, key: str) -> None:
+        atomic_write(self._molid_index_path(molid, render_parameters), key.encode())
+
+def render_thumbnail(
+    molid: int,
+    source: Any,
+    cache: Thumbnail_Cache,
+    rasteriser: Callable[[bytes, Render_Parameters], bytes] = cairosvg_rasteriser,
+    render_parameters: Render_Parameters = DEFAULT_RENDER_PARAMETERS,
+    force_regen: bool = False,
+) -> str:
+    if not force_regen:
+        cached_path = cache.get_for_molid(molid, render_parameters)
+        if cached_path is not None:
+            return cached_path
+
+    svg_bytes = cleaned_svg_bytes(source.fetch(molid), remove_background=render_parameters.remove_background)
+    key = cache.key(svg_bytes, render_parameters)
+    path = None if force_regen else cache.get(key)
+    if path is None:
+        with span('svg2png', molid=molid):
+            path = cache.put(key, rasteriser(svg_bytes, render_parameters))
+    cache.put_for_molid(molid, render_parameters, key)
+    return path
+
+def render_thumbnails(
+    molids: Iterable[int],
+    source: Any,
+    cache: Thumbnail_Cache,
+    rasteriser: Callable[[bytes, Render_Parameters], bytes] = cairosvg_rasteriser,
+    render_parameters: Render_Parameters = DEFAULT_RENDER_PARAMETERS,
+    force_regen: bool = False,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+) -> Dict[int, str]:
+    '''Fetch and rasterise the thumbnails of all (unique) molids concurrently. Returns {molid: png_file}.'''
+    unique_molids = list(dict.fromkeys(molids))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        png_files = executor.map(
+            lambda molid: render_thumbnail(molid, source, cache, rasteriser=rasteriser, render_parameters=render_parameters, force_regen=force_regen),
+            unique_molids,
+        )
+        return dict(zip(unique_molids, png_files))
+
+def best_columns(n_tiles: int, aspect_ratio: Tuple[float, float], tile_size: Tuple[int, int]) -> int:
+    '''Number of columns making a grid of `n_tiles` tiles closest to `aspect_ratio` (width, height).'''
+    target = (aspect_ratio[0] / aspect_ratio[1]) * (tile_size[1] / tile_size[0])
+    return max(1, min(n_tiles, int(round(sqrt(n_tiles * target)))))
+
+def draw_centred_label(draw: Any, xy: Tuple[int, int], label: str, font: Any) -> None:
+    '''Draw the (multiline) `label` horizontally centred on `xy`, below it.'''
+    try:
+        draw.multiline_text(xy, label, fill='black', font=font, anchor='ma', align='center')
+    except (AttributeError, TypeError, ValueError):
+        # Pillow < 8.0 has no anchors, and Pillow < 9.2 cannot anchor the bitmap font of `ImageFont.load_default()`: centre every line by hand
+        x, y = xy
+        for line in label.split('\n'):
+            width, height = font.getsize(line)
+            draw.text((x - width // 2, y), line, fill='black', font=font)
+            y += height + LABEL_LINE_SPACING
+
+def compose_collage(
+    tiles: Sequence[Tuple[Optional[str], str]],
+    tile_size: Tuple[int, int] = (300, 300),
+    label_height: int = 40,
+    aspect_ratio: Tuple[float, float] = (1.0, 1.4),
+    columns: Optional[int] = None,
+    font_name: str = 'Andale Mono',
+    font_size: int = 14,
+) -> Any:
+    '''Tile (png_file or None, label) pairs, row by row, into a single PIL image.'''
+    from PIL import Image, ImageDraw, ImageFont
+
+    assert len(tiles) > 0
+
+    if columns is None:
+        columns = best_columns(len(tiles), aspect_ratio, (tile_size[0], tile_size[1] + label_height))
+    rows = int(ceil(len(tiles) / columns))
+    cell_width, cell_height = tile_size[0], tile_size[1] + label_height
+
+    collage = Image.new('RGB', (columns * cell_width, rows * cell_height), 'white')
+    draw = ImageDraw.Draw(collage)
+    try:
+        font = ImageFont.truetype(font_name, font_size)
+    except OSError:
+        font = ImageFont.load_default()
+
+    for (n, (png_file, label)) in enumerate(tiles):
+        x, y = (n % columns) * cell_width, (n // columns) * cell_height
+        if png_file is not None:
+            with Image.open(png_file) as image:
+                thumbnail = image.convert('RGBA')
+            thumbnail.thumbnail(tile_size)
+            collage.paste(
+                thumbnail,
+                (x + (tile_size[0] - thumbnail.size[0]) // 2, y + (tile_size[1] - thumbnail.size[1]) // 2),
+                thumbnail,
+            )
+        draw_centred_label(draw, (x + cell_width // 2, y + tile_size[1]), label, font)
+
+    return collage
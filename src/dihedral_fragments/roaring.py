@@ -0,0 +1,328 @@
+'''
+Roaring bitmaps: compressed sets of unsigned 32 bits integers (e.g. molecule IDs), with NumPy containers.
+
+IDs are grouped by their 16 high bits (the container's key), and each container holds their 16 low bits, either as a sorted uint16 array (up to ARRAY_CONTAINER_SIZE IDs) or as a bitmap of 65536 bits (1024 uint64 words).
+AND (`&`), OR (`|`) and ANDNOT (`-`) are computed container by container, and only for the keys the operation can keep.
+
+Serialised bitmaps (little-endian, 8 bytes aligned): a 16 bytes header (magic, version, number of containers), the uint16 keys, the uint32 cardinalities, the uint64 offsets of the containers (from the start of the bitmap) and the containers.
+Bitmaps read from a buffer (e.g. a memory-mapped file) are views: containers are never copied, only combined.
+'''
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from dihedral_fragments.file_helpers import padding
+
+MAGIC = b'DFROARBM'
+
+FORMAT_VERSION = 1
+
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('version', '<u2'), ('reserved', '<u2'), ('n_containers', '<u4')])
+
+# Containers with more IDs are bitmaps (8 kB, the size of an array of 4096 uint16)
+ARRAY_CONTAINER_SIZE = 4096
+
+CONTAINER_BITS = 1 << 16
+
+BITMAP_WORDS = CONTAINER_BITS // 64
+
+Container = np.ndarray
+
+class Invalid_Roaring_Bitmap(Exception):
+    pass
+
+if hasattr(np, 'bitwise_count'):
+    def bitmap_cardinality(bitmap: Container) -> int:
+        return int(np.bitwise_count(bitmap).sum())
+else:
+    # NumPy < 2.0
+    BYTE_CARDINALITIES = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.int64)
+
+    def bitmap_cardinality(bitmap: Container) -> int:
+        return int(BYTE_CARDINALITIES[bitmap.view(np.uint8)].sum())
+
+def is_bitmap(container: Container) -> bool:
+    return container.dtype.itemsize == 8
+
+def array_to_bitmap(array: Container) -> Container:
+    bits = np.zeros(CONTAINER_BITS, dtype=bool)
+    bits[array] = True
+    return np.packbits(bits, bitorder='little').view('<u8')
+
+def bitmap_to_array(bitmap: Container) -> Container:
+    return np.flatnonzero(np.unpackbits(bitmap.view(np.uint8), bitorder='little')).astype('<u2')
+
+def sorted_unique(values: np.ndarray) -> np.ndarray:
+    '''Sorted distinct values (faster than `np.unique()`, which hashes small integers in recent NumPy versions).'''
+    values = np.sort(values)
+    if len(values) == 0:
+        return values
+    distinct = np.empty(len(values), dtype=bool)
+    distinct[0] = True
+    np.not_equal(values[1:], values[:-1], out=distinct[1:])
+    return values[distinct]
+
+def container_cardinality(container: Container) -> int:
+    return bitmap_cardinality(container) if is_bitmap(container) else len(container)
+
+Sized_Container = Tuple[Optional[Container], int]
+
+Keyed_Container = Tuple[int, Container, int]
+
+def normalised_bitmap(bitmap: Container) -> Sized_Container:
+    '''(container, cardinality) of a bitmap, converted to an array if small enough, or (None, 0) if empty.'''
+    cardinality = bitmap_cardinality(bitmap)
+    if cardinality == 0:
+        return (None, 0)
+    elif cardinality <= ARRAY_CONTAINER_SIZE:
+        return (bitmap_to_array(bitmap), cardinality)
+    else:
+        return (bitmap, cardinality)
+
+def sized_array(array: Container) -> Sized_Container:
+    return (array, len(array)) if len(array) else (None, 0)
+
+# Above, values are looked up in a table of the array's 65536 bits rather than by binary search
+TABLE_LOOKUP_SIZE = 1024
+
+def in_array(array: Container, values: Container) -> np.ndarray:
+    '''Mask of the `values` found in a (sorted) array container.'''
+    if len(array) == 0:
+        return np.zeros(len(values), dtype=bool)
+    if len(values) >= TABLE_LOOKUP_SIZE:
+        bits = np.zeros(CONTAINER_BITS, dtype=bool)
+        bits[array] = True
+        return bits[values]
+    positions = np.searchsorted(array, values)
+    positions[positions == len(array)] = 0
+    return array[positions] == values
+
+def in_bitmap(bitmap: Container, values: Container) -> np.ndarray:
+    return (bitmap[values >> 6] >> (values & 63).astype(np.uint64)) & np.uint64(1) == 1
+
+def and_containers(container_1: Container, container_2: Container) -> Sized_Container:
+    if is_bitmap(container_1) and is_bitmap(container_2):
+        return normalised_bitmap(container_1 & container_2)
+    elif is_bitmap(container_1):
+        return sized_array(container_2[in_bitmap(container_1, container_2)])
+    elif is_bitmap(container_2):
+        return sized_array(container_1[in_bitmap(container_2, container_1)])
+    else:
+        # Look the smallest array up in the largest one
+        smallest, largest = sorted((container_1, container_2), key=len)
+        return sized_array(smallest[in_array(largest, smallest)])
+
+def or_containers(container_1: Container, container_2: Container) -> Sized_Container:
+    if not is_bitmap(container_1) and not is_bitmap(container_2):
+        if len(container_1) + len(container_2) <= ARRAY_CONTAINER_SIZE:
+            return sized_array(sorted_unique(np.concatenate([container_1, container_2])))
+        return normalised_bitmap(array_to_bitmap(np.concatenate([container_1, container_2])))
+    bitmap = (
+        (container_1 if is_bitmap(container_1) else array_to_bitmap(container_1))
+        | (container_2 if is_bitmap(container_2) else array_to_bitmap(container_2))
+    )
+    return (bitmap, bitmap_cardinality(bitmap))
+
+def andnot_containers(container_1: Container, container_2: Container) -> Sized_Container:
+    if is_bitmap(container_1):
+        return normalised_bitmap(container_1 & ~(container_2 if is_bitmap(container_2) else array_to_bitmap(container_2)))
+    elif is_bitmap(container_2):
+        return sized_array(container_1[~in_bitmap(container_2, container_1)])
+    else:
+        return sized_array(container_1[~in_array(container_2, container_1)])
+
+class Roaring_Bitmap(object):
+    '''Immutable set of unsigned 32 bits integers. Containers are sorted by key, and never empty.'''
+    def __init__(self, keys: Sequence[int] = (), containers: Sequence[Container] = (), cardinalities: Optional[Sequence[int]] = None) -> None:
+        self.keys = list(keys)
+        self.containers = list(containers)
+        self.cardinalities = [container_cardinality(container) for container in self.containers] if cardinalities is None else list(cardinalities)
+
+    def __len__(self) -> int:
+        return sum(self.cardinalities)
+
+    def __bool__(self) -> bool:
+        return bool(self.keys)
+
+    def __repr__(self) -> str:
+        return 'Roaring_Bitmap({0} IDs in {1} containers)'.format(len(self), len(self.keys))
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Roaring_Bitmap) and self.keys == other.keys and self.cardinalities == other.cardinalities and np.array_equal(self.to_array(), other.to_array())
+
+    def container(self, key: int) -> Optional[Container]:
+        position = bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            return self.containers[position]
+        return None
+
+    def __contains__(self, value: int) -> bool:
+        container = self.container(value >> 16)
+        if container is None:
+            return False
+        values = np.array([value & 0xFFFF], dtype='<u2')
+        return bool((in_bitmap(container, values) if is_bitmap(container) else in_array(container, values))[0])
+
+    def to_array(self) -> np.ndarray:
+        '''Sorted uint32 array of the IDs.'''
+        if not self.keys:
+            return np.zeros(0, dtype=np.uint32)
+        return np.concatenate([
+            (np.uint32(key) << np.uint32(16)) | (bitmap_to_array(container) if is_bitmap(container) else container).astype(np.uint32)
+            for (key, container) in zip(self.keys, self.containers)
+        ])
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.to_array().tolist())
+
+    def __and__(self, other: 'Roaring_Bitmap') -> 'Roaring_Bitmap':
+        other_positions = {key: position for (position, key) in enumerate(other.keys)}
+        keyed_containers = [] # type: List[Keyed_Container]
+        for (key, container) in zip(self.keys, self.containers):
+            if key in other_positions:
+                result, cardinality = and_containers(container, other.containers[other_positions[key]])
+                if result is not None:
+                    keyed_containers.append((key, result, cardinality))
+        return roaring_bitmap_for_containers(keyed_containers)
+
+    def __or__(self, other: 'Roaring_Bitmap') -> 'Roaring_Bitmap':
+        return union([self, other])
+
+    def __sub__(self, other: 'Roaring_Bitmap') -> 'Roaring_Bitmap':
+        '''ANDNOT: IDs of `self` which are not in `other`.'''
+        other_positions = {key: position for (position, key) in enumerate(other.keys)}
+        keyed_containers = [] # type: List[Keyed_Container]
+        for (key, container, cardinality) in zip(self.keys, self.containers, self.cardinalities):
+            if key in other_positions:
+                container, cardinality = andnot_containers(container, other.containers[other_positions[key]])
+            if container is not None:
+                keyed_containers.append((key, container, cardinality))
+        return roaring_bitmap_for_containers(keyed_containers)
+
+    def serialised_size(self) -> int:
+        n_containers = len(self.keys)
+        return (
+            HEADER_DTYPE.itemsize
+            + 2 * n_containers + padding(2 * n_containers)
+            + 4 * n_containers + padding(4 * n_containers)
+            + 8 * n_containers
+            + sum(container.nbytes + padding(container.nbytes) for container in self.containers)
+        )
+
+    def to_bytes(self) -> bytes:
+        n_containers = len(self.keys)
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header['magic'], header['version'], header['n_containers'] = MAGIC, FORMAT_VERSION, n_containers
+
+        containers_offset = HEADER_DTYPE.itemsize + 2 * n_containers + padding(2 * n_containers) + 4 * n_containers + padding(4 * n_containers) + 8 * n_containers
+        offsets = np.cumsum([containers_offset] + [container.nbytes + padding(container.nbytes) for container in self.containers])[:-1]
+
+        chunks = [
+            header.tobytes(),
+            np.asarray(self.keys, dtype='<u2').tobytes(), b'\x00' * padding(2 * n_containers),
+            np.asarray(self.cardinalities, dtype='<u4').tobytes(), b'\x00' * padding(4 * n_containers),
+            np.asarray(offsets, dtype='<u8').tobytes(),
+        ]
+        for container in self.containers:
+            chunks.append(container.tobytes())
+            chunks.append(b'\x00' * padding(container.nbytes))
+        return b''.join(chunks)
+
+def roaring_bitmap_for_containers(keyed_containers: Sequence[Keyed_Container]) -> Roaring_Bitmap:
+    '''Roaring bitmap of (key, container, cardinality) triples, sorted by key.'''
+    return Roaring_Bitmap(
+        [key for (key, _, _) in keyed_containers],
+        [container for (_, container, _) in keyed_containers],
+        [cardinality for (_, _, cardinality) in keyed_containers],
+    )
+
+def roaring_bitmap_for_ids(ids: Iterable[int]) -> Roaring_Bitmap:
+    ids = sorted_unique(np.fromiter(ids, dtype=np.uint32) if not isinstance(ids, np.ndarray) else ids.astype(np.uint32))
+    return roaring_bitmap_for_sorted_ids(ids)
+
+def roaring_bitmap_for_sorted_ids(ids: np.ndarray) -> Roaring_Bitmap:
+    '''Roaring bitmap of a sorted uint32 array of distinct IDs.'''
+    if len(ids) == 0:
+        return Roaring_Bitmap()
+    high = ids >> np.uint32(16)
+    starts = np.concatenate([[0], np.flatnonzero(high[1:] != high[:-1]) + 1, [len(ids)]])
+    keyed_containers = [] # type: List[Keyed_Container]
+    for (start, stop) in zip(starts[:-1].tolist(), starts[1:].tolist()):
+        array = (ids[start:stop] & np.uint32(0xFFFF)).astype('<u2')
+        keyed_containers.append((int(high[start]), array_to_bitmap(array) if len(array) > ARRAY_CONTAINER_SIZE else array, len(array)))
+    return roaring_bitmap_for_containers(keyed_containers)
+
+def roaring_bitmap_from_buffer(buffer: np.ndarray, offset: int = 0) -> Roaring_Bitmap:
+    '''Roaring bitmap serialised at `offset` of a uint8 array (e.g. a `np.memmap`), whose containers are views of the buffer.'''
+    if len(buffer) < offset + HEADER_DTYPE.itemsize:
+        raise Invalid_Roaring_Bitmap('Truncated roaring bitmap (at offset {0})'.format(offset))
+    header = buffer[offset:offset + HEADER_DTYPE.itemsize].view(HEADER_DTYPE)[0]
+    if header['magic'] != MAGIC:
+        raise Invalid_Roaring_Bitmap('No roaring bitmap at offset {0}'.format(offset))
+    if header['version'] != FORMAT_VERSION:
+        raise Invalid_Roaring_Bitmap('Unsupported roaring bitmap version {0} (expected {1})'.format(header['version'], FORMAT_VERSION))
+
+    n_containers = int(header['n_containers'])
+    keys_offset = offset + HEADER_DTYPE.itemsize
+    cardinalities_offset = keys_offset + 2 * n_containers + padding(2 * n_containers)
+    offsets_offset = cardinalities_offset + 4 * n_containers + padding(4 * n_containers)
+
+    keys = buffer[keys_offset:keys_offset + 2 * n_containers].view('<u2').tolist()
+    cardinalities = buffer[cardinalities_offset:cardinalities_offset + 4 * n_containers].view('<u4').tolist()
+    container_offsets = buffer[offsets_offset:offsets_offset + 8 * n_containers].view('<u8').tolist()
+
+    containers = [] # type: List[Container]
+    for (container_offset, cardinality) in zip(container_offsets, cardinalities):
+        start = offset + container_offset
+        if cardinality > ARRAY_CONTAINER_SIZE:
+            containers.append(buffer[start:start + 8 * BITMAP_WORDS].view('<u8'))
+        else:
+            containers.append(buffer[start:start + 2 * cardinality].view('<u2'))
+    return Roaring_Bitmap(keys, containers, cardinalities)
+
+def write_roaring_bitmap(path: str, bitmap: Roaring_Bitmap) -> None:
+    with open(path, 'wb') as fh:
+        fh.write(bitmap.to_bytes())
+
+def read_roaring_bitmap(path: str) -> Roaring_Bitmap:
+    '''Memory-mapped roaring bitmap.'''
+    return roaring_bitmap_from_buffer(np.memmap(path, dtype=np.uint8, mode='r'))
+
+def intersection(bitmaps: Sequence[Roaring_Bitmap]) -> Roaring_Bitmap:
+    '''AND of several bitmaps, starting from the smallest.'''
+    if not bitmaps:
+        return Roaring_Bitmap()
+    bitmaps = sorted(bitmaps, key=len)
+    result = bitmaps[0]
+    for bitmap in bitmaps[1:]:
+        if not result:
+            break
+        result = result & bitmap
+    return result
+
+def union(bitmaps: Sequence[Roaring_Bitmap]) -> Roaring_Bitmap:
+    '''OR of several bitmaps, merging all the containers of a key at once.'''
+    containers_for_key = {} # type: Dict[int, List[Container]]
+    for bitmap in bitmaps:
+        for (key, container) in zip(bitmap.keys, bitmap.containers):
+            containers_for_key.setdefault(key, []).append(container)
+
+    keyed_containers = [] # type: List[Keyed_Container]
+    for key in sorted(containers_for_key):
+        key_containers = containers_for_key[key]
+        if len(key_containers) == 1:
+            container, cardinality = key_containers[0], container_cardinality(key_containers[0])
+        elif len(key_containers) == 2:
+            container, cardinality = or_containers(*key_containers)
+        else:
+            array_containers = [container for container in key_containers if not is_bitmap(container)]
+            bitmap_containers = [container for container in key_containers if is_bitmap(container)]
+            if not bitmap_containers and sum(len(array) for array in array_containers) <= ARRAY_CONTAINER_SIZE:
+                container, cardinality = sized_array(sorted_unique(np.concatenate(array_containers)))
+            else:
+                if array_containers:
+                    bitmap_containers.append(array_to_bitmap(np.concatenate(array_containers)))
+                container, cardinality = normalised_bitmap(np.bitwise_or.reduce(bitmap_containers))
+        keyed_containers.append((key, container, cardinality))
+    return roaring_bitmap_for_containers(keyed_containers)
@@ -0,0 +1,276 @@
+'''
+Distance between canonical dihedral fragments, and an index answering "closest known fragments" queries.
+
+The distance of two orientations of fragments sums, for the central atoms and for each side's neighbours, the multiset differences of their atoms (element and valence) and of their elements, plus CYCLE_WEIGHT times the multiset difference of their cycles (as (left neighbour, length, right neighbour)).
+A valence change therefore costs 2, an element change 4, a missing neighbour 2.
+The distance of two fragments is the smallest over the flip of one of them, which keeps it an (integer-valued) pseudo-metric: stereo-isomers are at distance 0.
+
+A Fragment_Similarity_Index buckets the known fragments by shape (central atoms, numbers of neighbours and of cycles, up to the flip), and interns the neighbour multisets of every side (which are few, compared to the fragments).
+A query computes its distance to every interned side at once with NumPy, then the distances of a bucket's fragments are sums of table lookups.
+Buckets are visited by increasing lower bound (the distance of the shapes), until none can improve on the k-th closest fragment found so far.
+'''
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment, Fragment, split_fragment_str, CHIRAL_MARKER
+from dihedral_fragments.improper import compact_atom
+
+Compact_Atom = Tuple[int, int]
+
+Side = Tuple[Compact_Atom, ...]
+
+Cycle_Atoms = Tuple[Compact_Atom, int, Compact_Atom]
+
+Oriented_Fragment = NamedTuple(
+    'Oriented_Fragment',
+    [('atom_2', Compact_Atom), ('atom_3', Compact_Atom), ('left', Side), ('right', Side), ('cycles', Tuple[Cycle_Atoms, ...])],
+)
+
+# Central atoms, numbers of left and right neighbours, number of cycles
+Fragment_Shape = Tuple[Compact_Atom, Compact_Atom, int, int, int]
+
+Similar_Fragment = NamedTuple('Similar_Fragment', [('distance', int), ('fragment', Fragment)])
+
+CYCLE_WEIGHT = 2
+
+def oriented_fragments(fragment: Fragment) -> Tuple[Oriented_Fragment, Oriented_Fragment]:
+    '''Both orientations of a (canonical) fragment string.'''
+    neighbours_1, atom_2, atom_3, neighbours_4, cycles = split_fragment_str(fragment)
+    left, right = [compact_atom(atom) for atom in neighbours_1], [compact_atom(atom) for atom in neighbours_4]
+    central_2, central_3 = compact_atom(atom_2.rstrip(CHIRAL_MARKER)), compact_atom(atom_3.rstrip(CHIRAL_MARKER))
+    cycle_atoms = [(left[i], n, right[j]) for (i, n, j) in cycles]
+    return (
+        Oriented_Fragment(central_2, central_3, tuple(sorted(left)), tuple(sorted(right)), tuple(sorted(cycle_atoms))),
+        Oriented_Fragment(central_3, central_2, tuple(sorted(right)), tuple(sorted(left)), tuple(sorted((j, n, i) for (i, n, j) in cycle_atoms))),
+    )
+
+def multiset_difference(a: Sequence[Any], b: Sequence[Any]) -> int:
+    '''Size of the symmetric difference of two sorted multisets.'''
+    i, j, common = 0, 0, 0
+    while i < len(a) and j < len(b):
+        if a[i] == b[j]:
+            common += 1
+            i += 1
+            j += 1
+        elif a[i] < b[j]:
+            i += 1
+        else:
+            j += 1
+    return len(a) + len(b) - 2 * common
+
+def side_distance(a: Side, b: Side) -> int:
+    '''Distance of two sorted sides (whose elements are then sorted too).'''
+    return multiset_difference(a, b) + multiset_difference([element for (element, _) in a], [element for (element, _) in b])
+
+def atom_distance(a: Compact_Atom, b: Compact_Atom) -> int:
+    return 0 if a == b else (2 if a[0] == b[0] else 4)
+
+def central_distance(a: Oriented_Fragment, b: Oriented_Fragment) -> int:
+    return atom_distance(a.atom_2, b.atom_2) + atom_distance(a.atom_3, b.atom_3)
+
+def cycles_distance(a: Sequence[Cycle_Atoms], b: Sequence[Cycle_Atoms]) -> int:
+    return CYCLE_WEIGHT * multiset_difference(a, b)
+
+def oriented_distance(a: Oriented_Fragment, b: Oriented_Fragment) -> int:
+    return central_distance(a, b) + side_distance(a.left, b.left) + side_distance(a.right, b.right) + cycles_distance(a.cycles, b.cycles)
+
+def fragment_distance(fragment_1: Fragment, fragment_2: Fragment) -> int:
+    orientation = oriented_fragments(fragment_1)[0]
+    return min(oriented_distance(orientation, other) for other in oriented_fragments(fragment_2))
+
+def fragment_shape(orientation: Oriented_Fragment) -> Fragment_Shape:
+    return (orientation.atom_2, orientation.atom_3, len(orientation.left), len(orientation.right), len(orientation.cycles))
+
+def shape_distance(a: Fragment_Shape, b: Fragment_Shape) -> int:
+    '''Lower bound of the `oriented_distance()` of any two orientations of these shapes (a missing neighbour costs 2, a missing cycle CYCLE_WEIGHT).'''
+    return (
+        atom_distance(a[0], b[0])
+        + atom_distance(a[1], b[1])
+        + 2 * abs(a[2] - b[2])
+        + 2 * abs(a[3] - b[3])
+        + CYCLE_WEIGHT * abs(a[4] - b[4])
+    )
+
+Bucket_Table = NamedTuple('Bucket_Table', [('lefts', np.ndarray), ('rights', np.ndarray), ('members', np.ndarray)])
+
+class Fragment_Similarity_Index(object):
+    def __init__(self, fragments: Iterable[Fragment] = ()) -> None:
+        self.fragments = [] # type: List[Fragment]
+        self.known_fragments = set() # type: Set[Fragment]
+        # Every fragment is stored in its orientation of (smallest) shape, the key of its bucket
+        self.orientations = [] # type: List[Oriented_Fragment]
+        self.buckets = {} # type: Dict[Fragment_Shape, List[int]]
+
+        # Interned sides, atoms and elements
+        self.side_ids = {} # type: Dict[Side, int]
+        self.atom_columns = {} # type: Dict[Compact_Atom, int]
+        self.element_columns = {} # type: Dict[int, int]
+
+        # NumPy tables, updated on the first query after fragments were added (only for the buckets which grew)
+        self.side_atom_counts = np.zeros((0, 0), dtype=np.int16)
+        self.side_element_counts = np.zeros((0, 0), dtype=np.int16)
+        self.bucket_tables = {} # type: Dict[Fragment_Shape, Bucket_Table]
+        self.stale_buckets = set() # type: Set[Fragment_Shape]
+        # Shapes of the buckets, and their (element, valence, element, valence, n_left, n_right, n_cycles) columns
+        self.shapes = [] # type: List[Fragment_Shape]
+        self.shape_table = np.zeros((0, 7), dtype=np.int64)
+
+        self.add_fragments(fragments)
+
+    def __len__(self) -> int:
+        return len(self.fragments)
+
+    def __contains__(self, fragment: Fragment) -> bool:
+        return fragment in self.known_fragments
+
+    def _side_id(self, side: Side) -> int:
+        if side not in self.side_ids:
+            self.side_ids[side] = len(self.side_ids)
+            for (element, valence) in side:
+                self.atom_columns.setdefault((element, valence), len(self.atom_columns))
+                self.element_columns.setdefault(element, len(self.element_columns))
+        return self.side_ids[side]
+
+    def add(self, fragment: Fragment) -> None:
+        '''Add a (canonical) fragment string to the index.'''
+        if fragment in self.known_fragments:
+            return
+        orientations = oriented_fragments(fragment)
+        shapes = (fragment_shape(orientations[0]), fragment_shape(orientations[1]))
+        shape = min(shapes)
+        orientation = orientations[shapes.index(shape)]
+        self._side_id(orientation.left), self._side_id(orientation.right)
+
+        self.buckets.setdefault(shape, []).append(len(self.fragments))
+        self.fragments.append(fragment)
+        self.known_fragments.add(fragment)
+        self.orientations.append(orientation)
+        self.stale_buckets.add(shape)
+
+    def add_fragments(self, fragments: Iterable[Fragment]) -> None:
+        for fragment in fragments:
+            self.add(fragment)
+
+    def _update_tables(self) -> None:
+        if self.side_atom_counts.shape != (len(self.side_ids), len(self.atom_columns)):
+            self.side_atom_counts = np.zeros((len(self.side_ids), len(self.atom_columns)), dtype=np.int16)
+            self.side_element_counts = np.zeros((len(self.side_ids), len(self.element_columns)), dtype=np.int16)
+            for (side, side_id) in self.side_ids.items():
+                for (element, valence) in side:
+                    self.side_atom_counts[side_id, self.atom_columns[(element, valence)]] += 1
+                    self.side_element_counts[side_id, self.element_columns[element]] += 1
+
+        if len(self.shapes) != len(self.buckets):
+            self.shapes = list(self.buckets)
+            self.shape_table = np.array([atom_2 + atom_3 + (n_left, n_right, n_cycles) for (atom_2, atom_3, n_left, n_right, n_cycles) in self.shapes], dtype=np.int64).reshape(-1, 7)
+
+        # Only the members added since the last update are appended
+        for shape in self.stale_buckets:
+            table = self.bucket_tables.get(shape, Bucket_Table(np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)))
+            new_members = self.buckets[shape][len(table.members):]
+            self.bucket_tables[shape] = Bucket_Table(
+                np.concatenate([table.lefts, np.array([self.side_ids[self.orientations[member].left] for member in new_members], dtype=np.intp)]),
+                np.concatenate([table.rights, np.array([self.side_ids[self.orientations[member].right] for member in new_members], dtype=np.intp)]),
+                np.concatenate([table.members, np.array(new_members, dtype=np.intp)]),
+            )
+        self.stale_buckets.clear()
+
+    def side_distances(self, side: Side) -> np.ndarray:
+        '''`side_distance()` of `side` to every interned side (indexed by side id).'''
+        self._update_tables()
+        atom_counts, element_counts = np.zeros(self.side_atom_counts.shape[1], dtype=np.int16), np.zeros(self.side_element_counts.shape[1], dtype=np.int16)
+        # Atoms and elements absent from the index are only counted once, against every side
+        n_unknown = 0
+        for (element, valence) in side:
+            if (element, valence) in self.atom_columns:
+                atom_counts[self.atom_columns[(element, valence)]] += 1
+            else:
+                n_unknown += 1
+            if element in self.element_columns:
+                element_counts[self.element_columns[element]] += 1
+            else:
+                n_unknown += 1
+        return (
+            np.abs(self.side_atom_counts - atom_counts).sum(axis=1)
+            + np.abs(self.side_element_counts - element_counts).sum(axis=1)
+            + n_unknown
+        )
+
+    def central_distances(self, orientation: Oriented_Fragment) -> np.ndarray:
+        '''`central_distance()` of `orientation` to the fragments of every bucket (in the order of `self.shapes`).'''
+        self._update_tables()
+        table = self.shape_table
+        return sum(
+            np.where(table[:, column] != atom[0], 4, np.where(table[:, column + 1] != atom[1], 2, 0))
+            for (column, atom) in ((0, orientation.atom_2), (2, orientation.atom_3))
+        )
+
+    def shape_distances(self, orientation: Oriented_Fragment) -> np.ndarray:
+        '''`shape_distance()` of the shape of `orientation` to the shape of every bucket.'''
+        central_distances, table = self.central_distances(orientation), self.shape_table
+        n_left, n_right, n_cycles = len(orientation.left), len(orientation.right), len(orientation.cycles)
+        return central_distances + 2 * np.abs(table[:, 4] - n_left) + 2 * np.abs(table[:, 5] - n_right) + CYCLE_WEIGHT * np.abs(table[:, 6] - n_cycles)
+
+    def nearest(self, fragment: Fragment, k: int = 5, max_distance: Optional[int] = None, canonise: bool = True) -> List[Similar_Fragment]:
+        '''
+        The `k` closest indexed fragments (closer than `max_distance`, if given), by increasing distance (ties by fragment string).
+        `fragment` is canonised first, unless `canonise` is False.
+        '''
+        if canonise:
+            fragment = str(Dihedral_Fragment(fragment))
+        self._update_tables()
+        query = oriented_fragments(fragment)
+        # Distances to the query's left and right sides (the flipped query swaps them), and to the central atoms of every bucket
+        distances_to = {side: self.side_distances(side) for side in (query[0].left, query[0].right)}
+        central_distances = [self.central_distances(orientation) for orientation in query]
+        lower_bounds = np.minimum(*[self.shape_distances(orientation) for orientation in query])
+        n_cycles = self.shape_table[:, 6] + len(query[0].cycles)
+
+        results = [] # type: List[Similar_Fragment]
+        radius = float('inf') if max_distance is None else max_distance
+        # Buckets of the same lower bound are searched together
+        for lower_bound in np.unique(lower_bounds).tolist():
+            if lower_bound > radius:
+                break
+            buckets = np.flatnonzero(lower_bounds == lower_bound)
+            tables = [self.bucket_tables[self.shapes[bucket]] for bucket in buckets.tolist()]
+            sizes = [len(table.members) for table in tables]
+            lefts, rights, members = [np.concatenate([getattr(table, column) for table in tables]) for column in ('lefts', 'rights', 'members')]
+
+            # Distances without the cycles, for both orientations of the query
+            oriented_partial_distances = [
+                np.repeat(central_distances[index][buckets], sizes) + distances_to[orientation.left][lefts] + distances_to[orientation.right][rights]
+                for (index, orientation) in enumerate(query)
+            ]
+            partial_distances = np.minimum(*oriented_partial_distances)
+            # Cycles cost at most `cycles_slack`, so the k-th smallest upper bound also bounds the distances worth computing
+            cycles_slack = CYCLE_WEIGHT * np.repeat(n_cycles[buckets], sizes)
+            radius_in_buckets = radius
+            if len(partial_distances) > k:
+                radius_in_buckets = min(radius, np.partition(partial_distances + cycles_slack, k - 1)[k - 1])
+
+            for index in np.flatnonzero(partial_distances <= radius_in_buckets).tolist():
+                member = int(members[index])
+                if cycles_slack[index]:
+                    distance = min(
+                        int(partial[index]) + cycles_distance(orientation.cycles, self.orientations[member].cycles)
+                        for (orientation, partial) in zip(query, oriented_partial_distances)
+                    )
+                else:
+                    distance = int(partial_distances[index])
+                if distance <= radius:
+                    results.append(Similar_Fragment(distance, self.fragments[member]))
+            results = sorted(results)[:k]
+            if len(results) == k:
+                radius = min(radius, results[-1].distance)
+        return results
+
+    def nearest_for_fragments(self, fragments: Sequence[Fragment], k: int = 5, max_distance: Optional[int] = None, canonise: bool = True) -> List[List[Similar_Fragment]]:
+        '''Batch `nearest()`: each distinct (canonical) query is only searched once.'''
+        canonical_fragments = [str(Dihedral_Fragment(fragment)) for fragment in fragments] if canonise else list(fragments)
+        results = {} # type: Dict[Fragment, List[Similar_Fragment]]
+        for fragment in canonical_fragments:
+            if fragment not in results:
+                results[fragment] = self.nearest(fragment, k=k, max_distance=max_distance, canonise=False)
+        return [results[fragment] for fragment in canonical_fragments]
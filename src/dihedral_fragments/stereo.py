@@ -0,0 +1,127 @@
+'''
+Enumeration of the stereochemically distinct canonical forms of a fragment, and fast mapping of dihedral angles to those forms.
+
+With distinct dihedral angles, the canonical form of a fragment only depends on the order of each side's neighbours by angle (`argsort(angles)`), not on the angles themselves.
+Without cycles, it only depends on the cyclic order of each side, as long as the side has no neighbours with the same atomic number but different descriptions (e.g. `C4` and `C3`):
+the neighbours are rotated to the best rotation by atomic number only, which is otherwise the same for every rotation of a cyclic order, but depends on where the rotation starts on such ties.
+Permutation tables (computed once per number of neighbours) map every ordering to its cyclic class and parity (for three neighbours, the parity alone identifies the cyclic class), so that each fragment is only canonicalised once per class.
+Angle assignments with ties fall back to the full canonicalisation (ties are broken on the neighbours' elements).
+'''
+from functools import lru_cache
+from itertools import permutations
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment, Invalid_Dihedral_Angles, Fragment, on_asc_atomic_number_then_asc_valence
+
+Ordering = Tuple[int, ...]
+
+Permutation_Entry = NamedTuple('Permutation_Entry', [('cyclic_class', Ordering), ('parity', int)])
+
+def permutation_parity(ordering: Ordering) -> int:
+    '''0 for even permutations, 1 for odd ones.'''
+    parity, seen = 0, [False] * len(ordering)
+    for start in range(len(ordering)):
+        if not seen[start]:
+            length, position = 0, start
+            while not seen[position]:
+                seen[position] = True
+                position = ordering[position]
+                length += 1
+            parity ^= (length - 1) & 1
+    return parity
+
+def cyclic_class(ordering: Ordering) -> Ordering:
+    '''Rotation of `ordering` starting with neighbour 0, which represents all its rotations.'''
+    start = ordering.index(0)
+    return ordering[start:] + ordering[:start]
+
+@lru_cache(maxsize=None)
+def permutation_table(n_neighbours: int) -> Dict[Ordering, Permutation_Entry]:
+    return {
+        ordering: Permutation_Entry(cyclic_class(ordering), permutation_parity(ordering))
+        for ordering in permutations(range(n_neighbours))
+    }
+
+@lru_cache(maxsize=None)
+def cyclic_classes(n_neighbours: int) -> Tuple[Ordering, ...]:
+    return tuple(sorted({entry.cyclic_class for entry in permutation_table(n_neighbours).values()}))
+
+def rotations_are_equivalent(neighbours: Sequence[str]) -> bool:
+    '''Whether every rotation of an ordering of `neighbours` has the same canonical form, i.e. whether neighbours with the same atomic number are identical.'''
+    neighbours_for_atomic_number = {} # type: Dict[int, Set[str]]
+    for neighbour in neighbours:
+        neighbours_for_atomic_number.setdefault(on_asc_atomic_number_then_asc_valence(neighbour)[0], set()).add(neighbour)
+    return all(len(same_atomic_number) == 1 for same_atomic_number in neighbours_for_atomic_number.values())
+
+def angle_ordering(angles: Sequence[float]) -> Optional[Ordering]:
+    '''Indices of the neighbours sorted by dihedral angle, or None if two angles are equal.'''
+    if len(set(angles)) < len(angles):
+        return None
+    return tuple(sorted(range(len(angles)), key=angles.__getitem__))
+
+def angles_for_ordering(ordering: Ordering) -> List[float]:
+    angles = [0.0] * len(ordering)
+    for (rank, neighbour_index) in enumerate(ordering):
+        angles[neighbour_index] = float(rank)
+    return angles
+
+Atom_List = Tuple[List[str], str, str, List[str], List[Tuple[int, int, int]]]
+
+class Stereo_Fragment(object):
+    '''Stereochemically distinct canonical forms of a fragment, given as an `atom_list` (the order of its neighbours is the order of the dihedral angles).'''
+    def __init__(self, atom_list: Atom_List) -> None:
+        if len(atom_list) == 4:
+            atom_list = tuple(atom_list) + ([],)
+        self.atom_list = atom_list
+        self.neighbours_1, self.atom_2, self.atom_3, self.neighbours_4, self.cycles = atom_list
+        # Cycles are renumbered by position, so rotations are not equivalent
+        self.equivalent_rotations = tuple(not self.cycles and rotations_are_equivalent(neighbours) for neighbours in (self.neighbours_1, self.neighbours_4))
+        self.forms = {} # type: Dict[Tuple[Ordering, Ordering], Fragment]
+
+    def _key(self, left_ordering: Ordering, right_ordering: Ordering) -> Tuple[Ordering, Ordering]:
+        return tuple(
+            permutation_table(len(ordering))[ordering].cyclic_class if equivalent_rotations else ordering
+            for (ordering, equivalent_rotations) in zip((left_ordering, right_ordering), self.equivalent_rotations)
+        )
+
+    def form_for_orderings(self, left_ordering: Ordering, right_ordering: Ordering) -> Fragment:
+        key = self._key(left_ordering, right_ordering)
+        try:
+            return self.forms[key]
+        except KeyError:
+            self.forms[key] = str(
+                Dihedral_Fragment(
+                    atom_list=self.atom_list,
+                    dihedral_angles=(angles_for_ordering(key[0]), angles_for_ordering(key[1])),
+                ),
+            )
+            return self.forms[key]
+
+    def form_for_angles(self, dihedral_angles: Tuple[List[float], List[float]]) -> Fragment:
+        '''Same as `str(Dihedral_Fragment(atom_list=..., dihedral_angles=dihedral_angles))`.'''
+        left_angles, right_angles = dihedral_angles
+        assert len(left_angles) == len(self.neighbours_1) and len(right_angles) == len(self.neighbours_4), (dihedral_angles, self.atom_list)
+        if not all(-180.0 <= angle <= 180.0 for angle in list(left_angles) + list(right_angles)):
+            raise Invalid_Dihedral_Angles([list(left_angles) + list(right_angles)])
+
+        left_ordering, right_ordering = angle_ordering(left_angles), angle_ordering(right_angles)
+        if left_ordering is None or right_ordering is None:
+            return str(Dihedral_Fragment(atom_list=self.atom_list, dihedral_angles=dihedral_angles))
+        else:
+            return self.form_for_orderings(left_ordering, right_ordering)
+
+    def orderings(self, n_neighbours: int, equivalent_rotations: bool) -> Sequence[Ordering]:
+        if equivalent_rotations:
+            return cyclic_classes(n_neighbours)
+        else:
+            return list(permutation_table(n_neighbours))
+
+    def stereo_forms(self) -> List[Fragment]:
+        '''Every distinct canonical form of the fragment (a single one for fragments without stereochemistry).'''
+        return sorted(
+            {
+                self.form_for_orderings(left_ordering, right_ordering)
+                for left_ordering in self.orderings(len(self.neighbours_1), self.equivalent_rotations[0])
+                for right_ordering in self.orderings(len(self.neighbours_4), self.equivalent_rotations[1])
+            },
+        )
@@ -0,0 +1,64 @@
+'''
+Streaming a function's results over many (slow) items, as soon as they are computed.
+
+Items are consumed lazily and run in a thread pool, with at most `max_in_flight` of them submitted (or waiting in the reorder buffer) at any time, so that memory stays bounded however many items there are.
+Results are yielded either as they complete, or in input order (completed results waiting in a reorder buffer until all the previous ones are yielded).
+'''
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+
+R = TypeVar('R')
+
+def iter_results(
+    function: Callable[[T], R],
+    items: Iterable[T],
+    max_workers: int = 1,
+    max_in_flight: Optional[int] = None,
+    ordered: bool = True,
+) -> Iterator[Tuple[int, T, R]]:
+    '''
+    (position, item, function(item)) for every item, in input order if `ordered` (else as they complete).
+    `max_in_flight` defaults to twice `max_workers`; a single worker runs items one after the other, in the calling thread.
+    An exception raised by `function` is raised when its result would have been yielded, and cancels the items not started yet.
+    '''
+    if max_workers == 1:
+        for (position, item) in enumerate(items):
+            yield (position, item, function(item))
+        return
+
+    max_in_flight = max(1, max_in_flight or 2 * max_workers)
+    positioned_items = enumerate(items)
+    pending = {} # type: Dict[Future, Tuple[int, T]]
+    reorder_buffer = {} # type: Dict[int, Tuple[T, Future]]
+    next_position, exhausted = 0, False
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            while True:
+                while not exhausted and len(pending) + len(reorder_buffer) < max_in_flight:
+                    try:
+                        (position, item) = next(positioned_items)
+                    except StopIteration:
+                        exhausted = True
+                    else:
+                        pending[executor.submit(function, item)] = (position, item)
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in sorted(done, key=lambda future: pending[future][0]):
+                    (position, item) = pending.pop(future)
+                    if ordered:
+                        reorder_buffer[position] = (item, future)
+                    else:
+                        yield (position, item, future.result())
+
+                while next_position in reorder_buffer:
+                    (item, future) = reorder_buffer.pop(next_position)
+                    yield (next_position, item, future.result())
+                    next_position += 1
+        finally:
+            # Consumers stopping early (or failures) do not wait for items that were not started
+            for future in pending:
+                future.cancel()
@@ -1,54 +1,174 @@
+from argparse import ArgumentParser
 from sys import stderr
 from os.path import exists
-from functools import reduce
+from functools import lru_cache
+from json import dumps, loads
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
 
-from atb_api import API
 from dihedral_fragments.pattern_matching import re_pattern_matching_for
 from dihedral_fragments.chemistry import CHEMICAL_GROUPS
+from dihedral_fragments.tagging import Tagging_Service
 
-DEBUG = True
+@lru_cache(maxsize=None)
+def chemical_groups_matching_patterns() -> List[Tuple[str, Callable[[str], bool]]]:
+    '''Matchers for every CHEMICAL_GROUPS pattern, compiled on first use rather than at import.'''
+    return [
+        (moiety, re_pattern_matching_for(pattern, metadata=moiety))
+        for (moiety, pattern) in CHEMICAL_GROUPS if pattern
+    ]
 
-CHEMICAL_GROUPS_MATCHING_PATTERNS = [
-    (moiety, re_pattern_matching_for(pattern, debug=DEBUG, metadata=moiety))
-    for (moiety, pattern) in CHEMICAL_GROUPS if pattern
-]
+def __getattr__(name: str) -> Any:
+    if name == 'CHEMICAL_GROUPS_MATCHING_PATTERNS':
+        return chemical_groups_matching_patterns()
+    raise AttributeError('module {0!r} has no attribute {1!r}'.format(__name__, name))
 
 def dihedrals(molecule):
     return molecule.dihedral_fragments
 
 def tags_for_dihedral(dihedral_string):
-    tags = [moiety for (moiety, matching_function) in CHEMICAL_GROUPS_MATCHING_PATTERNS if matching_function(dihedral_string)]
+    tags = [moiety for (moiety, matching_function) in chemical_groups_matching_patterns() if matching_function(dihedral_string)]
     assert len(tags) <= 1, 'No dihedral ({0}) should be matched by more than one rule: {1}'.format(dihedral_string, tags)
     return tags
 
 def tags_for_molecule(molecule):
-    return set(
-        reduce(
-            lambda acc, e: acc + e,
-            [tags_for_dihedral(dihedral) for dihedral in dihedrals(molecule)],
-            [],
-        ),
-    )
+    return set().union(*[tags_for_dihedral(dihedral) for dihedral in dihedrals(molecule)])
 
 def yes_or_no(query):
-    choice = eval(input(query))
-    if choice == 'y':
+    choice = input(query).strip().lower()
+    if choice in ('y', 'yes'):
        return True
-    elif choice == 'n':
+    elif choice in ('n', 'no'):
        return False
     else:
        stderr.write("Please respond with 'yes' or 'no'")
 
 IGNORE_FILE = '.ignore'
 
-def get_ignored_molids():
-    if exists(IGNORE_FILE):
-        with open(IGNORE_FILE) as fh:
-            return set([int(line) for line in fh.read().splitlines()])
+def get_ignored_molids(ignore_file: str = IGNORE_FILE) -> Set[int]:
+    if exists(ignore_file):
+        with open(ignore_file) as fh:
+            return set([int(line) for line in fh.read().splitlines() if line.strip()])
     else:
         return set()
 
-if __name__ == '__main__':
+def ignore_molids(molids: Iterable[int], ignore_file: str = IGNORE_FILE) -> None:
+    with open(ignore_file, 'a') as fh:
+        fh.write(''.join(str(molid) + '\n' for molid in molids))
+
+DATA_SETS_TAGS = set(['Shivakumar et al.', 'Marenich et al.', 'Mobley et al.', 'SAMPL0', 'SAMPL1', 'SAMPL2', 'SAMPL4'])
+
+DEFAULT_SEARCH = dict(tag='Mobley et al.', max_atoms=15)
+
+# Offline batch mode: dump molecules (JSON lines), propose tag diffs for all of them in parallel, review the diff file, apply the accepted diffs in bulk.
+
+Molecule_Record = NamedTuple('Molecule_Record', [('molid', int), ('tags', List[str]), ('dihedral_fragments', List[str])])
+
+# `accept` is left to None by `propose`, and set to true or false by the reviewer
+Tag_Diff = NamedTuple('Tag_Diff', [('molid', int), ('old_tags', List[str]), ('new_tags', List[str]), ('accept', Optional[bool])])
+
+def tags_to_add(tag_diff: Tag_Diff) -> List[str]:
+    return sorted(set(tag_diff.new_tags) - set(tag_diff.old_tags))
+
+def write_json_lines(path: str, records: Iterable[NamedTuple]) -> None:
+    with open(path, 'w') as fh:
+        for record in records:
+            fh.write(dumps(record._asdict()) + '\n')
+
+def read_json_lines(path: str, record_type: Any) -> List[Any]:
+    with open(path) as fh:
+        return [record_type(**loads(line)) for line in fh if line.strip()]
+
+def read_molecule_dump(path: str) -> List[Molecule_Record]:
+    return read_json_lines(path, Molecule_Record)
+
+def read_tag_diffs(path: str) -> List[Tag_Diff]:
+    return read_json_lines(path, Tag_Diff)
+
+def proposed_tag_diff(tagging_service: Any, molecule: Molecule_Record) -> Optional[Tag_Diff]:
+    new_tags = tagging_service.tags_for_molecule(molecule)
+    old_tags = set(molecule.tags) - DATA_SETS_TAGS
+    if old_tags != new_tags:
+        return Tag_Diff(molecule.molid, sorted(old_tags), sorted(new_tags), None)
+    else:
+        return None
+
+WORKER_TAGGING_SERVICE = None
+
+def _init_worker() -> None:
+    global WORKER_TAGGING_SERVICE
+    WORKER_TAGGING_SERVICE = Tagging_Service()
+
+def _proposed_tag_diff_in_worker(molecule: Molecule_Record) -> Optional[Tag_Diff]:
+    return proposed_tag_diff(WORKER_TAGGING_SERVICE, molecule)
+
+def proposed_tag_diffs(molecules: Sequence[Molecule_Record], ignored_molids: Set[int] = set(), workers: int = 1, chunksize: int = 64) -> List[Tag_Diff]:
+    '''Tag diffs (in input order) for every molecule whose predicted tags differ from its current ones. Each worker memoises its own fragment tags.'''
+    molecules = [molecule for molecule in molecules if molecule.molid not in ignored_molids]
+    if workers == 1:
+        _init_worker()
+        tag_diffs = map(_proposed_tag_diff_in_worker, molecules)
+        return [tag_diff for tag_diff in tag_diffs if tag_diff is not None]
+
+    from multiprocessing import Pool
+
+    with Pool(workers, initializer=_init_worker) as pool:
+        tag_diffs = pool.map(_proposed_tag_diff_in_worker, molecules, chunksize=chunksize)
+    return [tag_diff for tag_diff in tag_diffs if tag_diff is not None]
+
+def apply_tag_diffs(tag_api: Any, tag_diffs: Iterable[Tag_Diff], accept_all: bool = False, batch_size: int = 100, ignore_file: str = IGNORE_FILE) -> Tuple[int, int]:
+    '''
+    Add the tags of accepted diffs (or of undecided ones too, with `accept_all`), `batch_size` (molid, tag_name) pairs per API call.
+    Rejected molids are appended to `ignore_file`, as in the interactive session. Returns (number of tags added, number of rejected molecules).
+    '''
+    tag_diffs = list(tag_diffs)
+    additions = [
+        (tag_diff.molid, tag_name)
+        for tag_diff in tag_diffs
+        if tag_diff.accept or (accept_all and tag_diff.accept is None)
+        for tag_name in tags_to_add(tag_diff)
+    ]
+    for start in range(0, len(additions), batch_size):
+        tag_api.add_tags(additions[start:start + batch_size])
+
+    rejected_molids = [tag_diff.molid for tag_diff in tag_diffs if tag_diff.accept is False]
+    if rejected_molids:
+        ignore_molids(rejected_molids, ignore_file=ignore_file)
+    return (len(additions), len(rejected_molids))
+
+class ATB_Tag_API(object):
+    '''Adapter over the `atb_api` client. The ATB has no bulk tagging endpoint, so each batch is sent as concurrent per-tag requests.'''
+    def __init__(self, api: Any, max_workers: int = 8) -> None:
+        self.api = api
+        self.max_workers = max_workers
+
+    def search(self, **kwargs: Any) -> List[Molecule_Record]:
+        return [
+            Molecule_Record(molecule.molid, list(molecule.tags), list(molecule.dihedral_fragments))
+            for molecule in self.api.Molecules.search(**kwargs)
+        ]
+
+    def add_tags(self, additions: Sequence[Tuple[int, str]]) -> None:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(lambda addition: self.api.Molecules.molid(molid=addition[0]).tag(tag_name=addition[1]), additions))
+
+class Fake_Tag_API(object):
+    '''In-memory stand-in for ATB_Tag_API, recording every `add_tags` batch.'''
+    def __init__(self, molecules: Iterable[Molecule_Record]) -> None:
+        self.molecules = {molecule.molid: molecule for molecule in molecules}
+        self.tags = {molecule.molid: set(molecule.tags) for molecule in self.molecules.values()} # type: Dict[int, Set[str]]
+        self.batches = [] # type: List[List[Tuple[int, str]]]
+
+    def search(self, **kwargs: Any) -> List[Molecule_Record]:
+        return [molecule._replace(tags=sorted(self.tags[molid])) for (molid, molecule) in sorted(self.molecules.items())]
+
+    def add_tags(self, additions: Sequence[Tuple[int, str]]) -> None:
+        self.batches.append(list(additions))
+        for (molid, tag_name) in additions:
+            self.tags[molid].add(tag_name)
+
+def sanity_checks() -> None:
     assert tags_for_dihedral('CL,C,H|C|C|H,H,H') == ['chloro']
     #assert tags_for_dihedral('C|N|C|C,H') == ['']
     assert tags_for_dihedral('CL,CL,H|C|C|H,H,H') == ['dichloro']
@@ -58,20 +178,22 @@ if __name__ == '__main__':
     assert tags_for_dihedral('H,H,H|C|C|CL,CL,CL') == ['trichloro']
     assert tags_for_dihedral('O,O,O|P|O|C') == ['phosphate']
 
+def interactive_session(api: Any) -> None:
+    sanity_checks()
+
     ignored_molids = get_ignored_molids()
 
     fh = open(IGNORE_FILE, 'a')
 
-    DATA_SETS_TAGS = set(['Shivakumar et al.', 'Marenich et al.', 'Mobley et al.', 'SAMPL0', 'SAMPL1', 'SAMPL2', 'SAMPL4'])
+    tagging_service = Tagging_Service()
 
-    api = API(debug=True, api_format='pickle')
-    molecules = api.Molecules.search(tag='Mobley et al.', max_atoms=15)
+    molecules = api.Molecules.search(**DEFAULT_SEARCH)
     for molecule in molecules:
         if molecule.molid in ignored_molids:
             continue
 
         print(molecule)
-        new_tags = tags_for_molecule(molecule)
+        new_tags = tagging_service.tags_for_molecule(molecule)
         old_tags = set(molecule.tags) - DATA_SETS_TAGS
 
         if old_tags != new_tags:
@@ -90,3 +212,43 @@ if __name__ == '__main__':
                 fh.close()
                 raise
         print()
+
+def parse_args() -> Any:
+    parser = ArgumentParser(description='Predict molecule tags from their dihedral fragments, interactively (default) or in offline batches (dump, propose, apply).')
+    subparsers = parser.add_subparsers(dest='command')
+
+    dump_parser = subparsers.add_parser('dump', help='Dump the molecules (molid, tags, dihedral fragments) to a JSON lines file')
+    dump_parser.add_argument('output', type=str)
+    dump_parser.add_argument('--tag', type=str, default=DEFAULT_SEARCH['tag'])
+    dump_parser.add_argument('--max-atoms', type=int, default=DEFAULT_SEARCH['max_atoms'])
+
+    propose_parser = subparsers.add_parser('propose', help='Write the proposed tag diffs of a molecule dump to a reviewable JSON lines file')
+    propose_parser.add_argument('molecules', type=str)
+    propose_parser.add_argument('output', type=str)
+    propose_parser.add_argument('--workers', type=int, default=1)
+
+    apply_parser = subparsers.add_parser('apply', help='Apply the accepted diffs (`"accept": true`) of a reviewed diff file')
+    apply_parser.add_argument('diffs', type=str)
+    apply_parser.add_argument('--accept-all', action='store_true', help='Also apply undecided diffs (`"accept": null`)')
+    apply_parser.add_argument('--batch-size', type=int, default=100)
+
+    return parser.parse_args()
+
+def get_api() -> Any:
+    from dihedral_fragments.optional_dependencies import required_module
+    return required_module('atb_api').API(debug=True, api_format='pickle')
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    if args.command is None:
+        interactive_session(get_api())
+    elif args.command == 'dump':
+        write_json_lines(args.output, ATB_Tag_API(get_api()).search(tag=args.tag, max_atoms=args.max_atoms))
+    elif args.command == 'propose':
+        tag_diffs = proposed_tag_diffs(read_molecule_dump(args.molecules), ignored_molids=get_ignored_molids(), workers=args.workers)
+        write_json_lines(args.output, tag_diffs)
+        print('Wrote {0} proposed tag diffs to {1}'.format(len(tag_diffs), args.output))
+    elif args.command == 'apply':
+        n_added, n_rejected = apply_tag_diffs(ATB_Tag_API(get_api()), read_tag_diffs(args.diffs), accept_all=args.accept_all, batch_size=args.batch_size)
+        print('Added {0} tags, ignored {1} rejected molecules'.format(n_added, n_rejected))
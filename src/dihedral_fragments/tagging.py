@@ -0,0 +1,118 @@
+'''
+Molecule tagging with per-fragment memoisation.
+
+The same (canonical) dihedral fragments recur across nearly all molecules, so each fragment is only matched against the CHEMICAL_GROUPS patterns once.
+An inverted index (moiety -> fragments) lets `update_groups()` re-evaluate only the patterns which were added, removed or modified.
+'''
+from typing import AbstractSet, Any, Callable, Dict, FrozenSet, Iterable, List, Sequence, Set, Tuple
+
+from dihedral_fragments.chemistry import CHEMICAL_GROUPS
+from dihedral_fragments.dihedral_fragment import Fragment
+from dihedral_fragments.pattern_matching import re_pattern_matching_for
+from dihedral_fragments.tracing import TAGGING_TRACER
+
+Chemical_Group = Tuple[str, str]
+
+NO_TAGS = frozenset() # type: FrozenSet[str]
+
+def dihedrals(molecule: Any) -> List[Fragment]:
+    return molecule.dihedral_fragments
+
+class Tagging_Service(object):
+    def __init__(self, chemical_groups: Sequence[Chemical_Group] = CHEMICAL_GROUPS, get_dihedrals: Callable[[Any], Iterable[Fragment]] = dihedrals) -> None:
+        self.get_dihedrals = get_dihedrals
+        self.patterns = {} # type: Dict[str, str]
+        self.matchers = {} # type: Dict[str, Callable[[Fragment], bool]]
+        self.tags_for_fragment = {} # type: Dict[Fragment, FrozenSet[str]]
+        self.fragments_for_tag = {} # type: Dict[str, Set[Fragment]]
+        self._set_groups(chemical_groups)
+
+    def _set_groups(self, chemical_groups: Sequence[Chemical_Group]) -> None:
+        self.patterns = {moiety: pattern for (moiety, pattern) in chemical_groups if pattern}
+        for moiety in self.patterns:
+            if moiety not in self.matchers:
+                self.matchers[moiety] = re_pattern_matching_for(self.patterns[moiety], metadata=moiety)
+            self.fragments_for_tag.setdefault(moiety, set())
+
+    def _matching_moieties(self, fragment: Fragment, moieties: Iterable[str]) -> Set[str]:
+        return {moiety for moiety in moieties if self.matchers[moiety](fragment)}
+
+    def _check_tags(self, fragment: Fragment, tags: AbstractSet[str]) -> None:
+        assert len(tags) <= 1, 'No dihedral ({0}) should be matched by more than one rule: {1}'.format(fragment, sorted(tags))
+
+    def _set_tags(self, fragment: Fragment, tags: FrozenSet[str]) -> None:
+        self._check_tags(fragment, tags)
+        self.tags_for_fragment[fragment] = tags
+        for moiety in tags:
+            self.fragments_for_tag[moiety].add(fragment)
+
+    def tags_for_dihedral(self, fragment: Fragment) -> FrozenSet[str]:
+        try:
+            return self.tags_for_fragment[fragment]
+        except KeyError:
+            tags = frozenset(self._matching_moieties(fragment, self.patterns)) or NO_TAGS
+            self._set_tags(fragment, tags)
+            return tags
+
+    def tags_for_fragments(self, fragments: Iterable[Fragment]) -> Set[str]:
+        tags = set() # type: Set[str]
+        for fragment in fragments:
+            tags.update(self.tags_for_dihedral(fragment))
+        return tags
+
+    def tags_for_molecule(self, molecule: Any) -> Set[str]:
+        return self.tags_for_fragments(self.get_dihedrals(molecule))
+
+    def tags_for_molecules(self, molecules: Iterable[Any]) -> List[Set[str]]:
+        '''Tag a batch of molecules. Fragments are deduplicated across the batch, so that each new fragment is matched exactly once.'''
+        fragment_lists = [list(self.get_dihedrals(molecule)) for molecule in molecules]
+        for fragment in {fragment for fragments in fragment_lists for fragment in fragments}:
+            self.tags_for_dihedral(fragment)
+        return [self.tags_for_fragments(fragments) for fragments in fragment_lists]
+
+    def update_groups(self, chemical_groups: Sequence[Chemical_Group]) -> Set[Fragment]:
+        '''
+        Replace the chemical groups, re-evaluating (over every fragment seen so far) only the moieties whose pattern was added, removed or modified.
+        Returns the fragments whose tags changed.
+        If the new groups overlap (some fragment would get several tags), raises without changing the service.
+        '''
+        new_patterns = {moiety: pattern for (moiety, pattern) in chemical_groups if pattern}
+        removed_or_modified = {moiety for (moiety, pattern) in self.patterns.items() if new_patterns.get(moiety) != pattern}
+        added_or_modified = {moiety for (moiety, pattern) in new_patterns.items() if self.patterns.get(moiety) != pattern}
+
+        new_matchers = {moiety: re_pattern_matching_for(new_patterns[moiety], metadata=moiety) for moiety in added_or_modified}
+
+        new_tags_for_fragment = {} # type: Dict[Fragment, FrozenSet[str]]
+        for moiety in removed_or_modified:
+            for fragment in self.fragments_for_tag.get(moiety, ()):
+                new_tags_for_fragment[fragment] = new_tags_for_fragment.get(fragment, self.tags_for_fragment[fragment]) - {moiety}
+        for moiety in added_or_modified:
+            for fragment in self.tags_for_fragment:
+                if new_matchers[moiety](fragment):
+                    new_tags_for_fragment[fragment] = new_tags_for_fragment.get(fragment, self.tags_for_fragment[fragment]) | {moiety}
+
+        # Every new tag set is checked before anything is changed, so that overlapping groups leave the service as it was
+        for (fragment, tags) in new_tags_for_fragment.items():
+            self._check_tags(fragment, tags)
+
+        for moiety in removed_or_modified:
+            del self.matchers[moiety]
+            self.fragments_for_tag.pop(moiety, None)
+        self.matchers.update(new_matchers)
+        self._set_groups(chemical_groups)
+
+        changed_fragments = set()
+        for (fragment, tags) in new_tags_for_fragment.items():
+            if tags != self.tags_for_fragment[fragment]:
+                changed_fragments.add(fragment)
+            self._set_tags(fragment, frozenset(tags) or NO_TAGS)
+
+        if TAGGING_TRACER.info:
+            TAGGING_TRACER.emit(
+                'update_groups',
+                removed_or_modified=sorted(removed_or_modified),
+                added_or_modified=sorted(added_or_modified),
+                n_fragments=len(self.tags_for_fragment),
+                n_changed_fragments=len(changed_fragments),
+            )
+        return changed_fragments
@@ -1,15 +1,68 @@
+from argparse import ArgumentParser
 from contextlib import redirect_stdout
+from sys import stdin
+from typing import Any, Optional
 
 from dihedral_fragments.molecule_for_fragment import molid_after_capping_fragment
+from dihedral_fragments.instrumentation import add_sink, print_summary, Histogram_Sink
+from dihedral_fragments.batch_runner import Journal, Retry_Policy, DEFAULT_RETRY_POLICY, DEFAULT_STALE_AFTER, RUNNING, read_fragment_list, run_batch_with_workers, format_progress
 
 missing_fragments = {'O,C,H|C|C|O,H,H', 'C|O|C|C,H,H', 'H|S|C|C,H,H', 'P|O|C|C,H,H', 'H,H|N|C|N,C', 'O,C,H|C|C|N,C,H', 'H,H|N|C|O,N', 'H|O|C|C,C,H', 'O,N,H|C|C|C,H,H', 'C,H,H|C|C|C,H', 'H|O|C|C,C', 'H|O|C|O,C', 'O,H,H|C|C|N,C,H', 'C,C|N|C|O,C,H', 'C,H,H|C|C|C,H,H', 'H|N|C|N,N', 'H,H,H|N|C|C,H,H', 'S,H,H|C|C|N,C,H', 'H,H|N|C|N,N', 'C,C,H|C|C|C,H,H', 'C,H|N|C|C,H,H', 'O,C,H|C|C|C,C,H', 'H,H|N|C|O,C', 'O,O,O|P|O|C', 'C|N|C|C,H,H', 'H,H|N|C|C,H,H', 'N,H,H|C|C|C,H,H', 'H|O|C|C,H,H', 'S,H,H|C|C|C,H,H', 'C,H|N|C|N,N', 'C|O|C|C,C,H', 'O,C,H|C|C|O,C,H', 'C|S|C|C,H,H', 'C,H|C|C|C,H', 'C,H,H|C|C|O,N', 'H|O|C|C', 'C,H,H|C|C|N,C', 'C|O|C|N,C,H', 'N,C,H|C|C|C,C,H', 'O,C,H|C|C|C,H,H', 'O,H,H|C|C|N,H,H', 'N,C,H|C|C|C,H,H', 'C,H,H|C|C|O,O', 'O,C,H|C|C|N,H,H', 'C,C,C|N|C|C,H,H', 'C|O|C|O,C', 'O,N,H|C|C|O,C,H', 'C,H,H|C|C|C,C'}
 
+DEFAULT_JOURNAL = 'cap_all.sqlite'
+
+def parse_args() -> Any:
+    parser = ArgumentParser()
+    parser.add_argument('--fragments', type=str, default=None, help='File with one fragment per line ("-" for stdin). Defaults to the built-in missing_fragments.')
+    parser.add_argument('--journal', type=str, default=DEFAULT_JOURNAL, help='SQLite journal recording the status and result of every fragment')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes sharing the journal')
+    parser.add_argument('--max-attempts', type=int, default=DEFAULT_RETRY_POLICY.max_attempts, help='Maximum number of attempts for failed (or still running in the ATB) fragments')
+    parser.add_argument('--retry-delay', type=float, default=DEFAULT_RETRY_POLICY.retry_delay, help='Seconds before retrying a failed fragment (doubled after every further attempt)')
+    parser.add_argument('--stale-after', type=float, default=DEFAULT_STALE_AFTER, help='Seconds after which a running fragment is considered abandoned and claimed again')
+    parser.add_argument('--requeue-running', action='store_true', help='Requeue fragments left running by a previous (crashed) run')
+    parser.add_argument('--report', action='store_true', help='Only report the progress recorded in the journal')
+    return parser.parse_args()
+
+def quiet_molid_after_capping_fragment(fragment: str) -> Optional[int]:
+    with redirect_stdout(None):
+        return molid_after_capping_fragment(fragment, quick_run=False)
+
 if __name__ == '__main__':
-    for fragment in missing_fragments:
+    args = parse_args()
+
+    with Journal(args.journal) as journal:
+        if not args.report:
+            if args.fragments is None:
+                journal.add_fragments(sorted(missing_fragments))
+            elif args.fragments == '-':
+                journal.add_fragments(read_fragment_list(stdin))
+            else:
+                with open(args.fragments) as fh:
+                    journal.add_fragments(read_fragment_list(fh))
+
+            if args.requeue_running:
+                journal.requeue((RUNNING,))
+
+        print(format_progress(journal.progress()))
+
+    if not args.report:
+        add_sink(Histogram_Sink())
         try:
-            with redirect_stdout(None):
-                molids = molid_after_capping_fragment(fragment, quick_run=False)
-            print(fragment, molids)
-        except:
-            print(fragment)
-            raise
+            progress = run_batch_with_workers(
+                args.journal,
+                quiet_molid_after_capping_fragment,
+                workers=args.workers,
+                retry_policy=Retry_Policy(max_attempts=args.max_attempts, retry_statuses=DEFAULT_RETRY_POLICY.retry_statuses, retry_delay=args.retry_delay),
+                stale_after=args.stale_after,
+                progress_every=1,
+            )
+        finally:
+            print_summary()
+
+        print(format_progress(progress))
+
+        with Journal(args.journal) as journal:
+            for (fragment, molid) in journal.results():
+                print(fragment, molid)
+            for (fragment, status, error) in journal.errors():
+                print(fragment, status, error.splitlines()[-1] if error else '')
@@ -1,4 +1,4 @@
-from dihedral_fragments.dihedral_fragment import Dihedral_Fragment
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment, Fragment_Keys, canonical_keys, canonical_keys_for_fragments, element_valence_for_atom
 from dihedral_fragments.pattern_matching import sql_pattern_matching_for, re_pattern_matching_for
 
 TEST_ANGLES = [
@@ -145,7 +145,35 @@ def test_chiral_str() -> None:
     print(dihedral_1.__str__())
     print(dihedral_1.__str__(flag_chiral_sides=True))
 
+def test_element_valence_for_atom() -> None:
+    for (atom_desc, expected) in [('C', ('C', None)), ('c4', ('C', 4)), ('CL2', ('CL', 2)), ('Cl', ('CL', None)), ('J{3}', ('J{3}', None))]:
+        answer = element_valence_for_atom(atom_desc)
+        assert answer == expected, '{0}: {1} (answer) != {2} (expected)'.format(atom_desc, answer, expected)
+
+def test_canonical_keys() -> None:
+    test_cases = (
+        ('CL,C,H|C|C|H,H,H', Fragment_Keys('CL,C,H|C|C|H,H,H', 'CL,C,H|C|C|H,H,H', 'CL,C,H|C*|C|H,H,H')),
+        ('H1,CL1,C4|C*|C|F1,H1,H1', Fragment_Keys('CL1,C4,H1|C|C|F1,H1,H1', 'CL,C,H|C|C|F,H,H', 'CL1,C4,H1|C*|C|F1,H1,H1')),
+        # Without valences, the other side of the fragment comes first
+        ('O1,O1|C|C|O2,C3', Fragment_Keys('O2,C3|C|C|O1,O1', 'O,O|C|C|O,C', 'O2,C3|C|C|O1,O1')),
+        ('C4,C4|C|C|C4,C4|000,101', Fragment_Keys('C4,C4|C|C|C4,C4|000,101', 'C,C|C|C|C,C|000,101', 'C4,C4|C|C|C4,C4|000,101')),
+    )
+    for (fragment, expected) in test_cases:
+        answer = canonical_keys(fragment)
+        assert answer == expected, '{0}: {1} (answer) != {2} (expected)'.format(fragment, answer, expected)
+        assert answer.valence_free == canonical_keys(answer.valence_free).canonical, answer
+
+    fragments = [fragment for (fragment, _) in test_cases] * 2
+    assert canonical_keys_for_fragments(fragments) == [expected for (_, expected) in test_cases] * 2
+
+    dihedral_angles = ([0, 120, -120], [0, -120, 120])
+    answer = canonical_keys(atom_list=(['C4', 'O2', 'H1'], 'C', 'C', ['O1', 'C4', 'H1']), dihedral_angles=dihedral_angles)
+    assert answer.canonical == str(Dihedral_Fragment(atom_list=(['C4', 'O2', 'H1'], 'C', 'C', ['O1', 'C4', 'H1']), dihedral_angles=dihedral_angles)), answer
+    assert answer.valence_free == str(Dihedral_Fragment(atom_list=(['C', 'O', 'H'], 'C', 'C', ['O', 'C', 'H']), dihedral_angles=dihedral_angles)), answer
+
 if __name__ == "__main__" :
+    test_element_valence_for_atom()
+    test_canonical_keys()
     test_atom_list_init()
     test_patterns()
     test_CYP()
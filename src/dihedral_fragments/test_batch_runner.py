@@ -0,0 +1,165 @@
+from io import StringIO
+from os.path import join
+from tempfile import TemporaryDirectory
+from threading import Thread
+
+from dihedral_fragments.batch_runner import Journal, run_batch, run_batch_with_workers, read_fragment_list, Retry_Policy, DONE, FAILED, MOLECULE_RUNNING, PENDING, RUNNING
+from dihedral_fragments.exceptions import ATB_Molecule_Running
+from dihedral_fragments.instrumentation import add_sink, remove_sink, span, Histogram_Sink
+
+FRAGMENTS = ['C,H,H|C|C|H,H,H', 'H|O|C|C,H,H', 'O,O,O|P|O|C', 'C|S|C|C,H,H']
+
+def test_read_fragment_list() -> None:
+    fh = StringIO('# comment\nC,H,H|C|C|H,H,H 12\n\nH|O|C|C,H,H\n')
+    assert read_fragment_list(fh) == ['C,H,H|C|C|H,H,H', 'H|O|C|C,H,H'], read_fragment_list(fh)
+
+def test_resume_and_retry() -> None:
+    calls = []
+
+    def flaky_function(fragment):
+        calls.append(fragment)
+        if fragment == 'H|O|C|C,H,H':
+            raise ATB_Molecule_Running(1)
+        elif fragment == 'O,O,O|P|O|C' and calls.count(fragment) == 1:
+            raise ValueError(fragment)
+        return len(fragment)
+
+    with TemporaryDirectory() as directory:
+        path = join(directory, 'journal.sqlite')
+        with Journal(path) as journal:
+            assert journal.add_fragments(FRAGMENTS) == len(FRAGMENTS)
+            successes = []
+            progress = run_batch(journal, flaky_function, retry_policy=Retry_Policy(max_attempts=1, retry_statuses=(FAILED, MOLECULE_RUNNING), retry_delay=0.0), progress_stream=None, on_success=lambda fragment, result: successes.append((fragment, result)))
+            assert progress.counts[DONE] == 2 and progress.counts[FAILED] == 1 and progress.counts[MOLECULE_RUNNING] == 1, progress
+            assert calls == FRAGMENTS, calls
+            assert successes == journal.results() == [(FRAGMENTS[0], len(FRAGMENTS[0])), (FRAGMENTS[3], len(FRAGMENTS[3]))], successes
+
+        # Resuming from the journal only retries what failed, and adding known fragments is a no-op
+        with Journal(path) as journal:
+            assert journal.add_fragments(FRAGMENTS) == 0
+            progress = run_batch(journal, flaky_function, retry_policy=Retry_Policy(max_attempts=2, retry_statuses=(FAILED,), retry_delay=0.0), progress_stream=None)
+            assert calls == FRAGMENTS + ['O,O,O|P|O|C'], calls
+            assert journal.status('O,O,O|P|O|C') == DONE and journal.status('H|O|C|C,H,H') == MOLECULE_RUNNING
+            assert [fragment for (fragment, _) in journal.results()] == [FRAGMENTS[0], FRAGMENTS[2], FRAGMENTS[3]], journal.results()
+            assert progress.completed == progress.total == len(FRAGMENTS), progress
+
+def test_retry_delay() -> None:
+    def running_function(fragment):
+        raise ATB_Molecule_Running(fragment)
+
+    retry_policy = Retry_Policy(max_attempts=3, retry_statuses=(MOLECULE_RUNNING,), retry_delay=60.0)
+    with TemporaryDirectory() as directory:
+        with Journal(join(directory, 'journal.sqlite')) as journal:
+            journal.add_fragments(FRAGMENTS[:1])
+            # A molecule still running is not retried straight away
+            progress = run_batch(journal, running_function, retry_policy=retry_policy, progress_stream=None)
+            assert progress.counts[MOLECULE_RUNNING] == 1 and journal.claim('worker', retry_policy=retry_policy) is None, progress
+
+            journal.connection.execute('UPDATE fragments SET finished_at = finished_at - 61')
+            assert journal.claim('worker', retry_policy=retry_policy) == FRAGMENTS[0]
+            journal.record_failure(FRAGMENTS[0], MOLECULE_RUNNING, 'Still running')
+            # The delay doubles after every attempt
+            journal.connection.execute('UPDATE fragments SET finished_at = finished_at - 61')
+            assert journal.claim('worker', retry_policy=retry_policy) is None
+            journal.connection.execute('UPDATE fragments SET finished_at = finished_at - 60')
+            assert journal.claim('worker', retry_policy=retry_policy) == FRAGMENTS[0]
+
+def test_stale_fragments_run_out_of_attempts() -> None:
+    retry_policy = Retry_Policy(max_attempts=2, retry_statuses=(FAILED,), retry_delay=0.0)
+    with TemporaryDirectory() as directory:
+        with Journal(join(directory, 'journal.sqlite')) as journal:
+            journal.add_fragments(FRAGMENTS[:1])
+            # A worker which crashes (e.g. segfault or OOM) leaves its fragment running, which is reclaimed once stale ...
+            assert journal.claim('crashed', retry_policy=retry_policy) == FRAGMENTS[0]
+            journal.connection.execute('UPDATE fragments SET started_at = started_at - 10')
+            assert journal.claim('worker', retry_policy=retry_policy, stale_after=5.0) == FRAGMENTS[0]
+            # ... but not past `max_attempts`, after which it has failed
+            journal.connection.execute('UPDATE fragments SET started_at = started_at - 10')
+            assert journal.claim('worker', retry_policy=retry_policy, stale_after=5.0) is None
+            assert journal.status(FRAGMENTS[0]) == FAILED and journal.errors() == [(FRAGMENTS[0], FAILED, 'Worker stopped responding after 2 attempt(s)')], journal.errors()
+            assert journal.claim('worker', retry_policy=retry_policy, stale_after=5.0) is None
+
+def test_progress_of_resumed_runs() -> None:
+    with TemporaryDirectory() as directory:
+        with Journal(join(directory, 'journal.sqlite')) as journal:
+            journal.add_fragments(FRAGMENTS)
+            run_batch(journal, len, progress_stream=None)
+            # A previous run, a day ago
+            journal.connection.execute('UPDATE fragments SET started_at = started_at - 86400, finished_at = finished_at - 86400')
+            journal.add_fragments(['C{0}|C|C|H'.format(n) for n in range(3)])
+
+            progress = run_batch(journal, len, progress_stream=None)
+            assert progress.completed == progress.total == len(FRAGMENTS) + 3, progress
+            # Only this run's time and successes
+            assert progress.elapsed < 60.0 and progress.throughput * progress.elapsed <= 3.0 + 1e-6, progress
+            assert journal.progress().elapsed >= 86400.0, journal.progress()
+
+def timed_length(fragment: str) -> int:
+    with span('timed_length'):
+        return len(fragment)
+
+def test_timings_of_worker_processes() -> None:
+    histogram_sink = add_sink(Histogram_Sink())
+    try:
+        with TemporaryDirectory() as directory:
+            path = join(directory, 'journal.sqlite')
+            with Journal(path) as journal:
+                journal.add_fragments(FRAGMENTS)
+            progress = run_batch_with_workers(path, timed_length, workers=2, progress_every=0)
+            assert progress.counts[DONE] == len(FRAGMENTS), progress
+        # Spans run in the worker processes are merged into the caller's sinks
+        assert len(histogram_sink.durations['timed_length']) == len(FRAGMENTS) and histogram_sink.outcomes['timed_length'] == {'ok': len(FRAGMENTS)}, histogram_sink.durations
+    finally:
+        remove_sink(histogram_sink)
+
+def test_interrupted_fragment_is_released() -> None:
+    def interrupted_function(fragment):
+        raise KeyboardInterrupt()
+
+    with TemporaryDirectory() as directory:
+        with Journal(join(directory, 'journal.sqlite')) as journal:
+            journal.add_fragments(FRAGMENTS)
+            try:
+                run_batch(journal, interrupted_function, progress_stream=None)
+                raise Exception('This should have been interrupted.')
+            except KeyboardInterrupt:
+                pass
+            assert journal.status(FRAGMENTS[0]) == PENDING
+
+def test_concurrent_workers_never_share_fragments() -> None:
+    fragments = ['C{0}|C|C|H'.format(n) for n in range(200)]
+    seen = []
+
+    def record(fragment):
+        seen.append(fragment)
+
+    with TemporaryDirectory() as directory:
+        path = join(directory, 'journal.sqlite')
+        with Journal(path) as journal:
+            journal.add_fragments(fragments)
+
+        def worker(n):
+            with Journal(path) as journal:
+                run_batch(journal, record, worker='worker-{0}'.format(n), progress_stream=None)
+
+        threads = [Thread(target=worker, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with Journal(path) as journal:
+            assert journal.progress().counts[DONE] == len(fragments), journal.progress()
+            assert journal.progress().counts[RUNNING] == 0
+
+    assert sorted(seen) == sorted(fragments), (len(seen), len(fragments))
+
+if __name__ == '__main__':
+    test_read_fragment_list()
+    test_resume_and_retry()
+    test_retry_delay()
+    test_stale_fragments_run_out_of_attempts()
+    test_progress_of_resumed_runs()
+    test_timings_of_worker_processes()
+    test_interrupted_fragment_is_released()
+    test_concurrent_workers_never_share_fragments()
@@ -0,0 +1,81 @@
+from os.path import join
+from tempfile import TemporaryDirectory
+
+from dihedral_fragments.benchmarks import random_fragments, polycyclic_atom_lists
+from dihedral_fragments.binary_format import encode_fragments, decode_records, write_fragment_file, Fragment_File, Record_Layout, Invalid_Fragment_File
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment
+
+FRAGMENTS = [
+    'C,H,H|C|C|H,H,H',
+    'CL,CL,CL|C4|C4|H,H,H',
+    'O1,O1,O1|P4|O2|C4',
+    'N,C,H|C*|N*|H,H',
+    'C,C,H|C|C|C,C,H|030,1.12.1',
+]
+
+def test_round_trip() -> None:
+    canonical_fragments = FRAGMENTS + [str(Dihedral_Fragment(fragment)) for fragment in random_fragments(500)] + [
+        str(Dihedral_Fragment(atom_list=atom_list))
+        for atom_list in polycyclic_atom_lists(100)
+    ]
+    decoded_fragments = decode_records(encode_fragments(canonical_fragments))
+    for (answer, expected) in zip(decoded_fragments, canonical_fragments):
+        assert answer == expected, '"{0}" (answer) != "{1}" (expected)'.format(answer, expected)
+
+def test_layout() -> None:
+    records = encode_fragments(FRAGMENTS)
+    assert records.dtype['left_elements'].shape == (3,) and records.dtype['cycles'].shape == (2, 3), records.dtype
+
+    try:
+        encode_fragments(FRAGMENTS, layout=Record_Layout(max_neighbours=3, max_cycles=1))
+        raise Exception('This should have failed.')
+    except Exception as e:
+        assert 'does not fit' in str(e), e
+
+    # Neighbours and cycles which none of the decoded records have are skipped
+    assert decode_records(records[[0, 3]]) == [FRAGMENTS[0], FRAGMENTS[3]], decode_records(records[[0, 3]])
+
+    records['left_elements'][0, 0] = 200
+    try:
+        decode_records(records)
+        raise Exception('This should have failed.')
+    except Invalid_Fragment_File as e:
+        assert '200' in str(e), e
+
+def test_fragment_file() -> None:
+    with TemporaryDirectory() as directory:
+        path = join(directory, 'fragments.bin')
+        write_fragment_file(path, FRAGMENTS, counts=[10, 20, 30, 40, 50])
+
+        fragment_file = Fragment_File(path)
+        assert len(fragment_file) == len(FRAGMENTS)
+        assert fragment_file.fragments_with_count() == list(zip(FRAGMENTS, [10, 20, 30, 40, 50])), fragment_file.fragments_with_count()
+        assert fragment_file.fragment(3) == FRAGMENTS[3], fragment_file.fragment(3)
+        assert list(fragment_file.iter_fragments_with_count(chunk_size=2)) == fragment_file.fragments_with_count()
+        # Only the selected records are decoded
+        assert fragment_file.acyclic_positions().tolist() == [0, 1, 2, 3], fragment_file.acyclic_positions()
+        assert fragment_file.fragments_with_count_at(fragment_file.acyclic_positions()) == list(zip(FRAGMENTS[:4], [10, 20, 30, 40])), fragment_file.fragments_with_count_at(fragment_file.acyclic_positions())
+
+        for (position, fragment) in enumerate(FRAGMENTS):
+            assert fragment_file.position(fragment) == position, (fragment, fragment_file.position(fragment))
+        assert fragment_file.count_for('O1,O1,O1|P4|O2|C4') == 30
+        assert fragment_file.position('H|C|C|H') is None
+        assert fragment_file.position('C,C,C,C,C,C,C|C|C|H') is None
+
+        empty_path = join(directory, 'empty.bin')
+        write_fragment_file(empty_path, [])
+        assert len(Fragment_File(empty_path)) == 0 and Fragment_File(empty_path).position('H|C|C|H') is None
+
+        not_a_fragment_file = join(directory, 'not_a_fragment_file.bin')
+        with open(not_a_fragment_file, 'wb') as fh:
+            fh.write(b'\x80\x03]q\x00.' * 10)
+        try:
+            Fragment_File(not_a_fragment_file)
+            raise Exception('This should have failed.')
+        except Invalid_Fragment_File:
+            pass
+
+if __name__ == '__main__':
+    test_round_trip()
+    test_layout()
+    test_fragment_file()
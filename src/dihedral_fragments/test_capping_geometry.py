@@ -0,0 +1,42 @@
+from math import cos, sin, pi, sqrt
+
+from dihedral_fragments.capping import coordinate_template, uncapped_atoms_and_bonds, BOND_LENGTH
+
+def test_coordinate_template() -> None:
+    d = BOND_LENGTH
+    e, f = 0.5 * d, sqrt(d ** 2 - (0.5 * d) ** 2)
+    template = coordinate_template(3, 2)
+    assert len(template) == 3 + 2 + 2, template
+    assert template[3] == (-d / 2, 0, 0) and template[4] == (d / 2, 0, 0), template
+    assert template[1] == (-d / 2 - e, -f * cos(2 * pi / 3), f * sin(2 * pi / 3)), template
+    assert template[6] == (d / 2 + e, f * cos(pi), f * sin(pi)), template
+    assert coordinate_template(3, 2) is template
+
+def test_acyclic_atoms_and_bonds() -> None:
+    atoms, bonds, chains = uncapped_atoms_and_bonds('C4,H|C|N|H,H')
+    assert [(atom.index, atom.element, atom.valence, atom.capped) for atom in atoms] == [
+        (1, 'C', 4, False),
+        (2, 'H', None, False),
+        (3, 'C', 3, True),
+        (4, 'N', 3, True),
+        (5, 'H', None, False),
+        (6, 'H', None, False),
+    ], atoms
+    assert bonds == [(1, 3), (2, 3), (3, 4), (4, 5), (4, 6)], bonds
+    assert chains == [], chains
+
+def test_cyclic_atoms_and_bonds() -> None:
+    # Three-membered ring: the first neighbours on each side are the same atom
+    atoms, bonds, chains = uncapped_atoms_and_bonds('C,H,H|C|C|C,H,H|000')
+    assert [atom.index for atom in atoms] == [1, 2, 3, 4, 5, 7, 8], atoms
+    assert bonds == [(1, 4), (2, 4), (3, 4), (4, 5), (5, 1), (5, 7), (5, 8)], bonds
+    assert chains == [], chains
+
+    atoms, bonds, chains = uncapped_atoms_and_bonds('C,H,H|C|C|C,H,H|020,121')
+    assert len(atoms) == 8, atoms
+    assert chains == [(1, 2, 6), (2, 2, 7)], chains
+
+if __name__ == '__main__':
+    test_coordinate_template()
+    test_acyclic_atoms_and_bonds()
+    test_cyclic_atoms_and_bonds()
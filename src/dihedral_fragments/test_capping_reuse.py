@@ -0,0 +1,94 @@
+from dihedral_fragments.benchmarks.capping_reuse import Stand_In_Molecule, stand_in_solve, stand_in_solve_capped
+from dihedral_fragments.capping_reuse import Capping_Solution_Cache, caps_for_neighbours, capped_atoms_and_bonds, halves_of, EXACT, HALVES, FULL, FALLBACK, MISMATCH
+
+def test_halves() -> None:
+    ((left_key, left_ids), (right_key, right_ids)) = halves_of('N,H,C|C|C|O,H,H')
+    assert (left_key, left_ids) == (('C', 'C', 3, ('C', 'H', 'N')), [3, 2, 1]), (left_key, left_ids)
+    assert (right_key, right_ids) == (('C', 'C', 3, ('H', 'H', 'O')), [7, 8, 6]), (right_key, right_ids)
+
+    # Stereoisomers share both halves, and reversed fragments swap them
+    assert [key for (key, _) in halves_of('C,H,N|C|C|H,H,O')] == [left_key, right_key]
+    assert [key for (key, _) in halves_of('O,H,H|C|C|C,H,N')] == [right_key, left_key]
+    # Halves depend on the central atom they are bonded to, and on its number of neighbours (which bounds the order of the central bond)
+    assert halves_of('N,H,C|C|N|O,H,H')[0][0] != left_key
+    assert halves_of('N,H,C|C|C|O')[0][0] != left_key
+
+    assert halves_of('C,H|C|C|C,H|000') is None
+
+def test_caps_round_trip() -> None:
+    caps = {
+        1: (('C', -1), ('H', -1), ('H', 0), ('H', 0), ('H', 0)),
+        3: (('H', -1), ('H', -1)),
+        8: (('H', -1),),
+    }
+    atoms, bonds = capped_atoms_and_bonds('C,H,N|C|C|H,H,O', caps)
+    assert all(atom.capped for atom in atoms), atoms
+    assert [atom.valence for atom in atoms if atom.index in (1, 3, 4, 8)] == [3, 3, 4, 2], atoms
+
+    atoms_by_id = {atom.index: atom for atom in atoms}
+    assert caps_for_neighbours(atoms_by_id, bonds, 8, [1, 2, 3, 6, 7, 8]) == [caps[1], (), caps[3], (), (), caps[8]]
+    # Atoms added to a central atom are not part of any cap
+    assert caps_for_neighbours(atoms_by_id, bonds + [(4, 9)], 8, [1, 2, 3, 6, 7, 8]) is None
+    assert caps_for_neighbours(atoms_by_id, bonds, 8, [2, 3, 6, 7, 8]) is None
+
+    # Caps must agree with the valences given in the fragment
+    assert capped_atoms_and_bonds('C4,H|C|C|H,H', {1: (('H', -1),) * 3}) is not None
+    assert capped_atoms_and_bonds('C4,H|C|C|H,H', {1: (('H', -1),) * 2}) is None
+
+def test_reuse() -> None:
+    calls = []
+
+    def solve(fragment, debug=False):
+        calls.append(fragment)
+        return stand_in_solve(fragment)
+
+    capping_solution_cache = Capping_Solution_Cache(solve=solve, solve_capped=stand_in_solve_capped)
+    fragments_and_outcomes = [
+        ('C,H,H|C|C|O,H,H', FULL),
+        ('H,C,H|C|C|H,O,H', EXACT),
+        ('H,H,O|C|C|H,H,C', EXACT),
+        ('N,H,H|C|C|H,H,H', FULL),
+        # Left half from the first fragment, right half from the previous one
+        ('C,H,H|C|C|H,H,H', HALVES),
+        ('C,H|C|C|C,H|000', FULL),
+    ]
+    for (fragment, outcome) in fragments_and_outcomes:
+        n_outcome = capping_solution_cache.counts[outcome]
+        molecule = capping_solution_cache.best_capped_molecule(fragment)
+        assert capping_solution_cache.counts[outcome] == n_outcome + 1, (fragment, capping_solution_cache.counts)
+        assert molecule.formula() == stand_in_solve(fragment).formula(), (fragment, molecule.formula())
+    assert calls == [fragment for (fragment, outcome) in fragments_and_outcomes if outcome == FULL], calls
+
+def test_central_bond_order() -> None:
+    capping_solution_cache = Capping_Solution_Cache(solve=stand_in_solve, solve_capped=stand_in_solve_capped)
+    for fragment in ('C,H|C|C|H,H,H', 'H,H|C|C|H'):
+        capping_solution_cache.best_capped_molecule(fragment)
+    # The left half of `C,H|C|C|H,H,H` (with a single central bond) does not fit a multiple central bond: both halves are not cached
+    capping_solution_cache.best_capped_molecule('C,H|C|C|H')
+    assert capping_solution_cache.counts[FULL] == 3 and capping_solution_cache.counts[HALVES] == 0, capping_solution_cache.counts
+
+def test_fallback_and_verification() -> None:
+    def failing_solve_capped(fragment, atoms, bonds, debug=False):
+        raise ValueError('Infeasible')
+
+    capping_solution_cache = Capping_Solution_Cache(solve=stand_in_solve, solve_capped=failing_solve_capped)
+    capping_solution_cache.best_capped_molecule('C,H,H|C|C|H,H,H')
+    molecule = capping_solution_cache.best_capped_molecule('H,C,H|C|C|H,H,H')
+    assert capping_solution_cache.counts[FALLBACK] == 1 and molecule.formula() == 'C3H8', (capping_solution_cache.counts, molecule.formula())
+
+    def wrong_solve_capped(fragment, atoms, bonds, debug=False):
+        return Stand_In_Molecule(atoms[:-1], bonds[:-1])
+
+    for (solve_capped, outcome) in ((stand_in_solve_capped, EXACT), (wrong_solve_capped, MISMATCH)):
+        capping_solution_cache = Capping_Solution_Cache(verify=True, solve=stand_in_solve, solve_capped=solve_capped)
+        capping_solution_cache.best_capped_molecule('C,H,H|C|C|H,H,H')
+        molecule = capping_solution_cache.best_capped_molecule('H,C,H|C|C|H,H,H')
+        # Rejected compositions are replaced by the full solve
+        assert capping_solution_cache.counts[outcome] == 1 and molecule.formula() == 'C3H8', (capping_solution_cache.counts, molecule.formula())
+
+if __name__ == '__main__':
+    test_halves()
+    test_caps_round_trip()
+    test_reuse()
+    test_central_bond_order()
+    test_fallback_and_verification()
@@ -0,0 +1,52 @@
+from dihedral_fragments.benchmarks import polycyclic_atom_lists, random_fragments
+from dihedral_fragments.benchmarks.cycles import Legacy_Cycles_Dihedral_Fragment
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment, Cycle, cycle_for_str, str_for_cycle, split_fragment_str
+
+def test_polycyclic_equivalence_with_legacy_implementation() -> None:
+    for max_neighbours in (3, 5):
+        for atom_list in polycyclic_atom_lists(500, seed=max_neighbours, max_neighbours=max_neighbours):
+            answer, expected = str(Dihedral_Fragment(atom_list=atom_list)), str(Legacy_Cycles_Dihedral_Fragment(atom_list=atom_list))
+            assert answer == expected, '{0}: "{1}" (answer) != "{2}" (expected)'.format(atom_list, answer, expected)
+
+def test_monocyclic_equivalence_with_legacy_implementation() -> None:
+    for fragment in random_fragments(1000, cycle_probability=1.0):
+        answer, expected = str(Dihedral_Fragment(fragment)), str(Legacy_Cycles_Dihedral_Fragment(fragment))
+        assert answer == expected, '{0}: "{1}" (answer) != "{2}" (expected)'.format(fragment, answer, expected)
+
+def test_stereo_equivalence_with_legacy_implementation() -> None:
+    atom_list = (['C', 'N', 'C'], 'C', 'C', ['C', 'C', 'O'], [[0, 3, 0], [2, 3, 1], [1, 2, 2]])
+    for dihedral_angles in (([0, 120, -120], [0, 120, -120]), ([0, -120, 120], [60, 180, -60])):
+        answer = str(Dihedral_Fragment(atom_list=atom_list, dihedral_angles=dihedral_angles))
+        expected = str(Legacy_Cycles_Dihedral_Fragment(atom_list=atom_list, dihedral_angles=dihedral_angles))
+        assert answer == expected, '"{0}" (answer) != "{1}" (expected)'.format(answer, expected)
+
+def test_extended_cycle_encoding() -> None:
+    for (cycle_str, cycle) in (('030', Cycle(0, 3, 0)), ('0.12.1', Cycle(0, 12, 1)), ('10.2.3', Cycle(10, 2, 3)), ('1.0.11', Cycle(1, 0, 11))):
+        assert cycle_for_str(cycle_str) == cycle, '{0} != {1} (expected)'.format(cycle_for_str(cycle_str), cycle)
+        assert str_for_cycle(cycle) == cycle_str, '{0} != {1} (expected)'.format(str_for_cycle(cycle), cycle_str)
+
+    # Small cycles written in the extended encoding are read back in the compact one
+    assert str_for_cycle(cycle_for_str('0.3.0')) == '030', str_for_cycle(cycle_for_str('0.3.0'))
+
+    macrocycle, answer = str(Dihedral_Fragment('C,H,H|C|C|C,H,H|0.14.0')), 'C,H,H|C|C|C,H,H|0.14.0'
+    assert macrocycle == answer, '{0} != {1} (expected)'.format(macrocycle, answer)
+
+    mixed, answer = str(Dihedral_Fragment(atom_list=(['H', 'C', 'C'], 'C', 'C', ['C', 'C', 'H'], [[2, 12, 1], [1, 3, 0]]))), 'C,C,H|C|C|C,C,H|030,1.12.1'
+    assert mixed == answer, '{0} != {1} (expected)'.format(mixed, answer)
+    assert str(Dihedral_Fragment(mixed)) == mixed, (str(Dihedral_Fragment(mixed)), mixed)
+
+    many_neighbours = 'C,C,C,C,C,C,C,C,C,C,C,C|C|C|C|11.5.0'
+    assert split_fragment_str(many_neighbours)[4] == [Cycle(11, 5, 0)], split_fragment_str(many_neighbours)
+    assert str(Dihedral_Fragment(many_neighbours)) == 'C,C,C,C,C,C,C,C,C,C,C,C|C|C|C|050', str(Dihedral_Fragment(many_neighbours))
+
+    try:
+        cycle_for_str('0100')
+        raise Exception('This should have failed.')
+    except AssertionError:
+        pass
+
+if __name__ == '__main__':
+    test_polycyclic_equivalence_with_legacy_implementation()
+    test_monocyclic_equivalence_with_legacy_implementation()
+    test_stereo_equivalence_with_legacy_implementation()
+    test_extended_cycle_encoding()
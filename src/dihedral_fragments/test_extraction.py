@@ -0,0 +1,93 @@
+from itertools import product
+from random import Random
+from typing import List
+
+from dihedral_fragments.benchmarks import random_molecular_graphs
+from dihedral_fragments.capping import uncapped_atoms_and_bonds
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment, Fragment
+from dihedral_fragments.extraction import Molecular_Graph, dihedral_fragments_for_graph, molecular_graph_for_pdb_str, pdb_str_for_molecular_graph
+
+# Each fragment is the only one of its uncapped molecule (the fragments of test_chirality.py)
+ACYCLIC_FRAGMENTS = ['S,O,N|P|O|C', 'S,N,O|P|O|C', 'O,H,C|C|C|O,H,C', 'H,H,H|C|C|H,H,H', 'CL,H|C|C|CL,H', 'C,C|N|C|O,H,C', 'C,C|N|C|O,C,H']
+
+CYCLIC_FRAGMENTS = ['C,C,H|C|C|C,H,H|030', 'C,C|C|C|C,C|000', 'C,C,H|N|C|C,C,H|010,120', 'N,C|C|C|C,H|060']
+
+def molecular_graph_for_fragment(fragment: Fragment, with_coordinates: bool = True) -> Molecular_Graph:
+    '''Uncapped molecule of a fragment (cycles closed by carbon chains), with the placeholder coordinates of capping.coordinate_template() (and arbitrary ones for the chains).'''
+    atoms, bonds, chains = uncapped_atoms_and_bonds(fragment)
+    index_for_id = {atom.index: index for (index, atom) in enumerate(atoms)}
+    elements = [atom.element for atom in atoms]
+    coordinates = [atom.coordinates for atom in atoms]
+    bonds = [(index_for_id[i], index_for_id[j]) for (i, j) in bonds]
+    for (i_id, n, j_id) in chains:
+        chain = [index_for_id[i_id]] + list(range(len(elements), len(elements) + n - 1)) + [index_for_id[j_id]]
+        elements += ['C'] * (n - 1)
+        coordinates += [(0.0, 0.0, 3.0 + len(coordinates))] * (n - 1)
+        bonds += list(zip(chain[:-1], chain[1:]))
+    return Molecular_Graph(elements, bonds, coordinates if with_coordinates else None)
+
+def test_uncapped_molecules() -> None:
+    for fragment in ACYCLIC_FRAGMENTS:
+        answer = dihedral_fragments_for_graph(molecular_graph_for_fragment(fragment))
+        assert answer == [fragment], '{0} (answer) != {1} (expected)'.format(answer, [fragment])
+
+        # Without coordinates, neighbours are only ordered by element
+        answer = dihedral_fragments_for_graph(molecular_graph_for_fragment(fragment, with_coordinates=False))
+        expected = [str(Dihedral_Fragment(fragment))]
+        assert answer == expected, '{0} (answer) != {1} (expected)'.format(answer, expected)
+
+def test_cycles() -> None:
+    for fragment in CYCLIC_FRAGMENTS:
+        answer = dihedral_fragments_for_graph(molecular_graph_for_fragment(fragment, with_coordinates=False))
+        assert fragment in answer, '{0} not in {1}'.format(fragment, answer)
+
+    # A 10-membered ring is over MAX_RING_SIZE
+    graph = molecular_graph_for_fragment('C,H|C|C|C,H|070', with_coordinates=False)
+    answer = dihedral_fragments_for_graph(graph)
+    assert 'C,H|C|C|C,H' in answer, answer
+    assert 'C,H|C|C|C,H|070' in dihedral_fragments_for_graph(graph, max_ring_size=10)
+
+def permuted_graph(graph: Molecular_Graph, permutation: List[int]) -> Molecular_Graph:
+    '''Same molecule, with atom `index` renumbered `permutation[index]`.'''
+    atom_for_index = {new_index: index for (index, new_index) in enumerate(permutation)}
+    return Molecular_Graph(
+        [graph.elements[atom_for_index[index]] for index in range(len(permutation))],
+        [(permutation[i], permutation[j]) for (i, j) in graph.bonds],
+        [graph.coordinates[atom_for_index[index]] for index in range(len(permutation))] if graph.coordinates is not None else None,
+    )
+
+def test_atom_numbering() -> None:
+    random = Random(0)
+    graphs = [molecular_graph_for_fragment(fragment) for fragment in ACYCLIC_FRAGMENTS + CYCLIC_FRAGMENTS]
+    # Molecules with (possibly symmetric) cyclic fragments, whose canonical forms depend on the direction of the central bond and on the order of identical neighbours
+    graphs += [graph for graph in random_molecular_graphs(40, ring_closure_probability=0.5) if any(fragment.count('|') == 4 for fragment in dihedral_fragments_for_graph(graph))]
+    for (graph, with_coordinates, use_valences) in product(graphs, (True, False), (False, True)):
+        graph = graph if with_coordinates else graph._replace(coordinates=None)
+        expected = sorted(dihedral_fragments_for_graph(graph, use_valences=use_valences))
+        for _ in range(3):
+            permutation = list(range(len(graph.elements)))
+            random.shuffle(permutation)
+            answer = sorted(dihedral_fragments_for_graph(permuted_graph(graph, permutation), use_valences=use_valences))
+            assert answer == expected, '{0} (answer) != {1} (expected)'.format(answer, expected)
+
+def test_valences() -> None:
+    # Ethanol
+    graph = Molecular_Graph(['C', 'C', 'O', 'H', 'H', 'H', 'H', 'H', 'H'], [(0, 1), (1, 2), (0, 3), (0, 4), (0, 5), (1, 6), (1, 7), (2, 8)], None)
+    answer = dihedral_fragments_for_graph(graph, use_valences=True)
+    expected = ['O2,H1,H1|C4|C4|H1,H1,H1', 'H1|O2|C4|C4,H1,H1']
+    assert answer == expected, '{0} (answer) != {1} (expected)'.format(answer, expected)
+
+def test_pdb_round_trip() -> None:
+    for fragment in ACYCLIC_FRAGMENTS + CYCLIC_FRAGMENTS:
+        graph = molecular_graph_for_fragment(fragment)
+        pdb_graph = molecular_graph_for_pdb_str(pdb_str_for_molecular_graph(graph))
+        assert [element.upper() for element in graph.elements] == pdb_graph.elements, (graph.elements, pdb_graph.elements)
+        assert sorted(tuple(sorted(bond)) for bond in graph.bonds) == pdb_graph.bonds, (graph.bonds, pdb_graph.bonds)
+        assert dihedral_fragments_for_graph(pdb_graph) == dihedral_fragments_for_graph(graph), fragment
+
+if __name__ == '__main__':
+    test_uncapped_molecules()
+    test_cycles()
+    test_atom_numbering()
+    test_valences()
+    test_pdb_round_trip()
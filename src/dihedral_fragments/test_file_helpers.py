@@ -0,0 +1,32 @@
+from os import chdir, getcwd, listdir
+from os.path import join
+from tempfile import TemporaryDirectory
+
+from dihedral_fragments.file_helpers import atomic_write, padding
+
+def test_padding() -> None:
+    assert [padding(n) for n in (0, 1, 7, 8, 9)] == [0, 7, 1, 0, 7]
+    assert padding(5, alignment=4) == 3
+
+def test_atomic_write() -> None:
+    with TemporaryDirectory() as directory:
+        path = join(directory, 'a', 'b', 'data.bin')
+        atomic_write(path, b'first')
+        atomic_write(path, b'second')
+        with open(path, 'rb') as fh:
+            assert fh.read() == b'second'
+        assert listdir(join(directory, 'a', 'b')) == ['data.bin'], listdir(join(directory, 'a', 'b'))
+
+        # A bare filename is written to the current directory
+        cwd = getcwd()
+        try:
+            chdir(directory)
+            atomic_write('bare.bin', b'bare')
+        finally:
+            chdir(cwd)
+        with open(join(directory, 'bare.bin'), 'rb') as fh:
+            assert fh.read() == b'bare'
+
+if __name__ == '__main__':
+    test_padding()
+    test_atomic_write()
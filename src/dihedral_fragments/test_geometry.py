@@ -0,0 +1,47 @@
+from math import cos, sin, radians
+
+import numpy as np
+
+from dihedral_fragments.benchmarks import random_molecular_graphs
+from dihedral_fragments.extraction import Fragment_Extractor
+from dihedral_fragments.geometry import dihedral_angles, central_bond_quadruples, split_angles
+
+def coordinates_for_dihedral(angle: float) -> np.ndarray:
+    '''Four atoms (0, 1, 2, 3) whose dihedral angle is `angle` degrees.'''
+    return np.array([(1.0, 0.0, -1.0), (0.0, 0.0, -0.5), (0.0, 0.0, 0.5), (cos(radians(angle)), sin(radians(angle)), 1.0)])
+
+def test_dihedral_angles() -> None:
+    expected = [0.0, 60.0, -60.0, 120.0, -179.0, 180.0]
+    for angle in expected:
+        answer = dihedral_angles(coordinates_for_dihedral(angle), [(0, 1, 2, 3)])
+        assert answer.shape == (1,), answer.shape
+        assert abs(answer[0] - angle) < 1e-9, '{0} (answer) != {1} (expected)'.format(answer[0], angle)
+
+        # Reversing the quadruple does not change the angle
+        assert abs(dihedral_angles(coordinates_for_dihedral(angle), [(3, 2, 1, 0)])[0] - angle) < 1e-9
+
+    trajectory = np.stack([coordinates_for_dihedral(angle) for angle in expected])
+    answer = dihedral_angles(trajectory, [(0, 1, 2, 3), (3, 2, 1, 0)])
+    assert answer.shape == (len(expected), 2), answer.shape
+    assert np.allclose(answer, np.array([expected, expected]).T), answer
+    assert np.all(np.abs(answer) <= 180.0), answer
+
+def test_quadruples() -> None:
+    quadruples = central_bond_quadruples(1, 2, [0, 5], [3, 4, 6])
+    assert quadruples == [(0, 1, 2, 3), (5, 1, 2, 3), (0, 1, 2, 3), (0, 1, 2, 4), (0, 1, 2, 6)], quadruples
+    answer = split_angles([1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0], [(2, 3), (1, 1)])
+    assert answer == [([1.0, 2.0], [3.0, 4.0, 5.0]), ([6.0], [7.0])], answer
+
+def test_trajectory_fragments() -> None:
+    random = np.random.RandomState(0)
+    fragment_extractor = Fragment_Extractor()
+    for graph in random_molecular_graphs(20):
+        trajectory = np.array(graph.coordinates) + random.normal(scale=0.5, size=(10, len(graph.elements), 3))
+        answer = fragment_extractor.dihedral_fragments_for_frames(graph, trajectory, frames_per_chunk=3)
+        expected = [fragment_extractor.dihedral_fragments(graph._replace(coordinates=frame.tolist())) for frame in trajectory]
+        assert answer == expected, '{0} (answer) != {1} (expected)'.format(answer, expected)
+
+if __name__ == '__main__':
+    test_dihedral_angles()
+    test_quadruples()
+    test_trajectory_fragments()
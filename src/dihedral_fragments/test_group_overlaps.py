@@ -0,0 +1,58 @@
+from dihedral_fragments.chemistry import CHEMICAL_GROUPS
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment
+from dihedral_fragments.fragment_generator import enumerated_fragments
+from dihedral_fragments.group_overlaps import Fragment_Space, Overlap_Analyser
+from dihedral_fragments.pattern_matching import re_pattern_matching_for
+
+# A smaller space than `fragment_generator`'s, small enough to be tagged by brute force
+ATOM_VALENCES = {
+    'C': (2, 3, 4),
+    'N': (2, 3, 4),
+    'O': (1, 2),
+    'H': (1,),
+    'CL': (1,),
+}
+
+FORBIDDEN_BONDS = [['N', 'O']]
+
+# Exact (and non-canonical) patterns, overlapping 'alcohol I' and 'ammonium ion'
+CHEMICAL_GROUPS_WITH_EXACT_PATTERNS = list(CHEMICAL_GROUPS) + [('ethanol', 'H|O|C|H,H,C'), ('methylammonium', 'H,H,H|N|C|H,H,H')]
+
+def test_overlaps() -> None:
+    fragments = set(enumerated_fragments(ATOM_VALENCES, FORBIDDEN_BONDS))
+    matchers = [(moiety, re_pattern_matching_for(pattern)) for (moiety, pattern) in CHEMICAL_GROUPS_WITH_EXACT_PATTERNS]
+    tags_for_fragment = {fragment: [moiety for (moiety, matcher) in matchers if matcher(fragment)] for fragment in fragments}
+
+    overlap_analyser = Overlap_Analyser(CHEMICAL_GROUPS_WITH_EXACT_PATTERNS, Fragment_Space(ATOM_VALENCES, FORBIDDEN_BONDS))
+    for (moiety, _) in CHEMICAL_GROUPS_WITH_EXACT_PATTERNS:
+        expected = {fragment for (fragment, tags) in tags_for_fragment.items() if moiety in tags}
+        answer = list(overlap_analyser.matching_fragments(moiety))
+        assert len(answer) == len(set(answer)) and set(answer) == expected, '{0}: {1} (answer) != {2} (expected)'.format(moiety, len(answer), len(expected))
+
+    expected_overlaps = {}
+    for tags in tags_for_fragment.values():
+        for (i, moiety_1) in enumerate(tags):
+            for moiety_2 in tags[i + 1:]:
+                expected_overlaps[(moiety_1, moiety_2)] = expected_overlaps.get((moiety_1, moiety_2), 0) + 1
+    overlaps = overlap_analyser.overlaps()
+    answer_overlaps = {(group_overlap.moiety_1, group_overlap.moiety_2): group_overlap.n_fragments for group_overlap in overlaps}
+    assert answer_overlaps == expected_overlaps, '{0} (answer) != {1} (expected)'.format(answer_overlaps, expected_overlaps)
+    assert ('alcohol I', 'ethanol') in answer_overlaps and ('ammonium ion', 'methylammonium') in answer_overlaps, answer_overlaps
+
+    for group_overlap in overlaps:
+        assert str(Dihedral_Fragment(group_overlap.witness)) == group_overlap.witness, group_overlap
+        assert {group_overlap.moiety_1, group_overlap.moiety_2} <= set(tags_for_fragment[group_overlap.witness]), group_overlap
+
+def test_coverage() -> None:
+    fragments = set(enumerated_fragments(ATOM_VALENCES, FORBIDDEN_BONDS))
+    matchers = [(moiety, re_pattern_matching_for(pattern)) for (moiety, pattern) in CHEMICAL_GROUPS]
+    n_tags = [sum(1 for (_, matcher) in matchers if matcher(fragment)) for fragment in fragments]
+
+    coverage = Overlap_Analyser(CHEMICAL_GROUPS, Fragment_Space(ATOM_VALENCES, FORBIDDEN_BONDS)).coverage()
+    expected = (len(fragments), sum(1 for n in n_tags if n > 0), sum(1 for n in n_tags if n > 1))
+    assert coverage[:3] == expected, '{0} (answer) != {1} (expected)'.format(coverage[:3], expected)
+    assert sum(coverage.n_fragments_for_group.values()) == sum(n_tags), coverage
+
+if __name__ == '__main__':
+    test_overlaps()
+    test_coverage()
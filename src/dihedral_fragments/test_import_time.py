@@ -0,0 +1,67 @@
+from subprocess import check_output
+from sys import executable
+from json import loads
+from os import environ, pathsep
+from os.path import dirname, abspath
+
+import dihedral_fragments
+
+HEAVY_MODULES = ('jinja2', 'atb_api', 'cairosvg', 'fragment_capping', 'numpy', 'matplotlib', 'PIL')
+
+CORE_MODULES = (
+    'dihedral_fragments.dihedral_fragment',
+    'dihedral_fragments.pattern_matching',
+    'dihedral_fragments.chemistry',
+    'dihedral_fragments.tag_predictor',
+)
+
+# Generous upper bound (in seconds) so that slow CI machines do not fail; a cold import takes a few tens of milliseconds.
+MAX_CORE_IMPORT_TIME = 1.0
+
+IMPORT_TIME_SCRIPT = '''
+from json import dumps
+from sys import modules
+from time import perf_counter
+start = perf_counter()
+{imports}
+print(dumps(dict(seconds=perf_counter() - start, modules=sorted(modules))))
+'''
+
+def import_in_fresh_interpreter(module_names):
+    output = check_output(
+        [
+            executable,
+            '-c',
+            IMPORT_TIME_SCRIPT.format(imports='\n'.join('import ' + module_name for module_name in module_names)),
+        ],
+        env=dict(
+            environ,
+            PYTHONPATH=pathsep.join([dirname(dirname(abspath(dihedral_fragments.__file__)))] + ([environ['PYTHONPATH']] if 'PYTHONPATH' in environ else [])),
+        ),
+    )
+    return loads(output.decode())
+
+def test_core_import_is_standard_library_only() -> None:
+    result = import_in_fresh_interpreter(CORE_MODULES)
+    print('Core import time: {0:.1f} ms'.format(result['seconds'] * 1000))
+    heavy_modules = [module for module in result['modules'] if module.split('.')[0] in HEAVY_MODULES]
+    assert heavy_modules == [], heavy_modules
+    assert result['seconds'] < MAX_CORE_IMPORT_TIME, result['seconds']
+
+def test_molecule_for_fragment_import_is_lazy() -> None:
+    result = import_in_fresh_interpreter(('dihedral_fragments.molecule_for_fragment',))
+    print('molecule_for_fragment import time: {0:.1f} ms'.format(result['seconds'] * 1000))
+    heavy_modules = [module for module in result['modules'] if module.split('.')[0] in HEAVY_MODULES]
+    assert heavy_modules == [], heavy_modules
+
+def test_matchers_are_compiled_on_first_use() -> None:
+    from dihedral_fragments import tag_predictor
+
+    assert 'CHEMICAL_GROUPS_MATCHING_PATTERNS' not in vars(tag_predictor)
+    assert tag_predictor.tags_for_dihedral('H,H,H|C|C|O,C') == ['ketone']
+    assert len(tag_predictor.CHEMICAL_GROUPS_MATCHING_PATTERNS) > 0
+
+if __name__ == '__main__':
+    test_core_import_is_standard_library_only()
+    test_molecule_for_fragment_import_is_lazy()
+    test_matchers_are_compiled_on_first_use()
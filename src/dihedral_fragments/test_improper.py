@@ -0,0 +1,49 @@
+from dihedral_fragments.improper import Improper, canonical_impropers, improper_pattern_matching_for
+
+def test_canonical_str() -> None:
+    for (improper_str, expected) in (('C|C,C,H', 'C|C,C,H'), ('c|h,o,c', 'C|O,C,H'), ('N|H,C,H', 'N|C,H,H')):
+        answer = str(Improper(improper_str=improper_str))
+        assert answer == expected, '"{0}" (answer) != "{1}" (expected)'.format(answer, expected)
+        assert str(Improper(improper_str=answer)) == answer
+
+    assert str(Improper(central='C', neighbours=['H', 'O', 'C'])) == 'C|O,C,H'
+
+def test_stereo_ordering() -> None:
+    clockwise = Improper(improper_str='C|H,O,C', improper_angles=[10.0, 20.0, 30.0])
+    anticlockwise = Improper(improper_str='C|H,O,C', improper_angles=[30.0, 20.0, 10.0])
+    assert (str(clockwise), str(anticlockwise)) == ('C|O,C,H', 'C|O,H,C'), (str(clockwise), str(anticlockwise))
+    # Rotating the angles does not change the form
+    assert str(Improper(improper_str='C|H,O,C', improper_angles=[-100.0, 20.0, 140.0])) == str(clockwise)
+    # Equal angles fall back to the element ordering
+    assert str(Improper(improper_str='C|H,O,C', improper_angles=[0.0, 0.0, 0.0])) == 'C|O,C,H'
+
+def test_hashing() -> None:
+    impropers = {Improper(improper_str='C|H,O,C'), Improper(central='C', neighbours=['C', 'H', 'O']), Improper(improper_str='C|H,O,C', improper_angles=[30.0, 20.0, 10.0])}
+    assert len(impropers) == 2, impropers
+    assert Improper(improper_str='C|H,O,C').compact_key() == (6, 0, 8, 0, 6, 0, 1, 0), Improper(improper_str='C|H,O,C').compact_key()
+
+def test_bulk_canonicalisation() -> None:
+    improper_strs = ['C|H,O,C', 'N|H,C,H', 'C|H,O,C']
+    assert canonical_impropers(improper_strs) == ['C|O,C,H', 'N|C,H,H', 'C|O,C,H'], canonical_impropers(improper_strs)
+    assert canonical_impropers(improper_strs, improper_angles=[[10, 20, 30], [0, 0, 0], [30, 20, 10]]) == ['C|O,C,H', 'N|C,H,H', 'C|O,H,C']
+
+def test_pattern_matching() -> None:
+    for (pattern, test_string, expected) in (
+        ('C|O,%', 'C|O,C,H', True),
+        ('C|O,%', 'C|N,C,H', False),
+        ('C|O,X,J', 'C|O,CL,H', True),
+        ('C|O,X,J', 'C|O,CL,N', False),
+        ('C|J{3}', 'C|C,H,H', True),
+        ('N|!H,H,H', 'N|C,H,H', True),
+        ('C|H,O,C', 'C|O,C,H', True),
+        ('C|H,O,C', 'C|O,H,H', False),
+    ):
+        answer = improper_pattern_matching_for(pattern)(test_string)
+        assert answer == expected, '{0} ~ {1}: {2} (answer) != {3} (expected)'.format(pattern, test_string, answer, expected)
+
+if __name__ == '__main__':
+    test_canonical_str()
+    test_stereo_ordering()
+    test_hashing()
+    test_bulk_canonicalisation()
+    test_pattern_matching()
@@ -0,0 +1,58 @@
+from json import loads
+from os.path import join
+from tempfile import TemporaryDirectory
+
+from dihedral_fragments.instrumentation import span, add_sink, remove_sink, Histogram_Sink, JSON_Lines_Sink, percentile, SUCCESS
+
+def test_percentile() -> None:
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50, percentile(values, 50)
+    assert percentile(values, 95) == 95, percentile(values, 95)
+    assert percentile(values, 99) == 99, percentile(values, 99)
+    assert percentile([3.0], 99) == 3.0
+
+def test_histogram_sink() -> None:
+    sink = add_sink(Histogram_Sink())
+    try:
+        for _ in range(3):
+            with span('stage_a', fragment='C|C|C|C'):
+                pass
+        try:
+            with span('stage_b'):
+                raise KeyError()
+        except KeyError:
+            pass
+    finally:
+        remove_sink(sink)
+
+    assert len(sink.durations['stage_a']) == 3, sink.durations
+    assert sink.outcomes['stage_a'][SUCCESS] == 3, sink.outcomes
+    assert sink.outcomes['stage_b']['KeyError'] == 1, sink.outcomes
+    assert set(sink.percentiles('stage_a')) == {50, 95, 99}
+    print(sink.summary())
+
+def test_json_lines_sink() -> None:
+    with TemporaryDirectory() as directory:
+        path = join(directory, 'timings.jsonl')
+        sink = add_sink(JSON_Lines_Sink(path))
+        try:
+            with span('stage_a', fragment='C|C|C|C', molid=1):
+                pass
+        finally:
+            remove_sink(sink)
+
+        with open(path) as fh:
+            records = [loads(line) for line in fh]
+
+    assert len(records) == 1, records
+    assert records[0]['stage'] == 'stage_a' and records[0]['outcome'] == SUCCESS and records[0]['molid'] == 1, records
+
+def test_span_without_sinks() -> None:
+    with span('nothing_recorded'):
+        pass
+
+if __name__ == '__main__':
+    test_percentile()
+    test_histogram_sink()
+    test_json_lines_sink()
+    test_span_without_sinks()
@@ -0,0 +1,97 @@
+from dihedral_fragments.benchmarks import random_fragments
+from dihedral_fragments.chemistry import CHEMICAL_GROUPS
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment
+from dihedral_fragments.materialisation import Group_Materialisation, Invalid_Query, bitset_for_ids, ids_for_bitset, parsed_query, popcount
+from dihedral_fragments.pattern_matching import re_pattern_matching_for
+
+GROUP_PATTERNS = dict(CHEMICAL_GROUPS)
+
+def vocabulary(n: int, seed: int = 1):
+    return sorted({str(Dihedral_Fragment(fragment)) for fragment in random_fragments(n, seed=seed)})
+
+def matches(pattern: str):
+    return re_pattern_matching_for(pattern)
+
+def test_bitsets() -> None:
+    for ids in ([], [0], [3, 7, 8, 1000], list(range(0, 300, 3))):
+        bitset = bitset_for_ids(ids)
+        assert list(ids_for_bitset(bitset)) == ids, (ids, bitset)
+        assert popcount(bitset) == len(ids), (ids, bitset)
+
+def test_parsed_query() -> None:
+    for (query, expected) in (
+        ('ketone', ('operand', 'ketone')),
+        ('alcohol I AND NOT ester', ('AND', ('operand', 'alcohol I'), ('NOT', ('operand', 'ester')))),
+        ('ketone OR ester AND ether', ('OR', ('operand', 'ketone'), ('AND', ('operand', 'ester'), ('operand', 'ether')))),
+        ('(ketone OR ester) AND NOT NOT ether', ('AND', ('OR', ('operand', 'ketone'), ('operand', 'ester')), ('NOT', ('NOT', ('operand', 'ether'))))),
+        ('J|C|C|% AND "acyl halide"', ('AND', ('operand', 'J|C|C|%'), ('operand', 'acyl halide'))),
+        ("NOT 'C|C|O|H'", ('NOT', ('operand', 'C|C|O|H'))),
+    ):
+        answer = parsed_query(query)
+        assert answer == expected, '{0}: {1} (answer) != {2} (expected)'.format(query, answer, expected)
+
+    for query in ('', 'ketone AND', '(ketone', 'ketone)', 'NOT', 'ketone OR', 'AND ketone', '"ketone'):
+        try:
+            parsed_query(query)
+            raise AssertionError('{0} should raise Invalid_Query'.format(query))
+        except Invalid_Query:
+            pass
+
+def test_queries() -> None:
+    fragments = vocabulary(5000)
+    group_materialisation = Group_Materialisation(fragments)
+    assert len(group_materialisation) == len(fragments)
+
+    for (moiety, pattern) in CHEMICAL_GROUPS:
+        matcher = matches(pattern)
+        expected = [fragment for fragment in fragments if matcher(fragment)]
+        answer = group_materialisation.fragments_matching('"{0}"'.format(moiety))
+        assert answer == expected, '{0}: {1} (answer) != {2} (expected)'.format(moiety, answer, expected)
+
+    chloro, ketone, carbon_carbon = matches(GROUP_PATTERNS['chloro']), matches(GROUP_PATTERNS['acyl halide']), matches('%|C|C|%')
+    for (query, predicate) in (
+        ('chloro AND NOT acyl halide', lambda fragment: chloro(fragment) and not ketone(fragment)),
+        ('NOT (chloro OR acyl halide)', lambda fragment: not (chloro(fragment) or ketone(fragment))),
+        ('chloro OR %|C|C|%', lambda fragment: chloro(fragment) or carbon_carbon(fragment)),
+        ('NOT %|C|C|% AND NOT chloro', lambda fragment: not carbon_carbon(fragment) and not chloro(fragment)),
+        (fragments[10], lambda fragment: fragment == fragments[10]),
+        ('C,C,C|SI|SI|C,C,C', lambda fragment: False),
+    ):
+        expected = [fragment for fragment in fragments if predicate(fragment)]
+        answer = group_materialisation.fragments_matching(query)
+        assert answer == expected, '{0}: {1} (answer) != {2} (expected)'.format(query, answer, expected)
+        assert group_materialisation.count(query) == len(expected), query
+
+    try:
+        group_materialisation.query('ketone AND unknown group')
+        raise AssertionError('Unknown groups should raise Invalid_Query')
+    except Invalid_Query:
+        pass
+
+def test_incremental_growth() -> None:
+    fragments = vocabulary(3000)
+    half = len(fragments) // 2
+    group_materialisation = Group_Materialisation(fragments[:half], pattern_cache_size=2)
+    queries = ('chloro AND NOT %|C|C|%', 'J|C|C|J OR N|C|N|%', fragments[-1], 'NOT chloro')
+    for query in queries:
+        group_materialisation.query(query)
+    assert list(group_materialisation.patterns) == ['N|C|N|%', fragments[-1]], list(group_materialisation.patterns)
+
+    group_materialisation.add_fragments(fragments[half - 10:])
+    assert group_materialisation.fragments == fragments, 'Fragments should only be added once'
+    complete_materialisation = Group_Materialisation(fragments)
+    for query in queries + ('"acyl halide" OR nitrile',):
+        answer, expected = group_materialisation.query(query), complete_materialisation.query(query)
+        assert answer == expected, '{0}: {1} (answer) != {2} (expected)'.format(query, answer, expected)
+
+    # Only added or modified groups are re-materialised
+    chloro = group_materialisation.groups['chloro']
+    group_materialisation.update_groups([(moiety, pattern) for (moiety, pattern) in CHEMICAL_GROUPS if moiety != 'nitrile'] + [('silane', 'J{3}|SI|SI|J{3}')])
+    assert group_materialisation.groups['chloro'] is chloro and 'nitrile' not in group_materialisation.groups
+    assert group_materialisation.query('silane') == 0
+
+if __name__ == '__main__':
+    test_bitsets()
+    test_parsed_query()
+    test_queries()
+    test_incremental_growth()
@@ -0,0 +1,63 @@
+from os import getpid
+from tempfile import TemporaryDirectory
+from threading import Thread
+
+from dihedral_fragments.minimisation import Minimisation_Stage
+
+PDBS = ['HETATM    {0}  C   UNL     1       {0}.000   0.000   0.000  1.00  0.00           C\nEND\n'.format(n) for n in range(12)]
+
+def stand_in_minimiser(pdb: str) -> str:
+    '''Tags a PDB with the process which "minimised" it.'''
+    if 'FAIL' in pdb:
+        raise ValueError(pdb)
+    return 'REMARK minimised by {0}\n{1}'.format(getpid(), pdb)
+
+def minimising_pid(minimised_pdb: str) -> int:
+    return int(minimised_pdb.splitlines()[0].split()[-1])
+
+def test_batches_and_cache() -> None:
+    with TemporaryDirectory() as directory:
+        with Minimisation_Stage(stand_in_minimiser, processes=2, cache_directory=directory) as minimisation_stage:
+            minimised_pdbs = minimisation_stage.minimise(PDBS + PDBS[:4], chunksize=2)
+            assert [minimised_pdb.split('\n', 1)[1] for minimised_pdb in minimised_pdbs] == PDBS + PDBS[:4], minimised_pdbs
+            # Duplicates were only minimised once, by the (long-lived) workers
+            assert minimisation_stage.n_minimised == len(PDBS), minimisation_stage.n_minimised
+            worker_pids = {minimising_pid(minimised_pdb) for minimised_pdb in minimised_pdbs}
+            assert getpid() not in worker_pids and len(worker_pids) <= 2, worker_pids
+
+            assert minimisation_stage.minimise(PDBS[::-1]) == minimised_pdbs[:len(PDBS)][::-1]
+            assert minimisation_stage.n_minimised == len(PDBS), minimisation_stage.n_minimised
+
+            new_pdbs = [pdb.replace('UNL', 'NEW') for pdb in PDBS]
+            assert {minimising_pid(minimised_pdb) for minimised_pdb in minimisation_stage.minimise(new_pdbs, chunksize=1)} <= worker_pids
+
+            try:
+                minimisation_stage.minimise_one('FAIL')
+                raise AssertionError('Minimisation errors should be raised')
+            except ValueError:
+                pass
+
+        # Minimised PDBs are cached on disk, across stages (here, minimising in the calling process)
+        with Minimisation_Stage(stand_in_minimiser, processes=0, cache_directory=directory) as minimisation_stage:
+            assert minimisation_stage.minimise(PDBS) == minimised_pdbs[:len(PDBS)]
+            assert minimisation_stage.n_minimised == 0, minimisation_stage.n_minimised
+            assert minimising_pid(minimisation_stage.minimise_one(PDBS[0].replace('UNL', 'ONE'))) == getpid()
+
+def test_shared_stage_is_started_once() -> None:
+    from dihedral_fragments import molecule_for_fragment
+    minimisation_stage, processes = molecule_for_fragment.MINIMISATION_STAGE, molecule_for_fragment.MINIMISATION_PROCESSES
+    molecule_for_fragment.MINIMISATION_STAGE, molecule_for_fragment.MINIMISATION_PROCESSES = None, 0
+    try:
+        stages = []
+        threads = [Thread(target=lambda: stages.append(molecule_for_fragment.get_minimisation_stage())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(stages) == 8 and len({id(stage) for stage in stages}) == 1, stages
+    finally:
+        molecule_for_fragment.MINIMISATION_STAGE, molecule_for_fragment.MINIMISATION_PROCESSES = minimisation_stage, processes
+
+if __name__ == '__main__':
+    test_batches_and_cache()
+    test_shared_stage_is_started_once()
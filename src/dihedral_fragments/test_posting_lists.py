@@ -0,0 +1,74 @@
+from os.path import join
+from random import Random
+from tempfile import TemporaryDirectory
+
+from dihedral_fragments.benchmarks import random_fragments
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment
+from dihedral_fragments.posting_lists import Invalid_Posting_File, Posting_File, molecules_with_all, molecules_with_any, posting_lists_for_molecules, tag_posting_lists
+from dihedral_fragments.tagging import Tagging_Service
+
+CARBOXYLIC_ACID, NITRO = str(Dihedral_Fragment('O,C|C|O|H')), str(Dihedral_Fragment('H,H,H|C|N|O,O'))
+
+def random_molecules(n: int, seed: int = 1):
+    '''(molecule ID, fragments) pairs, with sparse molecule IDs spanning several roaring containers.'''
+    random = Random(seed)
+    vocabulary = sorted({str(Dihedral_Fragment(fragment)) for fragment in random_fragments(300, seed=seed)}) + [CARBOXYLIC_ACID, NITRO]
+    molecule_ids = random.sample(range(300000), n)
+    return [(molecule_id, random.sample(vocabulary, random.randint(0, 12))) for molecule_id in molecule_ids]
+
+def test_posting_lists() -> None:
+    molecules = random_molecules(5000)
+    posting_lists = posting_lists_for_molecules(molecules)
+    fragments = {fragment for (_, molecule_fragments) in molecules for fragment in molecule_fragments}
+    assert set(posting_lists.keys()) == fragments
+
+    for fragment in sorted(fragments):
+        expected = {molecule_id for (molecule_id, molecule_fragments) in molecules if fragment in molecule_fragments}
+        assert set(posting_lists.bitmap(fragment)) == expected, fragment
+    assert len(posting_lists.bitmap('C|C')) == 0
+
+    tagging_service = Tagging_Service()
+    tagging_service.tags_for_fragments(posting_lists.keys())
+    tags = tag_posting_lists(posting_lists, tagging_service.fragments_for_tag)
+    assert 'nitro' in tags and 'carboxylic acid' in tags
+    for (tag, tag_molecules) in tags.bitmaps.items():
+        expected = {molecule_id for (molecule_id, molecule_fragments) in molecules if tag in tagging_service.tags_for_fragments(molecule_fragments)}
+        assert set(tag_molecules) == expected, tag
+
+    # Molecules containing both (the canonical) `O,C|C|O|H` and a nitro group
+    answer = set(posting_lists.bitmap(CARBOXYLIC_ACID) & tags.bitmap('nitro'))
+    expected = {
+        molecule_id
+        for (molecule_id, molecule_fragments) in molecules
+        if CARBOXYLIC_ACID in molecule_fragments and 'nitro' in tagging_service.tags_for_fragments(molecule_fragments)
+    }
+    assert answer == expected and expected, (len(answer), len(expected))
+
+def test_posting_file() -> None:
+    molecules = random_molecules(2000, seed=2)
+    posting_lists = posting_lists_for_molecules(molecules)
+    with TemporaryDirectory() as directory:
+        path = join(directory, 'fragments.postings')
+        posting_lists.write(path)
+        posting_file = Posting_File(path)
+        assert len(posting_file) == len(posting_lists) and set(posting_file.keys()) == set(posting_lists.keys())
+        for fragment in posting_lists.keys():
+            assert fragment in posting_file and posting_file.bitmap(fragment) == posting_lists.bitmap(fragment), fragment
+        assert 'C|C' not in posting_file and len(posting_file.bitmap('C|C')) == 0
+
+        fragments = [CARBOXYLIC_ACID, NITRO, posting_lists.keys()[0]]
+        for (function, combine) in ((molecules_with_all, set.intersection), (molecules_with_any, set.union)):
+            expected = combine(*[set(posting_lists.bitmap(fragment)) for fragment in fragments])
+            assert set(function(posting_file, fragments)) == expected, function.__name__
+
+        with open(path, 'r+b') as fh:
+            fh.write(b'NOTAFILE')
+        try:
+            Posting_File(path)
+            raise AssertionError('Invalid posting files should raise Invalid_Posting_File')
+        except Invalid_Posting_File:
+            pass
+
+if __name__ == '__main__':
+    test_posting_lists()
+    test_posting_file()
@@ -0,0 +1,125 @@
+from os.path import join
+from struct import pack
+from tempfile import TemporaryDirectory
+from zlib import compress, crc32
+
+from dihedral_fragments.rendering import Local_SVG_Source, Thumbnail_Cache, Render_Parameters, render_thumbnails, compose_collage, draw_centred_label, cleaned_svg_bytes, is_valid_png, DEFAULT_RENDER_PARAMETERS
+
+SVG_TEMPLATE = '<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10"><rect x="0" y="0" width="10" height="10"/><text>{molid}</text></svg>'
+
+def png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return pack('>I', len(data)) + chunk_type + data + pack('>I', crc32(chunk_type + data) & 0xffffffff)
+
+def solid_png(width: int, height: int, grey: int) -> bytes:
+    rows = b''.join(b'\x00' + bytes([grey]) * width for _ in range(height))
+    return b'\x89PNG\r\n\x1a\n' + png_chunk(b'IHDR', pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)) + png_chunk(b'IDAT', compress(rows)) + png_chunk(b'IEND', b'')
+
+class Counting_Rasteriser(object):
+    def __init__(self) -> None:
+        self.calls = []
+
+    def __call__(self, svg_bytes, render_parameters):
+        self.calls.append(svg_bytes)
+        return solid_png(20, render_parameters.pixel_height, len(self.calls) % 256)
+
+def write_svgs(directory, molids) -> None:
+    for molid in molids:
+        with open(join(directory, '{0}_thumb.svg'.format(molid)), 'w') as fh:
+            fh.write(SVG_TEMPLATE.format(molid=molid))
+
+def test_cleaned_svg_bytes() -> None:
+    svg_bytes = SVG_TEMPLATE.format(molid=1).encode()
+    assert b'rect' not in cleaned_svg_bytes(svg_bytes)
+    assert cleaned_svg_bytes(svg_bytes, remove_background=False) == svg_bytes
+
+def test_render_thumbnails_offline_and_cached() -> None:
+    molids = [1, 2, 3, 2]
+    render_parameters = Render_Parameters(remove_background=True, pixel_height=30, dpi=100)
+    with TemporaryDirectory() as svg_directory, TemporaryDirectory() as cache_directory:
+        write_svgs(svg_directory, set(molids))
+        source, cache, rasteriser = Local_SVG_Source(svg_directory), Thumbnail_Cache(cache_directory), Counting_Rasteriser()
+
+        png_files = render_thumbnails(molids, source, cache, rasteriser=rasteriser, render_parameters=render_parameters, max_workers=4)
+        assert sorted(png_files) == [1, 2, 3], png_files
+        assert len(rasteriser.calls) == 3, rasteriser.calls
+        for png_file in png_files.values():
+            with open(png_file, 'rb') as fh:
+                assert is_valid_png(fh.read())
+
+        # Second run is served from the cache, without rasterising anything
+        assert render_thumbnails(molids, source, cache, rasteriser=rasteriser, render_parameters=render_parameters) == png_files
+        assert len(rasteriser.calls) == 3, rasteriser.calls
+
+        # Truncated cache entries are detected and re-rendered
+        with open(png_files[1], 'r+b') as fh:
+            fh.truncate(10)
+        render_thumbnails([1], source, cache, rasteriser=rasteriser, render_parameters=render_parameters)
+        assert len(rasteriser.calls) == 4, rasteriser.calls
+
+        # Different rendering parameters do not share cache entries
+        render_thumbnails([1], source, cache, rasteriser=rasteriser, render_parameters=DEFAULT_RENDER_PARAMETERS)
+        assert len(rasteriser.calls) == 5, rasteriser.calls
+
+def test_legacy_thumbnails_are_imported() -> None:
+    with TemporaryDirectory() as svg_directory, TemporaryDirectory() as cache_directory:
+        write_svgs(svg_directory, [1, 2])
+        source, cache, rasteriser = Local_SVG_Source(svg_directory), Thumbnail_Cache(cache_directory), Counting_Rasteriser()
+        # Thumbnails cached as `{molid}.png` before the content-addressed cache, one of them truncated
+        legacy_png = solid_png(20, 30, 7)
+        for (molid, png_bytes) in ((1, legacy_png), (2, legacy_png[:10])):
+            with open(join(cache_directory, '{0}.png'.format(molid)), 'wb') as fh:
+                fh.write(png_bytes)
+
+        png_files = render_thumbnails([1, 2], source, cache, rasteriser=rasteriser)
+        assert len(rasteriser.calls) == 1, rasteriser.calls
+        with open(png_files[1], 'rb') as fh:
+            assert fh.read() == legacy_png
+        assert cache.get_for_molid(1, DEFAULT_RENDER_PARAMETERS) == png_files[1]
+        # Legacy thumbnails were rendered with the default parameters only
+        render_thumbnails([1], source, cache, rasteriser=rasteriser, render_parameters=Render_Parameters(remove_background=False, pixel_height=30, dpi=100))
+        assert len(rasteriser.calls) == 2, rasteriser.calls
+
+class Unanchored_Draw(object):
+    '''Mimics `ImageDraw` of Pillow < 9.2 with a bitmap font, which cannot anchor text.'''
+    def __init__(self) -> None:
+        self.texts = []
+
+    def multiline_text(self, xy, text, **kwargs):
+        raise AttributeError("'ImageFont' object has no attribute 'getlength'")
+
+    def text(self, xy, text, **kwargs):
+        self.texts.append((xy, text))
+
+class Bitmap_Font(object):
+    def getsize(self, text):
+        return (6 * len(text), 11)
+
+def test_draw_centred_label_without_anchors() -> None:
+    draw = Unanchored_Draw()
+    draw_centred_label(draw, (100, 40), 'C|C|C|C\n(id=0)', Bitmap_Font())
+    assert draw.texts == [((79, 40), 'C|C|C|C'), ((82, 55), '(id=0)')], draw.texts
+
+def test_compose_collage() -> None:
+    with TemporaryDirectory() as directory:
+        png_file = join(directory, 'tile.png')
+        with open(png_file, 'wb') as fh:
+            fh.write(solid_png(50, 100, 0))
+
+        collage = compose_collage(
+            [(png_file, 'C|C|C|C\n(id=0)'), (None, 'missing'), (png_file, 'H|O|C|C')],
+            tile_size=(40, 40),
+            label_height=10,
+            columns=2,
+        )
+    assert collage.size == (80, 100), collage.size
+    # The tile is scaled into its cell (keeping its aspect ratio) and centred
+    assert collage.getpixel((20, 20)) == (0, 0, 0), collage.getpixel((20, 20))
+    assert collage.getpixel((2, 20)) == (255, 255, 255), collage.getpixel((2, 20))
+    assert collage.getpixel((60, 20)) == (255, 255, 255), collage.getpixel((60, 20))
+
+if __name__ == '__main__':
+    test_cleaned_svg_bytes()
+    test_render_thumbnails_offline_and_cached()
+    test_legacy_thumbnails_are_imported()
+    test_draw_centred_label_without_anchors()
+    test_compose_collage()
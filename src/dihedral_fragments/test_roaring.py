@@ -0,0 +1,70 @@
+from os.path import join
+from random import Random
+from tempfile import TemporaryDirectory
+
+from dihedral_fragments.roaring import ARRAY_CONTAINER_SIZE, Invalid_Roaring_Bitmap, Roaring_Bitmap, intersection, is_bitmap, read_roaring_bitmap, roaring_bitmap_for_ids, roaring_bitmap_from_buffer, union, write_roaring_bitmap
+
+import numpy as np
+
+# IDs per container: empty, sparse, at and around the array/bitmap threshold, dense
+CONTAINER_SIZES = (0, 1, 10, ARRAY_CONTAINER_SIZE, ARRAY_CONTAINER_SIZE + 1, 6000, 30000)
+
+def random_ids(random: Random):
+    ids = set()
+    for _ in range(random.randint(0, 4)):
+        key = random.randint(0, 5) if random.random() < 0.9 else random.randint(0, 65535)
+        ids.update((key << 16) | random.randrange(1 << 16) for _ in range(random.choice(CONTAINER_SIZES)))
+    return ids
+
+def assert_bitmap(bitmap: Roaring_Bitmap, ids, message: str) -> None:
+    assert set(bitmap) == ids, '{0}: {1} IDs (answer) != {2} IDs (expected)'.format(message, len(set(bitmap)), len(ids))
+    assert len(bitmap) == len(ids), '{0}: {1} (answer) != {2} (expected)'.format(message, len(bitmap), len(ids))
+    assert bitmap.keys == sorted(bitmap.keys) and all(bitmap.cardinalities), message
+    assert all(is_bitmap(container) == (cardinality > ARRAY_CONTAINER_SIZE) for (container, cardinality) in zip(bitmap.containers, bitmap.cardinalities)), message
+
+def test_operations() -> None:
+    random = Random(1)
+    for _ in range(40):
+        ids_1, ids_2, ids_3 = random_ids(random), random_ids(random), random_ids(random)
+        bitmap_1, bitmap_2, bitmap_3 = roaring_bitmap_for_ids(ids_1), roaring_bitmap_for_ids(ids_2), roaring_bitmap_for_ids(ids_3)
+        assert_bitmap(bitmap_1, ids_1, 'roaring_bitmap_for_ids')
+        assert_bitmap(bitmap_1 & bitmap_2, ids_1 & ids_2, 'AND')
+        assert_bitmap(bitmap_1 | bitmap_2, ids_1 | ids_2, 'OR')
+        assert_bitmap(bitmap_1 - bitmap_2, ids_1 - ids_2, 'ANDNOT')
+        assert_bitmap(intersection([bitmap_1, bitmap_2, bitmap_3]), ids_1 & ids_2 & ids_3, 'intersection')
+        assert_bitmap(union([bitmap_1, bitmap_2, bitmap_3]), ids_1 | ids_2 | ids_3, 'union')
+
+        for value in random.sample(sorted(ids_1), min(10, len(ids_1))) + [random.randrange(1 << 32) for _ in range(10)]:
+            assert (value in bitmap_1) == (value in ids_1), value
+
+    assert_bitmap(roaring_bitmap_for_ids([]), set(), 'empty')
+    assert_bitmap(roaring_bitmap_for_ids(np.array([3, 3, 1, (1 << 32) - 1])), {1, 3, (1 << 32) - 1}, 'duplicates')
+
+def test_serialisation() -> None:
+    random = Random(2)
+    with TemporaryDirectory() as directory:
+        for n in range(20):
+            ids = random_ids(random)
+            bitmap = roaring_bitmap_for_ids(ids)
+            serialised_bitmap = bitmap.to_bytes()
+            assert len(serialised_bitmap) == bitmap.serialised_size() and len(serialised_bitmap) % 8 == 0
+
+            path = join(directory, 'bitmap_{0}.bin'.format(n))
+            write_roaring_bitmap(path, bitmap)
+            mapped_bitmap = read_roaring_bitmap(path)
+            assert mapped_bitmap == bitmap, n
+            assert_bitmap(mapped_bitmap - roaring_bitmap_for_ids(list(ids)[:5]), set(sorted(ids)) - set(list(ids)[:5]), 'memory-mapped ANDNOT')
+
+            # Serialised bitmaps can be read at any (8 bytes aligned) offset
+            buffer = np.frombuffer(b'\x00' * 8 + serialised_bitmap, dtype=np.uint8)
+            assert roaring_bitmap_from_buffer(buffer, 8) == bitmap
+
+    try:
+        roaring_bitmap_from_buffer(np.zeros(16, dtype=np.uint8))
+        raise AssertionError('Invalid bitmaps should raise Invalid_Roaring_Bitmap')
+    except Invalid_Roaring_Bitmap:
+        pass
+
+if __name__ == '__main__':
+    test_operations()
+    test_serialisation()
@@ -0,0 +1,86 @@
+from itertools import combinations
+
+from dihedral_fragments.benchmarks import random_fragments
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment
+from dihedral_fragments.similarity import Fragment_Similarity_Index, Similar_Fragment, fragment_distance, fragment_shape, oriented_distance, oriented_fragments, shape_distance
+
+VALENCE_ATOMS = ('C4', 'C4', 'C3', 'H1', 'H1', 'N3', 'N2', 'O2', 'O1', 'S2', 'CL1', 'F1')
+
+CENTRAL_ATOMS = (('C4', 'C3', 'N3', 'O2', 'S2'), ('C4', 'C3', 'N3'))
+
+def vocabulary(n: int, seed: int = 1):
+    return sorted({str(Dihedral_Fragment(fragment)) for fragment in random_fragments(n, seed=seed, neighbour_atoms=VALENCE_ATOMS, central_atoms=CENTRAL_ATOMS)})
+
+def brute_force_distances(fragments, fragment):
+    '''Every fragment, sorted by distance to `fragment`.'''
+    orientation = oriented_fragments(str(Dihedral_Fragment(fragment)))[0]
+    return sorted(
+        Similar_Fragment(min(oriented_distance(orientation, other) for other in oriented_fragments(other_fragment)), other_fragment)
+        for other_fragment in fragments
+    )
+
+def brute_force_nearest(distances, k, max_distance=None):
+    return [similar_fragment for similar_fragment in distances if max_distance is None or similar_fragment.distance <= max_distance][:k]
+
+def test_fragment_distance() -> None:
+    for (fragment_1, fragment_2, expected) in (
+        ('C4,H1,H1|C4|C4|H1,H1,H1', 'C4,H1,H1|C4|C4|H1,H1,H1', 0),
+        # Flipped, or another stereo-isomer
+        ('C4,H1,H1|C4|C4|H1,H1,H1', 'H1,H1,H1|C4|C4|H1,H1,C4', 0),
+        ('CL1,F1,H1|C4|C4|H1,H1,H1', 'F1,CL1,H1|C4|C4|H1,H1,H1', 0),
+        # Valence, element, missing neighbour
+        ('C4,H1,H1|C4|C4|H1,H1,H1', 'C3,H1,H1|C4|C4|H1,H1,H1', 2),
+        ('C4,H1,H1|C4|C4|H1,H1,H1', 'N3,H1,H1|C4|C4|H1,H1,H1', 4),
+        ('C4,H1,H1|C4|C4|H1,H1,H1', 'C4,H1|C4|C4|H1,H1,H1', 2),
+        ('C4,H1,H1|C4|C4|H1,H1,H1', 'C4,H1,H1|C4|N3|H1,H1,H1', 4),
+        # Cycles
+        ('C4,H1|C4|C4|C4,H1|000', 'C4,H1|C4|C4|C4,H1', 2),
+        ('C4,H1|C4|C4|C4,H1|000', 'C4,H1|C4|C4|C4,H1|010', 4),
+    ):
+        answer = fragment_distance(fragment_1, fragment_2)
+        assert answer == expected, '{0}, {1}: {2} (answer) != {3} (expected)'.format(fragment_1, fragment_2, answer, expected)
+
+def test_pseudo_metric() -> None:
+    fragments = vocabulary(60)
+    for (fragment_1, fragment_2) in combinations(fragments, 2):
+        assert fragment_distance(fragment_1, fragment_2) == fragment_distance(fragment_2, fragment_1), (fragment_1, fragment_2)
+        # The shapes' distance is a lower bound
+        assert min(shape_distance(fragment_shape(oriented_fragments(fragment_1)[0]), fragment_shape(orientation)) for orientation in oriented_fragments(fragment_2)) <= fragment_distance(fragment_1, fragment_2), (fragment_1, fragment_2)
+    for (fragment_1, fragment_2, fragment_3) in combinations(fragments[:25], 3):
+        assert fragment_distance(fragment_1, fragment_3) <= fragment_distance(fragment_1, fragment_2) + fragment_distance(fragment_2, fragment_3), (fragment_1, fragment_2, fragment_3)
+
+def test_nearest() -> None:
+    fragments = vocabulary(3000)
+    similarity_index = Fragment_Similarity_Index(fragments)
+    assert len(similarity_index) == len(fragments) and fragments[0] in similarity_index
+
+    for fragment in vocabulary(40, seed=2) + ['C4,H1|SI4|C4|H1', 'BR1,H1|C4|C4|H1,H1|000']:
+        distances = brute_force_distances(fragments, fragment)
+        for (k, max_distance) in ((1, None), (5, None), (20, None), (20, 4)):
+            answer = similarity_index.nearest(fragment, k=k, max_distance=max_distance)
+            expected = brute_force_nearest(distances, k, max_distance=max_distance)
+            assert answer == expected, '{0}: {1} (answer) != {2} (expected)'.format(fragment, answer, expected)
+
+    # Indexed fragments are their own nearest fragment (queries are canonised)
+    fragment = next(fragment for fragment in fragments if fragment.count('|') == 3)
+    flipped_fragment = '|'.join(fragment.split('|')[::-1])
+    for query in (fragment, flipped_fragment):
+        answer = similarity_index.nearest(query, k=1)
+        assert answer == [Similar_Fragment(0, fragment)], '{0}: {1} (answer)'.format(query, answer)
+
+def test_incremental_and_batch() -> None:
+    fragments = vocabulary(1000)
+    similarity_index = Fragment_Similarity_Index(fragments[:300])
+    queries = vocabulary(20, seed=3)
+    similarity_index.nearest_for_fragments(queries)
+    similarity_index.add_fragments(fragments[300:])
+
+    answer = similarity_index.nearest_for_fragments(queries + queries[:5], k=3)
+    expected = [brute_force_nearest(brute_force_distances(fragments, query), 3) for query in queries + queries[:5]]
+    assert answer == expected, '{0} (answer) != {1} (expected)'.format(answer, expected)
+
+if __name__ == '__main__':
+    test_fragment_distance()
+    test_pseudo_metric()
+    test_nearest()
+    test_incremental_and_batch()
@@ -0,0 +1,73 @@
+from itertools import permutations
+from random import Random
+
+from dihedral_fragments.benchmarks import polycyclic_atom_lists
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment
+from dihedral_fragments.stereo import Stereo_Fragment, permutation_parity, permutation_table, cyclic_classes, angle_ordering, angles_for_ordering, rotations_are_equivalent
+
+ATOM_LISTS = [
+    (['C', 'H', 'O'], 'C', 'C', ['C', 'H', 'O']),
+    (['C', 'H', 'H'], 'C', 'C', ['C', 'H', 'O']),
+    (['H', 'H', 'H'], 'C', 'C', ['H', 'H', 'H']),
+    (['S', 'O', 'N'], 'P', 'O', ['C']),
+    (['CL', 'H'], 'C', 'C', ['CL', 'H']),
+    (['C', 'N', 'O', 'S'], 'C', 'C', ['F', 'CL', 'BR', 'I']),
+    (['O', 'H', 'C'], 'C', 'C', ['O', 'H', 'C'], [[0, 3, 1]]),
+]
+
+def test_permutation_tables() -> None:
+    assert [permutation_parity(ordering) for ordering in ((0, 1, 2), (1, 2, 0), (1, 0, 2), (2, 1, 0))] == [0, 0, 1, 1]
+    assert len(cyclic_classes(3)) == 2 and len(cyclic_classes(4)) == 6, (cyclic_classes(3), cyclic_classes(4))
+    # With three neighbours, the parity identifies the cyclic class
+    assert {entry.parity: entry.cyclic_class for entry in permutation_table(3).values()} == {0: (0, 1, 2), 1: (0, 2, 1)}
+    assert angle_ordering([0.0, 120.0, -120.0]) == (2, 0, 1) and angle_ordering([0.0, 0.0, 120.0]) is None
+
+def random_angles(random: Random, n: int, ties: bool = False):
+    angles = [random.uniform(-180.0, 180.0) for _ in range(n)]
+    if ties and n > 1:
+        angles[1] = angles[0]
+    return angles
+
+def test_same_forms_as_full_canonicalisation() -> None:
+    random = Random(1)
+    atom_lists = ATOM_LISTS + [(atom_list[0][:3], 'C', 'C', atom_list[3][:3], [cycle for cycle in atom_list[4] if cycle[0] < 3 and cycle[2] < 3]) for atom_list in polycyclic_atom_lists(30)]
+    for atom_list in atom_lists:
+        stereo_fragment = Stereo_Fragment(atom_list)
+        forms = set(stereo_fragment.stereo_forms())
+        for n in range(50):
+            dihedral_angles = (random_angles(random, len(atom_list[0]), ties=(n % 10 == 0)), random_angles(random, len(atom_list[3])))
+            answer = stereo_fragment.form_for_angles(dihedral_angles)
+            expected = str(Dihedral_Fragment(atom_list=atom_list, dihedral_angles=dihedral_angles))
+            assert answer == expected, '{0} {1}: "{2}" (answer) != "{3}" (expected)'.format(atom_list, dihedral_angles, answer, expected)
+            assert n % 10 == 0 or answer in forms, (answer, forms)
+
+def test_stereo_forms() -> None:
+    # Symmetric fragments: the two mixed forms are the same fragment read from either end
+    expected_numbers_of_forms = [3, 2, 1, 2, 1, 36, None]
+    for (atom_list, expected) in zip(ATOM_LISTS, expected_numbers_of_forms):
+        forms = Stereo_Fragment(atom_list).stereo_forms()
+        print(atom_list, forms)
+        if expected is not None:
+            assert len(forms) == expected, (atom_list, forms)
+
+def test_same_atomic_number_ties() -> None:
+    # The best rotation is chosen on atomic numbers only, so it depends on where the rotation of `C4` and `C3` starts
+    atom_list = (['C4', 'H', 'C3', 'H'], 'S', 'C', ['H', 'H', 'H'])
+    assert not rotations_are_equivalent(atom_list[0]) and rotations_are_equivalent(['C4', 'H', 'C4', 'O'])
+    stereo_fragment = Stereo_Fragment(atom_list)
+    for left_angles in ([30, 40, 10, 20], [10, 20, 30, 40]):
+        dihedral_angles = (left_angles, [1, 2, 3])
+        answer, expected = stereo_fragment.form_for_angles(dihedral_angles), str(Dihedral_Fragment(atom_list=atom_list, dihedral_angles=dihedral_angles))
+        assert answer == expected, (dihedral_angles, answer, expected)
+
+    expected_forms = {
+        str(Dihedral_Fragment(atom_list=atom_list, dihedral_angles=(angles_for_ordering(ordering), [1, 2, 3])))
+        for ordering in permutations(range(4))
+    }
+    assert set(stereo_fragment.stereo_forms()) == expected_forms, (stereo_fragment.stereo_forms(), expected_forms)
+
+if __name__ == '__main__':
+    test_permutation_tables()
+    test_same_forms_as_full_canonicalisation()
+    test_stereo_forms()
+    test_same_atomic_number_ties()
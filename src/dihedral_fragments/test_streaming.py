@@ -0,0 +1,119 @@
+from contextlib import redirect_stdout
+from io import StringIO
+from threading import current_thread, Lock
+from time import sleep
+
+from dihedral_fragments import molecule_for_fragment
+from dihedral_fragments.streaming import iter_results
+
+def slow_first(x: int) -> int:
+    if x == 0:
+        sleep(0.2)
+    return x * x
+
+def test_ordered_and_as_completed() -> None:
+    ordered = list(iter_results(slow_first, range(20), max_workers=4))
+    assert ordered == [(x, x, x * x) for x in range(20)], ordered
+
+    as_completed = list(iter_results(slow_first, range(20), max_workers=4, ordered=False))
+    assert sorted(as_completed) == ordered, as_completed
+    # The slow first item does not hold back the others
+    assert as_completed[0][0] != 0 and as_completed[-1][0] == 0, as_completed
+
+    threads = [thread_name for (_, _, thread_name) in iter_results(lambda _: current_thread().name, range(3))]
+    assert threads == [current_thread().name] * 3, threads
+
+def test_bounded_in_flight() -> None:
+    lock, pulled = Lock(), []
+
+    def items():
+        for x in range(100):
+            with lock:
+                pulled.append(x)
+            yield x
+
+    n_yielded = 0
+    for (position, x, square) in iter_results(slow_first, items(), max_workers=2, max_in_flight=3):
+        # Completed items wait in the reorder buffer, which counts towards the window
+        assert len(pulled) - n_yielded <= 3, (len(pulled), n_yielded)
+        assert position == x == n_yielded and square == x * x, (position, x, square)
+        n_yielded += 1
+    assert n_yielded == 100, n_yielded
+
+def test_exceptions_and_early_exits() -> None:
+    started = []
+
+    def failing(x: int) -> int:
+        started.append(x)
+        if x == 5:
+            raise ValueError(x)
+        return x
+
+    yielded = []
+    try:
+        for (_, _, x) in iter_results(failing, range(1000), max_workers=2, max_in_flight=4):
+            yielded.append(x)
+        raise AssertionError('Exceptions should be raised by the generator')
+    except ValueError:
+        pass
+    assert yielded == list(range(5)) and len(started) < 10, (yielded, len(started))
+
+    results = iter_results(slow_first, range(1000), max_workers=2)
+    next(results)
+    results.close()
+
+def test_streaming_matches() -> None:
+    protein_fragments = [('C,H,H|C|C|H,H,H', 10), ('H|O|C|C,H,H', 5), ('O,O,O|P|O|C', 1)]
+    molids = {'C,H,H|C|C|H,H,H': 1001, 'H|O|C|C,H,H': None, 'O,O,O|P|O|C': 1003}
+    printed, check_printed = StringIO(), True
+
+    def fake_molid_after_capping_fragment(fragment, count=None, i=None, fragments=None):
+        assert fragments is protein_fragments and protein_fragments[i] == (fragment, count)
+        # Every result is printed (by get_matches()) before the next fragment is run
+        assert not check_printed or printed.getvalue().count('--download') == sum(1 for (fragment, _) in protein_fragments[:i] if molids[fragment])
+        return molids[fragment]
+
+    molid_after_capping_fragment = molecule_for_fragment.molid_after_capping_fragment
+    molecule_for_fragment.molid_after_capping_fragment = fake_molid_after_capping_fragment
+    try:
+        with redirect_stdout(printed):
+            matches = molecule_for_fragment.get_matches(protein_fragments)
+        assert matches == [(fragment, molids[fragment]) for (fragment, _) in protein_fragments], matches
+        assert printed.getvalue().splitlines() == [molecule_for_fragment.download_command(fragment, molids[fragment]) for fragment in ('C,H,H|C|C|H,H,H', 'O,O,O|P|O|C')], printed.getvalue()
+
+        check_printed = False
+        streamed = list(molecule_for_fragment.iter_matches(protein_fragments, max_workers=3, ordered=False))
+        assert sorted(streamed, key=lambda match: match[0]) == sorted(matches, key=lambda match: match[0]), streamed
+    finally:
+        molecule_for_fragment.molid_after_capping_fragment = molid_after_capping_fragment
+
+def test_cached_matches_print_download_commands() -> None:
+    protein_fragments = [('C,H,H|C|C|H,H,H', 10), ('O,O,O|P|O|C', 1)]
+    cache = {}
+
+    def stand_in_cached(function, args, kwargs, hashed=False):
+        key = (function.__name__, repr(args), repr(kwargs))
+        if key not in cache:
+            cache[key] = function(*args, **kwargs)
+        return cache[key]
+
+    molid_after_capping_fragment, lazy_attribute = molecule_for_fragment.molid_after_capping_fragment, molecule_for_fragment.lazy_attribute
+    molecule_for_fragment.molid_after_capping_fragment = lambda fragment, **kwargs: 1000 + len(fragment)
+    molecule_for_fragment.lazy_attribute = lambda name: stand_in_cached if name == 'cached' else lazy_attribute(name)
+    try:
+        # Streamed on a cold run, and printed from the cache on reruns (whatever the number of workers)
+        for capping_workers in (1, 1, 4):
+            printed = StringIO()
+            with redirect_stdout(printed):
+                matches = molecule_for_fragment.cached_matches(protein_fragments, capping_workers=capping_workers)
+            assert printed.getvalue().splitlines() == [molecule_for_fragment.download_command(fragment, molid) for (fragment, molid) in matches], printed.getvalue()
+        assert list(cache) == [('get_matches', repr((protein_fragments,)), repr({}))], cache
+    finally:
+        molecule_for_fragment.molid_after_capping_fragment, molecule_for_fragment.lazy_attribute = molid_after_capping_fragment, lazy_attribute
+
+if __name__ == '__main__':
+    test_ordered_and_as_completed()
+    test_bounded_in_flight()
+    test_exceptions_and_early_exits()
+    test_streaming_matches()
+    test_cached_matches_print_download_commands()
@@ -0,0 +1,43 @@
+from os.path import join
+from tempfile import TemporaryDirectory
+
+from dihedral_fragments.tag_predictor import Molecule_Record, Tag_Diff, Fake_Tag_API, proposed_tag_diffs, apply_tag_diffs, write_json_lines, read_molecule_dump, read_tag_diffs, get_ignored_molids
+
+MOLECULES = [
+    Molecule_Record(1, ['Mobley et al.'], ['CL,CL,H|C|C|H,H,H', 'N,H,H|C|C|O,O']),
+    Molecule_Record(2, ['SAMPL1', 'phosphate'], ['O,O,O|P|O|C', 'N,H,H|C|C|O,O']),
+    Molecule_Record(3, [], ['C,C|N|C|H,H,H', 'H,H,H|C|C|O,C']),
+    Molecule_Record(4, ['ketone'], ['N,H,H|C|C|O,O']),
+    Molecule_Record(5, [], ['H,H,H|C|C|O,C']),
+]
+
+def test_offline_batch_mode() -> None:
+    api = Fake_Tag_API(MOLECULES)
+
+    with TemporaryDirectory() as directory:
+        molecules_path, diffs_path, ignore_file = join(directory, 'molecules.jsonl'), join(directory, 'diffs.jsonl'), join(directory, '.ignore')
+
+        write_json_lines(molecules_path, api.search())
+        assert read_molecule_dump(molecules_path) == MOLECULES, read_molecule_dump(molecules_path)
+
+        tag_diffs = proposed_tag_diffs(read_molecule_dump(molecules_path), ignored_molids={5}, workers=2, chunksize=1)
+        assert tag_diffs == [
+            Tag_Diff(1, [], ['dichloro'], None),
+            Tag_Diff(3, [], ['amine III', 'ketone'], None),
+            Tag_Diff(4, ['ketone'], [], None),
+        ], tag_diffs
+        assert proposed_tag_diffs(MOLECULES, ignored_molids={5}) == tag_diffs
+
+        # Review: accept molecule 1, reject molecule 4, leave molecule 3 undecided
+        write_json_lines(diffs_path, [tag_diffs[0]._replace(accept=True), tag_diffs[1], tag_diffs[2]._replace(accept=False)])
+
+        assert apply_tag_diffs(api, read_tag_diffs(diffs_path), ignore_file=ignore_file) == (1, 1)
+        assert api.tags[1] == {'Mobley et al.', 'dichloro'} and api.tags[3] == set(), api.tags
+        assert get_ignored_molids(ignore_file) == {4}, get_ignored_molids(ignore_file)
+
+        assert apply_tag_diffs(api, [tag_diffs[1]], accept_all=True, batch_size=1, ignore_file=ignore_file) == (2, 0)
+        assert api.tags[3] == {'amine III', 'ketone'}, api.tags
+        assert api.batches == [[(1, 'dichloro')], [(3, 'amine III')], [(3, 'ketone')]], api.batches
+
+if __name__ == '__main__':
+    test_offline_batch_mode()
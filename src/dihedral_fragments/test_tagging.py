@@ -0,0 +1,84 @@
+from typing import List, NamedTuple
+
+from dihedral_fragments.chemistry import CHEMICAL_GROUPS
+from dihedral_fragments.tag_predictor import tags_for_molecule
+from dihedral_fragments.tagging import Tagging_Service
+
+Molecule = NamedTuple('Molecule', [('molid', int), ('dihedral_fragments', List[str])])
+
+MOLECULES = [
+    Molecule(1, ['CL,C,H|C|C|H,H,H', 'H,H,H|C|C|O,C', 'H,H,H|C|C|H,H,H']),
+    Molecule(2, ['O,O,O|P|O|C', 'H,H,H|C|C|H,H,H']),
+    Molecule(3, ['C,C|N|C|H,H,H', 'CL,CL,H|C|C|H,H,H', 'H,H,H|C|C|O,C']),
+    Molecule(4, []),
+]
+
+GROUPS = [
+    ('dichloro', 'CL,CL,!X|C|Z|J{2-3}%'),
+    ('ketone', '%|C|C|O,C'),
+]
+
+AMINE_III_PATTERN = dict(CHEMICAL_GROUPS)['amine III']
+
+def test_same_tags_as_tag_predictor() -> None:
+    tagging_service = Tagging_Service(CHEMICAL_GROUPS)
+    answers = tagging_service.tags_for_molecules(MOLECULES)
+    for (molecule, answer) in zip(MOLECULES, answers):
+        expected = tags_for_molecule(molecule)
+        assert answer == expected, '{0}: {1} (answer) != {2} (expected)'.format(molecule.molid, answer, expected)
+        assert tagging_service.tags_for_molecule(molecule) == expected
+
+def test_fragments_are_matched_once() -> None:
+    tagging_service = Tagging_Service(GROUPS)
+    calls = []
+    for (moiety, matcher) in list(tagging_service.matchers.items()):
+        tagging_service.matchers[moiety] = lambda fragment, matcher=matcher: calls.append(fragment) or matcher(fragment)
+
+    tagging_service.tags_for_molecules(MOLECULES)
+    tagging_service.tags_for_molecules(MOLECULES)
+    n_unique_fragments = len({fragment for molecule in MOLECULES for fragment in molecule.dihedral_fragments})
+    assert len(calls) == n_unique_fragments * len(GROUPS), calls
+    assert tagging_service.fragments_for_tag == {'dichloro': {'CL,CL,H|C|C|H,H,H'}, 'ketone': {'H,H,H|C|C|O,C'}}, tagging_service.fragments_for_tag
+
+def test_update_groups() -> None:
+    tagging_service = Tagging_Service(GROUPS)
+    tagging_service.tags_for_molecules(MOLECULES)
+
+    new_groups = [
+        ('dichloro', 'CL,CL,!X|C|Z|J{2-3}%'),
+        ('amine III', AMINE_III_PATTERN),
+        ('phosphate', 'O,O,O|P|O|C'),
+    ]
+    changed_fragments = tagging_service.update_groups(new_groups)
+    assert changed_fragments == {'H,H,H|C|C|O,C', 'C,C|N|C|H,H,H', 'O,O,O|P|O|C'}, changed_fragments
+
+    answers, expected = tagging_service.tags_for_molecules(MOLECULES), Tagging_Service(new_groups).tags_for_molecules(MOLECULES)
+    assert answers == expected, '{0} (answer) != {1} (expected)'.format(answers, expected)
+    assert 'ketone' not in tagging_service.fragments_for_tag, tagging_service.fragments_for_tag
+
+    # Modifying a pattern re-evaluates it
+    assert tagging_service.update_groups(new_groups) == set()
+    assert tagging_service.update_groups([('dichloro', 'CL,CL,CL|C|C|H,H,H')] + new_groups[1:]) == {'CL,CL,H|C|C|H,H,H'}
+    assert tagging_service.tags_for_molecule(MOLECULES[2]) == {'amine III'}, tagging_service.tags_for_molecule(MOLECULES[2])
+
+def test_overlapping_update_changes_nothing() -> None:
+    tagging_service = Tagging_Service(GROUPS)
+    tagging_service.tags_for_molecules(MOLECULES)
+    state = (dict(tagging_service.patterns), dict(tagging_service.matchers), dict(tagging_service.tags_for_fragment), {moiety: set(fragments) for (moiety, fragments) in tagging_service.fragments_for_tag.items()})
+
+    # `CL,CL,H|C|C|H,H,H` would be tagged as both dichloro and trichloroethane
+    overlapping_groups = [GROUPS[0], ('trichloroethane', 'CL,CL,H|C|C|H,H,H'), ('phosphate', 'O,O,O|P|O|C')]
+    try:
+        tagging_service.update_groups(overlapping_groups)
+        raise Exception('Overlapping groups should be rejected')
+    except AssertionError:
+        pass
+    new_state = (tagging_service.patterns, tagging_service.matchers, tagging_service.tags_for_fragment, tagging_service.fragments_for_tag)
+    assert new_state == state, '{0} (answer) != {1} (expected)'.format(new_state, state)
+    assert tagging_service.tags_for_molecules(MOLECULES) == Tagging_Service(GROUPS).tags_for_molecules(MOLECULES)
+
+if __name__ == '__main__':
+    test_same_tags_as_tag_predictor()
+    test_fragments_are_matched_once()
+    test_update_groups()
+    test_overlapping_update_changes_nothing()
@@ -0,0 +1,55 @@
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment
+from dihedral_fragments.pattern_matching import re_pattern_matching_for
+from dihedral_fragments.tracing import set_level, trace_records, clear_trace_records, set_capacity, OFF, DEBUG, DEFAULT_CAPACITY
+
+def test_canonicalisation_decisions() -> None:
+    clear_trace_records()
+    set_level('canonicalisation', DEBUG)
+    try:
+        fragment = Dihedral_Fragment(atom_list=(['C', 'N', 'O'], 'C', 'C', ['O', 'O', 'O'], [[0, 6, 2], [1, 5, 1], [2, 4, 0]]))
+    finally:
+        set_level('canonicalisation', OFF)
+
+    events = [record.event for record in trace_records('canonicalisation')]
+    assert events.count('rotation') == 2, events
+    assert events.count('flip') == 1 and events.count('cycle_renumbering') == 1, events
+    flip, = trace_records('canonicalisation', 'flip')
+    assert flip.details['should_reverse'] and flip.details['reason'].startswith('neighbours 1 differ'), flip
+    clear_trace_records()
+
+def test_disabled_tracing_records_nothing() -> None:
+    clear_trace_records()
+    str(Dihedral_Fragment('C,C,N|C|C|C,C,C|002,101,200'))
+    re_pattern_matching_for('J+|C|S|H')('H|C|S|H')
+    assert trace_records() == [], trace_records()
+
+def test_pattern_matching_trace() -> None:
+    clear_trace_records()
+    matcher = re_pattern_matching_for('J+|C|S|H', metadata='thiol')
+    set_level('pattern_matching', DEBUG)
+    try:
+        assert matcher('H,H,H|C|S|H')
+    finally:
+        set_level('pattern_matching', OFF)
+    match, = trace_records('pattern_matching', 'match')
+    assert match.details['metadata'] == 'thiol' and match.details['matched'], match
+    clear_trace_records()
+
+def test_ring_buffer_capacity() -> None:
+    clear_trace_records()
+    set_capacity(3)
+    set_level('canonicalisation', DEBUG)
+    try:
+        for _ in range(5):
+            Dihedral_Fragment('C,H,H|C|C|H,H,H')
+        assert len(trace_records()) == 3, trace_records()
+    finally:
+        set_level('canonicalisation', OFF)
+        set_capacity(DEFAULT_CAPACITY)
+        clear_trace_records()
+
+if __name__ == '__main__':
+    test_canonicalisation_decisions()
+    test_disabled_tracing_records_nothing()
+    test_pattern_matching_trace()
+    test_ring_buffer_capacity()
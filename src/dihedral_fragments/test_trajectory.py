@@ -0,0 +1,81 @@
+from io import StringIO
+
+import numpy as np
+
+from dihedral_fragments.benchmarks import random_molecular_graphs
+from dihedral_fragments.extraction import Fragment_Extractor, Molecular_Graph
+from dihedral_fragments.geometry import dihedral_angles
+from dihedral_fragments.trajectory import Fragment_Tracker, frame_chunks, fragments_for_frames, read_change_log, write_change_log
+
+N_FRAMES = 60
+
+def random_trajectory(graph, random: np.random.RandomState) -> np.ndarray:
+    return np.array(graph.coordinates) + np.cumsum(random.normal(scale=0.3, size=(N_FRAMES, len(graph.elements), 3)), axis=0)
+
+def test_same_fragments_as_extractor() -> None:
+    random = np.random.RandomState(0)
+    for graph in random_molecular_graphs(10):
+        trajectory = random_trajectory(graph, random)
+        fragment_tracker = Fragment_Tracker(graph)
+        changes = list(fragment_tracker.track(frame_chunks(trajectory, frames_per_chunk=7)))
+        answer = list(fragments_for_frames(changes, len(fragment_tracker.topologies), N_FRAMES))
+        expected = Fragment_Extractor().dihedral_fragments_for_frames(graph, trajectory)
+        assert answer == expected, '{0} (answer) != {1} (expected)'.format(answer, expected)
+        assert fragment_tracker.n_frames == N_FRAMES, fragment_tracker.n_frames
+
+        # Every fragment is logged at the first frame, then only when it changes
+        assert [change.index for change in changes if change.frame == 0] == list(range(len(fragment_tracker.topologies)))
+        assert all(expected[change.frame - 1][change.index] != change.fragment for change in changes if change.frame > 0)
+
+def test_frame_by_frame_and_ties() -> None:
+    random = np.random.RandomState(1)
+    graph, = random_molecular_graphs(1, seed=3, max_heavy_atoms=30)
+    trajectory = random_trajectory(graph, random)
+    fragment_tracker = Fragment_Tracker(graph)
+    angles = dihedral_angles(trajectory, fragment_tracker.quadruples)
+    # Tie two angles of every side in some frames
+    for (left_slice, right_slice) in fragment_tracker.angle_slices:
+        for side_slice in (left_slice, right_slice):
+            if side_slice.stop - side_slice.start > 1:
+                angles[10:13, side_slice.start + 1] = angles[10:13, side_slice.start]
+
+    changes = [change for frame_angles in angles for change in fragment_tracker.update(frame_angles)]
+    answer = list(fragments_for_frames(changes, len(fragment_tracker.topologies), N_FRAMES))
+    fragment_extractor = Fragment_Extractor()
+    expected = [
+        [
+            fragment_extractor.canonical_fragment(topology.atom_list, (frame_angles[left_slice].tolist(), frame_angles[right_slice].tolist()))
+            for (topology, (left_slice, right_slice)) in zip(fragment_tracker.topologies, fragment_tracker.angle_slices)
+        ]
+        for frame_angles in angles
+    ]
+    assert answer == expected, '{0} (answer) != {1} (expected)'.format(answer, expected)
+
+def test_rotations_of_same_element_ties() -> None:
+    # Sulfur with C4, H, C2 and H neighbours (with valences): rotating their order changes the canonical form
+    elements = ['S', 'C', 'C', 'H', 'C', 'H', 'H', 'H', 'H', 'H', 'H', 'H', 'H']
+    bonds = [(0, 1), (0, 2), (0, 3), (0, 4), (0, 5), (1, 6), (1, 7), (1, 8), (2, 9), (2, 10), (2, 11), (4, 12)]
+    fragment_tracker = Fragment_Tracker(Molecular_Graph(elements, bonds, None), Fragment_Extractor(use_valences=True))
+    (left_slice, right_slice) = fragment_tracker.angle_slices[0]
+    assert fragment_tracker.topologies[0].atom_list[0] == ['C4', 'H1', 'C2', 'H1'], fragment_tracker.topologies[0].atom_list
+
+    angles = np.tile(np.arange(len(fragment_tracker.quadruples), dtype=float), (2, 1))
+    angles[:, left_slice] = [[30.0, 40.0, 10.0, 20.0], [10.0, 20.0, 30.0, 40.0]]
+    changes = fragment_tracker.update(angles)
+    assert [change.fragment for change in changes if change.index == 0] == ['C2,H1,C4,H1|S5|C4|H1,H1,H1', 'C4,H1,C2,H1|S5|C4|H1,H1,H1'], changes
+
+def test_change_log() -> None:
+    random = np.random.RandomState(2)
+    graph, = random_molecular_graphs(1, seed=4)
+    changes = list(Fragment_Tracker(graph).track(frame_chunks(random_trajectory(graph, random))))
+    fh = StringIO()
+    assert write_change_log(changes, fh) == len(changes)
+    fh.seek(0)
+    answer = list(read_change_log(fh))
+    assert answer == changes, '{0} (answer) != {1} (expected)'.format(answer, changes)
+
+if __name__ == '__main__':
+    test_same_fragments_as_extractor()
+    test_frame_by_frame_and_ties()
+    test_rotations_of_same_element_ties()
+    test_change_log()
@@ -0,0 +1,29 @@
+from dihedral_fragments.benchmarks import random_fragments
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment
+from dihedral_fragments.tagging import Tagging_Service
+from dihedral_fragments.worker_pool import Fragment_Worker_Pool, tuned_chunksize
+
+TAGGED_FRAGMENTS = ['CL,CL,H|C|C|H,H,H', 'H,H,H|C|C|O,C', 'C,C|N|C|H,H,H', 'O,O,O|P|O|C', 'N,H,H|C|C|O,O'] * 3
+
+def test_tuned_chunksize() -> None:
+    for (n_items, processes, expected) in [(0, 4, 1), (1, 4, 1), (100, 1, 25), (100, 4, 7), (1000, 32, 8)]:
+        answer = tuned_chunksize(n_items, processes)
+        assert answer == expected, '{0} (answer) != {1} (expected)'.format(answer, expected)
+
+def test_same_results_as_serial() -> None:
+    fragments = random_fragments(500) * 2
+    with Fragment_Worker_Pool(processes=2) as worker_pool:
+        answer = worker_pool.canonicalise(fragments)
+        expected = [str(Dihedral_Fragment(fragment)) for fragment in fragments]
+        assert answer == expected, '{0} (answer) != {1} (expected)'.format(answer[:5], expected[:5])
+        assert worker_pool.canonicalise(fragments, chunksize=7) == expected
+        assert worker_pool.canonicalise([]) == []
+
+        tagging_service = Tagging_Service()
+        answer = worker_pool.tag(TAGGED_FRAGMENTS)
+        expected = [sorted(tagging_service.tags_for_dihedral(fragment)) for fragment in TAGGED_FRAGMENTS]
+        assert answer == expected, '{0} (answer) != {1} (expected)'.format(answer, expected)
+
+if __name__ == '__main__':
+    test_tuned_chunksize()
+    test_same_results_as_serial()
@@ -0,0 +1,88 @@
+'''
+Per-subsystem tracing with a shared ring buffer for post-mortem inspection.
+
+Hot paths guard every trace call behind a plain attribute lookup, so that nothing (argument tuples, lists, format strings) is built when tracing is disabled:
+
+    if CANONICALISATION_TRACER.debug:
+        CANONICALISATION_TRACER.emit('flip', reason=...)
+
+Levels can be changed at runtime with `set_level()`, or at start-up with the DIHEDRAL_FRAGMENTS_TRACE environment variable (e.g. `canonicalisation=debug,pattern_matching=info`).
+'''
+from collections import deque
+from os import environ
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+OFF, INFO, DEBUG = 0, 1, 2
+
+LEVELS = {'off': OFF, 'info': INFO, 'debug': DEBUG}
+
+DEFAULT_CAPACITY = 10000
+
+TRACE_ENVIRONMENT_VARIABLE = 'DIHEDRAL_FRAGMENTS_TRACE'
+
+Trace_Record = NamedTuple('Trace_Record', [('subsystem', str), ('event', str), ('details', Dict[str, Any])])
+
+TRACE_BUFFER = deque(maxlen=DEFAULT_CAPACITY)
+
+class Tracer(object):
+    __slots__ = ('subsystem', 'level', 'info', 'debug', 'echo')
+
+    def __init__(self, subsystem: str, level: int = OFF, echo: bool = False) -> None:
+        self.subsystem = subsystem
+        self.echo = echo
+        self.set_level(level)
+
+    def set_level(self, level: int) -> None:
+        self.level = level
+        self.info = level >= INFO
+        self.debug = level >= DEBUG
+
+    def emit(self, event: str, echo: bool = False, **details: Any) -> None:
+        TRACE_BUFFER.append(Trace_Record(self.subsystem, event, details))
+        if echo or self.echo:
+            print('[{0}] {1}: {2}'.format(self.subsystem, event, details))
+
+    def __repr__(self) -> str:
+        return 'Tracer(subsystem={0}, level={1})'.format(self.subsystem, self.level)
+
+TRACERS = {} # type: Dict[str, Tracer]
+
+def tracer(subsystem: str) -> Tracer:
+    if subsystem not in TRACERS:
+        TRACERS[subsystem] = Tracer(subsystem, level=_environment_levels().get(subsystem, OFF))
+    return TRACERS[subsystem]
+
+def set_level(subsystem: str, level: int, echo: Optional[bool] = None) -> None:
+    a_tracer = tracer(subsystem)
+    a_tracer.set_level(level)
+    if echo is not None:
+        a_tracer.echo = echo
+
+def set_capacity(capacity: int) -> None:
+    global TRACE_BUFFER
+    TRACE_BUFFER = deque(TRACE_BUFFER, maxlen=capacity)
+
+def trace_records(subsystem: Optional[str] = None, event: Optional[str] = None) -> List[Trace_Record]:
+    return [
+        record
+        for record in TRACE_BUFFER
+        if (subsystem is None or record.subsystem == subsystem) and (event is None or record.event == event)
+    ]
+
+def clear_trace_records() -> None:
+    TRACE_BUFFER.clear()
+
+def _environment_levels() -> Dict[str, int]:
+    def parsed_item(item: str) -> Tuple[str, int]:
+        subsystem, _, level = item.partition('=')
+        return (subsystem.strip(), LEVELS[level.strip().lower() or 'debug'])
+
+    return dict(
+        parsed_item(item)
+        for item in environ.get(TRACE_ENVIRONMENT_VARIABLE, '').split(',')
+        if item.strip()
+    )
+
+CANONICALISATION_TRACER = tracer('canonicalisation')
+PATTERN_MATCHING_TRACER = tracer('pattern_matching')
+TAGGING_TRACER = tracer('tagging')
@@ -0,0 +1,145 @@
+'''
+Tracking the stereo-ordered fragment of every central bond along a trajectory, in constant memory.
+
+The canonical form of a fragment only depends on the cyclic order of each side's neighbours by dihedral angle (see stereo.py and extraction.py).
+A Fragment_Tracker holds the topology of the molecule once, computes these cyclic orders for every side of every fragment and every frame of a chunk with NumPy, and only recanonicalises the fragments (through a Fragment_Extractor's cache) one of whose sides changed order (or has tied angles).
+Sides whose rotations are not equivalent (see `stereo.rotations_are_equivalent()`) are compared by their full order instead.
+It emits a change log: a Fragment_Change for every fragment whose canonical form differs from the one at the previous frame (every fragment at the first frame).
+'''
+from typing import Any, Dict, IO, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from dihedral_fragments.dihedral_fragment import Fragment
+from dihedral_fragments.extraction import Fragment_Extractor, Molecular_Graph, fragment_topologies, topology_quadruples, FRAMES_PER_CHUNK
+from dihedral_fragments.geometry import dihedral_angles
+from dihedral_fragments.stereo import rotations_are_equivalent
+
+Fragment_Change = NamedTuple('Fragment_Change', [('frame', int), ('index', int), ('fragment', Fragment)])
+
+def rotated_to_first_neighbour(orderings: np.ndarray) -> np.ndarray:
+    '''Rotation of every ordering (last axis) which starts with neighbour 0.'''
+    n_neighbours = orderings.shape[-1]
+    start = np.argmax(orderings == 0, axis=-1)
+    return np.take_along_axis(orderings, (start[..., np.newaxis] + np.arange(n_neighbours)) % n_neighbours, axis=-1)
+
+def frame_chunks(trajectory: Any, frames_per_chunk: int = FRAMES_PER_CHUNK) -> Iterator[Any]:
+    '''Consecutive chunks of frames of an (F, N, 3) array (e.g. a `numpy.memmap`, which is never loaded at once).'''
+    for start in range(0, len(trajectory), frames_per_chunk):
+        yield trajectory[start:start + frames_per_chunk]
+
+class Fragment_Tracker(object):
+    def __init__(self, graph: Molecular_Graph, fragment_extractor: Optional[Fragment_Extractor] = None) -> None:
+        self.fragment_extractor = fragment_extractor if fragment_extractor is not None else Fragment_Extractor()
+        self.topologies = fragment_topologies(graph, use_valences=self.fragment_extractor.use_valences, max_ring_size=self.fragment_extractor.max_ring_size)
+        self.quadruples = topology_quadruples(self.topologies)
+
+        # Angle indices (in `self.quadruples`) of every fragment's sides
+        self.angle_slices = [] # type: List[Tuple[slice, slice]]
+        start = 0
+        for topology in self.topologies:
+            n_left, n_right = len(topology.left_neighbours), len(topology.right_neighbours)
+            self.angle_slices.append((slice(start, start + n_left), slice(start + n_left, start + n_left + n_right)))
+            start += n_left + n_right
+
+        # Sides with at least two neighbours, grouped by (side, number of neighbours), so that fragment indices are unique within a group
+        groups = {} # type: Dict[Tuple[int, int], List[int]]
+        for (index, side_slices) in enumerate(self.angle_slices):
+            for (side, side_slice) in enumerate(side_slices):
+                n_neighbours = side_slice.stop - side_slice.start
+                if n_neighbours > 1:
+                    groups.setdefault((side, n_neighbours), []).append(index)
+        self.side_groups = {
+            key: (
+                np.array(indices),
+                np.array([list(range(self.angle_slices[index][key[0]].start, self.angle_slices[index][key[0]].stop)) for index in indices]),
+                np.array([self.equivalent_rotations(index, key[0]) for index in indices]),
+            )
+            for (key, indices) in groups.items()
+        }
+
+        self.previous_sides = {} # type: Dict[Tuple[int, int], Tuple[np.ndarray, np.ndarray]]
+        self.fragments = [None] * len(self.topologies) # type: List[Optional[Fragment]]
+        self.n_frames = 0
+
+    def equivalent_rotations(self, index: int, side: int) -> bool:
+        '''Whether a side's cyclic order is enough to canonicalise its fragment (as for `Stereo_Fragment.equivalent_rotations`).'''
+        neighbours_1, _, _, neighbours_4, cycles = self.topologies[index].atom_list
+        return not cycles and rotations_are_equivalent(neighbours_1 if side == 0 else neighbours_4)
+
+    def changed_fragments(self, angles: np.ndarray) -> np.ndarray:
+        '''(F, number of fragments) mask of the fragments which need recanonicalising at each frame of a chunk of angles.'''
+        changed = np.zeros((angles.shape[0], len(self.topologies)), dtype=bool)
+        if self.n_frames == 0:
+            changed[0, :] = True
+
+        for (key, (indices, angle_indices, equivalent_rotations)) in self.side_groups.items():
+            side_angles = angles[:, angle_indices]
+            orderings = np.argsort(side_angles, axis=-1, kind='stable')
+            ties = np.any(np.diff(np.take_along_axis(side_angles, orderings, axis=-1), axis=-1) == 0.0, axis=-1)
+            classes = np.where(equivalent_rotations[:, np.newaxis], rotated_to_first_neighbour(orderings), orderings)
+
+            if key in self.previous_sides:
+                previous_classes, previous_ties = self.previous_sides[key]
+                previous_classes = np.concatenate([previous_classes[np.newaxis], classes[:-1]])
+                previous_ties = np.concatenate([previous_ties[np.newaxis], ties[:-1]])
+            else:
+                previous_classes, previous_ties = np.concatenate([classes[:1], classes[:-1]]), np.concatenate([ties[:1], ties[:-1]])
+
+            # Tied angles are canonicalised without the stereo tables, so tied sides are recanonicalised (as is the next frame)
+            changed[:, indices] |= np.any(classes != previous_classes, axis=-1) | ties | previous_ties
+            self.previous_sides[key] = (classes[-1], ties[-1])
+
+        return changed
+
+    def update(self, angles: Any) -> List[Fragment_Change]:
+        '''
+        Process the angles (of `self.quadruples`) of a frame (shape (Q,)) or of a chunk of consecutive frames (shape (F, Q)).
+        Returns the changes (in order of frame, then fragment index).
+        '''
+        angles = np.asarray(angles, dtype=np.float64).reshape(-1, len(self.quadruples))
+        changes = []
+        for (frame, index) in np.argwhere(self.changed_fragments(angles)).tolist():
+            left_slice, right_slice = self.angle_slices[index]
+            fragment = self.fragment_extractor.canonical_fragment(
+                self.topologies[index].atom_list,
+                (angles[frame, left_slice].tolist(), angles[frame, right_slice].tolist()),
+            )
+            if fragment != self.fragments[index]:
+                self.fragments[index] = fragment
+                changes.append(Fragment_Change(self.n_frames + frame, index, fragment))
+        self.n_frames += angles.shape[0]
+        return changes
+
+    def update_coordinates(self, coordinates: Any) -> List[Fragment_Change]:
+        '''Same as `update()`, for the coordinates of a frame (shape (N, 3)) or of a chunk of frames (shape (F, N, 3)).'''
+        return self.update(dihedral_angles(coordinates, self.quadruples))
+
+    def track(self, coordinate_chunks: Iterable[Any]) -> Iterator[Fragment_Change]:
+        '''Stream the changes of a trajectory, given as chunks of frames (see `frame_chunks()`).'''
+        for coordinates in coordinate_chunks:
+            yield from self.update_coordinates(coordinates)
+
+def write_change_log(changes: Iterable[Fragment_Change], fh: IO[str]) -> int:
+    '''One `frame index fragment` line per change. Returns the number of changes.'''
+    n_changes = 0
+    for change in changes:
+        fh.write('{0} {1} {2}\n'.format(*change))
+        n_changes += 1
+    return n_changes
+
+def read_change_log(fh: IO[str]) -> Iterator[Fragment_Change]:
+    for line in fh:
+        frame, index, fragment = line.split()
+        yield Fragment_Change(int(frame), int(index), fragment)
+
+def fragments_for_frames(changes: Iterable[Fragment_Change], n_fragments: int, n_frames: int) -> Iterator[List[Fragment]]:
+    '''Replay a change log into the (complete) list of fragments of every frame.'''
+    fragments = [None] * n_fragments # type: List[Any]
+    changes = iter(changes)
+    next_change = next(changes, None)
+    for frame in range(n_frames):
+        while next_change is not None and next_change.frame == frame:
+            fragments[next_change.index] = next_change.fragment
+            next_change = next(changes, None)
+        yield list(fragments)
@@ -0,0 +1,82 @@
+'''
+Process pool for canonicalising and tagging fragments across cores.
+
+The read-only structures (canonical CHEMICAL_GROUPS, compiled tag matchers, held by a Tagging_Service) are built once in the parent by `warm_up()`.
+With the `fork` start method, workers inherit them (copy-on-write) instead of re-importing the package and recompiling every matcher; with `spawn`, each worker warms up once in its initializer.
+Fragments are deduplicated in the parent and sent in a few large chunks per worker (one list per task, one list back), which keeps inter-process communication to a minimum.
+'''
+from math import ceil
+from multiprocessing import get_all_start_methods, get_context, cpu_count
+from typing import Any, Callable, List, Optional, Sequence, TypeVar
+
+from dihedral_fragments.dihedral_fragment import Dihedral_Fragment, Fragment
+from dihedral_fragments.tagging import Tagging_Service
+
+T = TypeVar('T')
+
+# Few enough chunks to keep IPC low, enough to even out the load between workers
+CHUNKS_PER_PROCESS = 4
+
+TAGGING_SERVICE = None # type: Optional[Tagging_Service]
+
+def warm_up() -> Tagging_Service:
+    '''Build (once per process) every read-only structure the workers need.'''
+    global TAGGING_SERVICE
+    if TAGGING_SERVICE is None:
+        TAGGING_SERVICE = Tagging_Service()
+    return TAGGING_SERVICE
+
+def canonicalise_chunk(fragments: Sequence[Fragment]) -> List[Fragment]:
+    return [str(Dihedral_Fragment(fragment)) for fragment in fragments]
+
+def tag_chunk(fragments: Sequence[Fragment]) -> List[List[str]]:
+    tagging_service = warm_up()
+    return [sorted(tagging_service.tags_for_dihedral(fragment)) for fragment in fragments]
+
+def tuned_chunksize(n_items: int, processes: int, chunks_per_process: int = CHUNKS_PER_PROCESS) -> int:
+    return max(1, int(ceil(n_items / (processes * chunks_per_process))))
+
+def chunked(items: Sequence[T], chunksize: int) -> List[Sequence[T]]:
+    return [items[start:start + chunksize] for start in range(0, len(items), chunksize)]
+
+class Fragment_Worker_Pool(object):
+    def __init__(self, processes: Optional[int] = None, start_method: Optional[str] = None) -> None:
+        self.processes = processes or cpu_count()
+        if start_method is None:
+            start_method = 'fork' if 'fork' in get_all_start_methods() else 'spawn'
+        self.start_method = start_method
+
+        warm_up()
+        self.pool = get_context(start_method).Pool(
+            self.processes,
+            initializer=(None if start_method == 'fork' else warm_up),
+        )
+
+    def close(self) -> None:
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self) -> 'Fragment_Worker_Pool':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def map_chunks(self, chunk_function: Callable[[Sequence[T]], List[Any]], items: Sequence[T], chunksize: Optional[int] = None) -> List[Any]:
+        '''Apply `chunk_function` (a module-level function mapping a list of items to a list of results) to `items`, split into chunks.'''
+        if len(items) == 0:
+            return []
+        chunks = chunked(list(items), chunksize or tuned_chunksize(len(items), self.processes))
+        return [result for chunk_results in self.pool.map(chunk_function, chunks, chunksize=1) for result in chunk_results]
+
+    def map_unique(self, chunk_function: Callable[[Sequence[Fragment]], List[Any]], fragments: Sequence[Fragment], chunksize: Optional[int] = None) -> List[Any]:
+        '''Same as `map_chunks()`, but each distinct fragment is only sent (and computed) once.'''
+        unique_fragments = list(dict.fromkeys(fragments))
+        results = dict(zip(unique_fragments, self.map_chunks(chunk_function, unique_fragments, chunksize=chunksize)))
+        return [results[fragment] for fragment in fragments]
+
+    def canonicalise(self, fragments: Sequence[Fragment], chunksize: Optional[int] = None) -> List[Fragment]:
+        return self.map_unique(canonicalise_chunk, fragments, chunksize=chunksize)
+
+    def tag(self, fragments: Sequence[Fragment], chunksize: Optional[int] = None) -> List[List[str]]:
+        return self.map_unique(tag_chunk, fragments, chunksize=chunksize)